@@ -0,0 +1,65 @@
+"""Move idle chat sessions into the compressed session archive, outside the request path.
+
+    python archive_sessions.py                          # sessions idle SESSION_ARCHIVE_AFTER_DAYS or more
+    python archive_sessions.py --after-days 30 --limit 5000
+    python archive_sessions.py --dry-run
+    python archive_sessions.py --restore <session_id>
+
+Sessions are read from MONGODB_URI / MONGO_DB_NAME. Each archived session becomes one
+zlib-compressed document in `session_archive`; a chat in it later restores it on first use,
+--restore does so ahead of time. Safe to run from cron and to interrupt; see src/session_lifecycle.py.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger("rag_service.archive_sessions")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--after-days", type=float, default=None, help="SESSION_ARCHIVE_AFTER_DAYS (default 0 = never)")
+    parser.add_argument("--limit", type=int, default=None, help="Archive at most this many sessions")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the sessions that would be archived")
+    parser.add_argument("--restore", metavar="SESSION_ID", action="append", default=None,
+                        help="Restore this session instead (repeatable)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    load_dotenv()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    from pymongo import MongoClient
+    from src.session_lifecycle import SessionArchiver
+
+    db = MongoClient(os.getenv("MONGODB_URI") or os.getenv("MONGO_URI"))[os.getenv("MONGO_DB_NAME") or "rag_service"]
+    archiver = SessionArchiver(db, archive_after_days=args.after_days)
+    if args.restore:
+        missing = [sid for sid in args.restore if not archiver.restore(sid)]
+        for sid in missing:
+            print(f"{sid}: not archived", file=sys.stderr)
+        return 1 if missing else 0
+    cutoff = archiver.cutoff()
+    if cutoff is None:
+        print("Archiving is off: set SESSION_ARCHIVE_AFTER_DAYS or pass --after-days", file=sys.stderr)
+        return 2
+    if args.dry_run:
+        n = sum(1 for _ in archiver.cold_sessions(cutoff, args.limit))
+        print(f"{n} sessions last active before {cutoff.isoformat()} (not checked against their latest message)")
+        return 0
+    started = datetime.utcnow()
+    counts = archiver.run(args.limit)
+    ratio = counts["raw_bytes"] / counts["stored_bytes"] if counts["stored_bytes"] else 0.0
+    print(f"Archived {counts['archived']} sessions ({counts['messages']} messages) in "
+          f"{(datetime.utcnow() - started).total_seconds():.1f}s; {counts['raw_bytes']} -> {counts['stored_bytes']} bytes "
+          f"({ratio:.1f}x); {counts['still_active']} were active again")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
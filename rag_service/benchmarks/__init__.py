@@ -0,0 +1 @@
+"""Offline benchmarks for the RAG service (run from rag_service/: `python -m benchmarks.<name>`)."""
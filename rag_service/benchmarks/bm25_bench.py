@@ -0,0 +1,146 @@
+"""Lexical index size, BM25 latency and BM25-only Hit@3 per analyzer, against the previous rank_bm25 index.
+
+    python -m benchmarks.bm25_bench --index-dir /tmp/rag_bench_index
+    python -m benchmarks.bm25_bench --data-folder data --repeat 20
+
+Chunks come from the live snapshot in --index-dir, or are cut from --data-folder. Rows:
+
+    rank_bm25           the previous index: BM25Okapi over whitespace tokens (skipped if
+                        rank-bm25 is not installed)
+    whitespace          CompactBM25, same tokens (its scores must equal rank_bm25's: `max diff`)
+    legal               CompactBM25, LegalAnalyzer (the default)
+    legal+stem          with ANALYZER_STEMMING=1
+    legal-stopwords     with ANALYZER_STOPWORDS=0
+
+`index MB` is memory retained by the built index (tracemalloc), vocabulary included.
+Latency covers analyzing the query, scoring and ranking the top --depth chunks. Hit@3: a gold
+keyword of the benchmark question appears in one of the top three BM25 chunks.
+"""
+import argparse
+import gc
+import logging
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from .common import latency_summary, load_benchmark, write_result
+from .offline import DEFAULT_DATA_FOLDER
+
+logger = logging.getLogger("benchmarks.bm25_bench")
+
+
+def load_chunks(index_dir: str, data_folder: str) -> List[str]:
+    if index_dir:
+        from src.index_snapshots import IndexManifest
+
+        _, directory = IndexManifest(index_dir).current()
+        if directory:
+            with open(os.path.join(directory, "docs.pkl"), "rb") as f:
+                return pickle.load(f)
+        logger.warning("No index in %s; chunking %s", index_dir, data_folder)
+    from src.document_processor import DocumentProcessor
+
+    return DocumentProcessor().process_documents(data_folder)
+
+
+def measure_build(build: Callable):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return index, elapsed, retained
+
+
+def top(scores: np.ndarray, depth: int) -> np.ndarray:
+    depth = min(depth, len(scores))
+    ranked = np.argpartition(scores, -depth)[-depth:]
+    return ranked[np.argsort(scores[ranked])][::-1]
+
+
+def evaluate(score: Callable[[str], np.ndarray], chunks: List[str], benchmark: List[Dict], depth: int,
+             repeat: int) -> Dict:
+    latencies, hits = [], 0
+    for item in benchmark:
+        ranked = top(score(item["query"]), depth)
+        selected = [chunks[i].lower() for i in ranked[:3]]
+        hits += any(kw.lower() in chunk for chunk in selected for kw in item["gold_keywords"])
+    for _ in range(repeat):
+        for item in benchmark:
+            start = time.perf_counter()
+            top(score(item["query"]), depth)
+            latencies.append(time.perf_counter() - start)
+    return dict(latency_summary(latencies), **{"hit@3": round(hits / max(1, len(benchmark)), 4)})
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-folder", default=DEFAULT_DATA_FOLDER)
+    parser.add_argument("--index-dir", default=None)
+    parser.add_argument("--depth", type=int, default=9, help="BM25 candidates ranked per query (k * multiplier)")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed passes over the queries")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    from src.bm25_index import CompactBM25
+    from src.text_analyzer import LegalAnalyzer, WhitespaceAnalyzer
+
+    chunks = load_chunks(args.index_dir, args.data_folder)
+    benchmark = load_benchmark()
+    rows, reference = [], None
+
+    try:
+        from rank_bm25 import BM25Okapi
+    except ImportError:
+        BM25Okapi = None
+        logger.warning("rank-bm25 not installed; skipping the rank_bm25 row")
+    whitespace = WhitespaceAnalyzer()
+    if BM25Okapi is not None:
+        index, build_s, retained = measure_build(
+            lambda: BM25Okapi([whitespace.analyze(c) or ["empty"] for c in chunks]))
+        reference = lambda q, index=index: index.get_scores(whitespace.analyze(q))  # noqa: E731
+        score = reference
+        rows.append(dict(evaluate(score, chunks, benchmark, args.depth, args.repeat), config="rank_bm25",
+                         build_s=round(build_s, 2), index_mb=round(retained / 1e6, 2), terms=len(index.idf),
+                         max_diff=None))
+
+    for config, analyzer in (("whitespace", whitespace), ("legal", LegalAnalyzer()),
+                             ("legal+stem", LegalAnalyzer(stemming=True)),
+                             ("legal-stopwords", LegalAnalyzer(stopwords=False))):
+        index, build_s, retained = measure_build(lambda: CompactBM25([analyzer.analyze(c) for c in chunks]))
+        score = lambda q, index=index, analyzer=analyzer: index.get_scores(  # noqa: E731
+            index.vocabulary.lookup(analyzer.analyze(q)))
+        max_diff = None
+        if config == "whitespace" and reference is not None:
+            max_diff = float(max(np.abs(score(item["query"]) - reference(item["query"])).max() for item in benchmark))
+        rows.append(dict(evaluate(score, chunks, benchmark, args.depth, args.repeat), config=config,
+                         build_s=round(build_s, 2), index_mb=round(retained / 1e6, 2), terms=len(index.vocabulary),
+                         max_diff=max_diff))
+
+    print(f"{len(chunks)} chunks, {len(benchmark)} queries, depth {args.depth}")
+    print(f"{'config':<16} {'terms':>7} {'index MB':>9} {'build s':>8} {'p50 ms':>8} {'p95 ms':>8} {'hit@3':>6} {'max diff':>9}")
+    for row in rows:
+        diff = "-" if row["max_diff"] is None else f"{row['max_diff']:.1e}"
+        print(f"{row['config']:<16} {row['terms']:>7} {row['index_mb']:>9.2f} {row['build_s']:>8.2f} {row['p50']:>8.3f} "
+              f"{row['p95']:>8.3f} {row['hit@3']:>6.3f} {diff:>9}")
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("bm25_bench", config, {"chunks": len(chunks), "rows": rows}, args.output)
+    print(f"Results written to {result['_path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Exact hits and latency of citation queries ("Article 21", "Section 302 IPC") with and without the citation index.
+
+    python -m benchmarks.citation_bench --index-dir /tmp/rag_citation_index
+    python -m benchmarks.citation_bench --real-embedder --k 5
+
+Queries are the benchmark questions that cite a provision plus a few statute citations
+below. Each goes through RAGPipeline.retrieve_chunks in three modes:
+
+    search      CITATION_LOOKUP=0: embedding, FAISS, BM25 and RRF only (the previous path)
+    pinned      lookup hits fused ahead of the search results (CITATION_SKIP_SEARCH=0)
+    lookup      the default: queries about nothing but the cited provisions skip the search
+
+`exact@1` / `exact@k`: share of cited provisions whose heading is in the first / any of the
+selected chunks. The index needs a snapshot built with it; an older --index-dir is rebuilt.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from typing import Dict, List
+
+from .common import load_benchmark, latency_summary, write_result
+from .offline import DEFAULT_DATA_FOLDER
+
+logger = logging.getLogger("benchmarks.citation_bench")
+
+STATUTE_QUERIES = [
+    "Section 302 IPC",
+    "What is Section 498A of the Indian Penal Code?",
+    "Explain S. 420 IPC",
+    "punishment u/s 304B ipc",
+    "What does Section 124A of the IPC say about sedition and how has the Supreme Court read it down?",
+    "Section 2 of the Customs Act",
+    "What is Section 135 of the Companies Act?",
+    "Article 5 of the UDHR",
+    "Art. 21A",
+    "Articles 14 to 18",
+]
+
+
+def exact_hits(chunks: List[str], citations, n: int) -> int:
+    from src.citation_index import headings
+
+    return sum(any(number in {h for h, _ in headings(chunk, act)} for chunk in chunks[:n])
+               for act, number in citations)
+
+
+def bm25_runs() -> int:
+    from src.metrics import STAGE_LATENCY
+
+    return STAGE_LATENCY.snapshot().get("bm25", {}).get("count", 0)
+
+
+def run_pass(rag, queries: List[str], k: int) -> Dict:
+    from src.citation_index import parse_citations
+
+    latencies, cited, at1, atk, chunks, chars = [], 0, 0, 0, 0, 0
+    before = bm25_runs()
+    for query in queries:
+        start = time.perf_counter()
+        selected = rag.retrieve_chunks(query, k)
+        latencies.append(time.perf_counter() - start)
+        citations = parse_citations(query)
+        cited += len(citations)
+        at1 += exact_hits(selected, citations, 1)
+        atk += exact_hits(selected, citations, k)
+        chunks += len(selected)
+        chars += sum(len(c) for c in selected)
+    n = max(1, len(queries))
+    return dict(
+        latency_summary(latencies),
+        **{"exact@1": round(at1 / max(1, cited), 4), "exact@k": round(atk / max(1, cited), 4)},
+        # Queries that went through BM25 (and so the embedding and FAISS search)
+        searched=bm25_runs() - before,
+        chunks_per_query=round(chunks / n, 2),
+        # Same 4-chars-per-token heuristic as the pipeline's token budgeting
+        context_tokens_per_query=round(chars / 4 / n, 1),
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-folder", default=DEFAULT_DATA_FOLDER)
+    parser.add_argument("--index-dir", default=None)
+    parser.add_argument("--k", type=int, default=3, help="Chunks requested per query")
+    parser.add_argument("--repeat", type=int, default=5, help="Passes over the queries per mode")
+    parser.add_argument("--real-embedder", action="store_true")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    from .offline import load_offline_pipeline
+    from src.citation_index import parse_citations
+
+    rag = load_offline_pipeline(args.data_folder, index_dir=args.index_dir, fake_embedder=not args.real_embedder)
+    if rag.retrieval.citations is None:
+        logger.warning("Index in %s predates the citation index; rebuilding", args.index_dir)
+        rag.rebuild_index(args.data_folder)
+    rag.reranker = None
+    rag.warmup()
+    queries = [item["query"] for item in load_benchmark() if parse_citations(item["query"])] + STATUTE_QUERIES
+
+    rows = []
+    for mode, lookup, skip in (("search", False, False), ("pinned", True, False), ("lookup", True, True)):
+        rag.citation_lookup, rag.citation_skip_search = lookup, skip
+        run_pass(rag, queries, args.k)  # warm caches
+        passes = [run_pass(rag, queries, args.k) for _ in range(args.repeat)]
+        row = passes[-1]
+        row.update({key: round(sum(p[key] for p in passes) / len(passes), 2) for key in ("p50", "p95", "mean")})
+        rows.append(dict(row, mode=mode))
+
+    print(f"{len(queries)} citation queries, {len(rag.retrieval.citations)} indexed provisions, k={args.k}")
+    print(f"{'mode':<8} {'exact@1':>8} {'exact@k':>8} {'p50 ms':>8} {'p95 ms':>8} {'searched':>8} {'chunks':>7} {'ctx tok':>8}")
+    for row in rows:
+        print(f"{row['mode']:<8} {row['exact@1']:>8.3f} {row['exact@k']:>8.3f} {row['p50']:>8.2f} {row['p95']:>8.2f} "
+              f"{row['searched']:>8} {row['chunks_per_query']:>7.2f} {row['context_tokens_per_query']:>8.1f}")
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("citation_bench", config, {"queries": len(queries), "rows": rows}, args.output)
+    print(f"Results written to {result['_path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Bursts of identical history-free chat queries, with and without single-flight coalescing.
+
+    python -m benchmarks.coalesce_bench --index-dir /tmp/rag_bench_index
+    python -m benchmarks.coalesce_bench --burst 64 --llm-latency-ms 500
+
+Each burst is --burst sessions asking the same question at once (spelling varied in case,
+spacing and closing punctuation), released together by a barrier. For every mode:
+
+    off     SINGLE_FLIGHT=0: every request retrieves and calls the LLM (the previous behaviour)
+    on      duplicates in flight wait for one retrieval and generation
+
+`generations` / `retrievals` are LLM generation calls and packing runs per burst. `persisted`
+checks that every session stored its own user message and the answer it was returned. LLM
+calls beyond LLM_MAX_CONCURRENCY (16) queue in the gateway, as they would in the service.
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, List
+
+from .common import latency_summary, load_benchmark, write_result
+from .offline import DEFAULT_DATA_FOLDER
+
+logger = logging.getLogger("benchmarks.coalesce_bench")
+
+
+def variants(query: str, n: int) -> List[str]:
+    forms = [query, query.lower(), query.upper(), "  " + query.replace(" ", "  "), query.rstrip("?") + " ?"]
+    return [forms[i % len(forms)] for i in range(n)]
+
+
+def burst(rag, query: str, n: int) -> Dict:
+    from src.metrics import LLM_CALLS, STAGE_LATENCY
+
+    sessions = [rag.conversation_manager.create_session() for _ in range(n)]
+    queries = variants(query, n)
+    barrier = threading.Barrier(n)
+    latencies, outputs = [0.0] * n, [None] * n
+
+    def one(i):
+        barrier.wait()
+        start = time.perf_counter()
+        outputs[i] = rag.chat(sessions[i], queries[i], include_history=False)
+        latencies[i] = time.perf_counter() - start
+
+    generations = LLM_CALLS.value(purpose="generation", outcome="ok")
+    retrievals = STAGE_LATENCY.snapshot().get("packing", {}).get("count", 0)
+    threads = [threading.Thread(target=one, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    persisted = 0
+    for session_id, out in zip(sessions, outputs):
+        messages = list(rag.conversation_manager.messages.find({"session_id": session_id}))
+        senders = sorted(m["sender"] for m in messages)
+        answer = next((m["text"] for m in messages if m["sender"] == "assistant"), None)
+        persisted += senders == ["assistant", "user"] and answer == out["response"]
+    return dict(
+        latency_summary(latencies),
+        generations=LLM_CALLS.value(purpose="generation", outcome="ok") - generations,
+        retrievals=STAGE_LATENCY.snapshot().get("packing", {}).get("count", 0) - retrievals,
+        coalesced=sum(bool(out["debug"].get("coalesced")) for out in outputs),
+        persisted=persisted,
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-folder", default=DEFAULT_DATA_FOLDER)
+    parser.add_argument("--index-dir", default=None)
+    parser.add_argument("--burst", type=int, default=32, help="Identical requests per burst")
+    parser.add_argument("--queries", type=int, default=3, help="Bursts (one benchmark question each)")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    from .offline import load_offline_pipeline
+    from src.single_flight import SingleFlight
+
+    rag = load_offline_pipeline(args.data_folder, index_dir=args.index_dir, llm_latency_ms=args.llm_latency_ms)
+    rag.warmup()
+    questions = [item["query"] for item in load_benchmark()[:args.queries]]
+
+    rows = []
+    for mode, single_flight in (("off", None), ("on", SingleFlight())):
+        rag.single_flight = single_flight
+        runs = [burst(rag, q, args.burst) for q in questions]
+        row = {key: round(sum(r[key] for r in runs) / len(runs), 2) for key in runs[0]}
+        rows.append(dict(row, mode=mode))
+
+    print(f"{len(questions)} bursts of {args.burst} identical queries, LLM latency {args.llm_latency_ms:.0f} ms")
+    print(f"{'mode':<5} {'p50 ms':>8} {'p95 ms':>8} {'generations':>12} {'retrievals':>11} {'coalesced':>10} {'persisted':>10}")
+    for row in rows:
+        print(f"{row['mode']:<5} {row['p50']:>8.1f} {row['p95']:>8.1f} {row['generations']:>12.1f} "
+              f"{row['retrievals']:>11.1f} {row['coalesced']:>10.1f} {row['persisted']:>10.1f}")
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("coalesce_bench", config, {"rows": rows}, args.output)
+    print(f"Results written to {result['_path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+"""Shared helpers for benchmark scripts: query loading, percentiles and comparable JSON results."""
+import json
+import math
+import os
+import platform
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence
+
+RAG_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERIES_PATH = os.path.join(RAG_ROOT, "benchmark_queries.json")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def load_benchmark(path: str = QUERIES_PATH) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["questions"]
+
+
+def load_queries(path: str = QUERIES_PATH) -> List[str]:
+    return [item["query"] for item in load_benchmark(path)]
+
+
+def percentile(sorted_values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def latency_summary(latencies_s: Sequence[float]) -> Dict[str, float]:
+    values = sorted(v * 1000.0 for v in latencies_s)
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3),
+        "max": round(values[-1], 3),
+    }
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MiB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (2 ** 20 if platform.system() == "Darwin" else 1024.0)
+
+
+def stage_breakdown(before: Dict, after: Dict) -> Dict[str, Dict[str, float]]:
+    """Mean latency and call count per stage between two metrics REGISTRY snapshots."""
+    b = before.get("rag_stage_latency_seconds", {})
+    a = after.get("rag_stage_latency_seconds", {})
+    out = {}
+    for stage, state in a.items():
+        prev = b.get(stage, {"sum": 0.0, "count": 0})
+        count = state["count"] - prev["count"]
+        if count > 0:
+            out[stage] = {
+                "mean_ms": round((state["sum"] - prev["sum"]) * 1000.0 / count, 3),
+                "count": count,
+            }
+    return out
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAG_ROOT,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def write_result(benchmark: str, config: Dict, data: Dict, output: Optional[str] = None) -> Dict:
+    """Wrap results with run metadata and write them to `output` (default: results/<benchmark>_<ts>.json)."""
+    now = datetime.now(timezone.utc)
+    payload = {
+        "benchmark": benchmark,
+        "timestamp": now.isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+    }
+    payload.update(data)
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{benchmark}_{now.strftime('%Y%m%dT%H%M%S')}.json")
+    else:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+    payload["_path"] = output
+    return payload
+
+
+def compare_results(baseline_path: str, current: Dict, max_regression: float) -> List[str]:
+    """Flag endpoints whose p95 latency grew or throughput dropped by more than `max_regression`."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    problems = []
+    for name, cur in current.get("endpoints", {}).items():
+        base = baseline.get("endpoints", {}).get(name)
+        if not base:
+            continue
+        base_p95, cur_p95 = base["latency_ms"]["p95"], cur["latency_ms"]["p95"]
+        if base_p95 and cur_p95 > base_p95 * (1 + max_regression):
+            problems.append(f"{name}: p95 {cur_p95:.1f}ms vs baseline {base_p95:.1f}ms")
+        base_rps, cur_rps = base.get("throughput_rps", 0), cur.get("throughput_rps", 0)
+        if base_rps and cur_rps < base_rps * (1 - max_regression):
+            problems.append(f"{name}: throughput {cur_rps:.1f} rps vs baseline {base_rps:.1f} rps")
+        if cur.get("errors", 0) > base.get("errors", 0):
+            problems.append(f"{name}: {cur['errors']} errors vs baseline {base.get('errors', 0)}")
+    return problems
@@ -0,0 +1,150 @@
+"""Stress RAGPipeline.search from many threads: QPS stability and cross-request interference.
+
+    python -m benchmarks.concurrency_stress
+    python -m benchmarks.concurrency_stress --factory HNSW32 --levels 1 8 32 128 --requests 2000
+    SEARCH_CONCURRENCY=2 EMBEDDING_THREADS=2 python -m benchmarks.concurrency_stress --modes executor
+
+An index is built with --factory (IVF by default, so per-call nprobe changes results), then
+every (query, search-params) job is answered once serially as the reference. Each concurrency
+level replays --requests jobs from that many client threads, with neighbouring requests using
+different nprobe/efSearch values, in two modes:
+
+    executor  the configured SearchExecutor (SEARCH_CONCURRENCY workers, pinned torch/FAISS threads)
+    inline    SEARCH_CONCURRENCY=0: every client thread searches directly (one OpenMP team each)
+
+Exits 1 if any search raised or returned results different from its serial reference (another
+request's parameters leaking in), or if executor QPS at the highest level falls below
+--min-qps-ratio x its best level.
+"""
+import argparse
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Tuple
+
+from .common import latency_summary, load_queries, write_result
+from .offline import DEFAULT_DATA_FOLDER
+
+logger = logging.getLogger("benchmarks.concurrency_stress")
+
+# (nprobe, efSearch) per request; each index type uses the one that applies to it
+PARAM_VARIANTS = ((1, 16), (4, 48), (64, 256))
+
+
+def fingerprint(results: List[Tuple[str, float]]) -> Tuple:
+    return tuple((hash(doc), round(score, 4)) for doc, score in results)
+
+
+def run_level(rag, jobs: List[Tuple], expected: Dict, concurrency: int, requests: int, k: int) -> Dict:
+    feed = itertools.islice(itertools.cycle(jobs), requests)
+    feed_lock = threading.Lock()
+    latencies, mismatches, errors = [], [], []
+    record_lock = threading.Lock()
+
+    def client():
+        while True:
+            with feed_lock:
+                job = next(feed, None)
+            if job is None:
+                return
+            query, (nprobe, ef_search) = job
+            start = time.perf_counter()
+            try:
+                got = fingerprint(rag.search(query, k, nprobe=nprobe, ef_search=ef_search))
+                error = None
+            except Exception as e:
+                got, error = None, repr(e)
+            elapsed = time.perf_counter() - start
+            with record_lock:
+                latencies.append(elapsed)
+                if error:
+                    errors.append(error)
+                elif got != expected[job]:
+                    mismatches.append({"query": query[:60], "nprobe": nprobe, "ef_search": ef_search})
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    return dict(latency_summary(latencies), concurrency=concurrency, requests=len(latencies),
+                qps=round(len(latencies) / wall, 1), mismatches=len(mismatches), errors=len(errors),
+                examples=(mismatches + errors)[:3])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-folder", default=DEFAULT_DATA_FOLDER)
+    parser.add_argument("--index-dir", default=None, help="Reuse/build the index here (default: a temp dir)")
+    parser.add_argument("--factory", default="IVF64,Flat", help="FAISS_INDEX_FACTORY for the stress index")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--requests", type=int, default=1000, help="Searches per level and mode")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=["executor", "inline"], choices=["executor", "inline"])
+    parser.add_argument("--min-qps-ratio", type=float, default=0.7)
+    parser.add_argument("--real-embedder", action="store_true")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    # Inherited by the spawned index builder
+    os.environ["FAISS_INDEX_FACTORY"] = args.factory
+    from .offline import load_offline_pipeline
+    from src.search_executor import SearchExecutor
+
+    index_dir = args.index_dir or tempfile.mkdtemp(prefix="rag_stress_")
+    rag = load_offline_pipeline(args.data_folder, index_dir=index_dir, fake_embedder=not args.real_embedder)
+    rag.warmup()
+    configured = rag.search_executor
+    store = rag.vector_store
+    print(f"index {store.factory} ({store.index_kind}), {len(store.documents)} chunks; executor budget {configured.budget}")
+
+    jobs = [(q, variant) for q in load_queries() for variant in PARAM_VARIANTS]
+    expected = {job: fingerprint(rag.search(job[0], args.k, nprobe=job[1][0], ef_search=job[1][1])) for job in jobs}
+    distinct = sum(len({expected[(q, v)] for v in PARAM_VARIANTS}) > 1 for q in load_queries())
+    print(f"{len(jobs)} jobs; {distinct} queries whose results depend on the per-call parameters")
+
+    failures, modes = [], {}
+    for mode in args.modes:
+        rag.search_executor = configured if mode == "executor" else SearchExecutor(workers=0)
+        levels = []
+        for concurrency in args.levels:
+            level = run_level(rag, jobs, expected, concurrency, args.requests, args.k)
+            levels.append(level)
+            print(f"{mode:<9} c={concurrency:<4} {level['qps']:>8.1f} qps  p50 {level['p50']:>7.2f}ms  "
+                  f"p99 {level['p99']:>8.2f}ms  mismatches {level['mismatches']}  errors {level['errors']}")
+            if level["mismatches"] or level["errors"]:
+                failures.append(f"{mode} c={concurrency}: {level['mismatches']} mismatches, {level['errors']} errors, "
+                                f"e.g. {level['examples'][:1]}")
+        modes[mode] = levels
+    rag.search_executor = configured
+
+    if "executor" in modes:
+        best = max(level["qps"] for level in modes["executor"])
+        last = modes["executor"][-1]
+        if last["qps"] < best * args.min_qps_ratio:
+            failures.append(f"executor QPS at c={last['concurrency']} is {last['qps']} vs best {best}")
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    config["budget"] = configured.budget
+    result = write_result("concurrency_stress", config, {
+        "factory": store.factory, "chunks": len(store.documents), "param_dependent_queries": distinct,
+        "modes": modes, "failures": failures,
+    }, args.output)
+    print(f"Results written to {result['_path']}")
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""Bytes of message debug with context previews vs chunk references, sampled traces and the migration.
+
+    python -m benchmarks.debug_storage_bench --index-dir /tmp/rag_bench_index
+    python -m benchmarks.debug_storage_bench --sessions 16 --turns 10 --sample-rate 0.2
+
+Runs --turns chats in each of --sessions sessions (half with history) through the offline
+pipeline with TRACE_SAMPLE_RATE=--sample-rate. Every chat asks for its trace, so the previews
+the previous layout stored come back in the response. Byte counts are BSON sizes:
+
+    debug/turn     message_debug bytes per assistant turn: previews (previous) vs chunk references
+    traces         chat_traces bytes per sampled turn: raw JSON vs compressed, per available codec
+
+Then writes the previous layout into a fresh database and runs migrate_debug.py against it.
+Checks:
+    - every reference resolves to the chunks that were prompted;
+    - references survive garbage collection of their index version;
+    - the migration resolves every preview, and the judge's context is rebuilt from the
+      references as it was from the previews;
+    - stored traces decompress to the turn.
+Prints OK, or the failed expectations.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from .common import load_benchmark, write_result
+from .fakes import FakeMongoClient, doc_size
+from .offline import DEFAULT_DATA_FOLDER
+
+logger = logging.getLogger("benchmarks.debug_storage_bench")
+
+PREVIEWS = ("conversation_context_preview", "retrieved_context_preview")
+# Added to the response by trace=True, never stored
+RESPONSE_ONLY = ("trace", "stage_ms", "trace_id") + PREVIEWS
+
+
+def debug_doc_size(debug: Dict) -> int:
+    """BSON size of a message_debug document holding `debug`."""
+    return doc_size({"_id": "0" * 24, "session_id": "0" * 36, "created_at": datetime(2026, 1, 1), "debug": debug})
+
+
+def chat_turns(rag, sessions: int, turns: int, questions: List[str]) -> List[Dict]:
+    """Debug as returned, as stored, and as the previous layout stored it, of every retrieval turn."""
+    cm, out = rag.conversation_manager, []
+    for s in range(sessions):
+        sid = cm.create_session()
+        for t in range(turns):
+            query = "hello" if t == 0 else questions[(s * turns + t) % len(questions)]
+            debug = rag.chat(sid, query, include_history=s % 2 == 0, trace=True)["debug"]
+            if debug.get("route") == "greeting":
+                continue
+            stored = {k: v for k, v in debug.items() if k not in RESPONSE_ONLY}
+            previous = {k: v for k, v in debug.items() if k not in RESPONSE_ONLY or k in PREVIEWS}
+            for k in ("retrieved_chunks", "context_chars"):
+                previous.pop(k)
+            out.append({"session_id": sid, "debug": debug, "stored": stored, "previous": previous})
+    return out
+
+
+def check_refs(resolver, turns: List[Dict]) -> List[str]:
+    """Each preview piece must be found in the referenced chunk at its position."""
+    failures = []
+    for i, turn in enumerate(turns):
+        refs = turn["debug"]["retrieved_chunks"]
+        texts = resolver.texts(refs)
+        pieces = [p for p in turn["previous"]["retrieved_context_preview"].split("\n\n") if p]
+        if len(texts) != len(refs["ids"]) or None in refs["ids"]:
+            failures.append(f"refs: turn {i}: {len(texts)} of {len(refs['ids'])} chunks resolved")
+            continue
+        for piece, text in zip(pieces, texts):
+            # Overlap trimming removes a few words at either end, the preview limit cuts the last piece
+            probe = piece[len(piece) // 4: len(piece) // 4 + 80]
+            if probe not in text:
+                failures.append(f"refs: turn {i}: a prompted chunk is not the referenced one")
+                break
+    return failures
+
+
+def check_gc(resolver, turns: List[Dict]) -> List[str]:
+    refs = dict(turns[0]["debug"]["retrieved_chunks"], index_version="20000101T000000-gone00")
+    if resolver.texts(refs) != resolver.texts(turns[0]["debug"]["retrieved_chunks"]):
+        return ["gc: references to a removed index version did not resolve by content key"]
+    return []
+
+
+def check_traces(rag, traces) -> (Dict, List[str]):
+    from src.trace_store import TraceStore
+
+    docs = list(traces.find({}))
+    failures, stats = [], {"sampled": len(docs)}
+    if not docs:
+        return stats, ["traces: nothing was sampled"]
+    stats["raw/turn"] = sum(d["raw_bytes"] for d in docs) / len(docs)
+    stats[f"{rag.trace_store.codec}/turn"] = sum(doc_size(d) for d in docs) / len(docs)
+    for codec in rag.trace_store.codecs:
+        if codec != rag.trace_store.codec:
+            store = TraceStore(lambda: traces, codec=codec)
+            stats[f"{codec}/turn"] = sum(doc_size(dict(d, **store.encode(rag.trace_store.load(d["_id"])))) for d in docs) / len(docs)
+    for doc in docs[:20]:
+        trace = rag.trace_store.load(doc["_id"])
+        message = rag.conversation_manager.messages.find_one({"_id": doc["_id"]})
+        if message is None or trace.get("response") != message["text"] or not trace.get("spans"):
+            failures.append(f"traces: trace of message {doc['_id']} does not match its turn")
+            break
+    return stats, failures
+
+
+def check_migration(rag, resolver, turns: List[Dict]) -> (Dict, List[str]):
+    """The previous layout in a fresh database, half of it inline on messages, migrated."""
+    from migrate_debug import PreviewMatcher, migrate
+    from src.evaluation_engine import EvaluationEngine
+
+    db = FakeMongoClient()["debug_migration"]
+    messages, message_debug = db.get_collection("messages"), db.get_collection("message_debug")
+    for i, turn in enumerate(turns):
+        user = {"session_id": turn["session_id"], "sender": "user", "text": f"question {i}"}
+        reply = {"session_id": turn["session_id"], "sender": "assistant", "text": f"answer {i}"}
+        at = datetime(2026, 1, 1) + timedelta(minutes=i)
+        messages.insert_one(dict(user, created_at=at))
+        if i % 2:
+            messages.insert_one(dict(reply, created_at=at, debug=turn["previous"]))
+        else:
+            reply_id = messages.insert_one(dict(reply, created_at=at, route="open")).inserted_id
+            message_debug.insert_one({"_id": reply_id, "session_id": turn["session_id"], "created_at": at,
+                                      "debug": turn["previous"]})
+    engine = EvaluationEngine(None, db, chunks=resolver)
+    before = {t["turn_id"]: t["context"] for t in engine.turns()}
+
+    version, _ = resolver.manifest.current()
+    counts = migrate(db, PreviewMatcher(version, resolver.documents(version)), 50, False, False)
+    after = {t["turn_id"]: t["context"] for t in engine.turns()}
+    failures = []
+    if counts["unresolved"]:
+        failures.append(f"migration: {counts['unresolved']} previews had unresolved chunks")
+    if messages.count_documents({"debug": {"$exists": True}}) or message_debug.count_documents({}) != len(turns):
+        failures.append("migration: inline debug left on messages, or missing from message_debug")
+    if any("retrieved_context_preview" in d["debug"] for d in message_debug.find({})):
+        failures.append("migration: previews left in message_debug")
+    for turn_id, context in before.items():
+        # The judge now gets the whole chunks the preview was cut from
+        if not after.get(turn_id) or not after[turn_id].startswith(context.split("\n\n")[0][:200]):
+            failures.append(f"migration: judge context of turn {turn_id} changed")
+            break
+    if counts["bytes_after"] >= counts["bytes_before"]:
+        failures.append("migration: debug did not get smaller")
+    # A preview with a piece the index no longer has is kept, and left alone by the next run
+    stale = "A chunk of a document that is no longer indexed. " * 4
+    message_debug.insert_one({"_id": "stale", "session_id": "stale", "created_at": datetime(2026, 1, 1),
+                              "debug": {"retrieved_context_preview": turns[0]["previous"]["retrieved_context_preview"]
+                                        .split("\n\n")[0] + "\n\n" + stale + "\n\nend"}})
+    first = migrate(db, PreviewMatcher(version, resolver.documents(version)), 50, False, False)
+    rerun = migrate(db, PreviewMatcher(version, resolver.documents(version)), 50, False, False)
+    kept = message_debug.find_one({"_id": "stale"})["debug"]
+    if first["message_debug"] != 1 or first["unresolved"] != 1 or "retrieved_context_preview" not in kept:
+        failures.append(f"migration: a preview with an unindexed chunk was not kept ({first})")
+    if rerun["message_debug"]:
+        failures.append(f"migration: a rerun visited {rerun['message_debug']} migrated entries again")
+    return counts, failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-folder", default=DEFAULT_DATA_FOLDER)
+    parser.add_argument("--index-dir", default=None)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=8, help="Chats per session")
+    parser.add_argument("--sample-rate", type=float, default=0.25, help="TRACE_SAMPLE_RATE")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    from .offline import load_offline_pipeline
+    from src.chunk_refs import ChunkResolver
+
+    rag = load_offline_pipeline(args.data_folder, index_dir=args.index_dir, llm_latency_ms=0.0)
+    rag.warmup()
+    rag.trace_store.sample_rate = args.sample_rate
+    cm = rag.conversation_manager
+    traces = cm.db.get_collection("chat_traces")
+    questions = [item["query"] for item in load_benchmark()]
+    resolver = ChunkResolver(rag.index_dir)
+
+    turns = chat_turns(rag, args.sessions, args.turns, questions)
+    new = sum(debug_doc_size(t["stored"]) for t in turns) / len(turns)
+    old = sum(debug_doc_size(t["previous"]) for t in turns) / len(turns)
+    trace_stats, failures = check_traces(rag, traces)
+    failures = check_refs(resolver, turns) + check_gc(resolver, turns) + failures
+    migration, migration_failures = check_migration(rag, resolver, turns)
+    failures += migration_failures
+
+    print(f"{len(turns)} retrieval turns in {args.sessions} sessions (bytes)")
+    print(f"debug/turn     previews {old:>8.0f}   chunk refs {new:>8.0f}   {new / old - 1:+.1%}")
+    codecs = ", ".join(f"{k} {v:.0f}" for k, v in trace_stats.items() if k.endswith("/turn"))
+    print(f"traces         {trace_stats['sampled']} sampled at {args.sample_rate:.0%}: {codecs}")
+    print(f"migration      {migration['message_debug']} message_debug + {migration['moved_inline']} inline: "
+          f"{migration['bytes_before']} -> {migration['bytes_after']} debug bytes")
+    print("OK" if not failures else "FAILED:\n  " + "\n  ".join(failures))
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("debug_storage_bench", config, {
+        "debug_per_turn": {"previews": old, "chunk_refs": new}, "traces": trace_stats, "migration": migration,
+        "failures": failures}, args.output)
+    print(f"Results written to {result['_path']}")
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""Index size and prompt tokens with and without chunk deduplication and query-time diversity.
+
+    python -m benchmarks.dedup_bench
+    python -m benchmarks.dedup_bench --real-embedder --thresholds 0.7 0.85 0.95
+
+Index time: the corpus is chunked once and deduplicated at each --thresholds value
+(exact + MinHash near-duplicates), reporting chunks kept. Two indexes are then built:
+DEDUP_ENABLED=0 (the previous behaviour) and DEDUP_ENABLED=1 at DEDUP_THRESHOLD.
+
+Query time: every benchmark query goes through RAGPipeline.retrieve_chunks for
+
+    baseline    undeduplicated index, DIVERSITY_ENABLED=0
+    dedup       deduplicated index, DIVERSITY_ENABLED=0
+    dedup+mmr   deduplicated index, MMR diversity and overlap trimming before packing
+
+reporting Hit@3, chunks and tokens per prompt, near-duplicate pairs inside prompts
+(estimated Jaccard >= --pair-similarity, or a shared chunk-overlap window) and latency.
+"""
+import argparse
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from .common import latency_summary, load_benchmark, write_result
+from .offline import DEFAULT_DATA_FOLDER
+
+logger = logging.getLogger("benchmarks.dedup_bench")
+
+
+def duplicate_pairs(chunks: List[str], pair_similarity: float, overlap_words: int) -> int:
+    from src.dedup import minhash, similarity
+
+    sigs = [minhash(c) for c in chunks]
+    words = [c.split() for c in chunks]
+    count = 0
+    for i, j in itertools.combinations(range(len(chunks)), 2):
+        shared_window = overlap_words and len(words[i]) > overlap_words and len(words[j]) > overlap_words and (
+            words[i][-overlap_words:] == words[j][:overlap_words] or words[j][-overlap_words:] == words[i][:overlap_words])
+        if shared_window or similarity(sigs[i], sigs[j]) >= pair_similarity:
+            count += 1
+    return count
+
+
+def run_queries(rag, benchmark: List[Dict], k: int, pair_similarity: float) -> Dict:
+    overlap = rag.document_processor.chunk_overlap
+    latencies, hit3, chunks, chars, dup_pairs = [], 0, 0, 0, 0
+    for item in benchmark:
+        start = time.perf_counter()
+        selected = rag.retrieve_chunks(item["query"], k)
+        latencies.append(time.perf_counter() - start)
+        hit3 += any(kw.lower() in c.lower() for c in selected[:3] for kw in item["gold_keywords"])
+        chunks += len(selected)
+        chars += sum(len(c) for c in selected)
+        dup_pairs += duplicate_pairs(selected, pair_similarity, overlap)
+    n = max(1, len(benchmark))
+    return dict(
+        latency_summary(latencies),
+        **{"hit@3": round(hit3 / n, 4)},
+        chunks_per_prompt=round(chunks / n, 2),
+        tokens_per_prompt=round(chars / 4 / n, 1),
+        duplicate_pairs_per_prompt=round(dup_pairs / n, 3),
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-folder", default=DEFAULT_DATA_FOLDER)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.7, 0.85, 0.95])
+    parser.add_argument("--threshold", type=float, default=None, help="DEDUP_THRESHOLD of the dedup index (default: env or 0.85)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--pair-similarity", type=float, default=0.5)
+    parser.add_argument("--real-embedder", action="store_true")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    from .offline import load_offline_pipeline
+    from src.dedup import dedupe_chunks
+    from src.document_processor import DocumentProcessor
+    from src.faiss_index import index_nbytes
+
+    chunks = DocumentProcessor().process_documents(args.data_folder)
+    index_time = []
+    for threshold in args.thresholds:
+        start = time.perf_counter()
+        _, _, stats = dedupe_chunks(chunks, threshold)
+        index_time.append(dict(stats, threshold=threshold, seconds=round(time.perf_counter() - start, 2)))
+        print(f"threshold {threshold:.2f}: {stats['chunks_kept']}/{stats['chunks_in']} chunks kept "
+              f"({stats['exact_duplicates']} exact, {stats['near_duplicates']} near duplicates)")
+
+    if args.threshold is not None:
+        os.environ["DEDUP_THRESHOLD"] = str(args.threshold)
+    pipelines = {}
+    for name, enabled in (("raw", "0"), ("dedup", "1")):
+        # Read by the spawned index builder
+        os.environ["DEDUP_ENABLED"] = enabled
+        rag = load_offline_pipeline(args.data_folder, index_dir=tempfile.mkdtemp(prefix=f"rag_dedup_{name}_"),
+                                    fake_embedder=not args.real_embedder)
+        rag.warmup()
+        pipelines[name] = rag
+        store = rag.vector_store
+        print(f"{name} index: {len(store.documents)} chunks, {index_nbytes(store.index) / 2**20:.1f} MiB")
+
+    benchmark = load_benchmark()
+    rows = []
+    for config, index, diversity in (("baseline", "raw", False), ("dedup", "dedup", False), ("dedup+mmr", "dedup", True)):
+        rag = pipelines[index]
+        rag.diversity_enabled = diversity
+        row = dict(run_queries(rag, benchmark, args.k, args.pair_similarity), config=config,
+                   index_chunks=len(rag.vector_store.documents),
+                   index_mib=round(index_nbytes(rag.vector_store.index) / 2**20, 2))
+        rows.append(row)
+
+    print(f"\n{'config':<10} {'chunks':>7} {'MiB':>6} {'hit@3':>6} {'per prompt: chunks':>19} {'tokens':>7} "
+          f"{'dup pairs':>9} {'p50 ms':>7} {'p95 ms':>7}")
+    for row in rows:
+        print(f"{row['config']:<10} {row['index_chunks']:>7} {row['index_mib']:>6.2f} {row['hit@3']:>6.3f} "
+              f"{row['chunks_per_prompt']:>19.2f} {row['tokens_per_prompt']:>7.0f} "
+              f"{row['duplicate_pairs_per_prompt']:>9.3f} {row['p50']:>7.2f} {row['p95']:>7.2f}")
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("dedup_bench", config, {"index_time": index_time, "rows": rows}, args.output)
+    print(f"Results written to {result['_path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""Embedding backend benchmark and cosine parity check against the fp32 PyTorch model.
+
+    python -m benchmarks.embedding_bench --backends torch torch-int8 onnx onnx-int8 --threads 1
+    python -m benchmarks.embedding_bench --backends onnx-int8 --min-cosine 0.98   # CI parity gate
+
+Each backend is loaded in a fresh spawned process, so load time and the RSS it adds are measured
+in isolation. Reported per backend: load time and memory, single-query encode latency (the serving
+pattern), batch encode throughput, cosine similarity to the reference vectors (mean / p1 / min)
+and recall@k of a search over its vectors vs exact search over the reference vectors, for every
+--storage codec (float32 / fp16 / sq8). Exits 1 when a backend's min cosine is below --min-cosine.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from .common import RAG_ROOT, latency_summary, load_queries, percentile, rss_mb, write_result
+
+logger = logging.getLogger("benchmarks.embedding_bench")
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def load_corpus(index_dir: str = None, max_docs: int = 2000) -> List[str]:
+    docs_path = os.path.join(index_dir, "docs.pkl") if index_dir else None
+    if docs_path and os.path.exists(docs_path):
+        with open(docs_path, "rb") as f:
+            docs = pickle.load(f)
+    else:
+        from src.document_processor import DocumentProcessor
+        docs = DocumentProcessor().process_documents(os.path.join(RAG_ROOT, "data"))
+    return docs[:max_docs]
+
+
+def encode_worker(model_name: str, backend: str, threads: int, docs: List[str], queries: List[str],
+                  repeat: int) -> Dict:
+    """Runs in a spawned child: load one backend, time it and return its vectors."""
+    if RAG_ROOT not in sys.path:
+        sys.path.insert(0, RAG_ROOT)
+    from src.embeddings import load_encoder
+
+    rss_start = rss_mb()
+    start = time.perf_counter()
+    model = load_encoder(model_name, backend, threads)
+    load_s = time.perf_counter() - start
+    rss_loaded = rss_mb()
+
+    def encode(texts, batch_size=32):
+        return np.asarray(model.encode(texts, batch_size=batch_size, convert_to_numpy=True,
+                                       show_progress_bar=False), dtype=np.float32)
+
+    encode(queries[:2])  # warm-up: lazy kernels, ORT session allocations
+    latencies = []
+    for _ in range(repeat):
+        for q in queries:
+            t0 = time.perf_counter()
+            encode([q])
+            latencies.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    doc_vecs = encode(docs, batch_size=64)
+    batch_s = time.perf_counter() - t0
+    return {
+        "backend": getattr(model, "embedding_backend", backend),
+        "load_s": round(load_s, 3),
+        "model_rss_mb": round(rss_loaded - rss_start, 1),
+        "peak_rss_mb": round(rss_mb(), 1),
+        "query_latency_ms": latency_summary(latencies),
+        "docs_per_s": round(len(docs) / batch_s, 1) if batch_s else 0.0,
+        "doc_vecs": doc_vecs,
+        "query_vecs": encode(queries),
+    }
+
+
+def normalized(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.where(norms == 0, 1.0, norms)
+
+
+def cosine_parity(ref: np.ndarray, cand: np.ndarray) -> Dict[str, float]:
+    cos = np.sort(np.sum(normalized(ref) * normalized(cand), axis=1))
+    return {
+        "mean": round(float(cos.mean()), 5),
+        "p1": round(float(percentile(cos.tolist(), 1)), 5),
+        "min": round(float(cos[0]), 5),
+    }
+
+
+def storage_recall(ref_docs: np.ndarray, ref_queries: np.ndarray, docs: np.ndarray, queries: np.ndarray,
+                   storage: str, k: int) -> Dict:
+    """recall@k of a (codec-compressed) flat index over `docs` vs exact search over the reference."""
+    import faiss
+    from src.faiss_index import apply_storage, build_index, index_nbytes
+
+    exact = faiss.IndexFlatIP(ref_docs.shape[1])
+    exact.add(normalized(ref_docs))
+    _, truth = exact.search(normalized(ref_queries), k)
+    factory = apply_storage("Flat", storage)
+    index = build_index(normalized(docs), factory)
+    _, ids = index.search(normalized(queries), k)
+    hits = sum(len(set(a) & set(b)) for a, b in zip(ids, truth))
+    return {
+        "factory": factory,
+        "bytes_per_vector": round(index_nbytes(index) / len(docs), 1),
+        f"recall@{k}": round(hits / float(len(truth) * k), 4),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx", "onnx-int8"])
+    parser.add_argument("--reference", default="torch", help="Backend the others are compared to")
+    parser.add_argument("--threads", type=int, default=None, help="EMBEDDING_THREADS for every backend")
+    parser.add_argument("--storage", nargs="+", default=["float32", "fp16", "sq8"])
+    parser.add_argument("--index-dir", default=None, help="Read corpus chunks from <dir>/docs.pkl")
+    parser.add_argument("--max-docs", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the queries for latency")
+    parser.add_argument("--min-cosine", type=float, default=0.98, help="Parity threshold on the minimum cosine")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    if RAG_ROOT not in sys.path:
+        sys.path.insert(0, RAG_ROOT)
+    docs = load_corpus(args.index_dir, args.max_docs)
+    queries = load_queries()
+    backends = [args.reference] + [b for b in args.backends if b != args.reference]
+
+    runs = {}
+    ctx = multiprocessing.get_context("spawn")
+    for backend in backends:
+        with ctx.Pool(1) as pool:
+            runs[backend] = pool.apply(encode_worker, (args.model, backend, args.threads, docs, queries, args.repeat))
+        if runs[backend]["backend"] != backend:
+            print(f"note: {backend} fell back to {runs[backend]['backend']}")
+
+    ref = runs[args.reference]
+    rows, failures = [], []
+    print(f"{len(docs)} chunks, {len(queries)} queries, threads={args.threads or 'default'}, k={args.k}")
+    print(f"{'backend':<11} {'load_s':>6} {'RSS_MB':>7} {'q_p50ms':>8} {'q_p95ms':>8} {'docs/s':>8} "
+          f"{'cos_mean':>8} {'cos_min':>8} | " + " ".join(f"{s:>8}" for s in args.storage))
+    for backend in backends:
+        run = runs[backend]
+        parity = cosine_parity(np.vstack([ref["doc_vecs"], ref["query_vecs"]]),
+                               np.vstack([run["doc_vecs"], run["query_vecs"]]))
+        storage = {s: storage_recall(ref["doc_vecs"], ref["query_vecs"], run["doc_vecs"], run["query_vecs"], s, args.k)
+                   for s in args.storage}
+        if parity["min"] < args.min_cosine:
+            failures.append(f"{backend}: min cosine {parity['min']} < {args.min_cosine}")
+        rows.append({
+            "backend": backend,
+            "effective_backend": run["backend"],
+            "load_s": run["load_s"],
+            "model_rss_mb": run["model_rss_mb"],
+            "peak_rss_mb": run["peak_rss_mb"],
+            "query_latency_ms": run["query_latency_ms"],
+            "docs_per_s": run["docs_per_s"],
+            "cosine": parity,
+            "storage": storage,
+        })
+        lat = run["query_latency_ms"]
+        print(f"{backend:<11} {run['load_s']:>6.2f} {run['model_rss_mb']:>7.1f} {lat['p50']:>8.2f} {lat['p95']:>8.2f} "
+              f"{run['docs_per_s']:>8.0f} {parity['mean']:>8.4f} {parity['min']:>8.4f} | "
+              + " ".join(f"{storage[s][f'recall@{args.k}']:>8.3f}" for s in args.storage))
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("embedding_bench", config, {
+        "n_docs": len(docs), "n_queries": len(queries), "rows": rows, "parity_failures": failures,
+    }, args.output)
+    print(f"Results written to {result['_path']}")
+    for failure in failures:
+        print(f"PARITY FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+"""Offline check of the batch evaluation engine against a stubbed judge with injected failures.
+
+    python -m benchmarks.eval_engine_check
+    python -m benchmarks.eval_engine_check --turns 400 --concurrency 16 --rpm 6000
+
+Seeds fake `messages` with --turns chat turns (plus greetings, which must be skipped) and
+runs src.evaluation_engine.EvaluationEngine over them with the fake LLM, where per turn:
+
+    rate limit   first attempt raises a 429 with retry-after (--rate-limited share)
+    bad JSON     first attempt returns truncated JSON (--flaky-json share), then valid JSON
+    fenced       JSON inside a code fence with "4/5"-style scores (must parse)
+    broken       every attempt returns prose (--broken share) -> status "invalid"
+
+The run is interrupted after --interrupt-at turns and resumed with the same run id. Checks:
+every turn has exactly one record, no finished turn is judged again after the resume, the
+request rate stays under --rpm, and results were bulk-written. Also reports turns/sec of
+concurrency 1 against --concurrency.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from .common import write_result
+
+logger = logging.getLogger("benchmarks.eval_engine_check")
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__("rate limit reached")
+        self.response = SimpleNamespace(status_code=429, headers={"retry-after": str(retry_after)})
+
+
+class FlakyJudge:
+    """`client.chat.completions.create` over the fake LLM, failing per turn as the module docstring describes."""
+
+    def __init__(self, latency_ms: float, shares: dict, retry_after: float):
+        from src.fake_llm import FakeCompletions
+
+        self._inner = FakeCompletions(latency_ms=latency_ms)
+        self.shares = shares
+        self.retry_after = retry_after
+        self.calls = {}
+        self.call_times = []
+        self.chat = SimpleNamespace(completions=self)
+
+    @staticmethod
+    def query_of(prompt: str) -> str:
+        return prompt.split("**USER QUERY:**", 1)[-1].split("**", 1)[0].strip()
+
+    def kind(self, query: str) -> str:
+        # Deterministic per turn
+        bucket = int(hashlib.md5(query.encode("utf-8")).hexdigest()[:8], 16) / 0xFFFFFFFF
+        edge = 0.0
+        for kind in ("rate_limited", "flaky_json", "fenced", "broken"):
+            edge += self.shares[kind]
+            if bucket < edge:
+                return kind
+        return "ok"
+
+    def create(self, messages=None, **kwargs):
+        query = self.query_of(messages[-1]["content"])
+        self.calls[query] = self.calls.get(query, 0) + 1
+        self.call_times.append(time.monotonic())
+        attempt, kind = self.calls[query], self.kind(query)
+        if kind == "rate_limited" and attempt == 1:
+            raise RateLimited(self.retry_after)
+        resp = self._inner.create(messages=messages, **kwargs)
+        content = resp.choices[0].message.content
+        if kind == "flaky_json" and attempt == 1:
+            content = content[: len(content) // 2]
+        elif kind == "fenced":
+            data = json.loads(content)
+            data["clarity"]["score"] = "4/5"
+            content = "Here is my assessment:\n```json\n" + json.dumps(data) + "\n```"
+        elif kind == "broken":
+            content = "The response is generally good but could cite more sources."
+        resp.choices[0].message.content = content
+        return resp
+
+
+def seed_messages(db, turns: int, greetings: int):
+    messages = db.get_collection("messages")
+    start = datetime(2026, 1, 1)
+    for i in range(turns + greetings):
+        session = f"session-{i % 25}"
+        at = start + timedelta(minutes=i)
+        greeting = i >= turns
+        query = "hello" if greeting else f"Question {i}: what does Article {i % 40 + 1} say about bail?"
+        debug = {"note": "retrieval_skipped_greeting"} if greeting else {"retrieved_context_preview": f"Article {i % 40 + 1} ... " * 20}
+        messages.insert_one({"session_id": session, "sender": "user", "text": query, "created_at": at})
+        reply = {"session_id": session, "sender": "assistant", "text": f"Answer {i} citing Article {i % 40 + 1}.",
+                 "created_at": at + timedelta(seconds=1)}
+        if i % 2:
+            # Written before debug moved to message_debug
+            messages.insert_one(dict(reply, debug=debug))
+            continue
+        reply_id = messages.insert_one(dict(reply, route="greeting" if greeting else "open")).inserted_id
+        db.get_collection("message_debug").insert_one({"_id": reply_id, "session_id": session,
+                                                       "created_at": reply["created_at"], "debug": debug})
+
+
+def interrupt_after(turns, n: int):
+    for i, turn in enumerate(turns):
+        if i == n:
+            raise KeyboardInterrupt
+        yield turn
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--greetings", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=float, default=3000.0)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Judge latency")
+    parser.add_argument("--rate-limited", type=float, default=0.1)
+    parser.add_argument("--flaky-json", type=float, default=0.1)
+    parser.add_argument("--fenced", type=float, default=0.05)
+    parser.add_argument("--broken", type=float, default=0.03)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--interrupt-at", type=int, default=80)
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    from .fakes import FakeMongoClient
+    from src.evaluation_engine import EvaluationEngine
+    from src.llm_gateway import LLMGateway
+
+    shares = {"rate_limited": args.rate_limited, "flaky_json": args.flaky_json, "fenced": args.fenced, "broken": args.broken}
+    db = FakeMongoClient()["eval_check"]
+    seed_messages(db, args.turns, args.greetings)
+    evaluations = db.get_collection("evaluations")
+    bulk_writes = []
+    bulk_write = evaluations.bulk_write
+    evaluations.bulk_write = lambda requests, **kw: bulk_writes.append(len(requests)) or bulk_write(requests, **kw)
+    failures = []
+
+    judge = FlakyJudge(args.latency_ms, shares, args.retry_after)
+    engine = EvaluationEngine(LLMGateway(client=judge), db, run_id="check", concurrency=args.concurrency, rpm=args.rpm,
+                              max_retries=2, batch_size=25)
+    # Backoff kept short so the check runs in seconds
+    engine._backoff = lambda attempt: 0.01 * attempt
+    start = time.perf_counter()
+    try:
+        engine.run(interrupt_after(engine.turns(), args.interrupt_at))
+        failures.append("run was not interrupted")
+    except KeyboardInterrupt:
+        pass
+    first = {d["turn_id"]: d["query"] for d in evaluations.find({"run_id": "check", "status": {"$in": ["ok", "invalid"]}})}
+    calls_before = dict(judge.calls)
+    resumed = engine.run(engine.turns())
+    elapsed = time.perf_counter() - start
+
+    records = list(evaluations.find({"run_id": "check"}))
+    turn_ids = [r["turn_id"] for r in records]
+    if len(turn_ids) != args.turns or len(set(turn_ids)) != args.turns:
+        failures.append(f"{len(turn_ids)} records ({len(set(turn_ids))} unique) for {args.turns} turns")
+    if resumed["skipped"] != len(first):
+        failures.append(f"resume skipped {resumed['skipped']} turns, {len(first)} were finished")
+    rejudged = [q for q in first.values() if judge.calls[q] != calls_before[q]]
+    if rejudged:
+        failures.append(f"{len(rejudged)} finished turns judged again after the resume")
+    report = engine.report(worst=3)
+    status = report["status"]
+    expected_invalid = sum(1 for r in records if judge.kind(r["query"]) == "broken")
+    if status.get("invalid", 0) != expected_invalid:
+        failures.append(f"{status.get('invalid', 0)} invalid records, expected {expected_invalid}")
+    if status.get("error"):
+        failures.append(f"{status['error']} records ended in error")
+    window = judge.call_times
+    observed_rpm = (len(window) - 1) / max(1e-9, window[-1] - window[0]) * 60 if len(window) > 1 else 0.0
+    if observed_rpm > args.rpm * 1.1:
+        failures.append(f"request rate {observed_rpm:.0f}/min above --rpm {args.rpm:.0f}")
+    if evaluations.ops["insert"] or sum(bulk_writes) < len(records):
+        failures.append(f"results not bulk-written ({evaluations.ops['insert']} inserts, batches {bulk_writes})")
+    runs = db.get_collection("evaluation_runs").find_one({"run_id": "check"})
+    if runs["status"] != "finished":
+        failures.append(f"run status {runs['status']}")
+
+    throughput = {}
+    for concurrency in (1, args.concurrency):
+        db2 = FakeMongoClient()[f"eval_tp_{concurrency}"]
+        seed_messages(db2, min(args.turns, 60), 0)
+        clean = FlakyJudge(args.latency_ms, dict.fromkeys(shares, 0.0), args.retry_after)
+        tp_engine = EvaluationEngine(LLMGateway(client=clean), db2, run_id="tp", concurrency=concurrency, rpm=0)
+        t0 = time.perf_counter()
+        counts = tp_engine.run(tp_engine.turns())
+        throughput[concurrency] = round(counts["ok"] / (time.perf_counter() - t0), 1)
+
+    print(f"turns {args.turns}, finished before interrupt {len(first)}, resumed: {resumed}")
+    print(f"status {status}, retried {report['retried']}, mean attempts {report['mean_attempts']}, "
+          f"overall mean {report['overall'].get('mean')}")
+    print(f"bulk writes {len(bulk_writes)} (sizes {bulk_writes[:6]}{'...' if len(bulk_writes) > 6 else ''})")
+    print(f"judge calls {sum(judge.calls.values())}, observed rate {observed_rpm:.0f}/min (limit {args.rpm:.0f}), "
+          f"elapsed {elapsed:.2f}s")
+    print("turns/sec: " + ", ".join(f"concurrency {c}: {tp}" for c, tp in throughput.items()))
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    print("OK" if not failures else f"{len(failures)} check(s) failed")
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("eval_engine_check", config, {"report": report, "resumed": resumed, "throughput": throughput,
+                                                        "observed_rpm": round(observed_rpm, 1), "failures": failures},
+                          args.output)
+    print(f"Results written to {result['_path']}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
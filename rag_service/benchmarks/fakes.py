@@ -0,0 +1,411 @@
+"""Deterministic in-process stand-ins for MongoDB, the embedding model, the reranker and translation.
+
+They implement only the surface the RAG service uses, so the whole FastAPI app can be
+driven offline (no API key, no database, no model download) for latency benchmarks. The
+LLM stand-in ships with the service (src/fake_llm.py, LLM_BACKEND=fake).
+"""
+import copy
+import hashlib
+import itertools
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+# ------------------------------------------------------------------------- Mongo
+
+class _Id(str):
+    """Stand-in for bson.ObjectId: unique, ordered and str()-able."""
+    _counter = itertools.count(1)
+
+    def __new__(cls, value: str = None):
+        return super().__new__(cls, value if value is not None else f"{next(cls._counter):024x}")
+
+
+def _get(doc: Dict, dotted: str):
+    cur = doc
+    for part in dotted.split("."):
+        if not isinstance(cur, dict) or part not in cur:
+            return None
+        cur = cur[part]
+    return cur
+
+
+def _matches(doc: Dict, flt: Optional[Dict]) -> bool:
+    for key, cond in (flt or {}).items():
+        if key == "$or":
+            if not any(_matches(doc, sub) for sub in cond):
+                return False
+            continue
+        if key == "$and":
+            if not all(_matches(doc, sub) for sub in cond):
+                return False
+            continue
+        value = _get(doc, key)
+        if isinstance(cond, dict) and any(k.startswith("$") for k in cond):
+            for op, arg in cond.items():
+                if op == "$in" and value not in arg:
+                    return False
+                if op == "$nin" and value in arg:
+                    return False
+                if op == "$ne" and value == arg:
+                    return False
+                if op == "$exists" and (value is not None) != bool(arg):
+                    return False
+                if op in ("$lt", "$lte", "$gt", "$gte"):
+                    if value is None:
+                        return False
+                    if op == "$lt" and not value < arg:
+                        return False
+                    if op == "$lte" and not value <= arg:
+                        return False
+                    if op == "$gt" and not value > arg:
+                        return False
+                    if op == "$gte" and not value >= arg:
+                        return False
+        elif value != cond:
+            return False
+    return True
+
+
+def doc_size(doc: Dict) -> int:
+    """Bytes of `doc` as BSON (what Mongo stores and sends), or as compact JSON without pymongo."""
+    try:
+        import bson
+
+        return len(bson.encode(doc))
+    except ImportError:
+        return len(json.dumps(doc, default=str, separators=(",", ":")).encode("utf-8"))
+
+
+def _project(doc: Dict, projection: Optional[Dict]) -> Dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    exclude = {k for k, v in projection.items() if not v}
+    if include:
+        out = {k: copy.deepcopy(doc[k]) for k in include if k in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            out["_id"] = doc["_id"]
+        return out
+    return {k: copy.deepcopy(v) for k, v in doc.items() if k not in exclude}
+
+
+class FakeCursor:
+    def __init__(self, docs: List[Dict], collection: "FakeCollection" = None):
+        self._docs = docs
+        self._limit = 0
+        self._collection = collection
+
+    def sort(self, key, direction: int = 1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for k, d in reversed(keys):
+            self._docs.sort(key=lambda doc: (_get(doc, k) is not None, _get(doc, k)), reverse=d < 0)
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def __iter__(self):
+        docs = self._docs[: self._limit] if self._limit else self._docs
+        if self._collection is not None:
+            self._collection.bytes["read"] += sum(doc_size(d) for d in docs)
+        return iter(docs)
+
+
+class FakeCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self._docs: List[Dict] = []
+        self._lock = threading.Lock()
+        self.indexes: List = []
+        # Counters used by storage/volume benchmarks
+        self.ops = {"insert": 0, "find": 0, "update": 0, "delete": 0}
+        # Document bytes inserted / $set, and returned by reads (after projection and limit)
+        self.bytes = {"written": 0, "read": 0}
+
+    def create_index(self, keys, **kwargs):
+        self.indexes.append((keys, kwargs))
+        return kwargs.get("name", str(keys))
+
+    def drop_index(self, name: str):
+        self.indexes = [(k, kw) for k, kw in self.indexes if kw.get("name", str(k)) != name]
+
+    def expire(self, now) -> int:
+        """What Mongo's TTL monitor would do at `now`: delete documents past their TTL index's expiry."""
+        from datetime import timedelta
+
+        removed = 0
+        for keys, kwargs in self.indexes:
+            if "expireAfterSeconds" not in kwargs:
+                continue
+            horizon = now - timedelta(seconds=kwargs["expireAfterSeconds"])
+            removed += self.delete_many({keys: {"$lt": horizon}}).deleted_count
+        return removed
+
+    def insert_one(self, doc: Dict):
+        with self._lock:
+            doc.setdefault("_id", _Id())
+            self._docs.append(copy.deepcopy(doc))
+            self.ops["insert"] += 1
+            self.bytes["written"] += doc_size(doc)
+        return SimpleNamespace(inserted_id=doc["_id"], acknowledged=True)
+
+    def insert_many(self, docs: List[Dict], ordered: bool = True):
+        ids = [self.insert_one(d).inserted_id for d in docs]
+        return SimpleNamespace(inserted_ids=ids, acknowledged=True)
+
+    def find(self, flt: Optional[Dict] = None, projection: Optional[Dict] = None):
+        with self._lock:
+            self.ops["find"] += 1
+            docs = [_project(d, projection) for d in self._docs if _matches(d, flt)]
+        return FakeCursor(docs, self)
+
+    def find_one(self, flt: Optional[Dict] = None, projection: Optional[Dict] = None):
+        for doc in self.find(flt, projection).limit(1):
+            return doc
+        return None
+
+    def count_documents(self, flt: Optional[Dict] = None) -> int:
+        with self._lock:
+            return sum(1 for d in self._docs if _matches(d, flt))
+
+    def _apply_update(self, doc: Dict, update):
+        if isinstance(update, list):
+            # Aggregation pipeline update: $set stages, "$field" values copy another field
+            for stage in update:
+                for key, value in stage.get("$set", {}).items():
+                    doc[key] = _get(doc, value[1:]) if isinstance(value, str) and value.startswith("$") else value
+            return
+        for key, value in update.get("$set", {}).items():
+            doc[key] = copy.deepcopy(value)
+        for key, value in update.get("$setOnInsert", {}).items():
+            doc.setdefault(key, copy.deepcopy(value))
+        for key, value in update.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + value
+        for key in update.get("$unset", {}):
+            doc.pop(key, None)
+
+    def update_one(self, flt: Dict, update: Dict, upsert: bool = False):
+        with self._lock:
+            self.ops["update"] += 1
+            self.bytes["written"] += doc_size(update.get("$set", {}))
+            for doc in self._docs:
+                if _matches(doc, flt):
+                    self._apply_update(doc, {k: v for k, v in update.items() if k != "$setOnInsert"})
+                    return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+            if not upsert:
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+            doc = {k: v for k, v in flt.items() if not k.startswith("$") and not isinstance(v, dict)}
+            doc.setdefault("_id", _Id())
+            self._apply_update(doc, update)
+            self._docs.append(doc)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+
+    def update_many(self, flt: Dict, update: Dict, upsert: bool = False):
+        with self._lock:
+            self.ops["update"] += 1
+            n = 0
+            for doc in self._docs:
+                if _matches(doc, flt):
+                    self._apply_update(doc, update)
+                    n += 1
+        return SimpleNamespace(matched_count=n, modified_count=n, upserted_id=None)
+
+    def bulk_write(self, requests, ordered: bool = True):
+        """pymongo UpdateOne / InsertOne requests, read through their private fields."""
+        inserted = upserted = modified = 0
+        for request in requests:
+            if hasattr(request, "_filter"):
+                result = self.update_one(request._filter, request._doc, upsert=request._upsert)
+                upserted += result.upserted_id is not None
+                modified += result.modified_count
+            else:
+                self.insert_one(request._doc)
+                inserted += 1
+        return SimpleNamespace(inserted_count=inserted, upserted_count=upserted, modified_count=modified,
+                               acknowledged=True)
+
+    def delete_many(self, flt: Dict):
+        with self._lock:
+            self.ops["delete"] += 1
+            before = len(self._docs)
+            self._docs = [d for d in self._docs if not _matches(d, flt)]
+            return SimpleNamespace(deleted_count=before - len(self._docs))
+
+    def delete_one(self, flt: Dict):
+        with self._lock:
+            self.ops["delete"] += 1
+            for i, d in enumerate(self._docs):
+                if _matches(d, flt):
+                    del self._docs[i]
+                    return SimpleNamespace(deleted_count=1)
+        return SimpleNamespace(deleted_count=0)
+
+
+class FakeDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[str, FakeCollection] = {}
+        self._lock = threading.Lock()
+
+    def get_collection(self, name: str) -> FakeCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = FakeCollection(name)
+            return self._collections[name]
+
+    __getitem__ = get_collection
+
+
+class FakeMongoClient:
+    """Drop-in for `pymongo.MongoClient`; all clients in a process share the same databases."""
+
+    _databases: Dict[str, FakeDatabase] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getitem__(self, name: str) -> FakeDatabase:
+        with self._lock:
+            if name not in self._databases:
+                self._databases[name] = FakeDatabase(name)
+            return self._databases[name]
+
+    get_database = __getitem__
+
+    def close(self):
+        pass
+
+
+# --------------------------------------------------------------------- Embedding
+
+class HashingEncoder:
+    """Drop-in for `SentenceTransformer`: signed feature hashing of word uni/bi-grams.
+
+    Not semantically meaningful, but deterministic and with realistic lexical overlap,
+    which is enough to exercise FAISS and fusion code paths at production shapes.
+    Also stands in for `load_encoder`, which takes the model name the same way.
+    """
+
+    embedding_backend = "hashing"
+
+    def __init__(self, model_name_or_path: str = None, dim: int = 384, **kwargs):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def _encode_one(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        words = _words(text)
+        for feat in words + [a + "_" + b for a, b in zip(words, words[1:])]:
+            h = int(hashlib.blake2b(feat.encode("utf-8"), digest_size=8).hexdigest(), 16)
+            vec[h % self.dim] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True,
+               show_progress_bar: bool = False, normalize_embeddings: bool = False, **kwargs):
+        single = isinstance(sentences, str)
+        items = [sentences] if single else list(sentences)
+        out = np.vstack([self._encode_one(s) for s in items]) if items else np.zeros((0, self.dim), dtype=np.float32)
+        return out[0] if single else out
+
+
+class OverlapCrossEncoder:
+    """Drop-in for the reranker's `CrossEncoder`: scores a pair by the share of query terms in the passage.
+
+    `ms_per_pair` adds a per-pair delay so the reranker's latency budget can be exercised.
+    """
+
+    ms_per_pair = 0.0
+
+    def __init__(self, model_name_or_path: str = None, max_length: int = 256, **kwargs):
+        self.max_length = max_length
+
+    def predict(self, pairs, batch_size: int = 32, show_progress_bar: bool = False, **kwargs):
+        if self.ms_per_pair:
+            time.sleep(self.ms_per_pair * len(pairs) / 1000.0)
+        scores = []
+        for query, passage in pairs:
+            terms = {w for w in _words(query) if len(w) > 3}
+            words = set(_words(passage)[:self.max_length])
+            scores.append(len(terms & words) / len(terms) if terms else 0.0)
+        return np.asarray(scores, dtype=np.float32)
+
+
+# --------------------------------------------------------------------------- translation
+
+class FakeMarianTokenizer:
+    """Word-level stand-in for `MarianTokenizer` (ids come from a growing shared vocabulary)."""
+
+    model_max_length = 512
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {"<pad>": 0}
+        self._words: List[str] = ["<pad>"]
+        self._lock = threading.Lock()
+
+    def tokenize(self, text: str) -> List[str]:
+        return re.findall(r"[^\s.,;:!?()\u0964]+|[.,;:!?()\u0964]", text)
+
+    def _id(self, token: str) -> int:
+        with self._lock:
+            if token not in self._ids:
+                self._ids[token] = len(self._words)
+                self._words.append(token)
+            return self._ids[token]
+
+    def __call__(self, texts, return_tensors: str = "pt", padding: bool = True, truncation: bool = False,
+                 max_length: Optional[int] = None, **kwargs):
+        import torch
+
+        texts = [texts] if isinstance(texts, str) else list(texts)
+        rows = [[self._id(t) for t in self.tokenize(text)] for text in texts]
+        if truncation:
+            rows = [row[:max_length or self.model_max_length] for row in rows]
+        width = max((len(r) for r in rows), default=0)
+        ids = torch.tensor([r + [0] * (width - len(r)) for r in rows], dtype=torch.long)
+        return {"input_ids": ids, "attention_mask": (ids != 0).long()}
+
+    def batch_decode(self, sequences, skip_special_tokens: bool = True) -> List[str]:
+        return [" ".join(self._words[int(i)] for i in row if int(i) != 0) for row in sequences]
+
+    def decode(self, sequence, skip_special_tokens: bool = True) -> str:
+        return self.batch_decode([sequence], skip_special_tokens)[0]
+
+
+class FakeMarianModel:
+    """Stand-in for `MarianMTModel.generate`: echoes the input ids after a decoder-like delay.
+
+    One decoder step per output token of the longest row, each step a little dearer per extra row,
+    so batching similar-length sentences pays off roughly as it does with the real model.
+    """
+
+    ms_per_step = 0.5
+    batch_step_factor = 0.1
+
+    def generate(self, input_ids=None, attention_mask=None, max_new_tokens: int = 512, **kwargs):
+        steps = min(int(input_ids.shape[1]), max_new_tokens)
+        time.sleep(steps * self.ms_per_step * (1 + self.batch_step_factor * (int(input_ids.shape[0]) - 1)) / 1000.0)
+        return input_ids[:, :max_new_tokens]
+
+    def eval(self):
+        return self
+
+
+def load_fake_marian(model_name: str, int8: bool = False):
+    """Stands in for `translation_service.load_marian`."""
+    return FakeMarianTokenizer(), FakeMarianModel()
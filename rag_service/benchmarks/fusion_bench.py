@@ -0,0 +1,274 @@
+"""Ranking quality, chunks kept and fusion cost of each fusion mode, with calibrated score thresholds.
+
+    python -m benchmarks.fusion_bench --index-dir /tmp/rag_bench_index
+    python -m benchmarks.fusion_bench --real-embedder --index-dir ../vector_store --emit retrieval_config.json
+
+Every benchmark query is retrieved through HybridRetriever.search in each mode of src/fusion.py
+with the loaded retrieval config (alpha, rrf_k, candidate depth), k = --k. Chunks are graded as
+in benchmarks/sweep.py (fraction of the gold keywords they contain; nDCG's ideal ranking is
+pooled over the modes). Per mode:
+
+    ranking     hit@1, hit@k, MRR and nDCG of the top k
+    threshold   the mode's threshold (FUSION_THRESHOLDS, through score_floors) applied as
+                RAGPipeline.select_chunks does:
+                chunks kept per query, prompt characters saved, share of the top k's relevance kept
+    calibrated  the highest threshold that keeps --mass of the top k's relevance
+    fusion      time of the fuse() call alone
+
+Checks: fused scores are in [0, 1]; `rrf` ranks and scores every candidate as the previous
+per-document RRF loop did (up to its normalization); each mode's threshold keeps at least
+--min-mass of the relevance, and keeps a first place in either list that the other list missed;
+rrf's keeps a chunk only one list found down to the same rank in either list. --emit writes the mode with the best nDCG and
+its calibrated threshold into the retrieval config file (other keys are kept).
+Prints OK, or the failed expectations.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from .common import QUERIES_PATH, load_benchmark, latency_summary, write_result
+from .sweep import relevance, score_config
+
+logger = logging.getLogger("benchmarks.fusion_bench")
+
+
+def legacy_rrf(bm25_ids, vector_ids, alpha: float, rrf_k: int) -> Dict[int, float]:
+    """The per-document RRF loop HybridRetriever.search used before src/fusion.py (without pins)."""
+    scores: Dict[int, float] = {}
+    for rank, doc_idx in enumerate(bm25_ids):
+        scores[int(doc_idx)] = scores.get(int(doc_idx), 0) + 1 / (rrf_k + rank + 1)
+    for rank, doc_idx in enumerate(vector_ids):
+        scores[int(doc_idx)] = scores.get(int(doc_idx), 0) + alpha / (rrf_k + rank + 1)
+    return scores
+
+
+class FuseRecorder:
+    """Stands in for hybrid_retriever.fuse: times each call and keeps its inputs and span info."""
+
+    def __init__(self, fuse):
+        self.fuse = fuse
+        self.calls: List[Dict] = []
+
+    def __call__(self, bm25_all, bm25_ids, vector_ids, vector_scores, **kwargs):
+        start = time.perf_counter()
+        ids, scores, info = self.fuse(bm25_all, bm25_ids, vector_ids, vector_scores, **kwargs)
+        self.calls.append({"seconds": time.perf_counter() - start, "info": info, "kwargs": kwargs,
+                           "bm25_ids": np.asarray(bm25_ids), "vector_ids": list(vector_ids),
+                           "vector_scores": list(vector_scores), "ids": ids, "scores": scores})
+        return ids, scores, info
+
+
+def run_mode(retriever, recorder: FuseRecorder, benchmark: List[Dict], cfg: Dict, mode: str, k: int) -> Dict:
+    recorder.calls.clear()
+    per_query = []
+    for item in benchmark:
+        # Floors at threshold 1.0: the best score the lists that found each chunk can give it
+        results, bounds = retriever.search_with_floors(item["query"], k, alpha=cfg["alpha"], rrf_k=cfg["rrf_k"],
+                                                       candidate_multiplier=cfg["candidate_multiplier"],
+                                                       nprobe=cfg["nprobe"], ef_search=cfg["ef_search"], fusion=mode)
+        per_query.append({
+            "ids": [retriever._doc_to_idx.get(doc, -1) for doc, _ in results],
+            "grades": [relevance(doc, item["gold_keywords"]) for doc, _ in results],
+            "scores": [score for _, score in results],
+            "bounds": bounds,
+            "chars": [len(doc) for doc, _ in results],
+        })
+    return {"per_query": per_query, "calls": list(recorder.calls)}
+
+
+def kept(per_query: List[Dict], threshold: float, min_chunks: int) -> List[List[bool]]:
+    """Which of each query's top k select_chunks keeps at `threshold` (scores in config units)."""
+    masks = []
+    for q in per_query:
+        mask = [s >= threshold for s in q["scores"]]
+        if sum(mask) < min_chunks:
+            mask = [i < min_chunks for i in range(len(mask))]
+        masks.append(mask)
+    return masks
+
+
+def threshold_stats(per_query: List[Dict], threshold: float, min_chunks: int) -> Dict:
+    masks = kept(per_query, threshold, min_chunks)
+
+    def picked(values, mask):
+        return [v for v, m in zip(values, mask) if m]
+
+    total_mass = sum(sum(q["grades"]) for q in per_query)
+    kept_mass = sum(sum(picked(q["grades"], m)) for q, m in zip(per_query, masks))
+    total_chars = sum(sum(q["chars"]) for q in per_query)
+    kept_chars = sum(sum(picked(q["chars"], m)) for q, m in zip(per_query, masks))
+    hits = sum(any(g > 0 for g in q["grades"]) for q in per_query)
+    kept_hits = sum(any(g > 0 for g in picked(q["grades"], m)) for q, m in zip(per_query, masks))
+    return {
+        "threshold": round(threshold, 4),
+        "chunks_per_query": round(sum(map(sum, masks)) / max(1, len(masks)), 2),
+        "chars_saved": round(1 - kept_chars / total_chars, 4) if total_chars else 0.0,
+        "mass_kept": round(kept_mass / total_mass, 4) if total_mass else 1.0,
+        "hits_kept": round(kept_hits / hits, 4) if hits else 1.0,
+    }
+
+
+def calibrate(per_query: List[Dict], mass: float, min_chunks: int) -> float:
+    """Highest threshold (one of the observed scores) whose kept relevance is at least `mass`."""
+    scores = {round(s, 4) for q in per_query for s in q["scores"]}
+    for threshold in sorted(scores, reverse=True):
+        if threshold_stats(per_query, threshold, min_chunks)["mass_kept"] >= mass:
+            return threshold
+    return 0.0
+
+
+def check_rrf(calls: List[Dict], cfg: Dict) -> List[str]:
+    """Fused rrf scores are the previous loop's scores divided by a first place in every non-empty list."""
+    for n, call in enumerate(calls):
+        legacy = legacy_rrf(call["bm25_ids"], call["vector_ids"], cfg["alpha"], cfg["rrf_k"])
+        norm = (float(len(call["bm25_ids"]) > 0) + cfg["alpha"] * (len(call["vector_ids"]) > 0)) / (cfg["rrf_k"] + 1)
+        fused = dict(zip(call["ids"].tolist(), call["scores"].tolist()))
+        if set(fused) != set(legacy) or any(abs(fused[i] - s / norm) > 1e-9 for i, s in legacy.items()):
+            return [f"rrf: query {n} is not scored as by the per-document RRF loop"]
+    return []
+
+
+def passing(fuse, mode: str, cfg: Dict, bm25_ids: List[int], vector_ids: List[int], threshold: float) -> Dict[int, bool]:
+    """Whether each candidate of a synthetic query reaches `threshold`, as select_chunks decides."""
+    from src.fusion import score_floors
+
+    n = len(bm25_ids) + len(vector_ids)
+    bm25_all = np.zeros(n)
+    bm25_all[bm25_ids] = np.arange(len(bm25_ids), 0, -1, dtype=float)
+    vector_scores = np.linspace(0.8, 0.4, len(vector_ids))
+    ids, scores, _ = fuse(bm25_all, bm25_ids, vector_ids, vector_scores, mode=mode, alpha=cfg["alpha"], rrf_k=cfg["rrf_k"])
+    floors = score_floors(mode, threshold, cfg["alpha"], np.isin(ids, bm25_ids), np.isin(ids, vector_ids))
+    return {int(i): s >= f for i, s, f in zip(ids, scores, floors)}
+
+
+def check_single_list(fuse, cfg: Dict) -> List[str]:
+    """The first place of either list alone (the other retriever missed it) reaches every mode's threshold,
+    and rrf's keeps chunks only one list found down to the same rank of either list."""
+    from src.fusion import FUSION_MODES, FUSION_THRESHOLDS
+
+    failures = []
+    for mode in FUSION_MODES:
+        kept_ids = passing(fuse, mode, cfg, [0, 1, 2], [3, 4, 5], FUSION_THRESHOLDS[mode])
+        for side, doc in (("BM25", 0), ("vector", 3)):
+            if not kept_ids[doc]:
+                failures.append(f"{mode}: the top {side}-only candidate is below the threshold {FUSION_THRESHOLDS[mode]}")
+    depth = 5 * cfg["candidate_multiplier"]
+    kept_ids = passing(fuse, "rrf", cfg, list(range(depth)), list(range(depth, 2 * depth)), FUSION_THRESHOLDS["rrf"])
+    bm25_kept = sum(kept_ids[i] for i in range(depth))
+    vector_kept = sum(kept_ids[i] for i in range(depth, 2 * depth))
+    if bm25_kept != vector_kept or bm25_kept == depth:
+        failures.append(f"rrf: keeps {bm25_kept} BM25-only and {vector_kept} vector-only candidates of {depth} "
+                        f"(expected the same number, fewer than all)")
+    return failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=5, help="Chunks requested per query")
+    parser.add_argument("--mass", type=float, default=0.95, help="Relevance kept by a calibrated threshold")
+    parser.add_argument("--min-mass", type=float, default=0.9, help="Relevance each mode's threshold must keep")
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--index-dir", default=None)
+    parser.add_argument("--real-embedder", action="store_true", help="Use the real SentenceTransformer")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--emit", default=None, help="Retrieval config file to write the best mode and its threshold to")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    from .offline import load_offline_pipeline
+    from src import hybrid_retriever
+    from src.fusion import FUSION_MODES, FUSION_THRESHOLDS
+
+    rag = load_offline_pipeline(index_dir=args.index_dir, fake_embedder=not args.real_embedder)
+    retriever = rag.hybrid_retriever
+    if not retriever:
+        print("Hybrid retriever unavailable; nothing to fuse", file=sys.stderr)
+        return 1
+    cfg, benchmark = rag.retrieval_config, load_benchmark(args.queries)
+    recorder = FuseRecorder(hybrid_retriever.fuse)
+    hybrid_retriever.fuse = recorder
+    try:
+        run_mode(retriever, recorder, benchmark[:3], cfg, "rrf", args.k)  # warm up
+        runs = {mode: run_mode(retriever, recorder, benchmark, cfg, mode, args.k) for mode in FUSION_MODES}
+    finally:
+        hybrid_retriever.fuse = recorder.fuse
+
+    pooled = [dict() for _ in benchmark]
+    for run in runs.values():
+        for pool, q in zip(pooled, run["per_query"]):
+            pool.update(zip(q["ids"], q["grades"]))
+    ideal = [sorted(pool.values(), reverse=True) for pool in pooled]
+
+    rows, failures = {}, []
+    for mode, run in runs.items():
+        per_query = run["per_query"]
+        scores = np.concatenate([c["scores"] for c in run["calls"]])
+        if len(scores) and (scores.min() < 0 or scores.max() > 1 + 1e-9):
+            failures.append(f"{mode}: fused scores outside [0, 1] ({scores.min():.3f}..{scores.max():.3f})")
+        # Thresholds in config units: rrf's are shares of the best score the chunk's lists can give
+        per_query = [dict(q, scores=[s / b if b > 0 else 1.0 for s, b in zip(q["scores"], q["bounds"])])
+                     for q in per_query]
+        calibrated = calibrate(per_query, args.mass, cfg["min_chunks"])
+        row = {
+            "ranking": score_config(per_query, args.k, ideal),
+            "threshold": threshold_stats(per_query, FUSION_THRESHOLDS[mode], cfg["min_chunks"]),
+            "calibrated": threshold_stats(per_query, calibrated, cfg["min_chunks"]),
+            "fusion_ms": latency_summary([c["seconds"] for c in run["calls"]]),
+        }
+        if mode == "dynamic":
+            weights = [c["info"]["w_vector"] for c in run["calls"]]
+            row["w_vector"] = {"mean": round(float(np.mean(weights)), 3), "min": min(weights), "max": max(weights)}
+        rows[mode] = row
+        if row["threshold"]["mass_kept"] < args.min_mass:
+            failures.append(f"{mode}: threshold {FUSION_THRESHOLDS[mode]} keeps {row['threshold']['mass_kept']:.1%} "
+                            f"of the relevance (< {args.min_mass:.0%})")
+    failures += check_rrf(runs["rrf"]["calls"], cfg) + check_single_list(recorder.fuse, cfg)
+
+    print(f"{len(benchmark)} queries, k={args.k}, alpha={cfg['alpha']}, rrf_k={cfg['rrf_k']}, "
+          f"depth={args.k * cfg['candidate_multiplier']}")
+    print(f"{'mode':<8} | {'hit@1':>6} {'hit@k':>6} {'mrr':>6} {'ndcg':>6} | {'thresh':>6} {'chunks':>6} {'saved':>6} "
+          f"{'mass':>6} | {'calib':>6} {'chunks':>6} {'saved':>6} | {'fuse p50':>8}")
+    for mode, row in rows.items():
+        r, t, c = row["ranking"], row["threshold"], row["calibrated"]
+        print(f"{mode:<8} | {r['hit@1']:>6.3f} {r['hit@k']:>6.3f} {r['mrr']:>6.3f} {r['ndcg']:>6.3f} | "
+              f"{t['threshold']:>6.3f} {t['chunks_per_query']:>6.2f} {t['chars_saved']:>6.1%} {t['mass_kept']:>6.1%} | "
+              f"{c['threshold']:>6.3f} {c['chunks_per_query']:>6.2f} {c['chars_saved']:>6.1%} | "
+              f"{row['fusion_ms']['p50']:>6.3f}ms")
+    if "w_vector" in rows.get("dynamic", {}):
+        w = rows["dynamic"]["w_vector"]
+        print(f"dynamic vector weight: mean {w['mean']:.2f}, {w['min']:.2f}..{w['max']:.2f} "
+              f"(prior {cfg['alpha'] / (1 + cfg['alpha']):.2f})")
+    print("OK" if not failures else "FAILED:\n  " + "\n  ".join(failures))
+
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "emit")}
+    result = write_result("fusion_bench", config, {"retrieval_config": cfg, "modes": rows, "failures": failures},
+                          args.output)
+    print(f"Results written to {result['_path']}")
+
+    if args.emit:
+        best = max(rows, key=lambda m: rows[m]["ranking"]["ndcg"])
+        data = {}
+        if os.path.exists(args.emit):
+            with open(args.emit, encoding="utf-8") as f:
+                data = json.load(f)
+        params = data.setdefault("params", {})
+        params.update(fusion=best, fusion_threshold=rows[best]["calibrated"]["threshold"])
+        data["fusion_generated_by"] = "benchmarks/fusion_bench.py"
+        data["fusion_generated_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        with open(args.emit, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        print(f"Fusion mode {best} (threshold {params['fusion_threshold']}) written to {args.emit}")
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""Mongo bytes per chat turn and per history read, with debug in message_debug vs inline in messages.
+
+    python -m benchmarks.history_bench --index-dir /tmp/rag_bench_index
+    python -m benchmarks.history_bench --sessions 16 --turns 20
+
+Runs --turns chats in each of --sessions sessions (half with history, half without) through the
+offline pipeline, then rebuilds the previous layout from what was stored: debug inline on the
+assistant message with the 2000-character retrieved context preview (from the chunks the debug
+references; the conversation preview is left out), plus the 500-character preview the user
+message carried without history. Byte counts are BSON sizes, as the in-memory Mongo stand-in counts them:
+
+    write/turn      bytes inserted into messages (+ message_debug) per turn
+    context read    bytes read to rebuild a conversation context after a cache miss
+    history page    bytes read for a 50-message page (the previous layout had no projection)
+
+Also walks sessions page by page, both orders, with timestamps tied at the same instant: every
+message must come back exactly once and in order. Prints OK, or the failed expectations.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from .common import load_benchmark, write_result
+from .fakes import FakeCollection
+from .offline import DEFAULT_DATA_FOLDER
+
+logger = logging.getLogger("benchmarks.history_bench")
+
+
+def legacy_layout(cm, session_ids: List[str], history: Dict[str, bool], resolver) -> FakeCollection:
+    """The same messages as the previous ConversationManager stored them."""
+    legacy = FakeCollection("messages_legacy")
+    for sid in session_ids:
+        msgs = list(cm.messages.find({"session_id": sid}).sort("created_at", 1))
+        debug = {}
+        for message_id, d in cm.get_debug([m["_id"] for m in msgs]).items():
+            refs = d.pop("retrieved_chunks", None)
+            d.pop("context_chars", None)
+            debug[message_id] = dict(d, retrieved_context_preview=resolver.context(refs)[:2000]) if refs else d
+        for i, msg in enumerate(msgs):
+            doc = {k: v for k, v in msg.items() if k != "route"}
+            if msg["sender"] == "assistant":
+                doc["debug"] = debug.get(str(msg["_id"]))
+            else:
+                reply = debug.get(str(msgs[i + 1]["_id"])) if i + 1 < len(msgs) else None
+                reply = reply or {}
+                if reply.get("note") == "retrieval_skipped_greeting":
+                    doc["debug"] = {"note": "greeting_user_input"}
+                elif not history[sid]:
+                    doc["debug"] = {"retrieved_context_preview": reply.get("retrieved_context_preview", "")[:500]}
+                else:
+                    doc["debug"] = None
+            legacy.insert_one(doc)
+    return legacy
+
+
+def read_bytes(collections, fn) -> int:
+    before = sum(c.bytes["read"] for c in collections)
+    fn()
+    return sum(c.bytes["read"] for c in collections) - before
+
+
+def walk(cm, session_id: str, limit: int, order: str) -> List[str]:
+    ids, cursor = [], None
+    while True:
+        page = cm.get_history(session_id, limit=limit, cursor=cursor, order=order)
+        ids += [m["id"] for m in page["messages"]]
+        cursor = page["next_cursor"]
+        if not cursor:
+            return ids
+
+
+def pagination_failures(cm, session_ids: List[str]) -> List[str]:
+    failures = []
+    # A session whose messages share timestamps three at a time
+    tied = cm.create_session()
+    base = datetime(2026, 1, 1)
+    for i in range(25):
+        cm.add_message(tied, "user" if i % 2 == 0 else "assistant", f"message {i}", created_at=base + timedelta(seconds=i // 3),
+                       debug={"n": i} if i % 2 else None)
+    for sid in session_ids[:3] + [tied]:
+        expected = [str(m["_id"]) for m in cm.messages.find({"session_id": sid}, {"_id": 1, "created_at": 1})
+                    .sort([("created_at", 1), ("_id", 1)])]
+        for limit in (1, 4, 50):
+            for order in ("asc", "desc"):
+                got = walk(cm, sid, limit, order)
+                # Tied timestamps come back in _id order, the same on every page and call
+                want = expected if order == "asc" else expected[::-1]
+                if len(got) != len(expected) or set(got) != set(expected) or got != want:
+                    failures.append(f"pagination: session {sid[:8]} limit {limit} {order}: "
+                                    f"{len(got)} ids ({len(set(got))} distinct) for {len(expected)} messages")
+    page = cm.get_history(tied, limit=4, include_debug=True)
+    if [m.get("debug") for m in page["messages"]] != [None, {"n": 1}, None, {"n": 3}]:
+        failures.append(f"include_debug: {[m.get('debug') for m in page['messages']]}")
+    if any("debug" in m for m in cm.get_history(tied, limit=4)["messages"]):
+        failures.append("debug returned without include_debug")
+    return failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-folder", default=DEFAULT_DATA_FOLDER)
+    parser.add_argument("--index-dir", default=None)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=10, help="Chats per session")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    from .offline import load_offline_pipeline
+    from src.chunk_refs import ChunkResolver
+
+    rag = load_offline_pipeline(args.data_folder, index_dir=args.index_dir, llm_latency_ms=0.0)
+    rag.warmup()
+    cm = rag.conversation_manager
+    questions = [item["query"] for item in load_benchmark()]
+
+    written = sum(c.bytes["written"] for c in (cm.messages, cm.message_debug))
+    session_ids, history = [], {}
+    for s in range(args.sessions):
+        sid = cm.create_session()
+        session_ids.append(sid)
+        history[sid] = s % 2 == 0
+        for t in range(args.turns):
+            query = "hello" if t == 0 else questions[(s * args.turns + t) % len(questions)]
+            rag.chat(sid, query, include_history=history[sid])
+    turns = args.sessions * args.turns
+    written = sum(c.bytes["written"] for c in (cm.messages, cm.message_debug)) - written
+    legacy = legacy_layout(cm, session_ids, history, ChunkResolver(rag.index_dir))
+
+    new, old = {"write/turn": written / turns}, {"write/turn": legacy.bytes["written"] / turns}
+    context_new = context_old = page_new = page_old = 0
+    history_sessions = [sid for sid in session_ids if history[sid]]
+    for sid in history_sessions:
+        cm._cache.pop(sid, None)
+        context_new += read_bytes([cm.messages], lambda: cm.get_conversation_context(sid))
+        context_old += read_bytes([legacy], lambda: list(legacy.find({"session_id": sid}).sort("created_at", -1)
+                                                         .limit(cm.max_history * 2)))
+    for sid in session_ids:
+        page_new += read_bytes([cm.messages, cm.message_debug], lambda: cm.get_history(sid, limit=50))
+        page_old += read_bytes([legacy], lambda: list(legacy.find({"session_id": sid}).sort("created_at", 1).limit(50)))
+    new["context read"], old["context read"] = context_new / len(history_sessions), context_old / len(history_sessions)
+    new["history page"], old["history page"] = page_new / len(session_ids), page_old / len(session_ids)
+
+    failures = [f"{name}: {new[name]:.0f} bytes, previously {old[name]:.0f}" for name in new if new[name] >= old[name]]
+    failures += pagination_failures(cm, session_ids)
+
+    print(f"{turns} turns in {args.sessions} sessions (bytes)")
+    print(f"{'':<14} {'inline debug':>13} {'message_debug':>14} {'change':>8}")
+    for name in new:
+        print(f"{name:<14} {old[name]:>13.0f} {new[name]:>14.0f} {new[name] / old[name] - 1:>+8.1%}")
+    print("OK" if not failures else "FAILED:\n  " + "\n  ".join(failures))
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("history_bench", config, {"inline_debug": old, "message_debug": new, "failures": failures},
+                          args.output)
+    print(f"Results written to {result['_path']}")
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
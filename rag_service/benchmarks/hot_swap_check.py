@@ -0,0 +1,152 @@
+"""Check that index rebuilds do not disturb serving: queries run continuously while the index is rebuilt and swapped.
+
+    python -m benchmarks.hot_swap_check
+    python -m benchmarks.hot_swap_check --rebuilds 3 --threads 4 --max-p95-ratio 1.5
+
+The offline pipeline is built into a temp index dir, then query threads call
+RAGPipeline.retrieve_context without pause through a baseline window, --rebuilds forced
+rebuilds (each built in a separate process and swapped in) and a window after the last swap.
+Exits 1 if any query raised or returned no context, if a thread ever saw the index version go
+backwards, if a rebuild did not produce a new live version, if more than INDEX_KEEP_VERSIONS
+versions remain on disk, or if p95 latency during rebuilds exceeds --max-p95-ratio x baseline
+(plus --slack-ms).
+
+The build runs at INDEX_BUILD_NICE with INDEX_BUILD_THREADS threads, so the p95 gate holds even on
+one core. But the query threads never pause, so there a rebuild only gets the CPU they leave and
+takes several times longer than on an idle host.
+"""
+import argparse
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from .common import latency_summary, load_queries, write_result
+from .offline import DEFAULT_DATA_FOLDER
+
+logger = logging.getLogger("benchmarks.hot_swap_check")
+
+
+class QueryLoad:
+    """Background threads querying the pipeline and recording (phase, latency, ok, version)."""
+
+    def __init__(self, rag, queries: List[str], threads: int, k: int):
+        self.rag = rag
+        self.queries = queries
+        self.k = k
+        self.phase = "baseline"
+        self.samples: List[List[Dict]] = [[] for _ in range(threads)]
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._run, args=(i,), daemon=True) for i in range(threads)]
+
+    def _run(self, slot: int):
+        out = self.samples[slot]
+        for query in itertools.cycle(self.queries[slot::len(self._threads)] or self.queries):
+            if self._stop.is_set():
+                return
+            phase = self.phase
+            start = time.perf_counter()
+            try:
+                version = self.rag.index_version
+                ok = bool(self.rag.retrieve_context(query, k=self.k))
+                error = None
+            except Exception as e:
+                version, ok, error = None, False, repr(e)
+            out.append({"phase": phase, "latency": time.perf_counter() - start, "ok": ok,
+                        "version": version, "error": error})
+
+    def start(self):
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-folder", default=DEFAULT_DATA_FOLDER)
+    parser.add_argument("--rebuilds", type=int, default=3, help="Forced rebuilds (> INDEX_KEEP_VERSIONS exercises GC)")
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--baseline-s", type=float, default=5.0)
+    parser.add_argument("--after-s", type=float, default=3.0)
+    parser.add_argument("--max-p95-ratio", type=float, default=1.5)
+    parser.add_argument("--slack-ms", type=float, default=2.0, help="Absolute p95 slack for very fast baselines")
+    parser.add_argument("--real-embedder", action="store_true")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    from .offline import load_offline_pipeline
+
+    index_dir = tempfile.mkdtemp(prefix="rag_hot_swap_")
+    rag = load_offline_pipeline(args.data_folder, index_dir=index_dir, fake_embedder=not args.real_embedder)
+    rag.warmup()
+    initial_version = rag.index_version
+    load = QueryLoad(rag, load_queries(), args.threads, args.k)
+    load.start()
+    time.sleep(args.baseline_s)
+
+    failures, versions, rebuild_s = [], [initial_version], []
+    load.phase = "rebuild"
+    for _ in range(args.rebuilds):
+        start = time.perf_counter()
+        rag.initialize(args.data_folder, force_rebuild=True)
+        rebuild_s.append(round(time.perf_counter() - start, 2))
+        if rag.index_version == versions[-1]:
+            failures.append(f"rebuild did not activate a new version (still {rag.index_version})")
+        versions.append(rag.index_version)
+    load.phase = "after"
+    time.sleep(args.after_s)
+    load.stop()
+
+    samples = [s for thread in load.samples for s in thread]
+    by_phase = {phase: [s["latency"] for s in samples if s["phase"] == phase] for phase in ("baseline", "rebuild", "after")}
+    summary = {phase: dict(latency_summary(lat), queries=len(lat)) for phase, lat in by_phase.items()}
+
+    errors = [s for s in samples if s["error"]]
+    empty = [s for s in samples if not s["ok"] and not s["error"]]
+    if errors:
+        failures.append(f"{len(errors)} queries raised, e.g. {errors[0]['error']}")
+    if empty:
+        failures.append(f"{len(empty)} queries returned no context")
+    for thread in load.samples:
+        seen = [s["version"] for s in thread if s["version"]]
+        if any(b < a for a, b in zip(seen, seen[1:])):
+            failures.append("a query thread saw the index version go backwards")
+            break
+    on_disk = [d for d in os.listdir(rag.manifest.versions_dir) if not d.startswith(".")]
+    if len(on_disk) > max(1, rag.keep_index_versions):
+        failures.append(f"{len(on_disk)} versions on disk, expected <= {rag.keep_index_versions}")
+    base_p95, during_p95 = summary["baseline"]["p95"], summary["rebuild"]["p95"]
+    if during_p95 > base_p95 * args.max_p95_ratio + args.slack_ms:
+        failures.append(f"p95 during rebuild {during_p95:.2f}ms vs baseline {base_p95:.2f}ms")
+
+    for phase, stats in summary.items():
+        print(f"{phase:<9} {stats['queries']:>6} queries  p50 {stats['p50']:>7.2f}ms  p95 {stats['p95']:>7.2f}ms  "
+              f"p99 {stats['p99']:>7.2f}ms  max {stats['max']:>7.2f}ms")
+    print(f"versions: {' -> '.join(versions)}; rebuild seconds: {rebuild_s}; on disk: {sorted(on_disk)}")
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("hot_swap_check", config, {
+        "phases": summary, "versions": versions, "rebuild_s": rebuild_s,
+        "versions_on_disk": sorted(on_disk), "failures": failures,
+    }, args.output)
+    print(f"Results written to {result['_path']}")
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,86 @@
+"""Import-time profile of the service modules (python -X importtime), heaviest first.
+
+    python -m benchmarks.import_profile                       # main and src.rag_pipeline
+    python -m benchmarks.import_profile --modules main --top 15
+
+Each module is imported in a fresh interpreter. Reported per module: total import time, the
+top-level packages by cumulative time (what an import pulls in) and the modules with the
+largest self time. `main` should stay light; the heavy stack is imported by the background
+loader after the port is bound.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List
+
+from .common import RAG_ROOT, write_result
+
+LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile(module: str) -> List[Dict]:
+    env = dict(os.environ)
+    env.setdefault("GROQ_API_KEY", "import-profile")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=RAG_ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append({
+                "module": name,
+                "self_ms": int(self_us) / 1000.0,
+                "cumulative_ms": int(cumulative_us) / 1000.0,
+                "depth": (len(indent) - 1) // 2,
+            })
+    return rows
+
+
+def report(module: str, rows: List[Dict], top: int) -> Dict:
+    target = next((r for r in rows if r["module"] == module), None)
+    # Direct imports of the target (depth 1 below it) plus anything imported at depth 0 before it
+    top_level = [r for r in rows if r["depth"] <= (1 if target and target["depth"] == 0 else 0) and r["module"] != module]
+    return {
+        "module": module,
+        "total_ms": round(target["cumulative_ms"] if target else sum(r["self_ms"] for r in rows), 1),
+        "modules_imported": len(rows),
+        "by_cumulative": [{"module": r["module"], "ms": round(r["cumulative_ms"], 1)}
+                          for r in sorted(top_level, key=lambda r: -r["cumulative_ms"])[:top]],
+        "by_self": [{"module": r["module"], "ms": round(r["self_ms"], 1)}
+                    for r in sorted(rows, key=lambda r: -r["self_ms"])[:top]],
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=["main", "src.rag_pipeline"])
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    reports = []
+    for module in args.modules:
+        rep = report(module, profile(module), args.top)
+        reports.append(rep)
+        print(f"\nimport {module}: {rep['total_ms']:.0f} ms, {rep['modules_imported']} modules")
+        print(f"  {'cumulative (direct imports)':<40} {'ms':>8}    {'self':<34} {'ms':>8}")
+        for i in range(max(len(rep["by_cumulative"]), len(rep["by_self"]))):
+            left = rep["by_cumulative"][i] if i < len(rep["by_cumulative"]) else {"module": "", "ms": ""}
+            right = rep["by_self"][i] if i < len(rep["by_self"]) else {"module": "", "ms": ""}
+            print(f"  {left['module'][:40]:<40} {left['ms']:>8}    {right['module'][:34]:<34} {right['ms']:>8}")
+
+    result = write_result("import_profile", {"modules": args.modules, "top": args.top}, {"reports": reports}, args.output)
+    print(f"\nResults written to {result['_path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
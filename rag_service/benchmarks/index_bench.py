@@ -0,0 +1,155 @@
+"""Build-time benchmark of FAISS index factories: memory, build time, QPS and recall vs exact search.
+
+    python -m benchmarks.index_bench --factories Flat HNSW32 IVF256,Flat IVF256,PQ32 OPQ32,IVF256,PQ32
+    python -m benchmarks.index_bench --synthetic 200000 --factories HNSW32 IVF4096,PQ32 IVF4096,SQ8
+
+Corpus mode embeds the chunks from --index-dir (docs.pkl) or the data folder; synthetic mode
+generates clustered unit vectors, which is useful to size indexes beyond the current corpus.
+Search-time parameters are swept per factory (nprobe for IVF, efSearch for HNSW).
+"""
+import argparse
+import logging
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+from .common import write_result
+
+logger = logging.getLogger("benchmarks.index_bench")
+
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    assign = rng.integers(0, clusters, n)
+    vecs = centers[assign] + 0.35 * rng.standard_normal((n, dim)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs
+
+
+def corpus_vectors(args):
+    from .offline import install_fakes, DEFAULT_DATA_FOLDER
+    from .common import load_queries
+
+    install_fakes(fake_embedder=not args.real_embedder)
+    import src.vector_store as vector_store
+    from src.document_processor import DocumentProcessor
+
+    docs_path = os.path.join(args.index_dir, "docs.pkl") if args.index_dir else None
+    if docs_path and os.path.exists(docs_path):
+        with open(docs_path, "rb") as f:
+            docs = pickle.load(f)
+    else:
+        docs = DocumentProcessor().process_documents(DEFAULT_DATA_FOLDER)
+    # Resolved through the module so --real-embedder / the fake hashing encoder both apply
+    encoder = vector_store.load_encoder("sentence-transformers/all-MiniLM-L6-v2")
+    xb = encoder.encode(docs, batch_size=64, convert_to_numpy=True, show_progress_bar=False).astype(np.float32)
+    xq = encoder.encode(load_queries(), convert_to_numpy=True, show_progress_bar=False).astype(np.float32)
+    return xb, xq
+
+
+def measure(index, xq: np.ndarray, k: int):
+    """Single-query QPS (the serving pattern) and batched QPS, plus the result ids."""
+    start = time.perf_counter()
+    for i in range(len(xq)):
+        index.search(xq[i:i + 1], k)
+    single = len(xq) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    _, ids = index.search(xq, k)
+    batch = len(xq) / (time.perf_counter() - start)
+    return single, batch, ids
+
+
+def recall_at_k(ids: np.ndarray, truth: np.ndarray, k: int) -> float:
+    hits = sum(len(set(a[:k]) & set(b[:k])) for a, b in zip(ids, truth))
+    return hits / float(len(truth) * k)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--factories", nargs="+", default=["Flat", "HNSW32", "IVF64,Flat", "IVF64,SQ8", "IVF64,PQ32"])
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N synthetic vectors instead of the corpus")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--nq", type=int, default=500, help="Queries for synthetic mode / QPS")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--threads", type=int, default=1, help="faiss.omp_set_num_threads for the run")
+    parser.add_argument("--index-dir", default=None, help="Read corpus chunks from <dir>/docs.pkl")
+    parser.add_argument("--real-embedder", action="store_true")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    rag_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if rag_root not in sys.path:
+        sys.path.insert(0, rag_root)
+    import faiss
+    from src.faiss_index import resolve_factory, build_index, index_kind, apply_search_params, index_nbytes
+
+    faiss.omp_set_num_threads(args.threads)
+    if args.synthetic:
+        data = synthetic_vectors(args.synthetic + args.nq, args.dim)
+        xb, xq = data[:args.synthetic], data[args.synthetic:]
+    else:
+        xb, xq = corpus_vectors(args)
+        # Pad the 30 benchmark queries with perturbed chunks so QPS is measured over enough searches
+        rng = np.random.default_rng(1)
+        extra = xb[rng.integers(0, len(xb), max(0, args.nq - len(xq)))]
+        extra = extra + 0.05 * rng.standard_normal(extra.shape).astype(np.float32)
+        xq = np.vstack([xq, extra]).astype(np.float32)
+    faiss.normalize_L2(xb)
+    faiss.normalize_L2(xq)
+
+    exact = faiss.IndexFlatIP(xb.shape[1])
+    exact.add(xb)
+    _, truth = exact.search(xq, args.k)
+
+    rows = []
+    print(f"{len(xb)} vectors x {xb.shape[1]} dims, {len(xq)} queries, k={args.k}, threads={args.threads}")
+    print(f"{'factory':<24} {'param':<12} {'build_s':>8} {'MB':>8} {'B/vec':>7} {'qps':>9} {'batch_qps':>10} {'recall':>7}")
+    for requested in args.factories:
+        factory = resolve_factory(len(xb), requested)
+        start = time.perf_counter()
+        try:
+            index = build_index(xb.copy(), factory)
+        except Exception as e:
+            print(f"{factory:<24} build failed: {e}")
+            continue
+        build_s = time.perf_counter() - start
+        nbytes = index_nbytes(index)
+        kind = index_kind(index)
+        settings = [{"nprobe": p} for p in args.nprobe] if kind == "ivf" else \
+            [{"efSearch": e} for e in args.ef_search] if kind == "hnsw" else [{}]
+        for params in settings:
+            apply_search_params(index, params)
+            single, batch, ids = measure(index, xq, args.k)
+            row = {
+                "factory": factory,
+                "search_params": params,
+                "build_s": round(build_s, 3),
+                "index_bytes": nbytes,
+                "bytes_per_vector": round(nbytes / len(xb), 1),
+                "qps": round(single, 1),
+                "batch_qps": round(batch, 1),
+                f"recall@{args.k}": round(recall_at_k(ids, truth, args.k), 4),
+            }
+            rows.append(row)
+            label = ",".join(f"{k}={v}" for k, v in params.items()) or "-"
+            print(f"{factory:<24} {label:<12} {build_s:>8.2f} {nbytes / 2**20:>8.1f} {row['bytes_per_vector']:>7} "
+                  f"{single:>9.0f} {batch:>10.0f} {row[f'recall@{args.k}']:>7.3f}")
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("index_bench", config, {"n_vectors": len(xb), "n_queries": len(xq), "rows": rows}, args.output)
+    print(f"Results written to {result['_path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""Session lifecycle: TTL indexes, cache consistency with expiry and archival, archive size, bulk reset.
+
+    python -m benchmarks.lifecycle_check --index-dir /tmp/rag_bench_index
+    python -m benchmarks.lifecycle_check --sessions 40 --turns 6
+
+Runs with SESSION_RETENTION_DAYS=30, SESSION_ARCHIVE_AFTER_DAYS=7 and
+SESSION_ARCHIVE_RETENTION_DAYS=365. The in-memory Mongo stand-in applies TTL indexes when asked
+(FakeCollection.expire), so expiry is simulated by backdating documents:
+
+    ttl         every hot collection has its TTL index with the configured retention; a message
+                from before last_active_at was the TTL field gets it and still expires
+    expiry      a cached context drops exchanges Mongo has expired, and matches a rebuild from Mongo
+    archive     --sessions chatted sessions, backdated past the archive threshold, are archived;
+                hot bytes before/after, archive bytes and compression ratio; a session with a recent
+                message is left alone; first use restores the same context and history
+    wake        a session that gets a message while it is being archived keeps every message
+    revive      a session archived 38 days ago and restored today survives the TTL monitor
+    reset       deletes issued resetting sessions one by one vs. in one bulk call (and by user_id
+                through POST /sessions/reset); nothing of the reset sessions may remain
+
+Prints OK, or the failed expectations.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from .common import load_benchmark, write_result
+from .fakes import doc_size
+from .offline import DEFAULT_DATA_FOLDER
+
+logger = logging.getLogger("benchmarks.lifecycle_check")
+
+RETENTION_DAYS, ARCHIVE_AFTER_DAYS, ARCHIVE_RETENTION_DAYS = 30, 7, 365
+DATE_FIELDS = ("created_at", "last_active_at", "updated_at")
+
+
+def hot_collections(cm):
+    return [cm.sessions, cm.messages, cm.message_debug, cm.summaries]
+
+
+def backdate(cm, session_ids: List[str], days: float):
+    """Shift every timestamp of the sessions' hot documents `days` into the past."""
+    ids, delta = set(session_ids), timedelta(days=days)
+    for coll in hot_collections(cm):
+        for doc in coll._docs:
+            if doc.get("session_id") in ids:
+                for field in DATE_FIELDS:
+                    if isinstance(doc.get(field), datetime):
+                        doc[field] -= delta
+    for sid in ids & set(cm._touched):
+        cm._touched[sid] -= delta
+
+
+def stored_bytes(collections, session_ids=None) -> int:
+    ids = set(session_ids) if session_ids is not None else None
+    return sum(doc_size(d) for c in collections for d in c._docs if ids is None or d.get("session_id") in ids)
+
+
+def full_history(cm, session_id: str) -> List[Dict]:
+    messages, cursor = [], None
+    while True:
+        page = cm.get_history(session_id, limit=50, cursor=cursor, include_debug=True)
+        messages += page["messages"]
+        cursor = page["next_cursor"]
+        if not cursor:
+            # Mongo keeps milliseconds; the stand-in keeps what it was given until a BSON round trip
+            return [dict({k: v for k, v in m.items() if k != "id"},
+                         created_at=m["created_at"].replace(microsecond=m["created_at"].microsecond // 1000 * 1000))
+                    for m in messages]
+
+
+def check_ttl(cm) -> List[str]:
+    from src.session_lifecycle import move_ttl_index
+
+    failures = []
+    expected = {c.name: RETENTION_DAYS * 86400 for c in hot_collections(cm)}
+    expected[cm.archiver.archive.name] = ARCHIVE_RETENTION_DAYS * 86400
+    for coll in hot_collections(cm) + [cm.archiver.archive]:
+        ttl = [kw["expireAfterSeconds"] for _, kw in coll.indexes if "expireAfterSeconds" in kw]
+        if ttl != [expected[coll.name]]:
+            failures.append(f"ttl: {coll.name} has TTL indexes {ttl}, expected [{expected[coll.name]}]")
+    # A message stored when the TTL index counted from created_at
+    now = datetime.utcnow()
+    legacy = cm.messages.insert_one({"session_id": "legacy", "sender": "user", "text": "old",
+                                     "created_at": now - timedelta(days=RETENTION_DAYS + 1)}).inserted_id
+    cm.messages.create_index("created_at", expireAfterSeconds=RETENTION_DAYS * 86400, name="created_at_ttl")
+    move_ttl_index(cm.messages, "last_active_at", "created_at", RETENTION_DAYS * 86400)
+    if any(kw.get("name") == "created_at_ttl" for _, kw in cm.messages.indexes):
+        failures.append("ttl: the created_at TTL index of messages was not dropped")
+    cm.messages.expire(now)
+    if cm.messages.count_documents({"_id": legacy}):
+        failures.append("ttl: a message without last_active_at never expires")
+    return failures
+
+
+def check_expiry(cm) -> List[str]:
+    """Exchanges 31 and 2 days old are cached, then Mongo expires the first."""
+    failures = []
+    sid = cm.create_session()
+    now = datetime.utcnow()
+    for i, age in enumerate((31, 2)):
+        at = now - timedelta(days=age)
+        cm.add_message(sid, "user", f"question {i}", created_at=at)
+        cm.add_message(sid, "assistant", f"answer {i}", created_at=at + timedelta(seconds=1), summary_for_context=f"summary {i}")
+    cm._cache.pop(sid, None)
+    cm.get_conversation_context(sid)
+    expired = sum(coll.expire(now) for coll in hot_collections(cm))
+    cached = cm.get_conversation_context(sid)
+    cm._cache.pop(sid, None)
+    rebuilt = cm.get_conversation_context(sid)
+    if not expired:
+        failures.append("expiry: the stand-in expired nothing")
+    if cached != rebuilt or "question 0" in cached:
+        failures.append(f"expiry: cached context {cached!r} != rebuilt {rebuilt!r}")
+    return failures
+
+
+def check_wake(cm) -> List[str]:
+    """A user message lands between the archive snapshot and the deletes."""
+    failures = []
+    sid = cm.create_session()
+    at = datetime.utcnow() - timedelta(days=ARCHIVE_AFTER_DAYS + 3)
+    for i in range(3):
+        cm.add_message(sid, "user", f"old question {i}", created_at=at + timedelta(minutes=i), debug={"turn": i})
+    backdate(cm, [sid], 0)
+    cm.sessions.update_one({"session_id": sid}, {"$set": {"last_active_at": at}})
+    cm._touched.pop(sid, None)
+    archive_doc = cm.archiver._archive_doc
+
+    def archive_then_wake(session_id, payload, now):
+        doc = archive_doc(session_id, payload, now)
+        cm.add_message(session_id, "user", "new question", debug={"turn": 3})
+        return doc
+
+    cm.archiver._archive_doc = archive_then_wake
+    try:
+        counts = cm.archiver.run()
+    finally:
+        cm.archiver._archive_doc = archive_doc
+    texts = [m["text"] for m in full_history(cm, sid)]
+    if counts["archived"] or counts["still_active"] != 1:
+        failures.append(f"wake: {counts['archived']} archived, {counts['still_active']} still active (expected 0 and 1)")
+    if texts != [f"old question {i}" for i in range(3)] + ["new question"]:
+        failures.append(f"wake: history after the run is {texts}")
+    if cm.message_debug.count_documents({"session_id": sid}) != 4:
+        failures.append("wake: debug documents were lost")
+    if cm.archiver.archive.count_documents({"session_id": sid}):
+        failures.append("wake: the session is both hot and archived")
+    return failures
+
+
+def check_revive(cm) -> List[str]:
+    """Archived after 7 idle days, restored 45 days after the last message (retention is 30)."""
+    failures = []
+    sid = cm.create_session()
+    for i in range(2):
+        cm.add_message(sid, "user", f"question {i}", debug={"turn": i})
+        cm.add_message(sid, "assistant", f"answer {i}", summary_for_context=f"summary {i}")
+    cm.save_summary(sid, "Running summary")
+    backdate(cm, [sid], 45)
+    cm._cache.pop(sid, None)
+    if cm.archiver.run(now=datetime.utcnow() - timedelta(days=38))["archived"] != 1:
+        return ["revive: the session was not archived"]
+    history = full_history(cm, sid)
+    now = datetime.utcnow()
+    for coll in hot_collections(cm):
+        coll.expire(now)
+    if full_history(cm, sid) != history or len(history) != 4:
+        failures.append(f"revive: {len(full_history(cm, sid))} of {len(history)} restored messages survive the TTL monitor")
+    if cm.message_debug.count_documents({"session_id": sid}) != 2 or cm.get_summary(sid) != "Running summary":
+        failures.append("revive: restored debug or summary expired")
+    if "question 1" not in cm.get_conversation_context(sid):
+        failures.append("revive: the cached context dropped the restored exchanges")
+    return failures
+
+
+def run_sessions(rag, n: int, turns: int, questions: List[str]) -> List[str]:
+    cm, session_ids = rag.conversation_manager, []
+    for s in range(n):
+        sid = cm.create_session(user_id=f"user-{s % 4}")
+        session_ids.append(sid)
+        for t in range(turns):
+            query = "hello" if t == 0 else questions[(s * turns + t) % len(questions)]
+            rag.chat(sid, query, include_history=s % 2 == 0)
+        cm.save_summary(sid, f"Running summary of session {s}")
+    return session_ids
+
+
+def check_archive(rag, session_ids: List[str]) -> (Dict, List[str]):
+    cm, failures = rag.conversation_manager, []
+    # One session whose last_active_at is stale but which got a message yesterday
+    active = session_ids[-1]
+    backdate(cm, session_ids, ARCHIVE_AFTER_DAYS + 3)
+    cm.add_message(active, "assistant", "late reply", created_at=datetime.utcnow() - timedelta(days=1))
+    before = {sid: (full_history(cm, sid), cm.get_conversation_context(sid)) for sid in session_ids[:6]}
+    # A cached session that another process archives
+    cached_sid = session_ids[0]
+    cm._cache.pop(cached_sid, None)
+    cm.get_conversation_context(cached_sid)
+
+    hot_before = stored_bytes(hot_collections(cm), session_ids)
+    counts = cm.archiver.run()
+    hot_after = stored_bytes(hot_collections(cm), session_ids)
+    archive_bytes = stored_bytes([cm.archiver.archive])
+    stats = dict(counts, hot_bytes_before=hot_before, hot_bytes_after=hot_after, archive_bytes=archive_bytes,
+                 compression=round(counts["raw_bytes"] / max(counts["stored_bytes"], 1), 2),
+                 hot_reduction=round(1 - hot_after / hot_before, 4))
+    if counts["archived"] != len(session_ids) - 1 or counts["still_active"] != 1:
+        failures.append(f"archive: {counts['archived']} archived, {counts['still_active']} still active "
+                        f"(expected {len(session_ids) - 1} and 1)")
+    if cm.messages.count_documents({"session_id": active}) == 0:
+        failures.append("archive: the active session was archived")
+    if stats["compression"] < 2:
+        failures.append(f"archive: compression ratio {stats['compression']}")
+
+    # Context from the (now stale) cache entry, then history of sessions nobody cached
+    for sid, (history, context) in before.items():
+        if sid != cached_sid:
+            cm._cache.pop(sid, None)
+        got_context = cm.get_conversation_context(sid)
+        got_history = full_history(cm, sid)
+        if got_context != context:
+            failures.append(f"restore: session {sid[:8]} context differs")
+        if got_history != history:
+            failures.append(f"restore: session {sid[:8]} history differs ({len(got_history)} vs {len(history)} messages)")
+        if cm.archiver.archive.count_documents({"session_id": sid}):
+            failures.append(f"restore: session {sid[:8]} still archived")
+    # A chat without history in an archived session restores it on the first write
+    sid = session_ids[6]
+    rag.chat(sid, "hello again", include_history=False)
+    if cm.archiver.archive.count_documents({"session_id": sid}) or cm.get_history(sid, limit=200)["messages"][0]["text"] != "hello":
+        failures.append("restore: a write to an archived session did not restore it")
+    return stats, failures
+
+
+def check_reset(app, cm, session_ids: List[str]) -> (Dict, List[str]):
+    from fastapi.testclient import TestClient
+
+    failures, stats = [], {}
+    collections = hot_collections(cm) + [cm.archiver.archive]
+    cm.archiver.run()  # leave some of them archived
+    half = len(session_ids) // 2
+    for mode, ids in (("one by one", session_ids[:half]), ("bulk", session_ids[half:])):
+        deletes = sum(c.ops["delete"] for c in collections)
+        if mode == "bulk":
+            cm.reset_sessions(ids)
+        else:
+            for sid in ids:
+                cm.reset_session(sid)
+        stats[mode] = {"sessions": len(ids), "delete_ops": sum(c.ops["delete"] for c in collections) - deletes}
+        left = stored_bytes(collections, ids) + sum(sid in cm._cache for sid in ids)
+        if left:
+            failures.append(f"reset {mode}: documents or cache entries remain")
+    if stats["bulk"]["delete_ops"] >= stats["one by one"]["delete_ops"]:
+        failures.append(f"reset: bulk issued {stats['bulk']['delete_ops']} deletes")
+
+    client = TestClient(app)
+    owned = [cm.create_session(user_id="bulk-user") for _ in range(5)]
+    response = client.post("/sessions/reset", json={"user_id": "bulk-user"})
+    if response.status_code != 200 or response.json().get("sessions_reset") != len(owned):
+        failures.append(f"POST /sessions/reset: {response.status_code} {response.text}")
+    if cm.sessions.count_documents({"user_id": "bulk-user"}):
+        failures.append("POST /sessions/reset: sessions of the user remain")
+    if client.post("/sessions/reset", json={}).status_code != 400:
+        failures.append("POST /sessions/reset without ids or user_id was not rejected")
+    return stats, failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-folder", default=DEFAULT_DATA_FOLDER)
+    parser.add_argument("--index-dir", default=None)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=5, help="Chats per session")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    os.environ.update(SESSION_RETENTION_DAYS=str(RETENTION_DAYS), SESSION_ARCHIVE_AFTER_DAYS=str(ARCHIVE_AFTER_DAYS),
+                      SESSION_ARCHIVE_RETENTION_DAYS=str(ARCHIVE_RETENTION_DAYS), RATE_LIMIT_USER_RPM="0",
+                      RATE_LIMIT_SESSION_RPM="0")
+    from .offline import load_offline_app
+
+    app, rag = load_offline_app(args.data_folder, index_dir=args.index_dir, llm_latency_ms=0.0)
+    rag.warmup()
+    cm = rag.conversation_manager
+    questions = [item["query"] for item in load_benchmark()]
+
+    failures = check_ttl(cm) + check_expiry(cm) + check_wake(cm) + check_revive(cm)
+    session_ids = run_sessions(rag, max(args.sessions, 8), args.turns, questions)
+    archive, archive_failures = check_archive(rag, session_ids)
+    backdate(cm, session_ids, ARCHIVE_AFTER_DAYS + 3)
+    reset, reset_failures = check_reset(app, cm, session_ids)
+    failures += archive_failures + reset_failures
+
+    print(f"Archive of {archive['archived']} sessions ({archive['messages']} messages)")
+    print(f"  hot bytes      {archive['hot_bytes_before']:>10} -> {archive['hot_bytes_after']:>10} "
+          f"({-archive['hot_reduction']:+.1%})")
+    print(f"  archive bytes  {archive['archive_bytes']:>10}   raw {archive['raw_bytes']}, "
+          f"compressed {archive['stored_bytes']} ({archive['compression']:.1f}x)")
+    print(f"{'reset':<12} {'sessions':>9} {'delete ops':>11}")
+    for mode, row in reset.items():
+        print(f"{mode:<12} {row['sessions']:>9} {row['delete_ops']:>11}")
+    print("OK" if not failures else "FAILED:\n  " + "\n  ".join(failures))
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("lifecycle_check", config, {"archive": archive, "reset": reset, "failures": failures},
+                          args.output)
+    print(f"Results written to {result['_path']}")
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
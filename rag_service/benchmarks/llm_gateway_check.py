@@ -0,0 +1,194 @@
+"""Failure handling of the LLM gateway against the fake backend: retries, timeouts, deadline, breaker, slots.
+
+    python -m benchmarks.llm_gateway_check
+    python -m benchmarks.llm_gateway_check --calls 400 --error-rate 0.3
+
+Scenarios (flaky and slow also run without the gateway, one direct create() per call as before):
+
+    flaky       --error-rate of the calls fail with a 503; jittered retries should absorb them
+    slow        the upstream takes --slow-ms; calls must give up after the purpose timeout
+    deadline    same upstream inside a 1 s request deadline: every call returns by then, retries included
+    outage      every call fails; once the breaker opens, calls fail in microseconds
+    half_open   a call in half-open state whose slot wait outlasts its deadline; the next call
+                must still get the trial and close the circuit
+    slots       --threads callers against LLM_MAX_CONCURRENCY=4: never more than 4 calls in flight
+
+Prints OK, or the failed expectations (exit status 1).
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from .common import latency_summary, write_result
+
+logger = logging.getLogger("benchmarks.llm_gateway_check")
+
+MESSAGES = [{"role": "user", "content": "What does Article 21 of the Constitution protect?"}]
+
+
+def run_calls(call: Callable[[], str], calls: int, threads: int) -> Dict:
+    latencies, failures = [], 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            call()
+            ok = True
+        except Exception:
+            ok = False
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            failures += not ok
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(one, range(calls)))
+    return dict(latency_summary(latencies), calls=calls, success=round(1 - failures / max(1, calls), 4))
+
+
+def direct(client) -> Callable[[], str]:
+    return lambda: client.chat.completions.create(messages=MESSAGES, max_tokens=60).choices[0].message.content
+
+
+class LateSlots:
+    """Slots handed out only once `seconds` have passed, as if every one had been busy until then."""
+
+    def __init__(self, slots, seconds: float):
+        self.slots, self.seconds = slots, seconds
+
+    def acquire(self, timeout=None):
+        time.sleep(self.seconds)
+        return self.slots.acquire(timeout=timeout)
+
+    def release(self):
+        self.slots.release()
+
+
+def check_half_open(gateway, deadline) -> (str, list):
+    """A half-open breaker whose trial call missed its deadline still closes on the next good call."""
+    from src.llm_gateway import LLMDeadlineExceeded
+
+    breaker = gateway.breaker
+    breaker._consecutive = breaker.failures
+    breaker._opened_at = time.monotonic() - breaker.reset_s - 1
+    slots, gateway._slots = gateway._slots, LateSlots(gateway._slots, 0.05)
+    try:
+        with deadline(0.02):
+            gateway.complete("rewrite", MESSAGES)
+        return breaker.state, ["half_open: the call did not miss its deadline"]
+    except LLMDeadlineExceeded:
+        pass
+    finally:
+        gateway._slots = slots
+    try:
+        gateway.complete("rewrite", MESSAGES)
+    except Exception as e:
+        return breaker.state, [f"half_open: the call after a missed deadline failed ({type(e).__name__}: {e})"]
+    if breaker.state != "closed":
+        return breaker.state, [f"half_open: breaker {breaker.state} after a successful trial"]
+    return breaker.state, []
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.2)
+    parser.add_argument("--slow-ms", type=float, default=3000.0)
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    # Short timeouts and backoff so the check runs in seconds
+    os.environ.update({"LLM_REWRITE_TIMEOUT_S": "0.3", "LLM_RETRY_BASE_S": "0.02", "LLM_MAX_RETRIES": "2",
+                       "LLM_BREAKER_FAILURES": "5", "LLM_BREAKER_RESET_S": "60", "LLM_MAX_CONCURRENCY": "4"})
+    from src.fake_llm import FakeLLMClient
+    from src.llm_gateway import LLMGateway, deadline
+
+    rows, failures = {}, []
+
+    client = FakeLLMClient(args.latency_ms, error_rate=args.error_rate)
+    rows["flaky/direct"] = run_calls(direct(client), args.calls, args.threads)
+    gateway = LLMGateway(client=FakeLLMClient(args.latency_ms, error_rate=args.error_rate))
+    rows["flaky/gateway"] = run_calls(lambda: gateway.complete("rewrite", MESSAGES), args.calls, args.threads)
+    # Three attempts fail together with probability error_rate ** 3
+    if rows["flaky/gateway"]["success"] < 1 - 3 * args.error_rate ** 3:
+        failures.append(f"flaky: gateway success {rows['flaky/gateway']['success']}")
+
+    slow_calls = max(4, args.threads // 2)
+    rows["slow/direct"] = run_calls(direct(FakeLLMClient(args.slow_ms)), slow_calls, slow_calls)
+    gateway = LLMGateway(client=FakeLLMClient(args.slow_ms))
+    gateway.breaker.failures = 0  # measure the timeouts alone
+    rows["slow/gateway"] = run_calls(lambda: gateway.complete("rewrite", MESSAGES), slow_calls, slow_calls)
+    # Three attempts of 0.3 s, plus backoff and waiting for one of the 4 slots
+    if rows["slow/gateway"]["max"] > 3 * 1000.0:
+        failures.append(f"slow: a gateway call took {rows['slow/gateway']['max']:.0f} ms")
+
+    def within_deadline():
+        with deadline(1.0):
+            return gateway.complete("rewrite", MESSAGES)
+
+    rows["deadline/gateway"] = run_calls(within_deadline, slow_calls, slow_calls)
+    if rows["deadline/gateway"]["max"] > 1000.0 + 50.0:
+        failures.append(f"deadline: a call took {rows['deadline/gateway']['max']:.0f} ms against a 1000 ms deadline")
+
+    gateway = LLMGateway(client=FakeLLMClient(args.latency_ms, error_rate=1.0))
+    rows["outage/gateway"] = run_calls(lambda: gateway.complete("rewrite", MESSAGES), args.calls, args.threads)
+    if gateway.breaker.state != "open":
+        failures.append(f"outage: breaker {gateway.breaker.state}")
+    upstream = gateway.client.chat.completions.calls
+    if upstream > 4 * 3 + gateway.breaker.failures:
+        failures.append(f"outage: {upstream} upstream calls for {args.calls} requests")
+    rows["outage/gateway"]["upstream_calls"] = upstream
+
+    half_open, half_open_failures = check_half_open(LLMGateway(client=FakeLLMClient(args.latency_ms)), deadline)
+    failures += half_open_failures
+
+    gateway = LLMGateway(client=FakeLLMClient(args.latency_ms * 4))
+    in_flight, peak = [0], [0]
+    lock = threading.Lock()
+    create = gateway.client.chat.completions.create
+
+    def counted(**kwargs):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        try:
+            return create(**kwargs)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    gateway.client.chat.completions.create = counted
+    # Generation's 30 s timeout: callers queue for a slot instead of being shed
+    rows["slots/gateway"] = run_calls(lambda: gateway.complete("generation", MESSAGES), args.calls, args.threads)
+    rows["slots/gateway"]["peak_in_flight"] = peak[0]
+    if rows["slots/gateway"]["success"] < 1.0 or peak[0] > gateway.max_concurrency:
+        failures.append(f"slots: success {rows['slots/gateway']['success']}, {peak[0]} calls in flight, "
+                        f"limit {gateway.max_concurrency}")
+
+    print(f"{'scenario':<18} {'calls':>6} {'success':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for name, row in rows.items():
+        print(f"{name:<18} {row['calls']:>6} {row['success']:>8.3f} {row['p50']:>8.2f} {row['p95']:>8.2f} {row['max']:>8.1f}")
+    print(f"outage: {rows['outage/gateway']['upstream_calls']} upstream calls; "
+          f"slots: peak {rows['slots/gateway']['peak_in_flight']} in flight; half-open: {half_open}")
+    print("OK" if not failures else "FAILED:\n  " + "\n  ".join(failures))
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("llm_gateway_check", config, {"rows": rows, "failures": failures}, args.output)
+    print(f"Results written to {result['_path']}")
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""Latency/throughput load test for /chat, /chat/stream and /evaluate/retrieval.
+
+Runs in-process against the offline app by default (fake LLM, in-memory Mongo), or against
+a live server with --base-url. Writes a JSON result that can be compared with a baseline:
+
+    python -m benchmarks.load_test --concurrency 8 --requests 200 --output results/latest.json
+    python -m benchmarks.load_test --baseline results/latest.json --max-regression 0.15
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from .common import QUERIES_PATH, load_queries, latency_summary, stage_breakdown, compare_results, write_result
+
+ENDPOINTS = ("chat", "chat_stream", "evaluate_retrieval")
+
+logger = logging.getLogger("benchmarks.load_test")
+
+
+async def _create_sessions(client, n: int):
+    sessions = []
+    for _ in range(n):
+        resp = await client.post("/sessions", json={"title": "load-test"})
+        resp.raise_for_status()
+        sessions.append(resp.json()["session_id"])
+    return sessions
+
+
+async def _one_request(client, endpoint: str, query: str, session_id: str, args):
+    if endpoint == "chat":
+        payload = {"session_id": session_id, "query": query, "include_history": args.history, "trace": True}
+        resp = await client.post("/chat", json=payload)
+        body = resp.json() if resp.status_code == 200 else {}
+        return resp.status_code, (body.get("debug") or {}).get("stage_ms")
+    if endpoint == "chat_stream":
+        payload = {"session_id": session_id, "query": query, "include_history": args.history}
+        async with client.stream("POST", "/chat/stream", json=payload) as resp:
+            async for _ in resp.aiter_bytes():
+                pass
+            return resp.status_code, None
+    resp = await client.post("/evaluate/retrieval", json={"queries": [query], "mode": "both"})
+    return resp.status_code, None
+
+
+async def run_endpoint(client, endpoint: str, queries, sessions, args):
+    sem = asyncio.Semaphore(args.concurrency)
+    latencies, statuses, traces = [], {}, []
+
+    async def worker(i: int):
+        query = queries[i % len(queries)]
+        session_id = sessions[i % len(sessions)]
+        async with sem:
+            start = time.perf_counter()
+            try:
+                status, stage_ms = await _one_request(client, endpoint, query, session_id, args)
+            except Exception as e:
+                logger.warning("%s request failed: %s", endpoint, e)
+                status, stage_ms = "exception", None
+            elapsed = time.perf_counter() - start
+        if i >= args.warmup:
+            latencies.append(elapsed)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if stage_ms:
+                traces.append(stage_ms)
+
+    from src.metrics import REGISTRY
+    before = REGISTRY.snapshot()
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.requests + args.warmup)))
+    wall = time.perf_counter() - wall_start
+    after = REGISTRY.snapshot()
+
+    completed = len(latencies)
+    errors = sum(n for s, n in statuses.items() if s != "200")
+    result = {
+        "requests": completed,
+        "errors": errors,
+        "status_codes": statuses,
+        "latency_ms": latency_summary(latencies),
+        "throughput_rps": round(completed / wall, 2) if wall else 0.0,
+    }
+    # In-process runs can diff the metrics registry; live runs only have the per-request traces
+    if not args.base_url:
+        result["stage_breakdown_ms"] = stage_breakdown(before, after)
+    if traces:
+        result["trace_stage_mean_ms"] = {
+            stage: round(sum(t.get(stage, 0.0) for t in traces) / len(traces), 3)
+            for stage in sorted({s for t in traces for s in t})
+        }
+    return result
+
+
+async def main_async(args):
+    import httpx
+
+    if args.base_url:
+        transport, base_url = None, args.base_url
+    else:
+        # Measures capacity, so no per-user/session rate limits; the admission concurrency limit still applies
+        for name in ("RATE_LIMIT_USER_RPM", "RATE_LIMIT_SESSION_RPM"):
+            os.environ.setdefault(name, "0")
+        from .offline import load_offline_app
+        app, _ = load_offline_app(
+            index_dir=args.index_dir,
+            llm_latency_ms=args.llm_latency_ms,
+            llm_ms_per_token=args.llm_ms_per_token,
+            fake_embedder=not args.real_embedder,
+        )
+        transport, base_url = httpx.ASGITransport(app=app), "http://offline"
+
+    queries = load_queries(args.queries)
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=timeout, limits=limits) as client:
+        sessions = await _create_sessions(client, max(1, args.sessions))
+        results = {}
+        for endpoint in args.endpoints:
+            logger.info("Running %s: %d requests at concurrency %d", endpoint, args.requests, args.concurrency)
+            results[endpoint] = await run_endpoint(client, endpoint, queries, sessions, args)
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=100, help="Measured requests per endpoint")
+    parser.add_argument("--warmup", type=int, default=5, help="Unmeasured requests per endpoint")
+    parser.add_argument("--sessions", type=int, default=16, help="Distinct chat sessions to spread requests over")
+    parser.add_argument("--history", action="store_true", help="Send include_history=true (exercises rewrite/summaries)")
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--base-url", default=None, help="Target a live server instead of the offline app")
+    parser.add_argument("--index-dir", default=None, help="Offline index dir (default: fresh temp dir)")
+    parser.add_argument("--real-embedder", action="store_true", help="Use the real SentenceTransformer offline")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0, help="Fake LLM base latency")
+    parser.add_argument("--llm-ms-per-token", type=float, default=0.0, help="Fake LLM per-token latency")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--output", default=None, help="Write JSON results here")
+    parser.add_argument("--baseline", default=None, help="Compare against a previous JSON result")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed relative p95/throughput regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    results = asyncio.run(main_async(args))
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}
+    payload = write_result("load_test", config, {"endpoints": results}, args.output)
+    print(json.dumps(payload["endpoints"], indent=2))
+    if args.baseline:
+        regressions = compare_results(args.baseline, payload, args.max_regression)
+        for line in regressions:
+            print(f"REGRESSION: {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
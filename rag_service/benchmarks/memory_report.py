@@ -0,0 +1,197 @@
+"""Per-worker memory of the service: unique (USS), proportional (PSS) and shared RSS, from /proc/<pid>/smaps_rollup.
+
+    python -m benchmarks.memory_report --pid <serve.py pid>             # a running launcher and its workers
+    python -m benchmarks.memory_report --launch --workers 4 --index-dir /tmp/rag_bench_index
+    python -m benchmarks.memory_report --launch --workers 4 --modes prefork prefork-mmap independent --real-embedder
+
+--launch starts the offline app once per mode, waits for readiness, sends --requests retrievals
+so every worker touches its pages, then reads the counters:
+
+    prefork       serve.py: assets loaded once in the parent, workers share them copy-on-write
+    prefork-mmap  same, with FAISS_MMAP=1 (index codes shared through the page cache)
+    independent   serve.py --no-preload: every worker loads its own copy (like uvicorn --workers)
+
+RSS summed over processes double-counts shared pages; the PSS sum is the real footprint.
+Linux only.
+"""
+import argparse
+import itertools
+import logging
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+from .common import RAG_ROOT, load_queries, write_result
+from .startup_bench import free_port
+
+logger = logging.getLogger("benchmarks.memory_report")
+
+FIELDS = ("Rss", "Pss", "Private_Clean", "Private_Dirty", "Shared_Clean", "Shared_Dirty")
+
+
+def read_smaps(pid: int) -> Dict[str, int]:
+    """KiB per field, from smaps_rollup (or summed over smaps on kernels without it)."""
+    totals = dict.fromkeys(FIELDS, 0)
+    path = f"/proc/{pid}/smaps_rollup"
+    if not os.path.exists(path):
+        path = f"/proc/{pid}/smaps"
+    with open(path, encoding="ascii") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in totals:
+                totals[key] += int(rest.split()[0])
+    return totals
+
+
+def child_pids(pid: int) -> List[int]:
+    pids = []
+    for tid in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{tid}/children", encoding="ascii") as f:
+                pids.extend(int(p) for p in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def process_rows(root_pid: int) -> List[Dict]:
+    rows = []
+    for role, pid in [("parent", root_pid)] + [("worker", p) for p in child_pids(root_pid)]:
+        try:
+            m = read_smaps(pid)
+        except OSError:
+            continue
+        rows.append({
+            "pid": pid,
+            "role": role,
+            "rss_mb": round(m["Rss"] / 1024.0, 1),
+            "pss_mb": round(m["Pss"] / 1024.0, 1),
+            "uss_mb": round((m["Private_Clean"] + m["Private_Dirty"]) / 1024.0, 1),
+            "shared_mb": round((m["Shared_Clean"] + m["Shared_Dirty"]) / 1024.0, 1),
+        })
+    return rows
+
+
+def summarize(rows: List[Dict]) -> Dict:
+    workers = [r for r in rows if r["role"] == "worker"]
+    return {
+        "processes": len(rows),
+        "sum_rss_mb": round(sum(r["rss_mb"] for r in rows), 1),
+        "sum_pss_mb": round(sum(r["pss_mb"] for r in rows), 1),
+        "worker_uss_mb_mean": round(sum(r["uss_mb"] for r in workers) / len(workers), 1) if workers else 0.0,
+        "worker_shared_mb_mean": round(sum(r["shared_mb"] for r in workers) / len(workers), 1) if workers else 0.0,
+    }
+
+
+def print_rows(title: str, rows: List[Dict], summary: Dict):
+    print(f"\n{title}")
+    print(f"  {'pid':>7} {'role':<7} {'RSS':>8} {'PSS':>8} {'USS':>8} {'shared':>8}  (MB)")
+    for r in rows:
+        print(f"  {r['pid']:>7} {r['role']:<7} {r['rss_mb']:>8.1f} {r['pss_mb']:>8.1f} {r['uss_mb']:>8.1f} {r['shared_mb']:>8.1f}")
+    print(f"  total: RSS sum {summary['sum_rss_mb']:.1f} MB, PSS sum (actual) {summary['sum_pss_mb']:.1f} MB; "
+          f"per worker USS {summary['worker_uss_mb_mean']:.1f} MB, shared {summary['worker_shared_mb_mean']:.1f} MB")
+
+
+def wait_ready(base: str, workers: int, proc: subprocess.Popen, timeout: float):
+    """Requests land on arbitrary workers, so require a run of consecutive ready answers."""
+    deadline, streak = time.perf_counter() + timeout, 0
+    with httpx.Client(timeout=5.0) as client:
+        while streak < 3 * workers:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with code {proc.returncode}")
+            if time.perf_counter() > deadline:
+                raise TimeoutError("service not ready before timeout")
+            try:
+                streak = streak + 1 if client.get(f"{base}/health/ready").status_code == 200 else 0
+            except httpx.TransportError:
+                streak = 0
+            time.sleep(0.05)
+
+
+def measure_mode(mode: str, args, queries: List[str]) -> Dict:
+    port = free_port()
+    cmd = [sys.executable, "-m", "benchmarks.offline", "--port", str(port), "--workers", str(args.workers),
+           "--index-dir", args.index_dir]
+    if mode == "independent":
+        cmd.append("--no-preload")
+    if args.real_embedder:
+        cmd.append("--real-embedder")
+    env = dict(os.environ, FAISS_MMAP="1" if mode == "prefork-mmap" else "0")
+    proc = subprocess.Popen(cmd, cwd=RAG_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(base, args.workers, proc, args.timeout)
+        with httpx.Client(timeout=60.0) as client:
+            for query in itertools.islice(itertools.cycle(queries), args.requests):
+                client.post(f"{base}/evaluate/retrieval", json={"queries": [query], "mode": "single"})
+        time.sleep(0.5)
+        rows = process_rows(proc.pid)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return {"mode": mode, "rows": rows, "summary": summarize(rows)}
+
+
+def ensure_index(index_dir: str, real_embedder: bool):
+    from src.index_snapshots import has_index
+
+    if has_index(index_dir):
+        return
+    print(f"Building the benchmark index in {index_dir} ...")
+    subprocess.run([sys.executable, "-c",
+                    "from benchmarks.offline import load_offline_pipeline; "
+                    f"load_offline_pipeline(index_dir={index_dir!r}, fake_embedder={not real_embedder})"],
+                   cwd=RAG_ROOT, check=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pid", type=int, default=None, help="Report a running launcher and its workers")
+    parser.add_argument("--launch", action="store_true", help="Start the offline app per mode and compare")
+    parser.add_argument("--modes", nargs="+", default=["prefork", "prefork-mmap", "independent"],
+                        choices=["prefork", "prefork-mmap", "independent"])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=100, help="Retrievals sent before measuring")
+    parser.add_argument("--index-dir", default=os.path.join(RAG_ROOT, "benchmarks", "results", "memory_index"))
+    parser.add_argument("--real-embedder", action="store_true")
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if not sys.platform.startswith("linux"):
+        print("memory_report needs /proc (Linux)", file=sys.stderr)
+        return 1
+    if args.pid:
+        rows = process_rows(args.pid)
+        summary = summarize(rows)
+        print_rows(f"pid {args.pid}", rows, summary)
+        result = write_result("memory_report", {"pid": args.pid}, {"modes": [{"mode": "attached", "rows": rows, "summary": summary}]}, args.output)
+    elif args.launch:
+        ensure_index(args.index_dir, args.real_embedder)
+        queries = load_queries()
+        modes = []
+        for mode in args.modes:
+            measured = measure_mode(mode, args, queries)
+            modes.append(measured)
+            print_rows(f"{mode}: {args.workers} workers", measured["rows"], measured["summary"])
+        config = {k: v for k, v in vars(args).items() if k not in ("output", "pid")}
+        result = write_result("memory_report", config, {"modes": modes}, args.output)
+    else:
+        print("Pass --pid or --launch", file=sys.stderr)
+        return 2
+    print(f"\nResults written to {result['_path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
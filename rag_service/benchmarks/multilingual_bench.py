@@ -0,0 +1,148 @@
+"""Latency added by the Hindi/English path of /chat and /chat/stream, per stage.
+
+    python -m benchmarks.multilingual_bench --index-dir /tmp/rag_bench_index
+    python -m benchmarks.multilingual_bench --real-models --llm-ms-per-token 5
+
+Every benchmark query goes through RAGPipeline.chat (history off, trace on) as
+
+    en          English query, English answer (no translation)
+    en->hi      English query, language="hi" (answer translated)
+    hi          Hindi query, answered in Hindi (query and answer translated)
+
+reporting end-to-end p50/p95 and the p50 of each stage (language_detect, translate_query,
+packing (retrieval), llm, translate_answer). The streaming section replays the LLM answer
+stream for the Hindi queries through RAGPipeline.localize_stream and reports time to the first
+translated segment and the tail after the last LLM token, against translating the whole
+answer once generation has finished. Offline, the models are a word-echo stand-in with a
+per-decoder-step delay; --real-models loads the opus-mt checkpoints.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from typing import Dict, List
+
+from .common import latency_summary, load_queries, percentile, write_result
+from .offline import DEFAULT_DATA_FOLDER
+
+logger = logging.getLogger("benchmarks.multilingual_bench")
+
+HINDI_QUERIES = [
+    "अनुच्छेद 21 के अंतर्गत जीवन के अधिकार में क्या शामिल है?",
+    "गिरफ्तारी के बाद जमानत के लिए आवेदन कैसे करें?",
+    "अग्रिम जमानत किन परिस्थितियों में मिलती है?",
+    "यदि पुलिस प्राथमिकी दर्ज न करे तो क्या करें?",
+    "दहेज की मांग करने पर क्या सजा है?",
+    "समानता के अधिकार का उल्लंघन होने पर कौन सी रिट दायर की जा सकती है?",
+    "उपभोक्ता शिकायत कहाँ दर्ज की जाती है?",
+    "बंदी प्रत्यक्षीकरण रिट क्या है?",
+]
+
+STAGES = ["language_detect", "translate_query", "packing", "llm", "translate_answer"]
+
+
+def run_mode(rag, queries: List[str], language) -> Dict:
+    latencies, stages = [], {stage: [] for stage in STAGES}
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        out = rag.chat(f"multilingual-{i}", query, include_history=False, trace=True, language=language)
+        latencies.append(time.perf_counter() - start)
+        totals = out["debug"]["stage_ms"]
+        for stage in STAGES:
+            stages[stage].append(totals.get(stage, 0.0))
+    return dict(latency_summary(latencies),
+                stage_p50_ms={stage: round(percentile(sorted(v), 50), 2) for stage, v in stages.items()})
+
+
+def run_stream(rag, queries: List[str]) -> Dict:
+    first, tail, streamed, after, after_tail = [], [], [], [], []
+    for query in queries:
+        english, info = rag.localize_query(query, "hi")
+
+        def deltas():
+            yield from rag.llm.stream("stream", [{"role": "user", "content": english}])
+
+        ended = []
+
+        def watched():
+            yield from deltas()
+            ended.append(time.perf_counter())
+
+        # Cold cache for both variants, so the comparison is translation work, not cache hits
+        rag.translator._cache.clear()
+        start = time.perf_counter()
+        first_at = None
+        for _ in rag.localize_stream(watched(), info):
+            first_at = first_at or time.perf_counter()
+        done = time.perf_counter()
+        first.append(first_at - start)
+        tail.append(done - ended[0])
+        streamed.append(done - start)
+
+        rag.translator._cache.clear()
+        start = time.perf_counter()
+        text = "".join(deltas())
+        generated = time.perf_counter()
+        rag.localize_answer(text, info)
+        done = time.perf_counter()
+        after.append(done - start)
+        after_tail.append(done - generated)
+    return {
+        "first_segment": latency_summary(first),
+        "tail_after_last_token": latency_summary(tail),
+        "total_streamed": latency_summary(streamed),
+        "total_translate_after": latency_summary(after),
+        "tail_translate_after": latency_summary(after_tail),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-folder", default=DEFAULT_DATA_FOLDER)
+    parser.add_argument("--index-dir", default=None)
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--llm-ms-per-token", type=float, default=2.0)
+    parser.add_argument("--ms-per-step", type=float, default=0.5, help="Decoder step delay of the offline translator")
+    parser.add_argument("--real-embedder", action="store_true")
+    parser.add_argument("--real-models", action="store_true", help="Load the opus-mt checkpoints")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    from . import fakes
+    from .offline import load_offline_pipeline
+
+    fakes.FakeMarianModel.ms_per_step = args.ms_per_step
+    rag = load_offline_pipeline(args.data_folder, index_dir=args.index_dir, llm_latency_ms=args.llm_latency_ms,
+                                llm_ms_per_token=args.llm_ms_per_token, fake_embedder=not args.real_embedder,
+                                fake_translator=not args.real_models)
+    rag.warmup()
+    rag.translator.warmup()
+    english = load_queries()
+
+    rows = []
+    for mode, queries, language in (("en", english, None), ("en->hi", english, "hi"), ("hi", HINDI_QUERIES, None)):
+        rows.append(dict(run_mode(rag, queries, language), mode=mode, queries=len(queries)))
+    stream = run_stream(rag, HINDI_QUERIES)
+
+    print(f"{'mode':<7} {'p50 ms':>8} {'p95 ms':>8}  " + " ".join(f"{s:>16}" for s in STAGES))
+    for row in rows:
+        print(f"{row['mode']:<7} {row['p50']:>8.1f} {row['p95']:>8.1f}  "
+              + " ".join(f"{row['stage_p50_ms'][s]:>16.2f}" for s in STAGES))
+    print(f"\n/chat/stream, Hindi answers (p50 ms): first segment {stream['first_segment']['p50']:.1f}, "
+          f"tail after last token {stream['tail_after_last_token']['p50']:.1f}, "
+          f"total {stream['total_streamed']['p50']:.1f}; translating after generation: "
+          f"tail {stream['tail_translate_after']['p50']:.1f}, total {stream['total_translate_after']['p50']:.1f}")
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("multilingual_bench", config, {"rows": rows, "stream": stream}, args.output)
+    print(f"Results written to {result['_path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+"""Build the FastAPI app fully offline: fake LLM backend + in-memory Mongo (+ optional hashing embedder).
+
+Also runnable as a server (used by benchmarks.startup_bench and for --base-url load tests):
+
+    python -m benchmarks.offline --port 8100 --index-dir /tmp/rag_bench_index
+    python -m benchmarks.offline --port 8100 --index-dir /tmp/rag_bench_index --workers 4   # pre-forked (serve.py)
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+
+from . import fakes
+
+RAG_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_DATA_FOLDER = os.path.join(RAG_ROOT, "data")
+
+logger = logging.getLogger(__name__)
+
+
+def install_fakes(llm_latency_ms: float = 50.0, llm_ms_per_token: float = 0.0, fake_embedder: bool = True,
+                  fake_reranker: bool = True, reranker_ms_per_pair: float = 0.0, fake_translator: bool = True):
+    """Swap the external clients referenced by the src modules for offline stand-ins.
+
+    Must run before `main` is imported: main reads its settings at import time, and the pipeline
+    that load_pipeline() builds in a background thread on startup must only ever see the stand-ins.
+    """
+    if RAG_ROOT not in sys.path:
+        sys.path.insert(0, RAG_ROOT)
+    os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+    # The service's own fake LLM backend; env, so forked and spawned workers use it too
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["LLM_FAKE_LATENCY_MS"] = str(llm_latency_ms)
+    os.environ["LLM_FAKE_MS_PER_TOKEN"] = str(llm_ms_per_token)
+    fakes.OverlapCrossEncoder.ms_per_pair = reranker_ms_per_pair
+
+    import src.conversation_manager
+    import src.legal_evaluator
+    import src.vector_store
+    import src.reranker
+    import src.translation_service
+
+    src.conversation_manager.MongoClient = fakes.FakeMongoClient
+    src.legal_evaluator.MongoClient = fakes.FakeMongoClient
+    if fake_embedder:
+        src.vector_store.load_encoder = fakes.HashingEncoder
+    if fake_reranker:
+        # Only used when RERANK_ENABLED=1
+        src.reranker.load_cross_encoder = fakes.OverlapCrossEncoder
+    if fake_translator:
+        src.translation_service.load_marian = fakes.load_fake_marian
+
+
+def load_offline_pipeline(data_folder: str = DEFAULT_DATA_FOLDER, index_dir: str = None, **fake_options):
+    """Return an initialized RAGPipeline wired to the fakes, without importing the FastAPI app.
+
+    The index is built into `index_dir` (a temp dir by default) so the real vector_store/ is untouched;
+    pass the same dir again to reuse it.
+    """
+    install_fakes(**fake_options)
+    index_dir = index_dir or tempfile.mkdtemp(prefix="rag_bench_index_")
+    from src.rag_pipeline import RAGPipeline
+
+    rag = RAGPipeline(os.environ["GROQ_API_KEY"], index_dir=index_dir, db_name="rag_benchmark")
+    rag.initialize(data_folder, force_rebuild=False)
+    logger.info("Offline pipeline ready: %d chunks indexed in %s", len(rag.vector_store.documents), index_dir)
+    return rag
+
+
+def load_offline_app(data_folder: str = DEFAULT_DATA_FOLDER, index_dir: str = None, **fake_options):
+    """Return (app, rag) with the offline pipeline installed as `main.rag`."""
+    install_fakes(**fake_options)
+    os.environ["RAG_DATA_FOLDER"] = data_folder
+    import main
+
+    # Endpoints look up `main.rag` at call time, so swapping the module global is enough
+    main.rag = load_offline_pipeline(data_folder, index_dir, **fake_options)
+    main.RAG_DATA_FOLDER = data_folder
+    return main.app, main.rag
+
+
+def serve(argv=None):
+    """Run main.app under uvicorn with the fakes installed; startup goes through the normal background loader."""
+    parser = argparse.ArgumentParser(description="Serve the RAG app offline")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--data-folder", default=DEFAULT_DATA_FOLDER)
+    parser.add_argument("--index-dir", default=None, help="Index directory (default: a new temp dir)")
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--real-embedder", action="store_true")
+    parser.add_argument("--workers", type=int, default=0, help="Run under serve.py with N forked workers")
+    parser.add_argument("--no-preload", action="store_true", help="With --workers: every worker loads its own copy")
+    args = parser.parse_args(argv)
+
+    install_fakes(llm_latency_ms=args.llm_latency_ms, fake_embedder=not args.real_embedder)
+    # main reads these at import time
+    os.environ["RAG_DATA_FOLDER"] = args.data_folder
+    os.environ["RAG_INDEX_DIR"] = args.index_dir or tempfile.mkdtemp(prefix="rag_bench_index_")
+    os.environ["MONGO_DB_NAME"] = "rag_benchmark"
+    log_level = os.getenv("LOG_LEVEL", "warning").lower()
+    if args.workers:
+        import serve as launcher
+
+        launcher.run(args.host, args.port, args.workers, preload=not args.no_preload, log_level=log_level)
+        return
+    import uvicorn
+    import main as service
+
+    uvicorn.run(service.app, host=args.host, port=args.port, log_level=log_level)
+
+
+if __name__ == "__main__":
+    serve()
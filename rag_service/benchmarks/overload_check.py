@@ -0,0 +1,286 @@
+"""Admission control under a synthetic overload of the offline app: rate limits, shedding, priority lanes.
+
+    python -m benchmarks.overload_check --index-dir /tmp/rag_bench_index
+    python -m benchmarks.overload_check --requests 120 --llm-latency-ms 300
+
+The app runs with ADMISSION_MAX_CONCURRENCY=4, small lane queues and low rate limits, so every
+scenario overloads it:
+
+    flood       one user fires --requests chats at once while 4 other users ask one question each:
+                the flooder gets at most its burst through, everyone else is answered
+    overload    --requests chats from distinct users at once: the excess is shed with 429 and
+                Retry-After (no 5xx), and never more than 4 requests hold a slot
+    lanes       slots held by chats while streams and /evaluate/retrieval batches queue: streams wait
+                less than batches, and only batches are shed
+    invalid     empty queries to /chat and /chat/stream get 400 and use none of the user's burst:
+                a valid chat after more of them than the burst is answered
+    ordering    the controller alone: with every slot held, queued streams start before queued batches
+    shared      two rate limiters on one (in-memory) Mongo collection, hammered from threads: the
+                compare-and-set store admits exactly one burst between them
+
+Prints OK, or the failed expectations (exit status 1).
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from .common import latency_summary, write_result
+from .offline import DEFAULT_DATA_FOLDER
+
+logger = logging.getLogger("benchmarks.overload_check")
+
+MAX_CONCURRENCY = 4
+USER_BURST = 5
+ENV = {
+    "ADMISSION_MAX_CONCURRENCY": str(MAX_CONCURRENCY), "ADMISSION_QUEUE_TIMEOUT_S": "5",
+    "ADMISSION_STREAM_QUEUE": "8", "ADMISSION_CHAT_QUEUE": "8", "ADMISSION_BATCH_QUEUE": "4",
+    "ADMISSION_BATCH_MAX_IN_FLIGHT": "2",
+    "RATE_LIMIT_STORE": "local", "RATE_LIMIT_USER_RPM": "6", "RATE_LIMIT_USER_BURST": str(USER_BURST),
+    "RATE_LIMIT_SESSION_RPM": "6", "RATE_LIMIT_SESSION_BURST": "3",
+}
+QUERY = "What does Article 21 of the Constitution protect?"
+
+
+async def request(client, endpoint: str, payload: Dict) -> Dict:
+    start = time.perf_counter()
+    if endpoint == "/chat/stream":
+        async with client.stream("POST", endpoint, json=payload) as resp:
+            async for _ in resp.aiter_bytes():
+                pass
+    else:
+        resp = await client.post(endpoint, json=payload)
+    return {"status": resp.status_code, "retry_after": resp.headers.get("retry-after"),
+            "latency": time.perf_counter() - start}
+
+
+async def sessions(client, n: int) -> List[str]:
+    return [(await client.post("/sessions", json={})).json()["session_id"] for _ in range(n)]
+
+
+def summarize(results: List[Dict]) -> Dict:
+    statuses: Dict[str, int] = {}
+    for r in results:
+        statuses[str(r["status"])] = statuses.get(str(r["status"]), 0) + 1
+    rejected = [r for r in results if r["status"] == 429]
+    return {
+        "requests": len(results),
+        "status_codes": statuses,
+        "missing_retry_after": sum(1 for r in rejected if not (r["retry_after"] or "").isdigit()),
+        "latency_ms": latency_summary([r["latency"] for r in results if r["status"] == 200]),
+        "rejected_latency_ms": latency_summary([r["latency"] for r in rejected]),
+    }
+
+
+def wait_means(before: Dict, after: Dict) -> Dict[str, float]:
+    """Mean admission queue wait per lane (ms) between two rag_admission_wait_seconds snapshots."""
+    out = {}
+    for lane, state in after.items():
+        count = state["count"] - before.get(lane, {}).get("count", 0)
+        total = state["sum"] - before.get(lane, {}).get("sum", 0.0)
+        out[lane] = round(1000.0 * total / count, 1) if count else 0.0
+    return out
+
+
+async def flood(client, args) -> Dict:
+    noisy = await sessions(client, args.requests)
+    quiet = await sessions(client, 4)
+    tasks = [request(client, "/chat", {"session_id": s, "user_id": "flooder", "query": QUERY, "include_history": False})
+             for s in noisy]
+    tasks += [request(client, "/chat", {"session_id": s, "user_id": f"quiet-{i}", "query": QUERY,
+                                        "include_history": False}) for i, s in enumerate(quiet)]
+    results = await asyncio.gather(*tasks)
+    return {"flooder": summarize(results[:len(noisy)]), "others": summarize(results[len(noisy):])}
+
+
+async def overload(client, args, admission) -> Dict:
+    ids = await sessions(client, args.requests)
+    peak, stop = [0], threading.Event()
+
+    def sample():
+        while not stop.is_set():
+            peak[0] = max(peak[0], admission.in_flight())
+            time.sleep(0.001)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    results = await asyncio.gather(*[
+        request(client, "/chat", {"session_id": s, "user_id": f"user-{i}", "query": QUERY, "include_history": False})
+        for i, s in enumerate(ids)])
+    stop.set()
+    sampler.join()
+    return dict(summarize(results), peak_in_flight=peak[0])
+
+
+async def lanes(client, args) -> Dict:
+    from src.metrics import ADMISSION_WAIT
+
+    before = ADMISSION_WAIT.snapshot()
+    ids = await sessions(client, MAX_CONCURRENCY + 8)
+    holders = [asyncio.ensure_future(request(client, "/chat", {"session_id": s, "user_id": f"holder-{i}", "query": QUERY,
+                                                                "include_history": False}))
+               for i, s in enumerate(ids[:MAX_CONCURRENCY])]
+    await asyncio.sleep(0.05)
+    batches = [request(client, "/evaluate/retrieval", {"queries": [QUERY] * 10, "mode": "both", "user_id": f"batch-{i}"})
+               for i in range(8)]
+    streams = [request(client, "/chat/stream", {"session_id": s, "user_id": f"stream-{i}", "query": QUERY})
+               for i, s in enumerate(ids[MAX_CONCURRENCY:])]
+    results = await asyncio.gather(*holders, *batches, *streams)
+    batch_results, stream_results = results[MAX_CONCURRENCY:MAX_CONCURRENCY + 8], results[MAX_CONCURRENCY + 8:]
+    return {"batch": summarize(batch_results), "stream": summarize(stream_results),
+            "mean_wait_ms": wait_means(before, ADMISSION_WAIT.snapshot())}
+
+
+async def invalid(client) -> Dict:
+    sid = (await sessions(client, 1))[0]
+    rejected = []
+    for i in range(USER_BURST + 2):
+        endpoint = "/chat" if i % 2 == 0 else "/chat/stream"
+        rejected.append(await request(client, endpoint, {"session_id": sid, "user_id": "blank", "query": "  "}))
+    valid = await request(client, "/chat", {"session_id": sid, "user_id": "blank", "query": QUERY, "include_history": False})
+    return {"empty": summarize(rejected), "valid_status": valid["status"]}
+
+
+def ordering() -> List[str]:
+    """Lanes in the order their queued requests were admitted, with every slot initially held."""
+    from src.admission import AdmissionController
+
+    controller = AdmissionController(max_concurrency=1, queue_timeout_s=5.0)
+    held = controller.acquire("chat")
+    order, lock = [], threading.Lock()
+
+    def one(lane: str):
+        with controller.acquire(lane):
+            with lock:
+                order.append(lane)
+            time.sleep(0.005)
+
+    threads = []
+    # Batches queue first; the streams arriving later must still be admitted before them
+    for lane in ["batch"] * 2 + ["stream"] * 3:
+        t = threading.Thread(target=one, args=(lane,))
+        t.start()
+        threads.append(t)
+        time.sleep(0.01)
+    held.release()
+    for t in threads:
+        t.join()
+    return order
+
+
+def shared(threads: int = 16, calls: int = 200) -> Dict:
+    from src.admission import AdmissionRejected, MongoBucketStore, RateLimiter
+    from .fakes import FakeMongoClient
+
+    collection = FakeMongoClient()["overload_check"].get_collection("rate_limits")
+    # Two "workers" sharing one collection; a burst of 10 and a refill too slow to matter during the run
+    limiters = [RateLimiter(MongoBucketStore(lambda: collection), user_rpm=0.01, user_burst=10, session_rpm=0)
+                for _ in range(2)]
+    admitted = [0]
+    lock = threading.Lock()
+
+    def one(i: int):
+        try:
+            limiters[i % 2].check("chat", user_id="shared-user")
+        except AdmissionRejected:
+            return
+        with lock:
+            admitted[0] += 1
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(one, range(calls)))
+    return {"calls": calls, "admitted": admitted[0], "burst": 10}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-folder", default=DEFAULT_DATA_FOLDER)
+    parser.add_argument("--index-dir", default=None)
+    parser.add_argument("--requests", type=int, default=60, help="Concurrent requests in the flood and overload scenarios")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+async def run_http(args) -> Dict:
+    import httpx
+    from .offline import load_offline_app
+
+    app, rag = load_offline_app(args.data_folder, index_dir=args.index_dir, llm_latency_ms=args.llm_latency_ms)
+    rag.warmup()
+    import main as service
+
+    rows = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://offline", timeout=60.0) as client:
+        rows["flood"] = await flood(client, args)
+        rows["overload"] = await overload(client, args, service.admission)
+        rows["lanes"] = await lanes(client, args)
+        rows["invalid"] = await invalid(client)
+    return rows
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # main.py builds its admission controller and rate limiter from the environment at import
+    os.environ.update(ENV)
+    rows = asyncio.run(run_http(args))
+    rows["ordering"] = ordering()
+    rows["shared"] = shared()
+
+    failures = []
+    flooder, others = rows["flood"]["flooder"], rows["flood"]["others"]
+    if flooder["status_codes"].get("200", 0) > USER_BURST:
+        failures.append(f"flood: {flooder['status_codes'].get('200', 0)} flooder requests answered, burst {USER_BURST}")
+    if others["status_codes"] != {"200": others["requests"]}:
+        failures.append(f"flood: other users got {others['status_codes']}")
+    over = rows["overload"]
+    if set(over["status_codes"]) - {"200", "429"} or not over["status_codes"].get("429"):
+        failures.append(f"overload: status codes {over['status_codes']}")
+    if over["peak_in_flight"] > MAX_CONCURRENCY:
+        failures.append(f"overload: {over['peak_in_flight']} requests in flight, limit {MAX_CONCURRENCY}")
+    for name, row in (("flood", flooder), ("overload", over), ("lanes/batch", rows["lanes"]["batch"])):
+        if row["missing_retry_after"]:
+            failures.append(f"{name}: {row['missing_retry_after']} 429s without a Retry-After")
+    lanes_row = rows["lanes"]
+    if lanes_row["stream"]["status_codes"] != {"200": lanes_row["stream"]["requests"]}:
+        failures.append(f"lanes: streams got {lanes_row['stream']['status_codes']}")
+    waits = lanes_row["mean_wait_ms"]
+    if waits.get("batch") and waits.get("stream", 0.0) > waits["batch"]:
+        failures.append(f"lanes: streams waited {waits['stream']} ms on average, batches {waits['batch']} ms")
+    if rows["invalid"]["empty"]["status_codes"] != {"400": USER_BURST + 2}:
+        failures.append(f"invalid: empty queries got {rows['invalid']['empty']['status_codes']}")
+    if rows["invalid"]["valid_status"] != 200:
+        failures.append(f"invalid: a valid chat after {USER_BURST + 2} empty ones got {rows['invalid']['valid_status']}")
+    if rows["ordering"] != ["stream"] * 3 + ["batch"] * 2:
+        failures.append(f"ordering: admitted {rows['ordering']}")
+    if rows["shared"]["admitted"] != rows["shared"]["burst"]:
+        failures.append(f"shared: {rows['shared']['admitted']} admitted across two limiters, burst {rows['shared']['burst']}")
+
+    print(f"{'scenario':<16} {'requests':>9} {'200':>5} {'429':>5} {'other':>6} {'p95 ms':>8} {'429 p95 ms':>11}")
+    for name, row in (("flood/flooder", flooder), ("flood/others", others), ("overload", over),
+                      ("lanes/stream", lanes_row["stream"]), ("lanes/batch", lanes_row["batch"])):
+        codes = row["status_codes"]
+        other = row["requests"] - codes.get("200", 0) - codes.get("429", 0)
+        print(f"{name:<16} {row['requests']:>9} {codes.get('200', 0):>5} {codes.get('429', 0):>5} {other:>6} "
+              f"{row['latency_ms']['p95']:>8.1f} {row['rejected_latency_ms']['p95']:>11.1f}")
+    print(f"overload: peak {over['peak_in_flight']} in flight; lanes: mean queue wait {waits}")
+    print(f"invalid: empty queries got {rows['invalid']['empty']['status_codes']}, "
+          f"then a valid chat {rows['invalid']['valid_status']}")
+    print(f"ordering: {rows['ordering']}; shared: {rows['shared']['admitted']}/{rows['shared']['calls']} admitted")
+    print("OK" if not failures else "FAILED:\n  " + "\n  ".join(failures))
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("overload_check", config, {"rows": rows, "failures": failures, "env": ENV}, args.output)
+    print(f"Results written to {result['_path']}")
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""Hit@3, prompt size and latency of retrieval with and without the cross-encoder reranker.
+
+    python -m benchmarks.rerank_bench --index-dir /tmp/rag_bench_index
+    python -m benchmarks.rerank_bench --real-embedder --real-reranker --budgets 50 100 200 400
+    python -m benchmarks.rerank_bench --reranker-ms-per-pair 5 --budgets 20 60 200   # exercise the budget offline
+
+Every benchmark query goes through RAGPipeline.retrieve_chunks, i.e. exactly the chunks that
+would reach the LLM. `fused` is the current pipeline (RRF order, score filter with top-k
+fallback); each `rerank@<budget>` row rescoring the top --top-n candidates under that budget.
+Reranker rows are run twice: `cold` (empty cache) and `warm` (every (query, chunk) pair cached).
+Offline, the reranker is a term-overlap stand-in; --real-reranker loads RERANK_MODEL.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from typing import Dict, List
+
+from .common import load_benchmark, latency_summary, write_result
+from .offline import DEFAULT_DATA_FOLDER
+
+logger = logging.getLogger("benchmarks.rerank_bench")
+
+
+def hit(chunks: List[str], gold_keywords: List[str], n: int) -> bool:
+    return any(kw.lower() in chunk.lower() for chunk in chunks[:n] for kw in gold_keywords)
+
+
+def run_pass(rag, benchmark: List[Dict], k: int) -> Dict:
+    from src.metrics import RERANK_OUTCOMES
+
+    before = RERANK_OUTCOMES.snapshot()
+    latencies, hit3, hitk, chunks, chars = [], 0, 0, 0, 0
+    for item in benchmark:
+        start = time.perf_counter()
+        selected = rag.retrieve_chunks(item["query"], k)
+        latencies.append(time.perf_counter() - start)
+        hit3 += hit(selected, item["gold_keywords"], 3)
+        hitk += hit(selected, item["gold_keywords"], k)
+        chunks += len(selected)
+        chars += sum(len(c) for c in selected)
+    after = RERANK_OUTCOMES.snapshot()
+    n = max(1, len(benchmark))
+    return dict(
+        latency_summary(latencies),
+        **{"hit@3": round(hit3 / n, 4), "hit@k": round(hitk / n, 4)},
+        chunks_per_query=round(chunks / n, 2),
+        # Same 4-chars-per-token heuristic as the pipeline's token budgeting
+        context_tokens_per_query=round(chars / 4 / n, 1),
+        outcomes={key: after.get(key, 0) - before.get(key, 0) for key in after},
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-folder", default=DEFAULT_DATA_FOLDER)
+    parser.add_argument("--index-dir", default=None)
+    parser.add_argument("--k", type=int, default=5, help="Chunks requested per query (RETRIEVE_K)")
+    parser.add_argument("--top-n", type=int, default=20, help="Fused candidates rescored")
+    parser.add_argument("--budgets", type=float, nargs="+", default=[50.0, 200.0], help="RERANK_BUDGET_MS values")
+    parser.add_argument("--min-score", type=float, default=None, help="RERANK_MIN_SCORE (default: env or 0.1)")
+    parser.add_argument("--real-embedder", action="store_true")
+    parser.add_argument("--real-reranker", action="store_true")
+    parser.add_argument("--reranker-ms-per-pair", type=float, default=0.0, help="Delay of the offline stand-in")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    from .offline import load_offline_pipeline
+    from src.reranker import Reranker
+
+    rag = load_offline_pipeline(args.data_folder, index_dir=args.index_dir, fake_embedder=not args.real_embedder,
+                                fake_reranker=not args.real_reranker, reranker_ms_per_pair=args.reranker_ms_per_pair)
+    rag.reranker = None
+    rag.warmup()
+    benchmark = load_benchmark()
+
+    rows = [dict(run_pass(rag, benchmark, args.k), config="fused", cache="-")]
+    for budget in args.budgets:
+        rag.reranker = Reranker(top_n=args.top_n, budget_ms=budget, min_score=args.min_score)
+        rag.reranker.warmup()
+        if rag.reranker.model is None:
+            print("Reranker model could not be loaded", file=sys.stderr)
+            return 1
+        for cache in ("cold", "warm"):
+            rows.append(dict(run_pass(rag, benchmark, args.k), config=f"rerank@{budget:g}ms", cache=cache))
+    rag.reranker = None
+
+    print(f"{'config':<16} {'cache':<5} {'hit@3':>6} {'hit@k':>6} {'chunks':>7} {'ctx tok':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8}  outcomes")
+    for row in rows:
+        outcomes = ", ".join(f"{k}={v}" for k, v in row["outcomes"].items() if v) or "-"
+        print(f"{row['config']:<16} {row['cache']:<5} {row['hit@3']:>6.3f} {row['hit@k']:>6.3f} "
+              f"{row['chunks_per_query']:>7.2f} {row['context_tokens_per_query']:>8.0f} "
+              f"{row['p50']:>8.2f} {row['p95']:>8.2f}  {outcomes}")
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("rerank_bench", config, {"rows": rows}, args.output)
+    print(f"Results written to {result['_path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
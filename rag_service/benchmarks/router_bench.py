@@ -0,0 +1,144 @@
+"""Accuracy and latency of the query router, against the keyword heuristics it replaced.
+
+    python -m benchmarks.router_bench
+    python -m benchmarks.router_bench --repeat 2000
+
+Samples are the benchmark questions (open, or citation when they cite nothing but a
+provision) and the labelled greetings and follow-ups below, all classified as if the session
+had history. The previous heuristics had no citation route; for them a citation query counts
+as open, which is what they did with it. Rows:
+
+    legacy      substring checks of RAGPipeline.is_greeting / is_informational / rewrite_query_with_context
+    router      QueryRouter.classify
+
+`rewrites` is how many samples would spend an LLM rewrite call. `wasted` is how many of those
+are not follow-ups. Latency is per classification, in microseconds.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Tuple
+
+from .common import load_benchmark, percentile, write_result
+
+logger = logging.getLogger("benchmarks.router_bench")
+
+GREETINGS = [
+    "hi", "Hello!", "hey there", "good morning", "Good evening.", "thanks", "thank you", "Thanks a lot!",
+    "bye", "namaste", "ok", "thx",
+]
+FOLLOW_UPS = [
+    "Can you explain that in simpler terms?", "What are the exceptions to it?", "Give me some examples",
+    "Tell me more", "What about for minors?", "Why?", "And the punishment?", "Elaborate on the second point",
+    "Does this apply to foreigners too?", "Which court hears those cases?", "How is it enforced?",
+    "Is the same true for companies?",
+    # Cite a provision, but "it"/"this" still points at the earlier turn
+    "Explain it under Article 21", "Does this apply under Section 420 IPC?",
+]
+# Move on to another provision without referring back: served from the citation index
+CITATION_EXTRA = ["What about Section 420 IPC?", "And Article 14?"]
+# Self-contained questions the substring checks mistook for follow-ups ("it" in "with" and "limitation")
+OPEN_EXTRA = [
+    "What is the Companies Act about?", "Who can file a writ petition with the Supreme Court?",
+    "What are the rights of an arrested person?", "Can a contract with a minor be enforced?",
+    "How do I contact a legal aid authority?", "What is the procedure for filing an FIR?",
+    "What is the limitation period for a civil suit?", "Explain the doctrine of basic structure",
+]
+
+LEGACY_GREETINGS = ["hi", "hey", "hello", "yo", "thanks", "thx", "bye"]
+LEGACY_PHRASES = ["good morning", "good night", "good evening", "thank you", "thanks a lot"]
+LEGACY_LEGAL = [
+    "article", "section", "act", "law", "rights", "ipc", "judgment", "judgement", "court", "statute", "contract",
+    "evidence", "penalty", "fine", "offence", "crime", "liable", "liability", "divorce", "marriage", "custody",
+    "writ", "injunction",
+]
+LEGACY_FOLLOW_UP = ["that", "this", "those", "it", "them", "examples", "more", "explain", "elaborate", "tell me"]
+
+
+def legacy_route(query: str) -> str:
+    """The decision the pipeline made before the router, for a session with history."""
+    q = query.strip().lower()
+    greeting = (len(q.split()) == 1 and q in LEGACY_GREETINGS) or (len(q.split()) <= 2 and q in LEGACY_PHRASES)
+    informational = "?" in q or len(q) > 40 or any(kw in q for kw in LEGACY_LEGAL)
+    if greeting and not informational:
+        return "greeting"
+    if len(query.split()) <= 15 and any(kw in q for kw in LEGACY_FOLLOW_UP):
+        return "follow_up"
+    return "open"
+
+
+def samples() -> List[Tuple[str, str]]:
+    from src.citation_index import citation_only, parse_citations
+
+    labelled = [(q, "greeting") for q in GREETINGS] + [(q, "follow_up") for q in FOLLOW_UPS]
+    for query in [item["query"] for item in load_benchmark()] + OPEN_EXTRA:
+        labelled.append((query, "citation" if parse_citations(query) and citation_only(query) else "open"))
+    return labelled + [(q, "citation") for q in CITATION_EXTRA]
+
+
+def evaluate(classify: Callable[[str], str], labelled: List[Tuple[str, str]], repeat: int,
+             citation_route: bool) -> Dict:
+    correct, rewrites, wasted, routes, errors = 0, 0, 0, Counter(), []
+    for query, label in labelled:
+        route = classify(query)
+        routes[route] += 1
+        expected = label if citation_route or label != "citation" else "open"
+        if route == expected:
+            correct += 1
+        else:
+            errors.append({"query": query, "label": label, "route": route})
+        if route == "follow_up":
+            rewrites += 1
+            wasted += label != "follow_up"
+    latencies = []
+    for _ in range(repeat):
+        for query, _ in labelled:
+            start = time.perf_counter()
+            classify(query)
+            latencies.append(time.perf_counter() - start)
+    micros = sorted(v * 1e6 for v in latencies)
+    summary = {"p50": round(percentile(micros, 50), 2), "p95": round(percentile(micros, 95), 2),
+               "mean": round(sum(micros) / len(micros), 2)}
+    return dict(summary, accuracy=round(correct / len(labelled), 4), rewrites=rewrites, wasted=wasted,
+                routes=dict(routes), errors=errors)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=500, help="Timed passes over the samples")
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    from src.query_router import QueryRouter
+
+    router = QueryRouter()
+    labelled = samples()
+    rows = [
+        dict(evaluate(legacy_route, labelled, args.repeat, citation_route=False), config="legacy"),
+        dict(evaluate(lambda q: router.classify(q, has_history=True).route, labelled, args.repeat,
+                      citation_route=True), config="router"),
+    ]
+
+    print(f"{len(labelled)} samples: {dict(Counter(label for _, label in labelled))}")
+    print(f"{'config':<8} {'accuracy':>8} {'rewrites':>8} {'wasted':>7} {'p50 us':>8} {'p95 us':>8}  routes")
+    for row in rows:
+        print(f"{row['config']:<8} {row['accuracy']:>8.3f} {row['rewrites']:>8} {row['wasted']:>7} {row['p50']:>8.1f} "
+              f"{row['p95']:>8.1f}  {row['routes']}")
+    for error in rows[-1]["errors"]:
+        print(f"  router: {error['query']!r} labelled {error['label']}, routed {error['route']}")
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("router_bench", config, {"samples": len(labelled), "rows": rows}, args.output)
+    print(f"Results written to {result['_path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
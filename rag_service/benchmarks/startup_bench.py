@@ -0,0 +1,151 @@
+"""Time-to-live and time-to-ready of a freshly started service process.
+
+    python -m benchmarks.startup_bench --runs 3 --index-dir /tmp/rag_bench_index
+    python -m benchmarks.startup_bench --command "uvicorn main:app --port {port}"   # the real service
+    python -m benchmarks.startup_bench --baseline results/startup_bench_<ts>.json --max-regression 0.2
+
+Each run spawns the server (by default `python -m benchmarks.offline`, i.e. fake LLM/Mongo),
+polls /health/live until the port answers and /health/ready until the pipeline is loaded, then
+sends one retrieval to measure the first-query latency. The per-stage startup timings reported
+by /health (import, pipeline, index, model) are included; medians over --runs are compared to
+the baseline if given. Pass the same --index-dir across runs so later runs load instead of build.
+"""
+import argparse
+import logging
+import os
+import shlex
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+from .common import RAG_ROOT, load_queries, write_result
+
+logger = logging.getLogger("benchmarks.startup_bench")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(client: httpx.Client, url: str, deadline: float, proc: subprocess.Popen) -> float:
+    """Poll `url` until it returns 200; returns the perf_counter time it did."""
+    while time.perf_counter() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            if client.get(url).status_code == 200:
+                return time.perf_counter()
+        except httpx.TransportError:
+            pass
+        time.sleep(0.02)
+    raise TimeoutError(f"{url} not ready before timeout")
+
+
+def run_once(args, query: str) -> Dict:
+    port = free_port()
+    if args.command:
+        cmd = shlex.split(args.command.format(port=port))
+    else:
+        cmd = [sys.executable, "-m", "benchmarks.offline", "--port", str(port)]
+        if args.index_dir:
+            cmd += ["--index-dir", args.index_dir]
+        if args.real_embedder:
+            cmd.append("--real-embedder")
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=RAG_ROOT, stdout=subprocess.DEVNULL,
+                            stderr=None if args.verbose else subprocess.DEVNULL)
+    try:
+        with httpx.Client(timeout=5.0) as client:
+            deadline = start + args.timeout
+            live = wait_for(client, f"{base}/health/live", deadline, proc)
+            ready = wait_for(client, f"{base}/health/ready", deadline, proc)
+            health = client.get(f"{base}/health").json()
+            t0 = time.perf_counter()
+            resp = client.post(f"{base}/evaluate/retrieval", json={"queries": [query], "mode": "single"}, timeout=60.0)
+            first_query = time.perf_counter() - t0
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return {
+        "time_to_live_s": round(live - start, 3),
+        "time_to_ready_s": round(ready - start, 3),
+        "first_query_ms": round(first_query * 1000.0, 2),
+        "first_query_status": resp.status_code,
+        "stages": health.get("startup", {}).get("stages", {}),
+    }
+
+
+def summarize(runs: List[Dict]) -> Dict:
+    keys = ("time_to_live_s", "time_to_ready_s", "first_query_ms")
+    summary = {k: round(statistics.median(r[k] for r in runs), 3) for k in keys}
+    stage_names = sorted({name for r in runs for name in r["stages"]})
+    summary["stages"] = {name: round(statistics.median(r["stages"].get(name, 0.0) for r in runs), 3)
+                         for name in stage_names}
+    return summary
+
+
+def compare(baseline_path: str, summary: Dict, max_regression: float) -> List[str]:
+    import json
+
+    with open(baseline_path, encoding="utf-8") as f:
+        base = json.load(f).get("summary", {})
+    problems = []
+    for key in ("time_to_live_s", "time_to_ready_s", "first_query_ms"):
+        if base.get(key) and summary[key] > base[key] * (1 + max_regression):
+            problems.append(f"{key}: {summary[key]} vs baseline {base[key]}")
+    return problems
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--command", default=None, help="Server command with a {port} placeholder (default: offline app)")
+    parser.add_argument("--index-dir", default=None, help="Index dir for the offline app (reused across runs)")
+    parser.add_argument("--real-embedder", action="store_true")
+    parser.add_argument("--timeout", type=float, default=600.0, help="Seconds to wait for readiness per run")
+    parser.add_argument("--verbose", action="store_true", help="Show the server's stderr")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    query = load_queries()[0]
+    runs = []
+    for i in range(args.runs):
+        run = run_once(args, query)
+        runs.append(run)
+        stages = " ".join(f"{k}={v:.2f}s" for k, v in run["stages"].items())
+        print(f"run {i + 1}: live {run['time_to_live_s']:.2f}s  ready {run['time_to_ready_s']:.2f}s  "
+              f"first query {run['first_query_ms']:.0f}ms ({run['first_query_status']})  {stages}")
+    summary = summarize(runs)
+    print(f"median: live {summary['time_to_live_s']:.2f}s  ready {summary['time_to_ready_s']:.2f}s  "
+          f"first query {summary['first_query_ms']:.0f}ms")
+
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "baseline")}
+    result = write_result("startup_bench", config, {"runs": runs, "summary": summary}, args.output)
+    print(f"Results written to {result['_path']}")
+    if args.baseline:
+        problems = compare(args.baseline, summary, args.max_regression)
+        for problem in problems:
+            print(f"REGRESSION {problem}", file=sys.stderr)
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
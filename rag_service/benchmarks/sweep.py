@@ -0,0 +1,221 @@
+"""In-process retrieval sweep over alpha, k, rrf_k, candidate depth and nprobe/efSearch.
+
+For every grid point each benchmark query is retrieved through HybridRetriever.search and
+scored with Hit@1/Hit@3/Hit@k, MRR@k and nDCG@k (a chunk's graded relevance is the fraction
+of the query's gold keywords it contains; the ideal ranking is pooled over all grid points).
+The recall/latency Pareto frontier is reported and the recommended point is written to a
+config file that RAGPipeline loads at startup:
+
+    python -m benchmarks.sweep --index-dir ../vector_store --real-embedder --emit retrieval_config.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import sys
+import time
+from typing import Dict, List
+
+from .common import QUERIES_PATH, RAG_ROOT, load_benchmark, latency_summary, write_result
+
+logger = logging.getLogger("benchmarks.sweep")
+
+GRID_KEYS = ("alpha", "k", "rrf_k", "candidate_multiplier", "nprobe", "ef_search")
+
+
+def relevance(text: str, gold_keywords: List[str]) -> float:
+    lowered = text.lower()
+    if not gold_keywords:
+        return 0.0
+    return sum(1 for kw in gold_keywords if kw.lower() in lowered) / len(gold_keywords)
+
+
+def dcg(gains: List[float]) -> float:
+    return sum(g / math.log2(i + 2) for i, g in enumerate(gains))
+
+
+def run_config(retriever, benchmark: List[Dict], params: Dict, repeat: int = 1):
+    """Retrieve every query with `params`; returns per-query (doc ids, grades) and latencies."""
+    per_query, latencies = [], []
+    for item in benchmark:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results = retriever.search(
+                item["query"], params["k"],
+                alpha=params["alpha"],
+                rrf_k=params["rrf_k"],
+                candidate_multiplier=params["candidate_multiplier"],
+                nprobe=params["nprobe"],
+                ef_search=params["ef_search"],
+            )
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        latencies.append(best)
+        ids = [retriever._doc_to_idx.get(doc, -1) for doc, _ in results]
+        grades = [relevance(doc, item["gold_keywords"]) for doc, _ in results]
+        per_query.append({"ids": ids, "grades": grades})
+    return per_query, latencies
+
+
+def score_config(per_query: List[Dict], k: int, ideal: List[List[float]]) -> Dict[str, float]:
+    hit1 = hit3 = hitk = mrr = ndcg = 0.0
+    for q, ideal_grades in zip(per_query, ideal):
+        hits = [g > 0 for g in q["grades"][:k]]
+        hit1 += any(hits[:1])
+        hit3 += any(hits[:3])
+        hitk += any(hits)
+        first = next((i for i, h in enumerate(hits) if h), None)
+        mrr += 1.0 / (first + 1) if first is not None else 0.0
+        idcg = dcg(ideal_grades[:k])
+        ndcg += dcg(q["grades"][:k]) / idcg if idcg else 0.0
+    n = max(1, len(per_query))
+    return {
+        "hit@1": round(hit1 / n, 4),
+        "hit@3": round(hit3 / n, 4),
+        "hit@k": round(hitk / n, 4),
+        "mrr": round(mrr / n, 4),
+        "ndcg": round(ndcg / n, 4),
+    }
+
+
+def pareto_frontier(rows: List[Dict], objective: str, latency_key: str = "p50") -> List[Dict]:
+    """Rows not dominated on (higher objective, lower latency), sorted by latency."""
+    ordered = sorted(rows, key=lambda r: (r["latency_ms"][latency_key], -r["metrics"][objective]))
+    frontier, best = [], -1.0
+    for row in ordered:
+        if row["metrics"][objective] > best:
+            frontier.append(row)
+            best = row["metrics"][objective]
+    return frontier
+
+
+def recommend(frontier: List[Dict], objective: str, tolerance: float, latency_budget_ms: float = None) -> Dict:
+    """Cheapest frontier point within `tolerance` of the best objective (under the budget, if any)."""
+    candidates = frontier
+    if latency_budget_ms is not None:
+        within = [r for r in frontier if r["latency_ms"]["p95"] <= latency_budget_ms]
+        candidates = within or frontier[:1]
+    top = max(r["metrics"][objective] for r in candidates)
+    return min((r for r in candidates if r["metrics"][objective] >= top - tolerance),
+               key=lambda r: r["latency_ms"]["p50"])
+
+
+def sweep(retriever, benchmark: List[Dict], grid: Dict[str, List], repeat: int = 1) -> List[Dict]:
+    combos = [dict(zip(GRID_KEYS, values)) for values in itertools.product(*(grid[k] for k in GRID_KEYS))]
+    logger.info("Sweeping %d configurations over %d queries", len(combos), len(benchmark))
+
+    # Warm caches/lazy paths so the first grid point is not penalised
+    run_config(retriever, benchmark[:3], combos[0])
+
+    raw = []
+    for params in combos:
+        per_query, latencies = run_config(retriever, benchmark, params, repeat)
+        raw.append((params, per_query, latencies))
+
+    # Pool every retrieved chunk's grade per query to build the ideal ranking for nDCG
+    pooled = [dict() for _ in benchmark]
+    for _, per_query, _ in raw:
+        for pool, q in zip(pooled, per_query):
+            for doc_id, grade in zip(q["ids"], q["grades"]):
+                pool[doc_id] = grade
+    ideal = [sorted(pool.values(), reverse=True) for pool in pooled]
+
+    rows = []
+    for params, per_query, latencies in raw:
+        rows.append({
+            "params": params,
+            "metrics": score_config(per_query, params["k"], ideal),
+            "latency_ms": latency_summary(latencies),
+            "per_query_latency_ms": [round(l * 1000.0, 3) for l in latencies],
+        })
+    return rows
+
+
+def parse_list(cast):
+    return lambda value: [None if v.lower() == "none" else cast(v) for v in value.split(",")]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alpha", type=parse_list(float), default=[0.5, 0.7, 0.9, 1.0])
+    parser.add_argument("--k", type=parse_list(int), default=[3, 5])
+    parser.add_argument("--rrf-k", type=parse_list(int), default=[20, 60])
+    parser.add_argument("--candidate-multiplier", type=parse_list(int), default=[2, 3, 5])
+    parser.add_argument("--nprobe", type=parse_list(int), default=[8, 16, 32], help="IVF indexes only")
+    parser.add_argument("--ef-search", type=parse_list(int), default=[32, 64, 128], help="HNSW indexes only")
+    parser.add_argument("--objective", choices=["hit@1", "hit@3", "hit@k", "mrr", "ndcg"], default="ndcg")
+    parser.add_argument("--tolerance", type=float, default=0.005, help="Quality slack traded for lower latency")
+    parser.add_argument("--latency-budget-ms", type=float, default=None, help="p95 budget for the recommendation")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per query (min is kept)")
+    parser.add_argument("--queries", default=QUERIES_PATH)
+    parser.add_argument("--index-dir", default=None, help="Reuse an existing index (default: build into a temp dir)")
+    parser.add_argument("--real-embedder", action="store_true", help="Use the real SentenceTransformer")
+    parser.add_argument("--output", default=None, help="Full sweep results JSON")
+    parser.add_argument("--emit", default=None, help=f"Write the recommended config (e.g. {os.path.join(RAG_ROOT, 'retrieval_config.json')})")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    from .offline import load_offline_pipeline
+    from src.faiss_index import index_kind
+
+    rag = load_offline_pipeline(index_dir=args.index_dir, fake_embedder=not args.real_embedder)
+    if not rag.hybrid_retriever:
+        print("Hybrid retriever unavailable; nothing to sweep", file=sys.stderr)
+        return 1
+    benchmark = load_benchmark(args.queries)
+    grid = {
+        "alpha": args.alpha,
+        "k": args.k,
+        "rrf_k": args.rrf_k,
+        "candidate_multiplier": args.candidate_multiplier,
+        "nprobe": args.nprobe,
+        "ef_search": args.ef_search,
+    }
+    # Search-time knobs that the loaded index type ignores would only multiply identical runs
+    kind = index_kind(rag.vector_store.index)
+    if kind != "ivf":
+        grid["nprobe"] = [None]
+    if kind != "hnsw":
+        grid["ef_search"] = [None]
+    rows = sweep(rag.hybrid_retriever, benchmark, grid, args.repeat)
+    frontier = pareto_frontier(rows, args.objective)
+    best = recommend(frontier, args.objective, args.tolerance, args.latency_budget_ms)
+
+    print(f"{'alpha':>5} {'k':>3} {'rrf_k':>5} {'mult':>4} {'nprobe':>6} {'ef':>4} | {'hit@3':>6} {'mrr':>6} {'ndcg':>6} | {'p50ms':>7} {'p95ms':>7}")
+    for row in frontier:
+        p, m, l = row["params"], row["metrics"], row["latency_ms"]
+        marker = " <- recommended" if row is best else ""
+        print(f"{p['alpha']:>5} {p['k']:>3} {p['rrf_k']:>5} {p['candidate_multiplier']:>4} {str(p['nprobe']):>6} {str(p['ef_search']):>4} | "
+              f"{m['hit@3']:>6.3f} {m['mrr']:>6.3f} {m['ndcg']:>6.3f} | {l['p50']:>7.2f} {l['p95']:>7.2f}{marker}")
+
+    config = {k: v for k, v in vars(args).items() if k not in ("output", "emit")}
+    write_result("sweep", config, {
+        "objective": args.objective,
+        "grid": grid,
+        "rows": rows,
+        "frontier": [r["params"] for r in frontier],
+        "recommended": best,
+    }, args.output)
+
+    if args.emit:
+        with open(args.emit, "w", encoding="utf-8") as f:
+            json.dump({
+                "params": best["params"],
+                "metrics": best["metrics"],
+                "latency_ms": best["latency_ms"],
+                "objective": args.objective,
+                "generated_by": "benchmarks/sweep.py",
+                "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            }, f, indent=2)
+        print(f"Recommended config written to {args.emit}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""Throughput of Hindi <-> English translation on long answers: the old one-call path vs TranslationService.
+
+    python -m benchmarks.translation_bench
+    python -m benchmarks.translation_bench --real-models --int8 --threads 1 2 4
+    python -m benchmarks.translation_bench --answers 40 --sentences 30 --ms-per-step 1.0
+
+Answers are numbered lists of --sentences points drawn (seeded) from the legal sentences
+below, so some points repeat across answers as they do in real traffic. For each direction:
+
+    legacy      one tokenizer/generate call per answer with truncation=True (the previous
+                translate_to_*); output beyond the 512-token input window is lost
+    segmented   TranslationService, batch size 1, no cache
+    batched     TranslationService, TRANSLATION_BATCH_SIZE batches, no cache
+    cache-cold  the same with the sentence cache on (repeats across answers hit it)
+    cache-warm  a second pass over the same answers
+
+reporting input chars/sec, per-answer latency and coverage (output letters / input
+letters; the stand-in echoes its input, so anything below 1 there is truncation).
+`first request` is the latency of the first translation with lazy loading vs after preload(). Offline, the models are a word-echo
+stand-in with a per-decoder-step delay; --real-models loads the opus-mt checkpoints.
+"""
+import argparse
+import logging
+import os
+import random
+import re
+import sys
+import time
+from typing import Dict, List
+
+from .common import latency_summary, write_result
+
+logger = logging.getLogger("benchmarks.translation_bench")
+
+ENGLISH = [
+    "Article 21 of the Constitution guarantees that no person shall be deprived of life or personal liberty except according to procedure established by law.",
+    "The Supreme Court has read this guarantee expansively, holding that the procedure must be fair, just and reasonable.",
+    "Under Sec. 302 of the Indian Penal Code, murder is punishable with death or imprisonment for life, and the offender is also liable to fine.",
+    "Bail is the rule and jail the exception, although the court must weigh the gravity of the offence and the risk of the accused absconding.",
+    "An anticipatory bail application under Section 438 may be filed before the Sessions Court or the High Court by a person apprehending arrest.",
+    "The right to equality under Article 14 forbids class legislation but permits reasonable classification founded on an intelligible differentia.",
+    "A writ of habeas corpus lies where a person is detained without authority of law, and the court may order the detenu to be produced.",
+    "Consumer complaints up to the pecuniary limit are heard by the District Commission, with appeals to the State Commission.",
+    "Dowry demands in connection with marriage are punishable under the Dowry Prohibition Act, and cruelty by the husband or relatives is an offence under Sec. 498A.",
+    "The limitation period for filing a civil suit for recovery of money is generally three years from the date the cause of action arises.",
+    "Please note that this information is general in nature and does not replace advice from a qualified advocate.",
+    "If the police refuse to register an FIR for a cognizable offence, the complainant may approach the Superintendent of Police or the Magistrate under Section 156(3).",
+]
+
+HINDI = [
+    "संविधान का अनुच्छेद 21 यह गारंटी देता है कि किसी व्यक्ति को विधि द्वारा स्थापित प्रक्रिया के बिना उसके जीवन या व्यक्तिगत स्वतंत्रता से वंचित नहीं किया जाएगा।",
+    "सर्वोच्च न्यायालय ने कहा है कि यह प्रक्रिया निष्पक्ष, न्यायसंगत और उचित होनी चाहिए।",
+    "भारतीय दंड संहिता की धारा 302 के अंतर्गत हत्या के लिए मृत्युदंड या आजीवन कारावास का प्रावधान है।",
+    "जमानत नियम है और जेल अपवाद, परंतु न्यायालय अपराध की गंभीरता पर विचार करता है।",
+    "गिरफ्तारी की आशंका होने पर व्यक्ति धारा 438 के अंतर्गत अग्रिम जमानत के लिए आवेदन कर सकता है।",
+    "अनुच्छेद 14 के अंतर्गत समानता का अधिकार वर्ग विधान को निषिद्ध करता है।",
+    "यदि पुलिस संज्ञेय अपराध की प्राथमिकी दर्ज करने से इनकार करे तो शिकायतकर्ता पुलिस अधीक्षक या मजिस्ट्रेट के पास जा सकता है।",
+    "दहेज की मांग दहेज निषेध अधिनियम के अंतर्गत दंडनीय है।",
+    "धन की वसूली के लिए दीवानी वाद दायर करने की परिसीमा अवधि सामान्यतः तीन वर्ष होती है।",
+    "कृपया ध्यान दें कि यह जानकारी सामान्य प्रकृति की है और किसी योग्य अधिवक्ता की सलाह का स्थान नहीं लेती।",
+]
+
+
+def make_answers(sentences: List[str], count: int, per_answer: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    answers = []
+    for _ in range(count):
+        points = [f"{i + 1}. {rng.choice(sentences)}" for i in range(per_answer)]
+        answers.append("Here is what the law says:\n\n" + "\n".join(points))
+    return answers
+
+
+def legacy_translate(tokenizer, model, text: str) -> str:
+    """The previous translate_to_* body: one call per text, input truncated to the model window."""
+    import torch
+
+    inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True)
+    with torch.inference_mode():
+        translated = model.generate(**inputs)
+    return tokenizer.decode(translated[0], skip_special_tokens=True)
+
+
+def letters(text: str) -> int:
+    return len(re.sub(r"[\W_]", "", text))
+
+
+def run_pass(translate, answers: List[str]) -> Dict:
+    latencies, in_letters, out_letters = [], 0, 0
+    start = time.perf_counter()
+    for text in answers:
+        t0 = time.perf_counter()
+        out = translate(text)
+        latencies.append(time.perf_counter() - t0)
+        in_letters += letters(text)
+        out_letters += letters(out)
+    elapsed = time.perf_counter() - start
+    return dict(
+        latency_summary(latencies),
+        chars_per_sec=round(sum(len(a) for a in answers) / elapsed, 1),
+        coverage=round(out_letters / max(1, in_letters), 3),
+    )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--answers", type=int, default=20)
+    parser.add_argument("--sentences", type=int, default=24, help="Points per answer")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--threads", type=int, nargs="+", default=[0], help="TRANSLATION_THREADS values (0: torch default)")
+    parser.add_argument("--int8", action="store_true")
+    parser.add_argument("--real-models", action="store_true")
+    parser.add_argument("--ms-per-step", type=float, default=0.5, help="Decoder step delay of the offline stand-in")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING"))
+    import src.translation_service as translation_service
+    import torch  # noqa: F401  (imported up front so it is not counted as model loading)
+    from src.translation_service import MODELS, TranslationService
+
+    if not args.real_models:
+        from . import fakes
+        fakes.FakeMarianModel.ms_per_step = args.ms_per_step
+        translation_service.load_marian = fakes.load_fake_marian
+
+    workloads = {
+        ("en", "hi"): make_answers(ENGLISH, args.answers, args.sentences, args.seed),
+        ("hi", "en"): make_answers(HINDI, args.answers, args.sentences, args.seed),
+    }
+    rows, first_request = [], []
+    for (source, target), answers in workloads.items():
+        direction = f"{source}->{target}"
+        # First request: lazy load inside the request vs models already preloaded
+        for preload in (False, True):
+            service = TranslationService(cache_size=0, batch_size=args.batch_size, int8=args.int8)
+            load_s = 0.0
+            if preload:
+                start = time.perf_counter()
+                service.preload([(source, target)])
+                load_s = time.perf_counter() - start
+            start = time.perf_counter()
+            service.translate_batch([answers[0]], source, target)
+            first_request.append({"direction": direction, "preload": preload,
+                                  "load_ms": round(load_s * 1000, 1),
+                                  "first_request_ms": round((time.perf_counter() - start) * 1000, 1)})
+
+        tokenizer, model = translation_service.load_marian(MODELS[(source, target)], args.int8)
+        rows.append(dict(run_pass(lambda t: legacy_translate(tokenizer, model, t), answers),
+                         direction=direction, config="legacy", threads="-"))
+        for threads in args.threads:
+            single = TranslationService(cache_size=0, batch_size=1, int8=args.int8, threads=threads)
+            single.preload([(source, target)])
+            rows.append(dict(run_pass(lambda t: single.translate_batch([t], source, target)[0], answers),
+                             direction=direction, config="segmented", threads=threads))
+            batched = TranslationService(cache_size=0, batch_size=args.batch_size, int8=args.int8, threads=threads)
+            batched.preload([(source, target)])
+            rows.append(dict(run_pass(lambda t: batched.translate_batch([t], source, target)[0], answers),
+                             direction=direction, config="batched", threads=threads))
+            service = TranslationService(batch_size=args.batch_size, int8=args.int8, threads=threads)
+            service.preload([(source, target)])
+            for config in ("cache-cold", "cache-warm"):
+                rows.append(dict(run_pass(lambda t: service.translate_batch([t], source, target)[0], answers),
+                                 direction=direction, config=config, threads=threads))
+
+    print(f"{'direction':<9} {'config':<10} {'threads':>7} {'chars/s':>9} {'coverage':>8} {'p50 ms':>9} {'p95 ms':>9}")
+    for row in rows:
+        print(f"{row['direction']:<9} {row['config']:<10} {str(row['threads']):>7} {row['chars_per_sec']:>9.0f} "
+              f"{row['coverage']:>8.3f} {row['p50']:>9.1f} {row['p95']:>9.1f}")
+    print()
+    for row in first_request:
+        print(f"{row['direction']:<9} first request {'after preload' if row['preload'] else 'lazy load':<13} "
+              f"{row['first_request_ms']:>9.1f} ms (load {row['load_ms']:.1f} ms)")
+
+    config = {k: v for k, v in vars(args).items() if k != "output"}
+    result = write_result("translation_bench", config, {"rows": rows, "first_request": first_request}, args.output)
+    print(f"Results written to {result['_path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""Evaluate stored chat turns with the legal judge prompt, outside the request path.
+
+    python evaluate_turns.py --run-id nightly-2026-10-19 --since 2026-10-18
+    python evaluate_turns.py --run-id nightly-2026-10-19          # resume after an interruption
+    python evaluate_turns.py --run-id nightly-2026-10-19 --report
+
+Turns are read from `messages` (MONGODB_URI / MONGO_DB_NAME), with the retrieved chunks they
+reference read from the index in RAG_INDEX_DIR, and judged concurrently under
+EVAL_RPM / EVAL_TPM with retries; results are bulk-written to `evaluations` with the run id.
+See src/evaluation_engine.py. benchmarks/eval_engine_check.py runs it against a stubbed LLM.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger("rag_service.evaluate_turns")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--run-id", default=None, help="Reuse to resume a run (default: a new id)")
+    parser.add_argument("--since", type=datetime.fromisoformat, default=None, help="Only turns created at or after (ISO date)")
+    parser.add_argument("--until", type=datetime.fromisoformat, default=None)
+    parser.add_argument("--session", action="append", default=None, help="Only this session (repeatable)")
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--concurrency", type=int, default=None, help="EVAL_CONCURRENCY (default 4)")
+    parser.add_argument("--rpm", type=float, default=None, help="EVAL_RPM, requests per minute (default 30, 0 = unlimited)")
+    parser.add_argument("--tpm", type=float, default=None, help="EVAL_TPM, tokens per minute (default 0 = unlimited)")
+    parser.add_argument("--max-retries", type=int, default=None)
+    parser.add_argument("--report", action="store_true", help="Only print the report of --run-id")
+    parser.add_argument("--worst", type=int, default=5, help="Lowest-scoring turns listed in the report")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    load_dotenv()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    from pymongo import MongoClient
+    from src.chunk_refs import ChunkResolver
+    from src.evaluation_engine import EvaluationEngine
+    from src.llm_gateway import LLMGateway
+
+    if args.report and not args.run_id:
+        print("--report needs --run-id", file=sys.stderr)
+        return 2
+    db = MongoClient(os.getenv("MONGODB_URI") or os.getenv("MONGO_URI"))[os.getenv("MONGO_DB_NAME") or "rag_service"]
+    # The index the service writes (main.py), to read back the chunks each turn references
+    index_dir = os.getenv("RAG_INDEX_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vector_store")
+    engine = EvaluationEngine(LLMGateway(os.getenv("GROQ_API_KEY")), db, run_id=args.run_id,
+                              concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm, max_retries=args.max_retries,
+                              chunks=ChunkResolver(index_dir))
+    if not args.report:
+        try:
+            counts = engine.run(engine.turns(args.since, args.until, args.session, args.limit))
+        except KeyboardInterrupt:
+            print(f"Interrupted; resume with --run-id {engine.run_id}", file=sys.stderr)
+            return 130
+        print(f"Run {engine.run_id}: {counts}")
+    print(json.dumps(engine.report(args.worst), indent=2, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -257,24 +257,36 @@
 #     return results
 
 import os
-from fastapi import FastAPI, HTTPException
+import time
+import threading
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
+from typing import List
 from datetime import datetime
 from dotenv import load_dotenv
 import logging
 
-from src.rag_pipeline import RAGPipeline
+# src.rag_pipeline (groq, pymongo, faiss, torch) is imported by the background loader, not here,
+# so the server binds its port immediately
+from src.startup import StartupState
+from src.admission import AdmissionController, AdmissionRejected, RateLimiter, Ticket
+from src.logging_setup import configure_logging
+from src.metrics import REGISTRY, HTTP_REQUESTS, HTTP_LATENCY
+from src.translation_service import LANGUAGES
 
 load_dotenv()
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger("rag_service")
 
 # Environment variables
 MONGO_URI = os.getenv("MONGODB_URI")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 RAG_DATA_FOLDER = os.path.abspath(os.getenv("RAG_DATA_FOLDER", "./data"))
+RAG_INDEX_DIR = os.getenv("RAG_INDEX_DIR") or os.path.join(os.path.dirname(__file__), "..", "vector_store")
+INDEX_POLL_SECONDS = float(os.getenv("INDEX_POLL_SECONDS", "30"))
 PORT = int(os.getenv("PORT", 8000))
 
 # FastAPI app
@@ -289,55 +301,152 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# RAGPipeline initialization
-rag = RAGPipeline(
-    GROQ_API_KEY,
-    index_dir=os.path.join(os.path.dirname(__file__), "..", "vector_store"),
-    mongo_uri=MONGO_URI,
-    db_name=os.getenv("MONGO_DB_NAME") or "rag_service"
-)
-
-@app.on_event("startup")
-async def startup_event():
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
     try:
-        logger.info("Starting RAG initialization at startup...")
-        logger.info(f"Resolved RAG_DATA_FOLDER = {RAG_DATA_FOLDER}")
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Use the route template (e.g. /sessions/{session_id}/reset) to keep label cardinality bounded
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_REQUESTS.inc(path=path, method=request.method, status=str(status))
+        HTTP_LATENCY.observe(time.perf_counter() - start, path=path, method=request.method)
+
+# RAGPipeline, built and initialized in the background by startup_event
+rag = None
+startup = StartupState()
+
+
+def load_pipeline(warm: bool = True):
+    """Import, construct, initialize and warm the pipeline; runs in a background thread.
+
+    serve.py calls it with warm=False in the pre-fork parent: the model weights are loaded but no
+    inference runs, since torch/OpenMP thread pools started before fork() do not survive in workers.
+    """
+    global rag
+    startup.set_phase("loading")
+    try:
+        if rag is None:
+            with startup.stage("import"):
+                from src.rag_pipeline import RAGPipeline
+            with startup.stage("pipeline"):
+                rag = RAGPipeline(
+                    GROQ_API_KEY,
+                    index_dir=RAG_INDEX_DIR,
+                    mongo_uri=MONGO_URI,
+                    db_name=os.getenv("MONGO_DB_NAME") or "rag_service"
+                )
 
+        logger.info(f"Resolved RAG_DATA_FOLDER = {RAG_DATA_FOLDER}")
         if not os.path.exists(RAG_DATA_FOLDER):
             os.makedirs(RAG_DATA_FOLDER)
             logger.info(f"Created RAG_DATA_FOLDER: {RAG_DATA_FOLDER}")
-
-        files = os.listdir(RAG_DATA_FOLDER)
-        pdfs = [f for f in files if f.lower().endswith('.pdf')]
-        logger.info(f"Files in RAG_DATA_FOLDER ({RAG_DATA_FOLDER}): {len(files)} total, {len(pdfs)} pdf(s) found")
-
+        pdfs = [f for f in os.listdir(RAG_DATA_FOLDER) if f.lower().endswith('.pdf')]
+        logger.info(f"{len(pdfs)} pdf(s) found in RAG_DATA_FOLDER")
         for p in pdfs[:20]:
             file_size = os.path.getsize(os.path.join(RAG_DATA_FOLDER, p)) / (1024 * 1024)
             logger.info(f" - {p} ({file_size:.2f} MB)")
 
-        for retry_count in range(3):
-            try:
-                rag.initialize(RAG_DATA_FOLDER, force_rebuild=False)
-                logger.info("RAG initialized successfully at startup.")
-                break
-            except Exception as e:
-                logger.warning(f"RAG initialization attempt {retry_count + 1} failed: {e}")
-                if retry_count < 2:
-                    import time
-                    time.sleep(2 ** (retry_count + 1))
-                else:
-                    raise
-
-        health_status = {
-            "initialized": rag.is_initialized,
-            "vector_store_ready": bool(rag.vector_store and rag.vector_store.index is not None),
-            "pdfs_loaded": len(pdfs)
-        }
-        logger.info(f"Health status after initialization: {health_status}")
-
+        # The embedding model loads in parallel with the index; a rebuild waits for it inside add_documents
+        warmer = threading.Thread(target=_warm_model, name="rag-warmup", daemon=True) if warm else None
+        if warmer:
+            warmer.start()
+        if not rag.is_initialized:
+            with startup.stage("index"):
+                for retry_count in range(3):
+                    try:
+                        rag.initialize(RAG_DATA_FOLDER, force_rebuild=False)
+                        break
+                    except Exception as e:
+                        logger.warning(f"RAG initialization attempt {retry_count + 1} failed: {e}")
+                        if retry_count < 2:
+                            time.sleep(2 ** (retry_count + 1))
+                        else:
+                            raise
+        if warmer:
+            warmer.join()
+        else:
+            with startup.stage("model"):
+                rag.vector_store.load_model()
+                if rag.reranker is not None:
+                    rag.reranker.load()
+                if rag.translation_preload:
+                    rag.preload_translation()
+        if not rag.vector_store.model_loaded:
+            raise RuntimeError("embedding model failed to load")
+        startup.set_phase("ready")
+        logger.info("RAG ready: %s", startup.snapshot())
     except Exception as e:
+        startup.set_phase("failed", str(e))
         logger.exception("RAG initialization failed at startup. Service will continue running but RAG may be unavailable.")
 
+
+def watch_index():
+    """Pick up index versions published by other processes (e.g. a rebuild handled by another worker)."""
+    while INDEX_POLL_SECONDS > 0:
+        time.sleep(INDEX_POLL_SECONDS)
+        if is_ready():
+            try:
+                rag.refresh_index()
+            except Exception:
+                logger.exception("Index refresh failed")
+
+
+def _warm_model():
+    try:
+        with startup.stage("model"):
+            rag.warmup()
+    except Exception:
+        logger.exception("Embedding model warmup failed")
+
+
+@app.on_event("startup")
+async def startup_event():
+    # Workers forked by serve.py inherit a loaded pipeline and only warm up their own thread pools
+    target = _warm_model if startup.ready else load_pipeline
+    threading.Thread(target=target, name="rag-startup", daemon=True).start()
+    threading.Thread(target=watch_index, name="rag-index-watch", daemon=True).start()
+
+
+def is_ready() -> bool:
+    # main.rag may also be installed directly (benchmarks/offline.py), leaving the phase at "starting"
+    return bool(rag is not None and rag.is_initialized and startup.phase not in ("loading", "failed"))
+
+
+def pipeline(require_ready: bool = True):
+    """The live RAGPipeline, or 503 (with Retry-After) while it is still loading."""
+    if rag is None or (require_ready and not is_ready()):
+        detail = "RAG initialization failed" if startup.phase == "failed" else "RAG service is starting"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+    return rag
+
+# Per worker: rate limits (in memory, or shared through Mongo with RATE_LIMIT_STORE=mongo), then a slot
+# in a priority lane. Queued requests wait on a threadpool thread, so the lane queues stay small.
+admission = AdmissionController.from_env()
+rate_limiter = RateLimiter.from_env(
+    lambda: pipeline(require_ready=False).conversation_manager.db.get_collection("rate_limits"))
+
+def admit(lane: str, user_id: str = None, session_id: str = None) -> Ticket:
+    """Rate limits, then a concurrency slot in `lane`; 429 with Retry-After when either turns the request away."""
+    try:
+        rate_limiter.check(lane, user_id, session_id)
+        return admission.acquire(lane)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header})
+
+def check_language(language: str):
+    if language is not None and language not in LANGUAGES:
+        raise HTTPException(status_code=400, detail=f"Unsupported language {language!r} (expected one of {', '.join(LANGUAGES)})")
+
+def check_query(query: str):
+    # Before admit(): an invalid request takes no rate-limit token or slot
+    if not query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
 # Request models
 class InitRequest(BaseModel):
     force_rebuild: bool = False
@@ -346,27 +455,38 @@ class SessionCreate(BaseModel):
     user_id: str = None
     title: str = "New Chat"
 
+class SessionsReset(BaseModel):
+    session_ids: List[str] = None
+    user_id: str = None
+
 class ChatRequest(BaseModel):
     session_id: str
     user_id: str = None
     query: str
     include_history: bool = True
     evaluate: bool = False
+    trace: bool = False
+    language: str = None  # answer language ("en" or "hi"); defaults to the language of the query
 
 # Endpoints
 @app.post("/initialize")
 def initialize(req: InitRequest):
+    rag = pipeline(require_ready=False)
     try:
+        # A rebuild runs in a separate process and swaps the index in atomically; serving continues meanwhile
         rag.initialize(RAG_DATA_FOLDER, force_rebuild=req.force_rebuild)
-        return {"status": "initialized", "data_folder": RAG_DATA_FOLDER}
+        if startup.phase == "failed":
+            startup.set_phase("ready")
+        return {"status": "initialized", "data_folder": RAG_DATA_FOLDER, "index_version": rag.index_version}
     except Exception as e:
         logger.exception("Initialization failed")
         raise HTTPException(status_code=500, detail=f"Initialization failed: {str(e)}")
 
 @app.post("/sessions")
 def create_session(req: SessionCreate):
+    rag = pipeline(require_ready=False)
     try:
-        sid = rag.conversation_manager.create_session()
+        sid = rag.conversation_manager.create_session(req.user_id)
         return {"session_id": sid, "title": req.title}
     except Exception as e:
         logger.exception("Session creation failed")
@@ -374,17 +494,18 @@ def create_session(req: SessionCreate):
 
 @app.post("/chat")
 def chat(req: ChatRequest):
-    if not rag.is_initialized:
-        raise HTTPException(status_code=400, detail="RAG not initialized")
+    rag = pipeline()
+    check_language(req.language)
+    check_query(req.query)
+    ticket = admit("chat", req.user_id, req.session_id)
     try:
-        if not req.query.strip():
-            raise HTTPException(status_code=400, detail="Query cannot be empty")
-
         out = rag.chat(
             req.session_id,
             req.query,
             include_history=req.include_history,
-            evaluate=req.evaluate
+            evaluate=req.evaluate,
+            trace=req.trace,
+            language=req.language
         )
 
         if not isinstance(out, dict):
@@ -399,7 +520,7 @@ def chat(req: ChatRequest):
 
         if out.get("evaluation") and isinstance(out["evaluation"], dict):
             try:
-                eval_data = out["evaluation"].get("evaluation", {})
+                eval_data = out["evaluation"].get("evaluation") or {}
                 for metric in eval_data.values():
                     if isinstance(metric, dict) and "score" in metric:
                         metric["score"] = max(0, min(5, float(metric["score"])))
@@ -413,31 +534,71 @@ def chat(req: ChatRequest):
         }
 
         return out
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Chat error")
         raise HTTPException(status_code=500, detail=f"Chat processing failed: {str(e)}")
+    finally:
+        ticket.release()
 
 @app.post("/chat/stream")
-async def chat_stream(req: ChatRequest):
-    if not rag.is_initialized:
-        raise HTTPException(status_code=400, detail="RAG not initialized")
+def chat_stream(req: ChatRequest):
+    rag = pipeline()
+    check_language(req.language)
+    check_query(req.query)
+    # The slot is held until the stream ends: released by the generator, or after the response if it never ran
+    ticket = admit("stream", req.user_id, req.session_id)
     try:
-        async def generate():
-            resp = rag.groq_client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": req.query}],
-                stream=True
-            )
-            for chunk in resp:
-                if chunk.choices[0].delta.content:
-                    yield f"data: {chunk.choices[0].delta.content}\n\n"
-        return StreamingResponse(generate(), media_type="text/event-stream")
+        query, language_info = rag.localize_query(req.query, req.language)
+
+        deltas = rag.llm.stream("stream", [{"role": "user", "content": query}])
+
+        # Sync generator: Starlette iterates it on a worker thread, translation batches overlap generation
+        def generate():
+            try:
+                for text in rag.localize_stream(deltas, language_info):
+                    yield f"data: {text}\n\n"
+            finally:
+                ticket.release()
+        return StreamingResponse(generate(), media_type="text/event-stream", background=BackgroundTask(ticket.release))
     except Exception as e:
+        ticket.release()
         logger.exception("Chat stream error")
         raise HTTPException(status_code=500, detail=f"Chat stream failed: {str(e)}")
 
+@app.get("/sessions/{session_id}/messages")
+def session_messages(session_id: str, limit: int = 50, cursor: str = None, order: str = "asc", include_debug: bool = False):
+    """A page of the session's messages; pass `next_cursor` back as `cursor` for the next one."""
+    rag = pipeline(require_ready=False)
+    try:
+        page = rag.conversation_manager.get_history(session_id, limit=limit, cursor=cursor, order=order,
+                                                    include_debug=include_debug)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("History retrieval failed")
+        raise HTTPException(status_code=500, detail=f"History retrieval failed: {str(e)}")
+    for msg in page["messages"]:
+        if isinstance(msg.get("created_at"), datetime):
+            msg["created_at"] = msg["created_at"].isoformat()
+    return page
+
+@app.post("/sessions/reset")
+def reset_sessions(req: SessionsReset):
+    """Delete many sessions at once: the listed ones, a user's, or both."""
+    if not req.session_ids and not req.user_id:
+        raise HTTPException(status_code=400, detail="Pass session_ids and/or user_id")
+    rag = pipeline(require_ready=False)
+    try:
+        return dict(rag.conversation_manager.reset_sessions(req.session_ids, req.user_id), status="reset")
+    except Exception as e:
+        logger.exception("Bulk reset failed")
+        raise HTTPException(status_code=500, detail=f"Reset failed: {str(e)}")
+
 @app.post("/sessions/{session_id}/reset")
 def reset(session_id: str):
+    rag = pipeline(require_ready=False)
     try:
         rag.conversation_manager.reset_session(session_id)
         return {"status": "reset", "session_id": session_id}
@@ -447,10 +608,31 @@ def reset(session_id: str):
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "initialized": rag.is_initialized}
+    """Liveness plus readiness details; always 200 while the process is serving."""
+    return {"status": "ok", "initialized": bool(rag is not None and rag.is_initialized), "ready": is_ready(),
+            "index_version": rag.index_version if rag is not None else None, "startup": startup.snapshot()}
+
+@app.get("/health/live")
+def health_live():
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+def health_ready():
+    """200 once requests can be served, 503 while loading or after a failed startup."""
+    if is_ready():
+        return {"status": "ready", "startup": startup.snapshot()}
+    return JSONResponse(status_code=503, content={"status": startup.phase, "startup": startup.snapshot()},
+                        headers={"Retry-After": "5"})
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/evaluate/retrieval")
 def evaluate_retrieval(req: dict):
+    rag = pipeline()
+    # Batch lane: behind queued chats and streams, and never more than ADMISSION_BATCH_MAX_IN_FLIGHT at once
+    ticket = admit("batch", req.get("user_id"))
     try:
         queries = req.get("queries", [])
         mode = req.get("mode", "both")
@@ -458,12 +640,15 @@ def evaluate_retrieval(req: dict):
 
         for query in queries:
             if mode == "both":
+                snapshot = rag.retrieval
                 hybrid_docs = []
-                if rag.hybrid_retriever:
-                    hybrid_results = rag.hybrid_retriever.search(query, k=5)
-                    hybrid_docs = [{"text": doc, "score": float(score)} for doc, score in hybrid_results]
+                if snapshot.hybrid_retriever:
+                    # What /chat would prompt with: the configured fusion, thresholds, reranker and diversity
+                    selection = rag.select_chunks(query, k=5)
+                    hybrid_docs = [{"text": doc, "score": float(score)}
+                                   for doc, score in zip(selection.chunks, selection.scores)]
 
-                vector_results = rag.vector_store.search(query, k=5)
+                vector_results = rag.search_executor.run(snapshot.vector_store.search, query, k=5)
                 vector_docs = [{"text": doc, "score": float(score)} for doc, score in vector_results]
 
                 results.append({
@@ -478,4 +663,6 @@ def evaluate_retrieval(req: dict):
         return results
     except Exception as e:
         logger.exception("Retrieval evaluation failed")
-        raise HTTPException(status_code=500, detail=f"Evaluation failed: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Evaluation failed: {str(e)}")
+    finally:
+        ticket.release()
\ No newline at end of file
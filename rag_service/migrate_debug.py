@@ -0,0 +1,176 @@
+"""Replace the context previews stored in message debug with references to the retrieved chunks.
+
+    python migrate_debug.py --dry-run
+    python migrate_debug.py --batch-size 500
+
+Debug written before chunk references (src/chunk_refs.py) carries `retrieved_context_preview`
+(2000 characters of the prompt's chunks) and `conversation_context_preview`. Each preview is
+split back into its chunks, which are looked up in the live index (RAG_INDEX_DIR): whole chunks
+exactly, overlap-trimmed or truncated ones by their first or last characters. The conversation
+preview is dropped; the conversation is in `messages`. Debug still inline on messages (written
+before message_debug existed) is moved to message_debug, and greeting replies get their route.
+
+A retrieved preview with pieces that match no chunk is kept as is (--drop-unresolved drops it
+anyway), next to the chunks it did match. Safe to interrupt and run again: migrated debug carries
+`retrieved_chunks.from_preview` and is skipped, so kept previews are not matched again; a rerun
+with --drop-unresolved still visits them to drop their previews.
+"""
+import argparse
+import logging
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger("rag_service.migrate_debug")
+
+PREVIEW_KEYS = ("retrieved_context_preview", "conversation_context_preview")
+# Characters matched at either end of a chunk that lost its head or tail
+EDGE_CHARS = 64
+
+
+class PreviewMatcher:
+    def __init__(self, version: str, documents: List[str]):
+        from src.chunk_refs import chunk_key
+
+        self.version = version
+        self.documents = documents
+        self.chunk_key = chunk_key
+        self.exact = {doc: i for i, doc in enumerate(documents)}
+        self.heads = {doc[:EDGE_CHARS]: i for i, doc in enumerate(documents) if len(doc) >= EDGE_CHARS}
+        self.tails = {doc[-EDGE_CHARS:]: i for i, doc in enumerate(documents) if len(doc) >= EDGE_CHARS}
+
+    def match(self, preview: str) -> Tuple[List[int], int]:
+        """Chunk ids in `preview`, and the number of pieces that matched none."""
+        ids, unresolved = [], 0
+        pieces = [p for p in preview.split("\n\n") if p.strip()]
+        for n, piece in enumerate(pieces):
+            i = self.exact.get(piece)
+            if i is None and len(piece) >= EDGE_CHARS:
+                i = self.heads.get(piece[:EDGE_CHARS])
+                if i is None:
+                    i = self.tails.get(piece[-EDGE_CHARS:])
+            if i is not None:
+                if i not in ids:
+                    ids.append(i)
+            elif n < len(pieces) - 1 or len(piece) >= EDGE_CHARS:
+                # (a last piece too short to match was cut by the preview limit)
+                unresolved += 1
+        return ids, unresolved
+
+    def compact(self, debug: Dict, drop_unresolved: bool = False) -> Tuple[Dict, bool]:
+        """`debug` with chunk references instead of previews, and whether every piece was found."""
+        preview = debug.get("retrieved_context_preview") or ""
+        ids, unresolved = self.match(preview)
+        out = {k: v for k, v in debug.items() if k not in PREVIEW_KEYS}
+        if preview and unresolved and not drop_unresolved:
+            out["retrieved_context_preview"] = preview
+        if preview:
+            out["retrieved_chunks"] = {"index_version": self.version, "ids": ids,
+                                       "keys": [self.chunk_key(self.documents[i]) for i in ids], "scores": [],
+                                       "from_preview": True}
+        return out, not unresolved
+
+
+def has_preview(debug: Optional[Dict]) -> bool:
+    return isinstance(debug, dict) and any(k in debug for k in PREVIEW_KEYS)
+
+
+def migrate(db, matcher: PreviewMatcher, batch_size: int, dry_run: bool, drop_unresolved: bool) -> Dict[str, int]:
+    from pymongo import UpdateOne
+
+    message_debug, messages = db.get_collection("message_debug"), db.get_collection("messages")
+    counts = {"message_debug": 0, "moved_inline": 0, "unresolved": 0, "bytes_before": 0, "bytes_after": 0}
+
+    def flush(coll, ops):
+        if ops and not dry_run:
+            coll.bulk_write(ops, ordered=False)
+        ops.clear()
+
+    ops: List = []
+    flt = {"$or": [{f"debug.{k}": {"$exists": True}} for k in PREVIEW_KEYS]}
+    if not drop_unresolved:
+        # Already migrated; its preview was kept on purpose
+        flt["debug.retrieved_chunks.from_preview"] = {"$exists": False}
+    for doc in message_debug.find(flt, {"debug": 1}):
+        if not has_preview(doc.get("debug")):
+            continue
+        new, resolved = matcher.compact(doc["debug"], drop_unresolved)
+        counts["message_debug"] += 1
+        counts["unresolved"] += not resolved
+        counts["bytes_before"] += _size(doc["debug"])
+        counts["bytes_after"] += _size(new)
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"debug": new}}))
+        if len(ops) >= batch_size:
+            flush(message_debug, ops)
+    flush(message_debug, ops)
+
+    moves: List = []
+    for msg in messages.find({"debug": {"$exists": True}}, {"session_id": 1, "sender": 1, "created_at": 1, "last_active_at": 1, "debug": 1}):
+        debug = msg.get("debug")
+        update: Dict = {"$unset": {"debug": ""}}
+        # Only assistant debug is kept; a user message's preview repeated its reply's
+        if msg.get("sender") == "assistant" and isinstance(debug, dict) and debug:
+            new, resolved = matcher.compact(debug, drop_unresolved) if has_preview(debug) else (debug, True)
+            counts["unresolved"] += not resolved
+            counts["bytes_before"] += _size(debug)
+            counts["bytes_after"] += _size(new)
+            moves.append(UpdateOne({"_id": msg["_id"]}, {"$set": {"session_id": msg["session_id"], "created_at": msg["created_at"],
+                                                                  "last_active_at": msg.get("last_active_at") or msg["created_at"],
+                                                                  "debug": new}}, upsert=True))
+            if debug.get("note") == "retrieval_skipped_greeting":
+                update["$set"] = {"route": "greeting"}
+        elif debug:
+            counts["bytes_before"] += _size(debug)
+        counts["moved_inline"] += 1
+        # The debug entry is written before the inline copy is removed
+        ops.append(UpdateOne({"_id": msg["_id"]}, update))
+        if len(ops) >= batch_size:
+            flush(message_debug, moves)
+            flush(messages, ops)
+    flush(message_debug, moves)
+    flush(messages, ops)
+    return counts
+
+
+def _size(doc) -> int:
+    import bson
+
+    return len(bson.encode({"d": doc}))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500, help="Updates per bulk write")
+    parser.add_argument("--dry-run", action="store_true", help="Count and measure without writing")
+    parser.add_argument("--drop-unresolved", action="store_true",
+                        help="Drop retrieved previews even when some of their chunks are not in the index")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    load_dotenv()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    from pymongo import MongoClient
+    from src.chunk_refs import ChunkResolver
+
+    index_dir = os.getenv("RAG_INDEX_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "vector_store")
+    resolver = ChunkResolver(index_dir)
+    version, _ = resolver.manifest.current()
+    documents = resolver.documents(version)
+    if not documents:
+        print(f"No index in {index_dir}; set RAG_INDEX_DIR", file=sys.stderr)
+        return 2
+    db = MongoClient(os.getenv("MONGODB_URI") or os.getenv("MONGO_URI"))[os.getenv("MONGO_DB_NAME") or "rag_service"]
+    counts = migrate(db, PreviewMatcher(version, documents), args.batch_size, args.dry_run, args.drop_unresolved)
+    prefix = "Would migrate" if args.dry_run else "Migrated"
+    print(f"{prefix} {counts['message_debug']} message_debug entries and {counts['moved_inline']} inline debug fields "
+          f"against index {version}: {counts['bytes_before']} -> {counts['bytes_after']} bytes; "
+          f"{counts['unresolved']} previews had chunks not in the index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
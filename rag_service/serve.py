@@ -0,0 +1,115 @@
+"""Pre-fork launcher: load the index, chunks, BM25 and embedding model once, then fork the workers.
+
+Workers share the parent's read-only pages copy-on-write instead of each building their own copy
+in RAGPipeline.initialize, so N workers cost roughly one set of assets plus per-worker heap:
+
+    python serve.py --workers 4 --port 8000
+    FAISS_MMAP=1 python serve.py --workers 4     # index codes also shared through the page cache
+
+`uvicorn main:app --workers N` still works, but every worker loads everything itself.
+Memory per worker (unique vs shared) is reported by `python -m benchmarks.memory_report`.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+logger = logging.getLogger("rag_service.serve")
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(main, sock: socket.socket, log_level: str):
+    import uvicorn
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, signal.SIG_DFL)
+    if main.rag is not None:
+        main.rag.after_fork()
+    config = uvicorn.Config(main.app, log_level=log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def run(host: str, port: int, workers: int, preload: bool = True, log_level: str = "info"):
+    """Load (if `preload`), bind once, fork `workers` uvicorn servers on the shared socket and supervise them."""
+    import main
+
+    if preload:
+        # A missing index is built in a spawned process (RAGPipeline.rebuild_index), never in this one
+        main.load_pipeline(warm=False)
+        # Collections would write to the GC headers of every tracked object and un-share those
+        # pages in each worker; frozen objects are never scanned
+        gc.collect()
+        gc.freeze()
+        logger.info("Preloaded pipeline (%s); forking %d workers", main.startup.snapshot(), workers)
+
+    sock = bind_socket(host, port)
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(main, sock, log_level)
+            except BaseException:
+                logger.exception("Worker crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        spawn()
+    logger.info("Serving on %s:%d with %d workers (pids %s)", host, port, workers, sorted(children))
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            logger.warning("Worker %d exited with code %s; restarting", pid, os.waitstatus_to_exitcode(status))
+            time.sleep(1)
+            spawn()
+    sock.close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", 2)))
+    parser.add_argument("--no-preload", action="store_true", help="Fork first and let every worker load its own copy")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info").lower())
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    run(args.host, args.port, args.workers, preload=not args.no_preload, log_level=args.log_level)
+    sys.exit(0)
@@ -0,0 +1,296 @@
+"""Admission control for the HTTP endpoints: per-user and per-session token buckets, then a concurrency
+limit with priority lanes and bounded queues. Whatever is not admitted gets an AdmissionRejected, which
+main.py turns into a 429 with Retry-After.
+"""
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+from .metrics import ADMISSION, ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, ADMISSION_WAIT
+
+logger = logging.getLogger(__name__)
+
+# Lanes in priority order: a free slot goes to the highest-priority waiter that may take it
+Lane = namedtuple("Lane", ["name", "priority", "max_queue", "max_in_flight"])
+LANES: Dict[str, Tuple[int, int, Optional[int]]] = {
+    # name: (priority, queue depth, in-flight cap; None = any free slot)
+    "stream": (0, 8, None),
+    "chat": (1, 8, None),
+    "batch": (2, 4, 4),
+}
+
+
+class AdmissionRejected(Exception):
+    """A request was not admitted; `retry_after` is the suggested wait in seconds."""
+
+    def __init__(self, reason: str, retry_after: float, detail: str = ""):
+        super().__init__(detail or reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        """Retry-After is whole seconds, at least 1."""
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class LocalBucketStore:
+    """Token buckets in this process's memory; each worker enforces the limits on its own."""
+
+    MAX_BUCKETS = 100_000
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Take `cost` tokens; 0.0 if they were there, else the seconds until they will be (nothing taken)."""
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) >= self.MAX_BUCKETS:
+                # A bucket idle long enough to refill is the same as a missing one
+                self._buckets = {k: v for k, v in self._buckets.items() if v[0] + (now - v[1]) * rate < burst}
+            tokens, at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - at) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (cost - tokens) / rate
+
+
+class MongoBucketStore:
+    """Token buckets in a Mongo collection, shared by every worker and host.
+
+    Each take is a read followed by a compare-and-set on the bucket's previous state, retried if
+    another process updated it in between. A TTL index drops buckets idle long enough to be full.
+    Mongo errors admit the request: losing the limiter must not take chat down with it.
+    """
+
+    CAS_ATTEMPTS = 5
+
+    def __init__(self, collection: Callable):
+        # A factory, so pre-forked workers use their own client (ConversationManager.connect)
+        self._collection = collection
+        self._indexed = False
+
+    def _buckets(self):
+        coll = self._collection()
+        if not self._indexed:
+            coll.create_index("key", unique=True)
+            coll.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+        return coll
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        try:
+            coll = self._buckets()
+            for _ in range(self.CAS_ATTEMPTS):
+                # Wall clock: the buckets are shared between machines
+                now = time.time()
+                doc = coll.find_one({"key": key})
+                if doc is None:
+                    tokens, at, current = burst, now, {"key": key, "tokens": None}
+                else:
+                    tokens, at = doc["tokens"], doc["updated_at"]
+                    current = {"key": key, "tokens": tokens, "updated_at": at}
+                tokens = min(burst, tokens + max(0.0, now - at) * rate)
+                wait = 0.0 if tokens >= cost else (cost - tokens) / rate
+                if wait:
+                    return wait
+                update = {"tokens": tokens - cost, "updated_at": now,
+                          "expires_at": _utc(now + (burst - tokens + cost) / rate)}
+                if doc is None:
+                    try:
+                        coll.update_one(current, {"$set": update}, upsert=True)
+                        return 0.0
+                    except Exception as e:
+                        # Another worker created the bucket first (unique index); read it and retry
+                        if type(e).__name__ != "DuplicateKeyError":
+                            raise
+                        continue
+                if coll.update_one(current, {"$set": update}).matched_count:
+                    return 0.0
+            logger.warning("Rate limit bucket %s stayed contended for %d attempts; admitting", key, self.CAS_ATTEMPTS)
+        except Exception as e:
+            logger.warning("Rate limit store unavailable (%s: %s); admitting", type(e).__name__, e)
+        return 0.0
+
+
+def _utc(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, tz=timezone.utc)
+
+
+class RateLimiter:
+    """Per-user and per-session token buckets; a limit of 0 requests/minute disables that bucket.
+
+    Requests without a user_id are only limited per session.
+    """
+
+    def __init__(self, store, user_rpm: float = 60.0, user_burst: float = 20.0, session_rpm: float = 20.0,
+                 session_burst: float = 10.0):
+        self.store = store
+        self.limits = {"user": (user_rpm / 60.0, user_burst), "session": (session_rpm / 60.0, session_burst)}
+
+    @classmethod
+    def from_env(cls, collection: Optional[Callable] = None) -> "RateLimiter":
+        """RATE_LIMIT_STORE=local (default) or mongo (needs the `collection` factory), RATE_LIMIT_* limits."""
+        backend = os.getenv("RATE_LIMIT_STORE", "local")
+        if backend == "mongo" and collection is not None:
+            store = MongoBucketStore(collection)
+        elif backend in ("local", "mongo"):
+            store = LocalBucketStore()
+        else:
+            raise ValueError(f"Unknown RATE_LIMIT_STORE {backend!r} (local | mongo)")
+        return cls(store,
+                   user_rpm=float(os.getenv("RATE_LIMIT_USER_RPM", "60")),
+                   user_burst=float(os.getenv("RATE_LIMIT_USER_BURST", "20")),
+                   session_rpm=float(os.getenv("RATE_LIMIT_SESSION_RPM", "20")),
+                   session_burst=float(os.getenv("RATE_LIMIT_SESSION_BURST", "10")))
+
+    def check(self, lane: str, user_id: Optional[str] = None, session_id: Optional[str] = None, cost: float = 1.0):
+        """Take a token from each applicable bucket, or raise AdmissionRejected."""
+        for scope, ident in (("user", user_id), ("session", session_id)):
+            rate, burst = self.limits[scope]
+            if not ident or rate <= 0:
+                continue
+            wait = self.store.take(f"{scope}:{ident}", rate, burst, min(cost, burst))
+            if wait:
+                ADMISSION.inc(lane=lane, outcome=f"rate_limited_{scope}")
+                raise AdmissionRejected(f"rate_limited_{scope}", wait, f"Too many requests for this {scope}")
+
+
+class Ticket:
+    """A held concurrency slot; release() is idempotent, so streams can release from several places."""
+
+    __slots__ = ("controller", "lane", "started", "_released")
+
+    def __init__(self, controller: "AdmissionController", lane: Lane):
+        self.controller = controller
+        self.lane = lane
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        self.controller._release(self)
+
+    def __enter__(self) -> "Ticket":
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """At most `max_concurrency` admitted requests at a time; the rest wait in per-lane queues.
+
+    A freed slot goes to the waiter in the highest-priority lane (FIFO within a lane). A request is
+    shed at once when its lane's queue is full, or after `queue_timeout_s` in the queue; Retry-After
+    is estimated from the queue length and the recent time a slot is held. max_concurrency=0
+    disables the limit.
+    """
+
+    def __init__(self, max_concurrency: int = 16, queue_timeout_s: float = 10.0, lanes: Optional[Dict] = None):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout_s = queue_timeout_s
+        self.lanes = {name: Lane(name, *spec) for name, spec in (lanes or LANES).items()}
+        self._cond = threading.Condition()
+        self._active = {name: 0 for name in self.lanes}
+        self._queued = {name: 0 for name in self.lanes}
+        self._waiters = []  # (priority, seq, lane name)
+        self._seq = itertools.count()
+        self._hold_s = 1.0  # moving average of how long a slot is held
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """ADMISSION_MAX_CONCURRENCY, ADMISSION_QUEUE_TIMEOUT_S, ADMISSION_<LANE>_QUEUE / _MAX_IN_FLIGHT."""
+        lanes = {}
+        for name, (priority, max_queue, max_in_flight) in LANES.items():
+            prefix = f"ADMISSION_{name.upper()}_"
+            cap = os.getenv(prefix + "MAX_IN_FLIGHT")
+            lanes[name] = (priority, int(os.getenv(prefix + "QUEUE", str(max_queue))),
+                           (int(cap) or None) if cap is not None else max_in_flight)
+        return cls(int(os.getenv("ADMISSION_MAX_CONCURRENCY", "16")),
+                   float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "10")), lanes)
+
+    def in_flight(self) -> int:
+        with self._cond:
+            return sum(self._active.values())
+
+    def _can_start(self, lane: Lane) -> bool:
+        if sum(self._active.values()) >= self.max_concurrency:
+            return False
+        return lane.max_in_flight is None or self._active[lane.name] < lane.max_in_flight
+
+    def _next_waiter(self) -> Optional[Tuple]:
+        """The waiter a free slot goes to: first by (priority, arrival) whose lane is under its cap."""
+        for waiter in sorted(self._waiters):
+            if self._can_start(self.lanes[waiter[2]]):
+                return waiter
+        return None
+
+    def _retry_after(self) -> float:
+        queued = sum(self._queued.values())
+        return self._hold_s * (queued + 1) / max(1, self.max_concurrency)
+
+    def _start(self, lane: Lane) -> Ticket:
+        self._active[lane.name] += 1
+        ADMISSION_IN_FLIGHT.set(self._active[lane.name], lane=lane.name)
+        return Ticket(self, lane)
+
+    def acquire(self, lane_name: str) -> Ticket:
+        """A slot in `lane_name`, waiting in its queue if needed; raises AdmissionRejected when shed."""
+        lane = self.lanes[lane_name]
+        if self.max_concurrency <= 0:
+            return Ticket(self, lane)
+        start = time.monotonic()
+        with self._cond:
+            # Nobody jumps a non-empty queue that could take the slot instead
+            if self._can_start(lane) and self._next_waiter() is None:
+                ADMISSION.inc(lane=lane.name, outcome="admitted")
+                return self._start(lane)
+            if self._queued[lane.name] >= lane.max_queue:
+                ADMISSION.inc(lane=lane.name, outcome="queue_full")
+                raise AdmissionRejected("queue_full", self._retry_after(),
+                                        f"Server busy: {self.max_concurrency} requests in flight, {lane.name} queue full")
+            waiter = (lane.priority, next(self._seq), lane.name)
+            self._waiters.append(waiter)
+            self._queued[lane.name] += 1
+            ADMISSION_QUEUED.set(self._queued[lane.name], lane=lane.name)
+            try:
+                until = start + self.queue_timeout_s
+                while self._next_waiter() != waiter:
+                    left = until - time.monotonic()
+                    if left <= 0:
+                        ADMISSION.inc(lane=lane.name, outcome="queue_timeout")
+                        raise AdmissionRejected("queue_timeout", self._retry_after(),
+                                                f"Server busy: no slot within {self.queue_timeout_s:.0f}s")
+                    self._cond.wait(left)
+                ticket = self._start(lane)
+            finally:
+                self._waiters.remove(waiter)
+                self._queued[lane.name] -= 1
+                ADMISSION_QUEUED.set(self._queued[lane.name], lane=lane.name)
+                # Leaving the queue may let a waiter behind this one (another lane under its cap) start
+                self._cond.notify_all()
+        ADMISSION.inc(lane=lane.name, outcome="admitted")
+        ADMISSION_WAIT.observe(time.monotonic() - start, lane=lane.name)
+        return ticket
+
+    def _release(self, ticket: Ticket):
+        with self._cond:
+            if ticket._released:
+                return
+            ticket._released = True
+            if self.max_concurrency <= 0:
+                return
+            self._active[ticket.lane.name] -= 1
+            ADMISSION_IN_FLIGHT.set(self._active[ticket.lane.name], lane=ticket.lane.name)
+            self._hold_s = 0.9 * self._hold_s + 0.1 * (time.monotonic() - ticket.started)
+            self._cond.notify_all()
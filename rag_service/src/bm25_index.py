@@ -0,0 +1,75 @@
+from collections import Counter
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+
+class Vocabulary:
+    """Interns terms as dense int ids, so each term string is stored once."""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def intern(self, term: str) -> int:
+        term_id = self.ids.get(term)
+        if term_id is None:
+            term_id = self.ids[term] = len(self.ids)
+        return term_id
+
+    def lookup(self, terms: Sequence[str]) -> List[int]:
+        """Ids of the known terms, unknown ones dropped."""
+        return [self.ids[t] for t in terms if t in self.ids]
+
+
+class CompactBM25:
+    """Okapi BM25 (same scores as rank_bm25.BM25Okapi) over postings in compressed sparse row form.
+
+    Term t's postings are doc_ids/tfs[offsets[t]:offsets[t + 1]]. A query only touches the
+    postings of its own terms, instead of one dict lookup per document per term.
+    """
+
+    def __init__(self, corpus: Sequence[Sequence[str]], k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1, self.b, self.epsilon = k1, b, epsilon
+        self.vocabulary = Vocabulary()
+        self.corpus_size = len(corpus)
+        postings: Dict[int, List] = {}
+        doc_len = np.zeros(self.corpus_size, dtype=np.float32)
+        for doc_id, terms in enumerate(corpus):
+            doc_len[doc_id] = len(terms)
+            for term, tf in Counter(terms).items():
+                postings.setdefault(self.vocabulary.intern(term), []).append((doc_id, tf))
+        vocab_size = len(self.vocabulary)
+        self.offsets = np.zeros(vocab_size + 1, dtype=np.int64)
+        for term_id in range(vocab_size):
+            self.offsets[term_id + 1] = self.offsets[term_id] + len(postings[term_id])
+        self.doc_ids = np.empty(int(self.offsets[-1]), dtype=np.int32)
+        self.tfs = np.empty(int(self.offsets[-1]), dtype=np.float32)
+        for term_id, entries in postings.items():
+            start = self.offsets[term_id]
+            self.doc_ids[start:start + len(entries)] = [d for d, _ in entries]
+            self.tfs[start:start + len(entries)] = [tf for _, tf in entries]
+        self.avgdl = float(doc_len.mean()) if self.corpus_size else 0.0
+        # k1 * (1 - b + b * dl / avgdl), the per-document part of the denominator
+        self.doc_norm = (k1 * (1 - b + b * doc_len / max(self.avgdl, 1e-9))).astype(np.float32)
+        df = np.diff(self.offsets).astype(np.float64)
+        idf = np.log(self.corpus_size - df + 0.5) - np.log(df + 0.5)
+        # Terms in more than half the documents get a floor of epsilon * mean idf, as in BM25Okapi
+        self.average_idf = float(idf.mean()) if vocab_size else 0.0
+        idf[idf < 0] = epsilon * self.average_idf
+        self.idf = idf.astype(np.float32)
+
+    def get_scores(self, term_ids: Sequence[int]) -> np.ndarray:
+        """BM25 score of every document for the query terms (repeats count again, as in BM25Okapi)."""
+        scores = np.zeros(self.corpus_size, dtype=np.float32)
+        for term_id, count in Counter(term_ids).items():
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs, tf = self.doc_ids[start:end], self.tfs[start:end]
+            scores[docs] += count * self.idf[term_id] * (tf * (self.k1 + 1) / (tf + self.doc_norm[docs]))
+        return scores
+
+    def nbytes(self) -> int:
+        """Size of the postings and per-term/per-document arrays (the vocabulary dict not included)."""
+        return sum(a.nbytes for a in (self.offsets, self.doc_ids, self.tfs, self.doc_norm, self.idf))
@@ -0,0 +1,104 @@
+"""References to the retrieved chunks of a turn, stored instead of copies of their text.
+
+A turn's debug keeps `retrieved_chunks`: the index version searched, each chunk's position in
+that version's documents, a short content key and its retrieval score. ChunkResolver turns the
+reference back into text from the index on disk; when that version has been garbage-collected
+(INDEX_KEEP_VERSIONS), chunks are found by content key in the live version instead.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+
+from .index_snapshots import IndexManifest
+
+logger = logging.getLogger(__name__)
+
+KEY_BYTES = 6
+
+
+class ChunkSelection(NamedTuple):
+    """The chunks that went into a prompt (after overlap trimming) and what identifies them in the index."""
+    chunks: List[str]
+    ids: List[Optional[int]]
+    keys: List[str]
+    scores: List[float]
+    index_version: Optional[str]
+
+
+def chunk_key(doc: str) -> str:
+    return hashlib.blake2b(doc.encode("utf-8"), digest_size=KEY_BYTES).hexdigest()
+
+
+def chunk_refs(selection: ChunkSelection) -> Dict:
+    """The `retrieved_chunks` debug entry for `selection`."""
+    return {
+        "index_version": selection.index_version,
+        "ids": selection.ids,
+        "keys": selection.keys,
+        "scores": [round(float(s), 4) for s in selection.scores],
+    }
+
+
+class ChunkResolver:
+    """Chunk text for `retrieved_chunks` references, from the documents of the index versions on disk."""
+
+    CACHED_VERSIONS = 2
+
+    def __init__(self, index_dir: str):
+        self.manifest = IndexManifest(index_dir)
+        self._documents: "OrderedDict[str, Optional[List[str]]]" = OrderedDict()
+        self._by_key: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def documents(self, version: Optional[str]) -> Optional[List[str]]:
+        """The chunks of index `version`, or None if it is no longer on disk."""
+        if not version:
+            return None
+        with self._lock:
+            if version in self._documents:
+                self._documents.move_to_end(version)
+                return self._documents[version]
+        path = os.path.join(self.manifest.version_dir(version), "docs.pkl")
+        docs = None
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                docs = pickle.load(f)
+        with self._lock:
+            self._documents[version] = docs
+            while len(self._documents) > self.CACHED_VERSIONS:
+                old, _ = self._documents.popitem(last=False)
+                self._by_key.pop(old, None)
+        return docs
+
+    def _key_index(self, version: str, docs: List[str]) -> Dict[str, int]:
+        with self._lock:
+            index = self._by_key.get(version)
+        if index is None:
+            index = {chunk_key(doc): i for i, doc in enumerate(docs)}
+            with self._lock:
+                self._by_key[version] = index
+        return index
+
+    def texts(self, refs: Optional[Dict]) -> List[str]:
+        """The referenced chunks that can still be found, best first."""
+        if not refs:
+            return []
+        ids, keys = refs.get("ids") or [], refs.get("keys") or []
+        docs = self.documents(refs.get("index_version"))
+        if docs is not None:
+            found = [docs[i] for i in ids if i is not None and 0 <= i < len(docs)]
+            if len(found) == len(ids):
+                return found
+        live, _ = self.manifest.current()
+        live_docs = self.documents(live)
+        if not live_docs or not keys:
+            return [] if docs is None else found
+        index = self._key_index(live, live_docs)
+        return [live_docs[index[key]] for key in keys if key in index]
+
+    def context(self, refs: Optional[Dict]) -> str:
+        return "\n\n".join(self.texts(refs))
@@ -0,0 +1,250 @@
+import bisect
+import json
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CITATIONS_FILE = "citations.json"
+
+# Acts recognised in data/: a document belongs to the act whose title it opens with. `unit` is
+# what a citation of it numbers ("Article 21", "Section 302"); aliases are matched in queries.
+ACTS = {
+    "constitution": {"unit": "article", "title": "THE CONSTITUTION OF INDIA",
+                     "aliases": ("constitution of india", "indian constitution", "constitution", "coi")},
+    "ipc": {"unit": "section", "title": "THE INDIAN PENAL CODE",
+            "aliases": ("indian penal code", "penal code", "ipc")},
+    "companies_act": {"unit": "section", "title": "THE COMPANIES ACT",
+                      "aliases": ("companies act",)},
+    "customs_act": {"unit": "section", "title": "THE CUSTOMS ACT",
+                    "aliases": ("customs act",)},
+    "udhr": {"unit": "article", "title": "Universal Declaration of Human Rights", "labelled": True,
+             "aliases": ("universal declaration of human rights", "universal declaration", "udhr")},
+}
+# Act assumed when a citation names none ("What is Article 21?")
+DEFAULT_ACTS = {"article": "constitution", "section": "ipc"}
+
+# Statute bodies open each provision with "21. Protection of life and personal liberty.—", with
+# amendment marks such as "1[370. ... ]. —". Contents pages list the same headings without "—".
+# The title may not run into another numbered item, or a footnote would swallow the next heading.
+_NUMBERED = re.compile(
+    r"(?:(?<=\s)|^)[^\w\s\[]*(?:\d+\W?\[)?(\d{1,3})([A-Z]{0,3})\.\s?(?:\d+\[)?"
+    r"[A-Z“](?:(?!\s\d{1,3}[A-Z]{0,3}\.\s)[^—]){0,200}?\s?\]?\s?\.\s?\]?\s?—"
+)
+# The UDHR style: "Article 5 No one shall be ...", "Article 13 1. Everyone has ..."
+_LABELLED = re.compile(r"(?:(?<=\s)|^)Article (\d{1,3})([A-Z]{0,3})\s+(?=[A-Z]|1\.\s)")
+
+_NUMBER = r"\d{1,3}[A-Za-z]{0,3}(?![\w])"
+_CLAUSES = r"(?:\s?\(\w{1,4}\))*"
+_UNITS = {"article": "article", "articles": "article", "art": "article", "arts": "article",
+          "section": "section", "sections": "section", "sec": "section", "secs": "section",
+          "s": "section", "ss": "section", "u/s": "section"}
+_CITATION = re.compile(
+    r"(?<![\w/])(articles?|arts?\.?|sections?|secs?\.?|ss?\.|u/s\.?)\s*"
+    rf"({_NUMBER}{_CLAUSES}(?:\s*(?:,|&|and|or|to)\s*{_NUMBER}{_CLAUSES})*)",
+    re.IGNORECASE,
+)
+_ALIASES = sorted(((alias, act) for act, spec in ACTS.items() for alias in spec["aliases"]),
+                  key=lambda pair: -len(pair[0]))
+_ACT_MENTION = re.compile(r"\b(" + "|".join(re.escape(alias) for alias, _ in _ALIASES) + r")\b", re.IGNORECASE)
+_ALIAS_ACT = dict(_ALIASES)
+_SECTION_ALIASES = "|".join(re.escape(alias) for alias, act in _ALIASES if ACTS[act]["unit"] == "section")
+# "302 IPC", "IPC 302", "498A of the Indian Penal Code"
+_BARE = re.compile(
+    rf"\b(?:({_NUMBER}){_CLAUSES}\s+(?:of\s+)?(?:the\s+)?({_SECTION_ALIASES})\b"
+    rf"|({_SECTION_ALIASES})\s+({_NUMBER}))",
+    re.IGNORECASE,
+)
+# Words that leave a query about nothing but the cited provision ("What does Article 14 guarantee?")
+_FILLER = frozenset("""
+a about act all an and any are as be by can cover covers deal deals define defines describe describes
+detail details do does explain full give guarantee guarantees i in indian india is it its law legal me
+mean meaning means mention mentions of on or please protect protected provide provides provision
+provisions purpose read relate related relates say says significance state states summarise summarize
+summary tell text that the this under what whats which with
+""".split())
+
+
+def normalize_number(number: str) -> str:
+    """'021a' -> '21A'."""
+    match = re.match(r"0*(\d+)([A-Za-z]*)", number.strip())
+    return match.group(1) + match.group(2).upper() if match else number
+
+
+def detect_act(text: str) -> Optional[str]:
+    """The act a document is, from the title it opens with."""
+    head = text[:500].lower()
+    for act, spec in ACTS.items():
+        if spec["title"].lower() in head:
+            return act
+    return None
+
+
+def _sort_key(number: str) -> Tuple[int, str]:
+    match = re.match(r"(\d+)([A-Z]*)", number)
+    return int(match.group(1)), match.group(2)
+
+
+def headings(text: str, act: str) -> List[Tuple[str, int]]:
+    """(number, character offset) of everything in `text` laid out like a provision heading of `act`."""
+    pattern = _LABELLED if ACTS[act].get("labelled") else _NUMBERED
+    return [(m.group(1) + m.group(2), m.start()) for m in pattern.finditer(text)]
+
+
+def extract_provisions(text: str, act: str) -> List[Tuple[str, int]]:
+    """(number, character offset) of each provision heading in a statute's text, in order.
+
+    Schedules, footnotes and quoted amendments restart or repeat numbers; only headings on the
+    longest increasing run of numbers through the document are kept, which is the body itself.
+    """
+    found = headings(text, act)
+    # Longest strictly increasing subsequence by (number, letter suffix), O(n log n)
+    tails, tail_at, previous = [], [], [None] * len(found)
+    for i, (number, _) in enumerate(found):
+        key = _sort_key(number)
+        j = bisect.bisect_left(tails, key)
+        if j == len(tails):
+            tails.append(key)
+            tail_at.append(i)
+        else:
+            tails[j], tail_at[j] = key, i
+        previous[i] = tail_at[j - 1] if j else None
+    kept, i = [], tail_at[-1] if tail_at else None
+    while i is not None:
+        kept.append(found[i])
+        i = previous[i]
+    return kept[::-1]
+
+
+def _resolve_act(unit: str, position: int, mentions: List[Tuple[int, str]]) -> str:
+    # The nearest act named in the query that is cited in this unit, else the default for the unit
+    candidates = [(abs(at - position), act) for at, act in mentions if ACTS[act]["unit"] == unit]
+    return min(candidates)[1] if candidates else DEFAULT_ACTS[unit]
+
+
+def parse_citations(query: str) -> List[Tuple[str, str]]:
+    """Normalized (act, number) pairs cited in `query`, in order of appearance.
+
+    Understands "Article 21", "Art. 21A", "Articles 14 to 18", "Section 302 IPC", "S. 420 of the
+    Indian Penal Code", "u/s 498A", "302 IPC" and "IPC 302". Sub-clauses such as "19(1)(a)" cite
+    the article itself.
+    """
+    if not query:
+        return []
+    mentions = [(m.start(), _ALIAS_ACT[m.group(1).lower()]) for m in _ACT_MENTION.finditer(query)]
+    found = []
+    for m in _CITATION.finditer(query):
+        unit = _UNITS[m.group(1).lower().rstrip(".")]
+        act = _resolve_act(unit, m.end(), mentions)
+        last, in_range = None, False
+        for number, to in re.findall(rf"({_NUMBER}){_CLAUSES}|\b(to)\b", m.group(2), re.IGNORECASE):
+            if to:
+                in_range = True
+                continue
+            number = normalize_number(number)
+            if in_range and last and last.isdigit() and number.isdigit() and 0 < int(number) - int(last) <= 20:
+                # "Articles 14 to 18"; wider ranges are not citations of individual provisions
+                found.extend((m.start(), act, str(n)) for n in range(int(last) + 1, int(number)))
+            found.append((m.start(), act, number))
+            last, in_range = number, False
+    for m in _BARE.finditer(query):
+        number, alias = (m.group(1), m.group(2)) if m.group(1) else (m.group(4), m.group(3))
+        found.append((m.start(), _ALIAS_ACT[alias.lower()], normalize_number(number)))
+    citations = []
+    for _, act, number in sorted(found, key=lambda item: item[0]):
+        if (act, number) not in citations:
+            citations.append((act, number))
+    return citations
+
+
+def citation_only(query: str) -> bool:
+    """True when `query` asks about the cited provisions and nothing else ("What is Article 21?")."""
+    rest = _BARE.sub(" ", _CITATION.sub(" ", query))
+    rest = _ACT_MENTION.sub(" ", rest)
+    words = re.findall(r"[a-z]+", rest.lower())
+    return all(word in _FILLER for word in words)
+
+
+class CitationIndex:
+    """(act, number) -> ids of the chunks where that provision begins, best first.
+
+    Built at ingestion from the full text of each document, so every heading is attributed to
+    its act. Chunk ids are positions in the snapshot's documents, as used by HybridRetriever.
+    """
+
+    def __init__(self, entries: Optional[Dict[str, List[int]]] = None):
+        self.entries = entries or {}
+
+    @staticmethod
+    def key(act: str, number: str) -> str:
+        return f"{act}:{number}"
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, act: str, number: str) -> List[int]:
+        return self.entries.get(self.key(act, number), [])
+
+    def lookup(self, citations: Sequence[Tuple[str, str]]) -> List[int]:
+        """Chunk ids for all `citations`: each one's best chunk first, then the alternates."""
+        lists = [self.get(act, number) for act, number in citations]
+        ids = []
+        for rank in range(max((len(l) for l in lists), default=0)):
+            for chunk_ids in lists:
+                if rank < len(chunk_ids) and chunk_ids[rank] not in ids:
+                    ids.append(chunk_ids[rank])
+        return ids
+
+    @classmethod
+    def build(cls, documents: Sequence[Tuple[str, str, List[str]]], chunk_ids: Dict[str, int],
+              chunk_size: int, chunk_overlap: int) -> "CitationIndex":
+        """Index the (name, cleaned text, chunks) of each document.
+
+        `chunk_ids` maps chunk text to its id in the built index (chunks dropped as duplicates are
+        absent); chunk_size/chunk_overlap are the chunker's, in words. A provision maps to the chunk
+        its heading starts furthest forward in, else to the previous chunk when the heading falls in
+        their overlap; a heading whose chunks were both dropped is found in the duplicate's document.
+        """
+        step = chunk_size - chunk_overlap
+        entries: Dict[str, List[int]] = {}
+        for name, text, chunks in documents:
+            act = detect_act(text)
+            if act is None or not chunks:
+                continue
+            provisions = extract_provisions(text, act)
+            words, counted_to = 0, 0
+            for number, offset in provisions:
+                # Cleaned text is single-space separated, so spaces before the heading = its word index
+                words += text.count(" ", counted_to, offset)
+                counted_to = offset
+                first = min(words // step, len(chunks) - 1)
+                candidates = [first]
+                if first > 0 and words - (first - 1) * step < chunk_size:
+                    candidates.append(first - 1)
+                for i in candidates:
+                    chunk_id = chunk_ids.get(chunks[i])
+                    if chunk_id is not None:
+                        ids = entries.setdefault(cls.key(act, number), [])
+                        if chunk_id not in ids:
+                            ids.append(chunk_id)
+                        break
+            logger.info("Citation index: %d provisions of %s in %s", len(provisions), act, name)
+        return cls(entries)
+
+    def save(self, directory: str):
+        with open(os.path.join(directory, CITATIONS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["CitationIndex"]:
+        """The index saved with a snapshot, or None for snapshots built before it existed."""
+        try:
+            with open(os.path.join(directory, CITATIONS_FILE), encoding="utf-8") as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Unreadable citation index in %s: %s", directory, e)
+            return None
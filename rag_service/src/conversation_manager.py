@@ -1,49 +1,214 @@
 import os
+import json
 import uuid
+import base64
+import logging
+import threading
+from collections import OrderedDict
 from typing import Dict, List, Tuple, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from pymongo import MongoClient
 
+from .metrics import time_stage, record_cache
+from .session_lifecycle import (DAY_S, LEGACY_TTL_FIELDS, TTL_FIELDS, SessionArchiver, delete_sessions, ensure_ttl_index,
+                                env_days, move_ttl_index)
+from .trace_store import TRACES_COLLECTION
+
 load_dotenv()
+logger = logging.getLogger(__name__)
+
+HISTORY_MAX_LIMIT = 200
+# Stored fields left out of history pages: debug lives in message_debug, summary_for_context and
+# last_active_at (retention) are internal
+_HISTORY_PROJECTION = {"debug": 0, "summary_for_context": 0, "last_active_at": 0}
+
+
+def _encode_cursor(created_at: datetime, seen_ids: List[str]) -> str:
+    raw = json.dumps({"t": created_at.isoformat(), "ids": seen_ids}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, List[str]]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(data["t"]), [str(i) for i in data["ids"]]
+    except Exception as e:
+        raise ValueError(f"Invalid history cursor: {e}") from e
+
 
 class ConversationManager:
     def __init__(self, max_history: int = 3, mongo_uri: Optional[str] = None, db_name: Optional[str] = None, max_context_tokens: int = 1000):
         self.max_history = max_history
         self.max_context_tokens = max_context_tokens
-        mongo_uri = mongo_uri or os.getenv("MONGODB_URI") or os.getenv("MONGO_URI") or "mongodb://localhost:27017"
-        db_name = db_name or os.getenv("MONGO_DB_NAME") or "rag_service"
+        self.mongo_uri = mongo_uri or os.getenv("MONGODB_URI") or os.getenv("MONGO_URI") or "mongodb://localhost:27017"
+        self.db_name = db_name or os.getenv("MONGO_DB_NAME") or "rag_service"
+        # Days before Mongo's TTL monitor deletes messages (and sessions idle that long), and before
+        # archive_sessions.py archives an idle session; 0 = never
+        self.retention_days = env_days("SESSION_RETENTION_DAYS")
+        self.archive_after_days = env_days("SESSION_ARCHIVE_AFTER_DAYS")
+        self.cache_max_sessions = int(os.getenv("CONTEXT_CACHE_MAX_SESSIONS", "10000"))
+        self.touch_interval_s = float(os.getenv("SESSION_TOUCH_INTERVAL_S", "600"))
+        self.connect()
+        # in-memory cache for recent exchanges, least recently used first
+        self._cache: "OrderedDict[str, List[Tuple[str, str, datetime]]]" = OrderedDict()
+        # when each session's last_active_at was last written
+        self._touched: "OrderedDict[str, datetime]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # ensure indexes
+        try:
+            # _id breaks created_at ties (milliseconds), so history pages and context keep turn order
+            self.messages.create_index([("session_id", 1), ("created_at", 1), ("_id", 1)])
+            self.message_debug.create_index("session_id")
+            self.sessions.create_index("session_id", unique=True)
+            self.sessions.create_index("user_id")
+            self.summaries.create_index("session_id", unique=True)
+            for name, field in TTL_FIELDS.items():
+                if name in LEGACY_TTL_FIELDS:
+                    move_ttl_index(self.db.get_collection(name), field, LEGACY_TTL_FIELDS[name], self.retention_days * DAY_S)
+                else:
+                    ensure_ttl_index(self.db.get_collection(name), field, self.retention_days * DAY_S)
+        except Exception:
+            logger.warning("Could not create conversation indexes", exc_info=True)
+
+        self.enable_summarization = os.getenv("ENABLE_TURN_SUMMARIZATION", "true").lower() == "true"
+
+    def connect(self):
+        """(Re)create the Mongo client; pre-forked workers call this since MongoClient is not fork-safe."""
         self.client = MongoClient(
-            mongo_uri,
+            self.mongo_uri,
             maxPoolSize=50,  # Limit connection pool
             minPoolSize=10,
             maxIdleTimeMS=45000
         )
-        self.db = self.client[db_name]
+        self.db = self.client[self.db_name]
         self.sessions = self.db.get_collection("sessions")
         self.messages = self.db.get_collection("messages")
         self.summaries = self.db.get_collection("conversation_summaries")
-        # in-memory cache for recent exchanges
-        self._cache: Dict[str, List[Tuple[str, str, datetime]]] = {}
-        # ensure indexes
-        try:
-            self.messages.create_index([("session_id", 1), ("created_at", 1)])
-            self.sessions.create_index("session_id", unique=True)
-            self.summaries.create_index("session_id", unique=True)
-        except Exception:
-            pass
+        # Per-message debug blobs, keyed by the message's _id, so history reads never carry them
+        self.message_debug = self.db.get_collection("message_debug")
+        self.archiver = SessionArchiver(self.db, self.archive_after_days)
 
-        self.enable_summarization = os.getenv("ENABLE_TURN_SUMMARIZATION", "true").lower() == "true"
-
-    def create_session(self) -> str:
+    def create_session(self, user_id: Optional[str] = None) -> str:
         session_id = str(uuid.uuid4())
-        self.sessions.insert_one({"session_id": session_id, "created_at": datetime.utcnow()})
-        self._cache[session_id] = []
+        now = datetime.utcnow()
+        doc = {"session_id": session_id, "created_at": now, "last_active_at": now}
+        if user_id:
+            doc["user_id"] = user_id
+        self.sessions.insert_one(doc)
+        self._cache_put(session_id, [])
+        with self._cache_lock:
+            self._touched[session_id] = now
         return session_id
 
-    def _summarize_assistant_response(self, user_query: str, assistant_response: str, groq_client) -> str:
+    def _cache_put(self, session_id: str, exchanges: List[Tuple[str, str, datetime]]):
+        with self._cache_lock:
+            self._cache[session_id] = exchanges
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.cache_max_sessions:
+                self._cache.popitem(last=False)
+
+    def _cache_get(self, session_id: str) -> List[Tuple[str, str, datetime]]:
+        """Cached exchanges, minus what Mongo has expired or archived since they were cached."""
+        now = datetime.utcnow()
+        with self._cache_lock:
+            exchanges = self._cache.get(session_id)
+            if not exchanges:
+                return []
+            if self.archive_after_days and exchanges[-1][2] < now - timedelta(days=self.archive_after_days):
+                # Idle long enough to have been archived; the rebuild restores it if it was
+                del self._cache[session_id]
+                return []
+            if self.retention_days:
+                horizon = now - timedelta(days=self.retention_days)
+                exchanges = [e for e in exchanges if e[2] >= horizon]
+                self._cache[session_id] = exchanges
+            self._cache.move_to_end(session_id)
+            return exchanges
+
+    def _touch(self, session_id: str, now: datetime):
+        """Bump the session's last_active_at (TTL and archival), at most once per SESSION_TOUCH_INTERVAL_S."""
+        last = self._touched.get(session_id)
+        if last is not None and (now - last).total_seconds() < self.touch_interval_s:
+            return
+        result = self.sessions.update_one({"session_id": session_id}, {"$set": {"last_active_at": now},
+                                                                       "$setOnInsert": {"created_at": now}}, upsert=True)
+        if result.upserted_id is not None:
+            # The session document was gone: archived (or expired) while the client kept the id
+            self.archiver.restore(session_id, now)
+        with self._cache_lock:
+            self._touched[session_id] = now
+            self._touched.move_to_end(session_id)
+            while len(self._touched) > self.cache_max_sessions:
+                self._touched.popitem(last=False)
+
+    def add_message(self, session_id: str, sender: str, text: str, debug: Optional[dict] = None,
+                    created_at: Optional[datetime] = None, **fields):
+        """Insert one message; `debug`, if any, goes to message_debug under the message's _id."""
+        doc = {"session_id": session_id, "sender": sender, "text": text, "created_at": created_at or datetime.utcnow()}
+        doc["last_active_at"] = doc["created_at"]
+        doc.update(fields)
+        with time_stage("mongo_write", collection="messages"):
+            message_id = self.messages.insert_one(doc).inserted_id
+            if debug:
+                self.message_debug.insert_one({"_id": message_id, "session_id": session_id, "created_at": doc["created_at"],
+                                               "last_active_at": doc["created_at"], "debug": debug})
+            if sender == "user":
+                self._touch(session_id, doc["created_at"])
+        return message_id
+
+    def get_debug(self, message_ids: List) -> Dict[str, dict]:
+        """Debug dicts by str(message _id), for the messages that have one."""
+        if not message_ids:
+            return {}
+        docs = self.message_debug.find({"_id": {"$in": list(message_ids)}}, {"debug": 1})
+        return {str(doc["_id"]): doc.get("debug") for doc in docs}
+
+    def get_history(self, session_id: str, limit: int = 50, cursor: Optional[str] = None, order: str = "asc",
+                    include_debug: bool = False) -> Dict:
+        """One page of a session's messages, oldest first (order="asc") or newest first ("desc").
+
+        Keyset pagination on the (session_id, created_at) index: `cursor` is the `next_cursor` of the
+        previous page, which holds the last created_at and the ids already returned at that instant
+        (timestamps tie at millisecond resolution). Debug data is only read with include_debug.
+        """
+        if order not in ("asc", "desc"):
+            raise ValueError(f"Unknown order {order!r} (asc | desc)")
+        limit = max(1, min(int(limit), HISTORY_MAX_LIMIT))
+        flt: Dict = {"session_id": session_id}
+        at, seen = _decode_cursor(cursor) if cursor else (None, [])
+        if at is not None:
+            flt["created_at"] = {"$gte" if order == "asc" else "$lte": at}
+        direction = 1 if order == "asc" else -1
+        # Fetch one extra to know whether there is a next page
+        docs = self.messages.find(flt, _HISTORY_PROJECTION).sort([("created_at", direction), ("_id", direction)])
+        docs = docs.limit(limit + len(seen) + 1)
+        docs = [d for d in docs if str(d["_id"]) not in seen]
+        if not docs and not cursor and self.archiver.restore(session_id):
+            return self.get_history(session_id, limit, cursor, order, include_debug)
+        page, more = docs[:limit], len(docs) > limit
+
+        next_cursor = None
+        if more and page:
+            last = page[-1]["created_at"]
+            tied = [str(d["_id"]) for d in page if d["created_at"] == last]
+            # Still on the cursor's instant: keep excluding what earlier pages returned there
+            if last == at:
+                tied = seen + tied
+            next_cursor = _encode_cursor(last, tied)
+
+        debug = self.get_debug([d["_id"] for d in page]) if include_debug else {}
+        messages = []
+        for d in page:
+            msg = {"id": str(d.pop("_id")), **{k: v for k, v in d.items() if k != "session_id"}}
+            if include_debug:
+                msg["debug"] = debug.get(msg["id"])
+            messages.append(msg)
+        return {"session_id": session_id, "messages": messages, "next_cursor": next_cursor}
+
+    def _summarize_assistant_response(self, user_query: str, assistant_response: str, llm) -> str:
         """Create a compact summary of assistant's response (max 100 tokens) for future conversation context."""
-        if groq_client is None or not assistant_response:
+        if llm is None or not assistant_response:
             return assistant_response[:400]  # fallback truncation
 
         summary_prompt = f"""Summarize this legal assistant response in under 100 tokens, preserving key facts and legal points:
@@ -54,48 +219,32 @@ Assistant answered: {assistant_response}
 Concise summary:"""
 
         try:
-            resp = groq_client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": summary_prompt}],
-                temperature=0.1,
-                max_tokens=150
-            )
-            return resp.choices[0].message.content.strip()
+            with time_stage("summarization"):
+                return llm.complete("turn_summary", [{"role": "user", "content": summary_prompt}]).strip()
         except Exception:
             return assistant_response[:400]  # fallback
 
-    def add_exchange(self, session_id: str, user_message: str, bot_response: str, debug: Optional[dict] = None, groq_client=None):
-        """Add exchange and create compact summary of bot_response for future context."""
+    def add_exchange(self, session_id: str, user_message: str, bot_response: str, debug: Optional[dict] = None, llm=None,
+                     fields: Optional[dict] = None):
+        """Add exchange and create compact summary of bot_response for future context; returns the reply's message id."""
         now = datetime.utcnow()
-        self.messages.insert_one({
-            "session_id": session_id,
-            "sender": "user",
-            "text": user_message,
-            "created_at": now,
-            "debug": debug.get("user") if isinstance(debug, dict) else None
-        })
+        debug = debug if isinstance(debug, dict) else {}
+        self.add_message(session_id, "user", user_message, debug=debug.get("user"), created_at=now)
 
         # Create compact summary of assistant response for conversation context
-        if self.enable_summarization and groq_client:
-            response_summary = self._summarize_assistant_response(user_message, bot_response, groq_client)
+        if self.enable_summarization and llm:
+            response_summary = self._summarize_assistant_response(user_message, bot_response, llm)
         else:
             response_summary = bot_response[:400]  # truncate fallback
 
-        # Insert assistant message with both full response and summary
-        assistant_doc = {
-            "session_id": session_id,
-            "sender": "assistant",
-            "text": bot_response,  # full response shown to user
-            "summary_for_context": response_summary,  # compact version for next turn
-            "created_at": datetime.utcnow(),
-            "debug": debug.get("assistant") if isinstance(debug, dict) else None
-        }
-        self.messages.insert_one(assistant_doc)
+        # Full response is shown to the user; the summary is the compact version for the next turn
+        message_id = self.add_message(session_id, "assistant", bot_response, debug=debug.get("assistant"),
+                                      summary_for_context=response_summary, **(fields or {}))
 
         # Update in-memory cache with SUMMARY instead of full response
-        self._cache.setdefault(session_id, []).append((user_message, response_summary, now))
-        if len(self._cache[session_id]) > self.max_history:
-            self._cache[session_id] = self._cache[session_id][-self.max_history:]
+        exchanges = self._cache_get(session_id) + [(user_message, response_summary, now)]
+        self._cache_put(session_id, exchanges[-self.max_history:])
+        return message_id
 
     def _estimate_tokens(self, text: str) -> int:
         """Rough token estimate (1 token ≈ 4 chars)."""
@@ -108,11 +257,13 @@ Concise summary:"""
         return doc.get("summary") if doc else None
 
     def save_summary(self, session_id: str, summary: str):
-        self.summaries.update_one({"session_id": session_id}, {"$set": {"summary": summary, "updated_at": datetime.utcnow()}}, upsert=True)
+        now = datetime.utcnow()
+        self.summaries.update_one({"session_id": session_id}, {"$set": {"summary": summary, "updated_at": now,
+                                                                        "last_active_at": now}}, upsert=True)
 
-    def ensure_summary_limit(self, session_id: str, groq_client, max_summary_tokens: int = 500):
-        """Ensure stored summary for session_id is under max_summary_tokens by re-summarizing using groq_client."""
-        if groq_client is None:
+    def ensure_summary_limit(self, session_id: str, llm, max_summary_tokens: int = 500):
+        """Ensure stored summary for session_id is under max_summary_tokens by re-summarizing through the LLM gateway."""
+        if llm is None:
             return  # cannot summarize without LLM client
 
         summary_doc = self.summaries.find_one({"session_id": session_id})
@@ -132,31 +283,32 @@ Original summary:
 {current_summary}
 """
         try:
-            resp = groq_client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[
+            with time_stage("summarization"):
+                new_summary = llm.complete("summary_compression", [
                     {"role": "system", "content": "You are an expert legal summarizer."},
                     {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=max(200, max_summary_tokens)  # request reasonable token budget for summary
-            )
-            new_summary = resp.choices[0].message.content
+                ], max_tokens=max(200, max_summary_tokens))  # request reasonable token budget for summary
             # Save compressed summary
             self.save_summary(session_id, new_summary)
         except Exception as e:
             # fallback: truncate the existing summary conservatively
             truncated = current_summary[: max_summary_tokens * 4]  # approx char limit
             self.save_summary(session_id, truncated)
-            print(f"Warning: summary re-compression failed for session {session_id}: {e}")
+            logger.warning("Summary re-compression failed for session %s: %s", session_id, e)
 
-    def get_conversation_context(self, session_id: str, groq_client=None) -> str:
+    def get_conversation_context(self, session_id: str, llm=None) -> str:
         """Get conversation context using response summaries (not full responses) for efficiency."""
         # Load from cache (which now has summaries)
-        exchanges = self._cache.get(session_id, [])
+        exchanges = self._cache_get(session_id)
+        record_cache("conversation_context", bool(exchanges))
         if not exchanges:
             # Rebuild from DB using summary_for_context field
-            msgs = list(self.messages.find({"session_id": session_id}).sort("created_at", -1).limit(self.max_history*2))
+            projection = {"sender": 1, "text": 1, "summary_for_context": 1, "created_at": 1, "last_active_at": 1}
+            # A turn's two messages can share a millisecond; _id keeps them in insertion order
+            newest = [("created_at", -1), ("_id", -1)]
+            msgs = list(self.messages.find({"session_id": session_id}, projection).sort(newest).limit(self.max_history*2))
+            if not msgs and self.archiver.restore(session_id):
+                msgs = list(self.messages.find({"session_id": session_id}, projection).sort(newest).limit(self.max_history*2))
             msgs = list(reversed(msgs))
             exchanges = []
             i = 0
@@ -169,21 +321,37 @@ Original summary:
                         i += 2
                     else:
                         i += 1
-                    exchanges.append((user_msg, bot_summary, msgs[max(i-1,0)]["created_at"]))
+                    # Cached exchanges age like the messages: from last_active_at, which a restore refreshes
+                    last = msgs[max(i-1,0)]
+                    exchanges.append((user_msg, bot_summary, last.get("last_active_at") or last["created_at"]))
                 else:
                     i += 1
-            self._cache[session_id] = exchanges[-self.max_history:]
+            exchanges = exchanges[-self.max_history:]
+            self._cache_put(session_id, exchanges)
 
         # Build context from user queries + assistant summaries (not full responses)
         parts = []
-        for u, summary, _ in self._cache.get(session_id, []):
+        for u, summary, _ in exchanges:
             parts.append(f"User: {u}")
             parts.append(f"Assistant: {summary}")
         return "\n".join(parts)
 
     def reset_session(self, session_id: str):
-        self.messages.delete_many({"session_id": session_id})
-        self.summaries.delete_many({"session_id": session_id})
-        self.sessions.delete_many({"session_id": session_id})
-        if session_id in self._cache:
-            del self._cache[session_id]
+        self.reset_sessions([session_id])
+
+    def reset_sessions(self, session_ids: Optional[List[str]] = None, user_id: Optional[str] = None) -> Dict[str, int]:
+        """Delete sessions (given, and/or all of `user_id`'s) with their messages, debug, summaries,
+        archives and traces: one delete_many per collection per 500 sessions. Returns deleted documents per collection."""
+        ids = dict.fromkeys(session_ids or [])
+        if user_id:
+            ids.update(dict.fromkeys(d["session_id"] for d in self.sessions.find({"user_id": user_id}, {"session_id": 1})))
+        ids = list(ids)
+        if not ids:
+            return {"sessions_reset": 0}
+        deleted = delete_sessions([self.messages, self.message_debug, self.summaries, self.archiver.archive,
+                                   self.db.get_collection(TRACES_COLLECTION), self.sessions], ids)
+        with self._cache_lock:
+            for session_id in ids:
+                self._cache.pop(session_id, None)
+                self._touched.pop(session_id, None)
+        return dict(deleted, sessions_reset=len(ids))
@@ -0,0 +1,158 @@
+import hashlib
+import logging
+import os
+import re
+import zlib
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 64
+# 16 bands x 4 rows: pairs above ~0.5 Jaccard become candidates, then are checked against the threshold
+LSH_BANDS = 16
+SHINGLE_WORDS = 5
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+# Fixed seed: signatures are persisted with the index and compared across processes. a and b span
+# the whole field: with small ones, a*x + b (x a 32-bit CRC) wraps around p only a few times, every
+# permutation keeps nearly the order of x, and unrelated chunks share most minima.
+_rng = np.random.default_rng(1)
+_PERM_A = _rng.integers(1, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, (1 << 61) - 1, size=NUM_PERM, dtype=np.uint64)
+_LOW32 = np.uint64((1 << 32) - 1)
+_LOW29 = np.uint64((1 << 29) - 1)
+
+
+def _permute(hashes: np.ndarray) -> np.ndarray:
+    """(a*x + b) mod p for every permutation at once, shape (NUM_PERM, shingles), for x < 2^32.
+
+    a*x needs up to 93 bits, so the uint64 product is split: a = a_hi * 2^32 + a_lo. Both partial
+    products fit in 64 bits, and a_hi*x * 2^32 is reduced with 2^61 = 1 (mod p).
+    """
+    a_hi, a_lo = (_PERM_A >> np.uint64(32))[:, None], (_PERM_A & _LOW32)[:, None]
+    t = a_hi * hashes  # < 2^61
+    high = ((t >> np.uint64(29)) + ((t & _LOW29) << np.uint64(32))) % _MERSENNE_PRIME
+    low = (a_lo * hashes) % _MERSENNE_PRIME
+    return (high + low + _PERM_B[:, None]) % _MERSENNE_PRIME
+
+
+def dedup_threshold() -> float:
+    """Estimated Jaccard similarity above which two chunks count as near-duplicates (DEDUP_THRESHOLD)."""
+    return float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text.lower())).strip()
+
+
+def exact_key(text: str) -> str:
+    return hashlib.sha1(normalize(text).encode("utf-8")).hexdigest()
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature (NUM_PERM uint64) over word 5-gram shingles."""
+    words = normalize(text).split()
+    if len(words) < SHINGLE_WORDS:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in set(shingles)), dtype=np.uint64)
+    return _permute(hashes).min(axis=1)
+
+
+def signatures(texts: Sequence[str]) -> np.ndarray:
+    if not texts:
+        return np.zeros((0, NUM_PERM), dtype=np.uint64)
+    return np.vstack([minhash(t) for t in texts])
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return float(np.mean(a == b))
+
+
+def dedupe_chunks(chunks: List[str], threshold: Optional[float] = None) -> Tuple[List[str], np.ndarray, Dict]:
+    """Drop exact and near-duplicate chunks, keeping the first occurrence.
+
+    Returns (kept chunks, their signatures, stats). Near-duplicate candidates come from LSH
+    banding and are confirmed by estimated Jaccard >= threshold.
+    """
+    threshold = dedup_threshold() if threshold is None else threshold
+    rows = NUM_PERM // LSH_BANDS
+    seen_exact = set()
+    buckets: Dict[Tuple[int, bytes], List[int]] = {}
+    kept, kept_sigs = [], []
+    exact = near = 0
+    for chunk in chunks:
+        key = exact_key(chunk)
+        if key in seen_exact:
+            exact += 1
+            continue
+        sig = minhash(chunk)
+        bands = [(b, sig[b * rows:(b + 1) * rows].tobytes()) for b in range(LSH_BANDS)]
+        candidates = {j for band in bands for j in buckets.get(band, ())}
+        if threshold < 1.0 and any(similarity(sig, kept_sigs[j]) >= threshold for j in candidates):
+            near += 1
+            continue
+        seen_exact.add(key)
+        for band in bands:
+            buckets.setdefault(band, []).append(len(kept))
+        kept.append(chunk)
+        kept_sigs.append(sig)
+    stats = {"chunks_in": len(chunks), "exact_duplicates": exact, "near_duplicates": near, "chunks_kept": len(kept)}
+    logger.info("Chunk dedup: %s", stats)
+    sigs = np.vstack(kept_sigs) if kept_sigs else np.zeros((0, NUM_PERM), dtype=np.uint64)
+    return kept, sigs, stats
+
+
+def diversify(results: List[Tuple[str, float]], k: int, signature_of: Callable[[str], np.ndarray],
+              lambda_: float = 0.7, max_similarity: float = 0.5) -> List[Tuple[str, float]]:
+    """MMR selection of k results: relevance (score scaled to the best) against similarity to chunks already picked.
+
+    Candidates whose similarity to a picked chunk reaches `max_similarity` are never picked.
+    Returns results in pick order with their original scores; with no overlap this is results[:k].
+    """
+    if len(results) <= 1:
+        return results[:k]
+    top = max(score for _, score in results) or 1.0
+    sigs = [signature_of(doc) for doc, _ in results]
+    remaining = list(range(len(results)))
+    picked: List[int] = []
+    while remaining and len(picked) < k:
+        best, best_value = None, None
+        for i in remaining:
+            overlap = max((similarity(sigs[i], sigs[j]) for j in picked), default=0.0)
+            if overlap >= max_similarity:
+                continue
+            value = lambda_ * results[i][1] / top - (1 - lambda_) * overlap
+            if best_value is None or value > best_value:
+                best, best_value = i, value
+        if best is None:
+            break
+        picked.append(best)
+        remaining.remove(best)
+    return [results[i] for i in picked]
+
+
+def trim_overlaps(chunks: List[str], overlap_words: int) -> List[str]:
+    """Remove the `overlap_words` shared by consecutive windows of the same text when both were selected.
+
+    chunk_text() repeats the last `overlap_words` words of a chunk at the start of the next one.
+    """
+    if overlap_words <= 0 or len(chunks) < 2:
+        return chunks
+    words = [c.split() for c in chunks]
+    heads = {tuple(w[:overlap_words]): i for i, w in enumerate(words) if len(w) > overlap_words}
+    out = list(words)
+    for i, w in enumerate(words):
+        if len(w) <= overlap_words:
+            continue
+        j = heads.get(tuple(w[-overlap_words:]))
+        # Chunk j continues chunk i: drop the repeated words from whichever of the two ranks lower
+        if j is not None and j != i:
+            if j > i and len(out[j]) > overlap_words:
+                out[j] = out[j][overlap_words:]
+            elif j < i and len(out[i]) > overlap_words:
+                out[i] = out[i][:-overlap_words]
+    return [" ".join(w) for w in out if w]
@@ -1,8 +1,11 @@
 import os
 import re
-from typing import List
+import logging
+from typing import List, Tuple
 from PyPDF2 import PdfReader
 
+logger = logging.getLogger(__name__)
+
 class DocumentProcessor:
     def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
         self.chunk_size = chunk_size
@@ -17,7 +20,7 @@ class DocumentProcessor:
                     page_text = p.extract_text() or ""
                     text += page_text + "\n"
         except Exception as e:
-            print(f"Error reading PDF {pdf_path}: {e}")
+            logger.error("Error reading PDF %s: %s", pdf_path, e)
         return text
 
     def clean_text(self, text: str) -> str:
@@ -38,18 +41,24 @@ class DocumentProcessor:
                 break
         return chunks
 
-    def process_documents(self, data_folder: str) -> List[str]:
-        """Process documents and return text chunks (plain strings for vector store)."""
-        all_chunks = []
+    def load_documents(self, data_folder: str) -> List[Tuple[str, str]]:
+        """(file name, cleaned text) of every PDF in `data_folder`."""
+        documents = []
         if not os.path.exists(data_folder):
             return []
         for fname in os.listdir(data_folder):
             if fname.lower().endswith(".pdf"):
                 path = os.path.join(data_folder, fname)
-                print(f"Processing {fname}")
+                logger.info("Processing %s", fname)
                 text = self.extract_text_from_pdf(path)
-                cleaned = self.clean_text(text)
-                chunks = self.chunk_text(cleaned)
-                # Return plain strings (not dicts) for compatibility with vector store and BM25
-                all_chunks.extend(chunks)
+                documents.append((fname, self.clean_text(text)))
+        return documents
+
+    def process_documents(self, data_folder: str) -> List[str]:
+        """Process documents and return text chunks (plain strings for vector store)."""
+        all_chunks = []
+        for _, cleaned in self.load_documents(data_folder):
+            chunks = self.chunk_text(cleaned)
+            # Return plain strings (not dicts) for compatibility with vector store and BM25
+            all_chunks.extend(chunks)
         return all_chunks
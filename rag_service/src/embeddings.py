@@ -0,0 +1,76 @@
+import logging
+import os
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+# sentence_transformers pulls in torch + transformers (seconds of import time), so it is
+# imported inside the loaders rather than when the service modules are imported
+logger = logging.getLogger(__name__)
+
+# torch: the original fp32 PyTorch model; torch-int8: dynamic int8 quantization of the Linear layers;
+# onnx / onnx-int8: ONNX Runtime on CPU (needs `pip install "sentence-transformers[onnx]"`)
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+# Pre-quantized graph shipped in the all-MiniLM-L6-v2 hub repo; pick the avx512/arm64 variant if the CPU has it
+DEFAULT_ONNX_INT8_FILE = "onnx/model_quint8_avx2.onnx"
+
+
+def embedding_threads(threads: Optional[int] = None) -> Optional[int]:
+    """Intra-op thread count for encoding (EMBEDDING_THREADS); None leaves the library default."""
+    if threads is None and os.getenv("EMBEDDING_THREADS"):
+        threads = int(os.getenv("EMBEDDING_THREADS"))
+    return threads if threads and threads > 0 else None
+
+
+def _load_onnx(model_name: str, int8: bool, threads: Optional[int]) -> "SentenceTransformer":
+    import onnxruntime as ort
+    from sentence_transformers import SentenceTransformer
+
+    options = ort.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    model_kwargs = {"provider": "CPUExecutionProvider", "session_options": options}
+    if int8:
+        model_kwargs["file_name"] = os.getenv("EMBEDDING_ONNX_FILE", DEFAULT_ONNX_INT8_FILE)
+    return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+
+def _load_torch(model_name: str, int8: bool, threads: Optional[int]) -> "SentenceTransformer":
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if threads:
+        torch.set_num_threads(threads)
+    if not int8:
+        return SentenceTransformer(model_name)
+    model = SentenceTransformer(model_name, device="cpu")
+    # Weights of every Linear layer become int8; activations are quantized on the fly per batch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_encoder(model_name: str, backend: Optional[str] = None, threads: Optional[int] = None) -> "SentenceTransformer":
+    """Load the sentence encoder with the configured backend (EMBEDDING_BACKEND, default "torch").
+
+    ONNX backends fall back to the equivalent torch backend when onnxruntime/optimum are missing
+    or the model has no exported graph, so a misconfigured worker still serves requests.
+    """
+    backend = (backend or os.getenv("EMBEDDING_BACKEND", "torch")).lower()
+    if backend not in EMBEDDING_BACKENDS:
+        logger.warning("Unknown EMBEDDING_BACKEND %r, using torch", backend)
+        backend = "torch"
+    threads = embedding_threads(threads)
+    int8 = backend.endswith("-int8")
+    if backend.startswith("onnx"):
+        try:
+            model = _load_onnx(model_name, int8, threads)
+        except Exception as e:
+            logger.warning("ONNX embedding backend unavailable (%s), falling back to torch%s", e, "-int8" if int8 else "")
+            backend = "torch-int8" if int8 else "torch"
+    if not backend.startswith("onnx"):
+        model = _load_torch(model_name, int8, threads)
+    model.embedding_backend = backend
+    logger.info("Loaded %s with %s backend (threads=%s)", model_name, backend, threads or "default")
+    return model
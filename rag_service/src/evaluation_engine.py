@@ -0,0 +1,322 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from pymongo import UpdateOne
+
+from .legal_evaluator import DIMENSIONS, INVALID_STATUS, EvaluationParseError, evaluation_messages, parse_evaluation
+from .llm_gateway import backoff, retry_after, status_code
+from .metrics import time_stage
+
+logger = logging.getLogger(__name__)
+
+# A turn with one of these is not evaluated again when its run is resumed ("error" turns are)
+FINAL_STATUSES = ("ok", INVALID_STATUS)
+# Assistant messages whose message_debug entries are read with one query
+DEBUG_BATCH = 256
+
+
+class RateLimiter:
+    """Requests- and tokens-per-minute buckets shared by all evaluation workers (0 = unlimited).
+
+    pause() holds every worker until a provider's retry-after has passed, since the limit is per account.
+    """
+
+    def __init__(self, rpm: float = 0, tpm: float = 0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = min(rpm, 1.0)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 0):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed, self._updated = now - self._updated, now
+                if self.rpm:
+                    self._requests = min(max(1.0, self.rpm / 60.0), self._requests + elapsed * self.rpm / 60.0)
+                if self.tpm:
+                    self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+                    tokens = min(tokens, self.tpm)
+                delay = self._resume_at - now
+                if delay <= 0:
+                    delay = max(
+                        (1.0 - self._requests) * 60.0 / self.rpm if self.rpm else 0.0,
+                        (tokens - self._tokens) * 60.0 / self.tpm if self.tpm else 0.0,
+                    )
+                    if delay <= 0:
+                        if self.rpm:
+                            self._requests -= 1.0
+                        if self.tpm:
+                            self._tokens -= tokens
+                        return
+            time.sleep(min(delay, 5.0))
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+            # The provider saw more traffic than the bucket allowed for; start it empty again
+            self._requests = min(self._requests, 0.0)
+
+
+class EvaluationEngine:
+    """Evaluate stored chat turns offline: concurrent, rate-limited, retried, bulk-written and resumable.
+
+    A turn is a user message and the assistant reply that follows it in `messages`; its turn_id is
+    the assistant message id. Results are upserted into `evaluations` keyed by (run_id, turn_id) in
+    batches of EVAL_BATCH_SIZE. Starting a run_id again skips the turns it already finished, so an
+    interrupted run carries on where it stopped. Run metadata and counts go to `evaluation_runs`.
+    """
+
+    def __init__(self, llm, db, run_id: Optional[str] = None, concurrency: Optional[int] = None,
+                 rpm: Optional[float] = None, tpm: Optional[float] = None, max_retries: Optional[int] = None,
+                 batch_size: Optional[int] = None, model: Optional[str] = None, chunks=None):
+        # An LLMGateway; its retries are off here, since this engine retries on its own terms
+        self.llm = llm
+        # A ChunkResolver: the judge's context is rebuilt from the chunks a turn's debug references
+        self.chunks = chunks
+        self.run_id = run_id or datetime.utcnow().strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+        self.concurrency = concurrency or int(os.getenv("EVAL_CONCURRENCY", "4"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("EVAL_MAX_RETRIES", "3"))
+        self.batch_size = batch_size or int(os.getenv("EVAL_BATCH_SIZE", "50"))
+        # The gateway's evaluation model (LLM_EVALUATION_MODEL, then LLM_MODEL) unless one is given
+        self.model = model or (llm.config("evaluation")["model"] if llm is not None else None)
+        self.max_tokens = 1000
+        self.limiter = RateLimiter(rpm if rpm is not None else float(os.getenv("EVAL_RPM", "30")),
+                                   tpm if tpm is not None else float(os.getenv("EVAL_TPM", "0")))
+        self.messages = db.get_collection("messages")
+        self.message_debug = db.get_collection("message_debug")
+        self.evaluations = db.get_collection("evaluations")
+        self.runs = db.get_collection("evaluation_runs")
+        try:
+            # Inline /chat evaluations have no run_id and stay out of the unique index
+            self.evaluations.create_index([("run_id", 1), ("turn_id", 1)], unique=True,
+                                          partialFilterExpression={"run_id": {"$exists": True}})
+            self.runs.create_index("run_id", unique=True)
+        except Exception:
+            pass
+
+    def turns(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+              session_ids: Optional[List[str]] = None, limit: Optional[int] = None) -> Iterator[Dict]:
+        """Stored turns in session order; greetings (no retrieval) are skipped."""
+        flt: Dict = {}
+        if since or until:
+            flt["created_at"] = {k: v for k, v in (("$gte", since), ("$lt", until)) if v is not None}
+        if session_ids:
+            flt["session_id"] = {"$in": list(session_ids)}
+        # "debug" is only still inline on messages written before it moved to message_debug
+        cursor = self.messages.find(flt, {"session_id": 1, "sender": 1, "text": 1, "created_at": 1, "route": 1, "debug": 1})
+        last_user: Dict[str, Dict] = {}
+        pending: List = []
+        count = 0
+        for msg in cursor.sort([("session_id", 1), ("created_at", 1)]):
+            if msg.get("sender") == "user":
+                last_user[msg["session_id"]] = msg
+                continue
+            user = last_user.pop(msg.get("session_id"), None)
+            if msg.get("sender") != "assistant" or user is None or msg.get("route") == "greeting" \
+                    or (msg.get("debug") or {}).get("note") == "retrieval_skipped_greeting":
+                continue
+            pending.append((user, msg))
+            if limit and count + len(pending) >= limit:
+                break
+            if len(pending) >= DEBUG_BATCH:
+                yield from self._with_context(pending)
+                count += len(pending)
+                pending = []
+        yield from self._with_context(pending)
+
+    def _with_context(self, pairs: List) -> Iterator[Dict]:
+        """Turns for (user, assistant) message pairs, with the retrieved context from message_debug."""
+        ids = [msg["_id"] for _, msg in pairs if "debug" not in msg]
+        stored = {}
+        if ids:
+            stored = {doc["_id"]: doc.get("debug") for doc in self.message_debug.find({"_id": {"$in": ids}}, {"debug": 1})}
+        for user, msg in pairs:
+            debug = msg.get("debug") or stored.get(msg["_id"]) or {}
+            yield {
+                "turn_id": str(msg["_id"]),
+                "session_id": msg["session_id"],
+                "query": user.get("text", ""),
+                "response": msg.get("text", ""),
+                "context": self._context(debug),
+                "created_at": msg.get("created_at"),
+            }
+
+    def _context(self, debug: Dict) -> str:
+        # Written before debug referenced chunks, or kept by migrate_debug.py for chunks no longer indexed
+        if "retrieved_context_preview" in debug:
+            return debug["retrieved_context_preview"]
+        if "retrieved_chunks" in debug and self.chunks is not None:
+            return self.chunks.context(debug["retrieved_chunks"])
+        return ""
+
+    def completed(self) -> set:
+        docs = self.evaluations.find({"run_id": self.run_id, "status": {"$in": list(FINAL_STATUSES)}}, {"turn_id": 1})
+        return {doc["turn_id"] for doc in docs}
+
+    def evaluate(self, turn: Dict) -> Dict:
+        """Evaluation record for one turn, after up to EVAL_MAX_RETRIES retries.
+
+        Rate limits pause every worker for the provider's retry-after; other errors and replies that
+        fail the schema back off exponentially (with jitter) and try again.
+        """
+        messages = evaluation_messages(turn["query"], turn["response"], turn["context"])
+        tokens = sum(len(m["content"]) for m in messages) // 4 + self.max_tokens
+        start = time.perf_counter()
+        status, error, evaluation, attempts = "error", None, None, 0
+        while attempts <= self.max_retries:
+            attempts += 1
+            self.limiter.acquire(tokens)
+            try:
+                with time_stage("evaluation", mode="batch", attempt=attempts):
+                    content = self.llm.complete(
+                        "evaluation", messages, retries=0,
+                        model=self.model,
+                        # A little more randomness on retries, so an unparseable reply is not repeated
+                        temperature=0.1 if attempts == 1 else 0.3,
+                        max_tokens=self.max_tokens,
+                    )
+                evaluation = parse_evaluation(content)
+                status, error = "ok", None
+                break
+            except EvaluationParseError as e:
+                status, error = INVALID_STATUS, f"parse: {e}"
+            except Exception as e:
+                wait = retry_after(e)
+                status, error = "error", f"{type(e).__name__}: {e}"
+                if wait is not None:
+                    self.limiter.pause(wait or self._backoff(attempts))
+                    continue
+                code = status_code(e)
+                if code is not None and 400 <= code < 500:
+                    break  # bad request, auth: retrying will not help
+            if attempts <= self.max_retries:
+                time.sleep(self._backoff(attempts))
+        return {
+            "run_id": self.run_id,
+            "turn_id": turn["turn_id"],
+            "session_id": turn["session_id"],
+            "query": turn["query"],
+            "response": turn["response"],
+            "evaluation": evaluation,
+            "status": status,
+            "error": error,
+            "attempts": attempts,
+            "model": self.model,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "turn_created_at": turn.get("created_at"),
+            "timestamp": datetime.utcnow(),
+        }
+
+    def _backoff(self, attempt: int) -> float:
+        return backoff(attempt)
+
+    def run(self, turns: Iterable[Dict]) -> Dict:
+        """Evaluate `turns` (skipping those this run already finished) and return the counts.
+
+        On KeyboardInterrupt, results finished so far are written and the run is marked interrupted.
+        """
+        done = self.completed()
+        counts = {"skipped": 0, "ok": 0, "invalid": 0, "error": 0}
+        self.runs.update_one({"run_id": self.run_id}, {
+            "$setOnInsert": {"run_id": self.run_id, "started_at": datetime.utcnow()},
+            "$set": {"status": "running", "model": self.model, "updated_at": datetime.utcnow()},
+        }, upsert=True)
+        pending_writes: List[Dict] = []
+        pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="evaluate")
+        in_flight = set()
+        status = "interrupted"
+
+        def collect(finished):
+            for future in finished:
+                doc = future.result()
+                counts[doc["status"]] += 1
+                pending_writes.append(doc)
+            if len(pending_writes) >= self.batch_size:
+                self._write(pending_writes)
+
+        try:
+            for turn in turns:
+                if turn["turn_id"] in done:
+                    counts["skipped"] += 1
+                    continue
+                # Bounded submission: a large backlog is streamed from Mongo, not loaded at once
+                while len(in_flight) >= 2 * self.concurrency:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                in_flight.add(pool.submit(contextvars.copy_context().run, self.evaluate, turn))
+            while in_flight:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+            status = "finished"
+        finally:
+            for future in in_flight:
+                future.cancel()
+            pool.shutdown(wait=True)
+            collect([f for f in in_flight if f.done() and not f.cancelled()])
+            self._write(pending_writes)
+            self.runs.update_one({"run_id": self.run_id}, {
+                "$set": {"status": status, "updated_at": datetime.utcnow()},
+                "$inc": {f"counts.{k}": v for k, v in counts.items()},
+            })
+            logger.info("Evaluation run %s %s: %s", self.run_id, status, counts)
+        return counts
+
+    def _write(self, docs: List[Dict]):
+        if not docs:
+            return
+        requests = [UpdateOne({"run_id": d["run_id"], "turn_id": d["turn_id"]}, {"$set": d}, upsert=True) for d in docs]
+        with time_stage("mongo_write", collection="evaluations", docs=len(docs)):
+            self.evaluations.bulk_write(requests, ordered=False)
+        logger.info("Evaluation run %s: wrote %d results", self.run_id, len(docs))
+        docs.clear()
+
+    def report(self, worst: int = 5) -> Dict:
+        docs = self.evaluations.find({"run_id": self.run_id}, {"turn_id": 1, "session_id": 1, "query": 1, "status": 1,
+                                                               "evaluation": 1, "attempts": 1, "latency_ms": 1})
+        return dict(summarize(list(docs), worst), run_id=self.run_id)
+
+
+def _describe(values: List[float]) -> Dict:
+    values = sorted(values)
+    if not values:
+        return {"n": 0}
+    return {
+        "n": len(values),
+        "mean": round(sum(values) / len(values), 3),
+        "p50": values[len(values) // 2],
+        "min": values[0],
+        # Share of turns per rounded score 1..5
+        "distribution": {str(s): round(sum(1 for v in values if round(v) == s) / len(values), 3) for s in range(1, 6)},
+    }
+
+
+def summarize(docs: List[Dict], worst: int = 5) -> Dict:
+    """Aggregate report over evaluation records: status counts, per-dimension and overall scores, worst turns."""
+    ok = [d for d in docs if d.get("status", "ok") == "ok" and d.get("evaluation")]
+    statuses: Dict[str, int] = {}
+    for d in docs:
+        statuses[d.get("status", "ok")] = statuses.get(d.get("status", "ok"), 0) + 1
+    attempts = [d.get("attempts", 1) for d in docs]
+    lowest = sorted(ok, key=lambda d: d["evaluation"]["overall_score"])[:worst]
+    return {
+        "turns": len(docs),
+        "status": statuses,
+        "retried": sum(1 for a in attempts if a > 1),
+        "mean_attempts": round(sum(attempts) / len(attempts), 3) if attempts else 0.0,
+        "overall": _describe([float(d["evaluation"]["overall_score"]) for d in ok]),
+        "dimensions": {dim: _describe([float(d["evaluation"][dim]["score"]) for d in ok]) for dim in DIMENSIONS},
+        "worst": [{"turn_id": d.get("turn_id"), "session_id": d.get("session_id"),
+                   "overall_score": d["evaluation"]["overall_score"], "query": (d.get("query") or "")[:120],
+                   "summary": d["evaluation"].get("summary", "")} for d in lowest],
+    }
@@ -0,0 +1,183 @@
+import logging
+import math
+import os
+import re
+from typing import Dict, Optional
+
+import numpy as np
+import faiss
+
+logger = logging.getLogger(__name__)
+
+# FAISS needs ~39 training points per centroid (and per PQ sub-quantizer code); it warns below that
+MIN_POINTS_PER_CENTROID = 39
+# More than this per centroid adds training time without improving the clustering
+MAX_POINTS_PER_CENTROID = 256
+# Below this many vectors an exact flat scan beats any approximate structure
+AUTO_FLAT_THRESHOLD = 20000
+
+# Product-quantizer codes ("PQ32", "PQ32x6"), not the OPQ rotation prefix
+PQ_CODE = r"(?<!O)PQ(\d+)(?:x(\d+))?"
+
+# EMBEDDING_STORAGE -> scalar-quantizer codec replacing the float32 "Flat" codes
+STORAGE_CODECS = {"float32": None, "fp16": "SQfp16", "sq8": "SQ8"}
+
+DEFAULT_EF_SEARCH = 64
+DEFAULT_NPROBE = 16
+
+
+def resolve_factory(n: int, factory: Optional[str] = None) -> str:
+    """Return a FAISS index-factory string for `n` vectors.
+
+    Uses FAISS_INDEX_FACTORY (e.g. "HNSW32", "IVF4096,PQ32", "OPQ32,IVF4096,PQ32", "IVF1024,SQ8", "Flat");
+    "auto" (default) picks Flat for small corpora and IVF with ~4*sqrt(n) lists otherwise. The IVF list
+    count and PQ code size are clamped so every centroid gets enough training points.
+    FAISS_USE_IVF=0 still forces Flat. EMBEDDING_STORAGE (float32, fp16, sq8) swaps uncompressed
+    codes for a scalar quantizer.
+    """
+    factory = factory or os.getenv("FAISS_INDEX_FACTORY", "auto")
+    if factory == "auto":
+        if os.getenv("FAISS_USE_IVF", "1") == "0" or n < AUTO_FLAT_THRESHOLD:
+            factory = "Flat"
+        else:
+            factory = f"IVF{int(4 * math.sqrt(n))},Flat"
+    factory = apply_storage(factory)
+
+    match = re.search(r"IVF(\d+)", factory)
+    if match:
+        nlist = int(match.group(1))
+        max_nlist = max(1, n // MIN_POINTS_PER_CENTROID)
+        if nlist > max_nlist:
+            logger.warning("IVF%d needs >= %d training vectors, have %d; using IVF%d",
+                           nlist, nlist * MIN_POINTS_PER_CENTROID, n, max_nlist)
+            factory = factory.replace(match.group(0), f"IVF{max_nlist}", 1)
+
+    # Each PQ sub-quantizer trains 2^nbits centroids; shrink the code size on small corpora
+    match = re.search(PQ_CODE, factory)
+    if match:
+        nbits = int(match.group(2) or 8)
+        fit = nbits
+        while fit > 4 and (2 ** fit) * MIN_POINTS_PER_CENTROID > n:
+            fit -= 1
+        if fit != nbits:
+            logger.warning("PQ%sx%d needs >= %d training vectors, have %d; using %d-bit codes",
+                           match.group(1), nbits, (2 ** nbits) * MIN_POINTS_PER_CENTROID, n, fit)
+            factory = factory[:match.start()] + f"PQ{match.group(1)}x{fit}" + factory[match.end():]
+    return factory
+
+
+def apply_storage(factory: str, storage: Optional[str] = None) -> str:
+    """Store vectors as fp16 (2 B/dim) or 8-bit scalar codes (1 B/dim) instead of float32.
+
+    Factories that already compress (PQ/SQ) are left alone.
+    """
+    storage = (storage or os.getenv("EMBEDDING_STORAGE", "float32")).lower()
+    if storage not in STORAGE_CODECS:
+        logger.warning("Unknown EMBEDDING_STORAGE %r, keeping float32", storage)
+        return factory
+    codec = STORAGE_CODECS[storage]
+    if codec is None or re.search(PQ_CODE, factory) or "SQ" in factory:
+        return factory
+    if factory == "Flat" or factory.endswith(",Flat"):
+        return factory[:-len("Flat")] + codec
+    if re.fullmatch(r"(.*,)?HNSW\d+", factory):
+        return f"{factory},{codec}"
+    return factory
+
+
+def training_sample_size(factory: str, n: int) -> int:
+    """Vectors to train on: enough for IVF centroids and PQ codebooks, capped at the corpus size."""
+    needed = 0
+    match = re.search(r"IVF(\d+)", factory)
+    if match:
+        needed = max(needed, int(match.group(1)) * MAX_POINTS_PER_CENTROID)
+    match = re.search(PQ_CODE, factory)
+    if match:
+        nbits = int(match.group(2) or 8)
+        needed = max(needed, (2 ** nbits) * MAX_POINTS_PER_CENTROID)
+    if "SQ" in factory and not needed:
+        needed = 10000
+    return min(n, needed) if needed else n
+
+
+def build_index(embeddings: np.ndarray, factory: str) -> faiss.Index:
+    """Create, train (on a sampled subset) and fill an inner-product index; `embeddings` must be L2-normalized."""
+    n, dim = embeddings.shape
+    index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        sample_size = training_sample_size(factory, n)
+        if sample_size < n:
+            rng = np.random.default_rng(0)
+            sample = embeddings[rng.choice(n, sample_size, replace=False)]
+        else:
+            sample = embeddings
+        logger.info("Training %s on %d/%d vectors", factory, len(sample), n)
+        index.train(np.ascontiguousarray(sample))
+    index.add(embeddings)
+    return index
+
+
+def index_kind(index: faiss.Index) -> str:
+    """'ivf', 'hnsw' or 'flat' (looking through OPQ/pre-transform wrappers)."""
+    try:
+        faiss.extract_index_ivf(index)
+        return "ivf"
+    except Exception:
+        pass
+    base = index.index if isinstance(index, faiss.IndexPreTransform) else index
+    if hasattr(faiss.downcast_index(base), "hnsw"):
+        return "hnsw"
+    return "flat"
+
+
+def default_search_params(index: faiss.Index) -> Dict[str, int]:
+    kind = index_kind(index)
+    if kind == "ivf":
+        return {"nprobe": min(DEFAULT_NPROBE, faiss.extract_index_ivf(index).nlist)}
+    if kind == "hnsw":
+        return {"efSearch": DEFAULT_EF_SEARCH}
+    return {}
+
+
+def apply_search_params(index: faiss.Index, params: Dict[str, int]):
+    """Set nprobe/efSearch on the index, ignoring parameters the index type does not have.
+
+    Only for an index no other thread is searching yet (after build/load); searches pass search_parameters().
+    """
+    if not params:
+        return
+    kind = index_kind(index)
+    if kind == "ivf" and params.get("nprobe"):
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = int(min(params["nprobe"], ivf.nlist))
+    elif kind == "hnsw" and params.get("efSearch"):
+        base = index.index if isinstance(index, faiss.IndexPreTransform) else index
+        faiss.downcast_index(base).hnsw.efSearch = int(params["efSearch"])
+
+
+def search_parameters(index: faiss.Index, params: Dict[str, int], kind: Optional[str] = None) -> Optional["faiss.SearchParameters"]:
+    """Per-call nprobe/efSearch for index.search(..., params=...).
+
+    Unlike apply_search_params this leaves the shared index untouched, so concurrent searches
+    with different settings cannot see each other's values. None for flat indexes.
+    """
+    kind = kind or index_kind(index)
+    if kind == "ivf" and params.get("nprobe"):
+        return faiss.SearchParametersIVF(nprobe=int(min(params["nprobe"], faiss.extract_index_ivf(index).nlist)))
+    if kind == "hnsw" and params.get("efSearch"):
+        return faiss.SearchParametersHNSW(efSearch=int(params["efSearch"]))
+    return None
+
+
+def read_index(path: str, mmap: bool = False) -> faiss.Index:
+    """Read an index; with `mmap` the vector codes stay in the page cache, shared by every process reading the file."""
+    if not mmap:
+        return faiss.read_index(path)
+    # IO_FLAG_MMAP_IFC (faiss >= 1.10) also maps flat/SQ codes zero-copy; IO_FLAG_MMAP alone covers IVF lists
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+
+
+def index_nbytes(index: faiss.Index) -> int:
+    """Serialized size, a good proxy for resident memory of the index structure."""
+    return int(faiss.serialize_index(index).nbytes)
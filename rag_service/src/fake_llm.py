@@ -0,0 +1,109 @@
+"""Deterministic local stand-in for the Groq client (LLM_BACKEND=fake).
+
+Implements only `client.chat.completions.create`, so the whole pipeline can be load-tested
+offline: answers are built from the prompt's own words, evaluations are fixed valid JSON and
+rewrites echo the follow-up question. Latency is simulated with sleep.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+_EVAL_JSON = {
+    "factual_accuracy": {"score": 4, "reason": "fake"},
+    "legal_reasoning": {"score": 4, "reason": "fake"},
+    "citation_quality": {"score": 3, "reason": "fake"},
+    "clarity": {"score": 5, "reason": "fake"},
+    "completeness": {"score": 4, "reason": "fake"},
+    "overall_score": 4.0,
+    "summary": "Deterministic evaluation from the fake LLM backend.",
+}
+
+
+class FakeLLMError(Exception):
+    """A simulated upstream failure (LLM_FAKE_ERROR_RATE); status 503, so the gateway retries it."""
+
+    status_code = 503
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+class FakeCompletions:
+    def __init__(self, latency_ms: float = 50.0, ms_per_token: float = 0.0, answer_tokens: int = 120,
+                 error_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.ms_per_token = ms_per_token
+        self.answer_tokens = answer_tokens
+        self.error_rate = error_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _content(self, messages: List[Dict], max_tokens: Optional[int]) -> str:
+        system = " ".join(m["content"] for m in messages if m["role"] == "system")
+        user = messages[-1]["content"]
+        if "JSON" in system:
+            return json.dumps(_EVAL_JSON)
+        if "Rewritten question:" in user:
+            return user.split("User's follow-up question:", 1)[-1].split("\n", 1)[0].strip()
+        # Deterministic answer built from the prompt's own vocabulary
+        seed = int(hashlib.md5(user.encode("utf-8")).hexdigest()[:8], 16)
+        vocab = _words(user) or ["legal"]
+        n = min(self.answer_tokens, max_tokens or self.answer_tokens)
+        words = [vocab[(seed + i * 7) % len(vocab)] for i in range(n)]
+        # Sentences of 12 words, so sentence-level consumers (streamed translation) see several
+        return " ".join(" ".join(words[i:i + 12]).capitalize() + "." for i in range(0, n, 12))
+
+    def _wait(self, seconds: float, timeout: Optional[float]):
+        # Like an HTTP client, give up after `timeout` seconds
+        if timeout is not None and seconds > timeout:
+            time.sleep(max(0.0, timeout))
+            raise TimeoutError(f"fake LLM did not answer within {timeout:.3f}s")
+        time.sleep(seconds)
+
+    def create(self, model: str = None, messages: List[Dict] = None, temperature: float = None,
+               max_tokens: Optional[int] = None, stream: bool = False, timeout: Optional[float] = None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+        content = self._content(messages or [], max_tokens)
+        prompt_tokens = sum(len(m["content"]) for m in messages or []) // 4
+        completion_tokens = len(content) // 4
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        if failed:
+            self._wait(self.latency_ms / 1000.0, timeout)
+            raise FakeLLMError("simulated upstream error")
+        if stream:
+            return self._stream(content, timeout)
+        self._wait((self.latency_ms + self.ms_per_token * completion_tokens) / 1000.0, timeout)
+        message = SimpleNamespace(content=content, role="assistant")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=usage, model=model)
+
+    def _stream(self, content: str, timeout: Optional[float]):
+        self._wait(self.latency_ms / 1000.0, timeout)
+        for piece in re.findall(r"\S+\s*", content):
+            if self.ms_per_token:
+                time.sleep(self.ms_per_token / 1000.0)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=piece))])
+
+
+class FakeLLMClient:
+    """Drop-in for `groq.Groq` exposing `client.chat.completions.create`.
+
+    Defaults come from LLM_FAKE_LATENCY_MS (50), LLM_FAKE_MS_PER_TOKEN (0) and LLM_FAKE_ERROR_RATE (0).
+    """
+
+    def __init__(self, latency_ms: Optional[float] = None, ms_per_token: Optional[float] = None,
+                 error_rate: Optional[float] = None, **kwargs):
+        self.chat = SimpleNamespace(completions=FakeCompletions(
+            float(os.getenv("LLM_FAKE_LATENCY_MS", "50")) if latency_ms is None else latency_ms,
+            float(os.getenv("LLM_FAKE_MS_PER_TOKEN", "0")) if ms_per_token is None else ms_per_token,
+            error_rate=float(os.getenv("LLM_FAKE_ERROR_RATE", "0")) if error_rate is None else error_rate,
+        ))
@@ -0,0 +1,121 @@
+"""Fusion of the BM25 and vector candidate lists into one scored ranking (HybridRetriever.search).
+
+Every mode scores the union of both candidate lists with NumPy array operations and returns
+scores in [0, 1], so one threshold per mode (FUSION_THRESHOLDS, calibrated by
+benchmarks/fusion_bench.py) can tell relevant chunks from the rest of the top k:
+
+    rrf       weighted Reciprocal Rank Fusion, divided by the score of a first place in every list
+              that returned candidates (ranks only: 1.0 = top of both lists)
+    minmax    per-query min-max normalized scores, convex combination with the alpha weight
+    zscore    per-query z-scores, weighted sum squashed by a logistic
+    dynamic   minmax, with the vector weight set per query from how far each retriever's top
+              score stands out from the rest of its list (alpha is the prior)
+
+A candidate only one retriever returned is scored by the other with its full BM25 score, or the
+lowest vector score returned (an upper bound of its own). Pinned chunks (exact citation hits)
+come first with score 1.0.
+"""
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+FUSION_MODES = ("rrf", "minmax", "zscore", "dynamic")
+
+# Lowest fused score of a chunk worth prompting, as read by score_floors(); calibrated by
+# benchmarks/fusion_bench.py. rrf's is a share of the best score the lists that found a chunk can
+# give it: 0.87 keeps a chunk only one retriever found down to rank 10 (rrf_k=60) of that list,
+# BM25 or vector alike, whatever alpha is.
+FUSION_THRESHOLDS = {"rrf": 0.87, "minmax": 0.43, "zscore": 0.57, "dynamic": 0.35}
+
+
+def score_floors(mode: str, threshold: float, alpha: float, in_bm25: np.ndarray, in_vector: np.ndarray) -> np.ndarray:
+    """The fused score each candidate needs to reach a `fusion_threshold` of `mode`.
+
+    `in_bm25`/`in_vector` say which lists returned each candidate. An rrf score is bounded by the
+    lists that found the chunk (a first place in only the vector list scores alpha / (1 + alpha),
+    in only the BM25 list 1 / (1 + alpha)), so rrf's threshold is scaled by that bound per
+    candidate; a plain score threshold would judge the two lists' chunks by different ranks.
+    Pinned chunks, in neither list, get floor 0. Other modes use the threshold as is.
+    """
+    in_bm25 = np.asarray(in_bm25, dtype=bool)
+    in_vector = np.asarray(in_vector, dtype=bool)
+    if mode != "rrf":
+        return np.full(len(in_bm25), threshold)
+    # As fuse() normalizes: by a first place in every list that returned candidates
+    norm = float(in_bm25.any()) + alpha * in_vector.any() or 1.0
+    return threshold * (in_bm25 + alpha * in_vector) / norm
+
+
+def _minmax(scores: np.ndarray) -> np.ndarray:
+    lo, hi = scores.min(), scores.max()
+    if hi - lo <= 1e-12:
+        return np.ones_like(scores)
+    return (scores - lo) / (hi - lo)
+
+
+def _zscore(scores: np.ndarray) -> np.ndarray:
+    std = scores.std()
+    if std <= 1e-12:
+        return np.zeros_like(scores)
+    return (scores - scores.mean()) / std
+
+
+def _confidence(scores: np.ndarray) -> float:
+    """How many standard deviations a list's top score is above the list's mean (0 for flat lists)."""
+    if len(scores) < 2:
+        return float(len(scores))
+    return max(float(_zscore(scores).max()), 0.0)
+
+
+def fuse(bm25_all: np.ndarray, bm25_ids: np.ndarray, vector_ids: np.ndarray, vector_scores: np.ndarray,
+         mode: str = "rrf", alpha: float = 0.5, rrf_k: int = 60,
+         pinned: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray, Dict]:
+    """Document ids and fused scores, best first, and what the span should record.
+
+    `bm25_all` is the BM25 score of every document, `bm25_ids` the BM25 candidates best first;
+    `vector_ids`/`vector_scores` are the vector candidates and their similarities, best first.
+    """
+    if mode not in FUSION_MODES:
+        raise ValueError(f"Unknown fusion mode {mode!r}; expected one of {FUSION_MODES}")
+    bm25_ids = np.asarray(bm25_ids, dtype=np.int64)
+    vector_ids = np.asarray(vector_ids, dtype=np.int64)
+    vector_scores = np.asarray(vector_scores, dtype=np.float64)
+    pinned_ids = np.asarray(list(dict.fromkeys(pinned or ())), dtype=np.int64)
+    candidates = np.unique(np.concatenate([bm25_ids, vector_ids, pinned_ids]))
+    n, has_bm25, has_vector = len(candidates), len(bm25_ids) > 0, len(vector_ids) > 0
+    info = {"candidates": n}
+    if n == 0:
+        return candidates, np.zeros(0), info
+    w_vector = alpha / (1.0 + alpha) if has_bm25 and has_vector else float(has_vector)
+
+    if mode == "rrf":
+        rank_b = np.full(n, np.inf)
+        rank_b[np.searchsorted(candidates, bm25_ids)] = np.arange(1, len(bm25_ids) + 1)
+        rank_v = np.full(n, np.inf)
+        rank_v[np.searchsorted(candidates, vector_ids)] = np.arange(1, len(vector_ids) + 1)
+        # 1/inf = 0 for lists a candidate is missing from
+        scores = 1.0 / (rrf_k + rank_b) + alpha / (rrf_k + rank_v)
+        scores /= (float(has_bm25) + alpha * has_vector) / (rrf_k + 1) or 1.0
+    else:
+        bm25 = np.asarray(bm25_all)[candidates].astype(np.float64)
+        vector = np.full(n, vector_scores.min() if has_vector else 0.0)
+        vector[np.searchsorted(candidates, vector_ids)] = vector_scores
+        if mode == "zscore":
+            combined = (1 - w_vector) * _zscore(bm25) + w_vector * _zscore(vector)
+            scores = 1.0 / (1.0 + np.exp(-combined))
+        else:
+            if mode == "dynamic" and has_bm25 and has_vector:
+                conf_b = _confidence(bm25_all[bm25_ids])
+                conf_v = alpha * _confidence(vector_scores)
+                if conf_b + conf_v > 0:
+                    w_vector = conf_v / (conf_b + conf_v)
+            scores = (1 - w_vector) * _minmax(bm25) + w_vector * _minmax(vector)
+    info["w_vector"] = round(float(w_vector), 3)
+
+    order = np.argsort(-scores, kind="stable")
+    ids, scores = candidates[order], scores[order]
+    if len(pinned_ids):
+        is_pinned = np.isin(ids, pinned_ids)
+        ids = np.concatenate([pinned_ids, ids[~is_pinned]])
+        scores = np.concatenate([np.ones(len(pinned_ids)), scores[~is_pinned]])
+    return ids, scores, info
@@ -1,69 +1,75 @@
-from rank_bm25 import BM25Okapi
+import logging
+from typing import List, Optional, Tuple
+
 import numpy as np
 
+from .bm25_index import CompactBM25
+from .fusion import fuse, score_floors
+from .metrics import time_stage
+from .text_analyzer import Analyzer, analyzer_from_env
+
+logger = logging.getLogger(__name__)
+
 class HybridRetriever:
-    def __init__(self, vector_store, documents):
+    def __init__(self, vector_store, documents, analyzer: Optional[Analyzer] = None):
         self.vector_store = vector_store
         self.documents = documents
-        # Tokenize docs for BM25
-        tokenized = []
-        for doc in documents:
-            tokens = doc.lower().split()
-            tokens = [t for t in tokens if len(t) > 1]  # Filter short tokens
-            tokenized.append(tokens if tokens else ["empty"])
-        
-        self.bm25 = BM25Okapi(tokenized)
-        print(f"DEBUG: BM25 initialized with {len(tokenized)} documents")
+        # One analyzer for chunks and queries (BM25_ANALYZER), so both sides produce the same terms
+        self.analyzer = analyzer or analyzer_from_env()
+        self.bm25 = CompactBM25([self.analyzer.analyze(doc) for doc in documents])
+        # Built once here rather than on every search (was O(corpus) per query)
+        self._doc_to_idx = {doc: i for i, doc in enumerate(documents)}
+        logger.info("BM25 initialized with %d documents, %d terms (%s), %.1f MB of postings",
+                    len(documents), len(self.bm25.vocabulary), self.analyzer.describe(), self.bm25.nbytes() / 1e6)
     
-    def search(self, query: str, k: int = 5, alpha: float = 0.5):
-        """Optimized combination of BM25 + Vector using Reciprocal Rank Fusion (RRF)."""
-        query_tokens = query.lower().split()
-        query_tokens = [t for t in query_tokens if len(t) > 1]
-        
-        if not query_tokens:
-            return self.vector_store.search(query, k)
-        
-        # Get BM25 ranked results - only search top-k*3 for efficiency
-        bm25_scores = self.bm25.get_scores(query_tokens)
-        top_k_bm25 = k * 3
-        bm25_ranked = np.argpartition(bm25_scores, -top_k_bm25)[-top_k_bm25:]
-        bm25_ranked = bm25_ranked[np.argsort(bm25_scores[bm25_ranked])][::-1]
-        
-        # Get Vector ranked results - only get top-k*3
-        vector_results = self.vector_store.search(query, k=k*3)
-        # Create a fast lookup dictionary
-        doc_to_idx = {doc: i for i, doc in enumerate(self.documents)}
-        vector_ranked = []
-        for doc, score in vector_results:
-            idx = doc_to_idx.get(doc)
-            if idx is not None:
-                vector_ranked.append(idx)
-        
-        # Reciprocal Rank Fusion (RRF)
-        # Score(d) = sum(1 / (k + rank(d))) for each retrieval method
-        rrf_k = 60  # Standard RRF constant
-        rrf_scores = {}
-        
-        # Add BM25 ranks
-        for rank, doc_idx in enumerate(bm25_ranked[:k*3]):  # Consider top-3k from BM25
-            rrf_scores[doc_idx] = rrf_scores.get(doc_idx, 0) + (1 / (rrf_k + rank + 1))
-        
-        # Add Vector ranks (weighted by alpha)
-        for rank, doc_idx in enumerate(vector_ranked[:k*3]):
-            rrf_scores[doc_idx] = rrf_scores.get(doc_idx, 0) + (alpha / (rrf_k + rank + 1))
-        
-        # Sort by RRF score
-        sorted_docs = sorted(rrf_scores.items(), key=lambda x: x[1], reverse=True)
-        
-        # DEBUG
-        top_bm25_score = bm25_scores[bm25_ranked[0]] if len(bm25_ranked) > 0 else 0
-        top_vector_score = vector_results[0][1] if vector_results else 0
-        print(f"DEBUG: BM25_top={top_bm25_score:.4f}, Vector_top={top_vector_score:.4f}, RRF_alpha={alpha}")
-        
-        # Return top-k with RRF scores
-        results = []
-        for doc_idx, rrf_score in sorted_docs[:k]:
-            if doc_idx < len(self.documents):
-                results.append((self.documents[doc_idx], rrf_score))
-        
-        return results
+    def search(self, query: str, k: int = 5, alpha: float = 0.5, rrf_k: int = 60, candidate_multiplier: int = 3, nprobe: int = None, ef_search: int = None, depth: int = None,
+               pinned: List[int] = None, fusion: str = "rrf"):
+        """Combination of BM25 + Vector candidates, fused by `fusion` (see src/fusion.py).
+
+        Each retriever contributes its top `depth` (default `k * candidate_multiplier`) candidates.
+        `pinned` document indices (exact citation hits) rank ahead of everything else with score 1.0.
+        Scores are in [0, 1] in every mode.
+        """
+        return self.search_with_floors(query, k, alpha, rrf_k, candidate_multiplier, nprobe, ef_search, depth,
+                                       pinned, fusion)[0]
+
+    def search_with_floors(self, query: str, k: int = 5, alpha: float = 0.5, rrf_k: int = 60, candidate_multiplier: int = 3,
+                           nprobe: int = None, ef_search: int = None, depth: int = None, pinned: List[int] = None,
+                           fusion: str = "rrf", threshold: float = 1.0) -> Tuple[List[Tuple[str, float]], List[float]]:
+        """search(), plus the score each result needs to reach `threshold` (fusion.score_floors)."""
+        query_tokens = self.analyzer.analyze(query)
+        depth = depth or k * candidate_multiplier
+        # Get BM25 ranked results - only the top candidates are ranked for efficiency
+        with time_stage("bm25", terms=len(query_tokens)):
+            bm25_scores = self.bm25.get_scores(self.bm25.vocabulary.lookup(query_tokens))
+            top_k_bm25 = min(depth, len(bm25_scores))
+            bm25_ranked = np.argpartition(bm25_scores, -top_k_bm25)[-top_k_bm25:]
+            bm25_ranked = bm25_ranked[np.argsort(bm25_scores[bm25_ranked])][::-1]
+            # Chunks with none of the query terms are not BM25 candidates
+            bm25_ranked = bm25_ranked[bm25_scores[bm25_ranked] > 0]
+
+        # Get Vector ranked results - only the top candidates
+        vector_results = self.vector_store.search(query, k=depth, nprobe=nprobe, ef_search=ef_search)
+        with time_stage("fusion", mode=fusion) as fusion_span:
+            vector_ranked, vector_scores = [], []
+            for doc, score in vector_results:
+                idx = self._doc_to_idx.get(doc)
+                # (duplicate chunk texts all map to the first copy)
+                if idx is not None and idx not in vector_ranked:
+                    vector_ranked.append(idx)
+                    vector_scores.append(score)
+            ids, scores, info = fuse(bm25_scores, bm25_ranked, vector_ranked, vector_scores,
+                                     mode=fusion, alpha=alpha, rrf_k=rrf_k, pinned=pinned)
+            fusion_span.set(**info)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            top_bm25_score = bm25_scores[bm25_ranked[0]] if len(bm25_ranked) > 0 else 0
+            top_vector_score = vector_results[0][1] if vector_results else 0
+            logger.debug("BM25_top=%.4f Vector_top=%.4f fusion=%s alpha=%s w_vector=%s",
+                         top_bm25_score, top_vector_score, fusion, alpha, info.get("w_vector"))
+
+        # Over every candidate, so the floors know which lists returned any
+        floors = score_floors(fusion, threshold, alpha, np.isin(ids, bm25_ranked), np.isin(ids, vector_ranked))
+        results = [((self.documents[i], float(s)), float(f)) for i, s, f in zip(ids[:k], scores[:k], floors)
+                   if i < len(self.documents)]
+        return [r for r, _ in results], [f for _, f in results]
@@ -0,0 +1,225 @@
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Index files written directly into index_dir before versioned snapshots existed
+LEGACY_VERSION = "legacy"
+# In-progress builds older than this are assumed dead and removed by gc()
+STALE_BUILD_SECONDS = 6 * 3600
+
+
+class RetrievalSnapshot:
+    """An immutable (version, vector store, hybrid retriever, citation index) set.
+
+    RAGPipeline swaps the whole snapshot with one reference assignment, so a request that read
+    the reference keeps a consistent index/documents/BM25 set even while a new version goes live.
+    """
+
+    __slots__ = ("version", "vector_store", "hybrid_retriever", "citations")
+
+    def __init__(self, version: Optional[str], vector_store, hybrid_retriever=None, citations=None):
+        self.version = version
+        self.vector_store = vector_store
+        self.hybrid_retriever = hybrid_retriever
+        self.citations = citations
+
+
+class IndexManifest:
+    """Versioned snapshots under <index_dir>/versions/<version>/ with <index_dir>/manifest.json naming the live one."""
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        self.versions_dir = os.path.join(index_dir, "versions")
+        self.path = os.path.join(index_dir, "manifest.json")
+        self._lock_path = os.path.join(index_dir, ".manifest.lock")
+
+    @staticmethod
+    def new_version() -> str:
+        # Lexicographic order == creation order
+        return time.strftime("%Y%m%dT%H%M%S", time.gmtime()) + "-" + uuid.uuid4().hex[:6]
+
+    def version_dir(self, version: str) -> str:
+        return self.index_dir if version == LEGACY_VERSION else os.path.join(self.versions_dir, version)
+
+    def building_dir(self, version: str) -> str:
+        return os.path.join(self.versions_dir, f".building-{version}")
+
+    @contextmanager
+    def _locked(self):
+        """Serialize manifest read-modify-write across worker processes."""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(self.index_dir, exist_ok=True)
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read(self) -> Dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"current": None, "versions": []}
+        except Exception as e:
+            logger.warning("Unreadable index manifest %s: %s", self.path, e)
+            return {"current": None, "versions": []}
+
+    def _write(self, data: Dict):
+        tmp = f"{self.path}.tmp-{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def current(self) -> Tuple[Optional[str], Optional[str]]:
+        """(version, directory) of the live snapshot, falling back to a legacy unversioned index."""
+        version = self.read().get("current")
+        if version and os.path.exists(os.path.join(self.version_dir(version), "faiss.index")):
+            return version, self.version_dir(version)
+        if os.path.exists(os.path.join(self.index_dir, "faiss.index")) and os.path.exists(os.path.join(self.index_dir, "docs.pkl")):
+            return LEGACY_VERSION, self.index_dir
+        return None, None
+
+    def publish(self, version: str, info: Optional[Dict] = None):
+        """Make `version` (already complete on disk) the live snapshot."""
+        with self._locked():
+            data = self.read()
+            data["versions"] = [v for v in data.get("versions", []) if v.get("version") != version]
+            data["versions"].append(dict(info or {}, version=version, published_at=time.time()))
+            data["current"] = version
+            self._write(data)
+        logger.info("Published index version %s", version)
+
+    def gc(self, keep: int = 2) -> List[str]:
+        """Delete all but the `keep` newest versions (never the current one) and stale partial builds."""
+        removed = []
+        with self._locked():
+            data = self.read()
+            current = data.get("current")
+            on_disk = sorted(d for d in os.listdir(self.versions_dir) if not d.startswith(".")) \
+                if os.path.isdir(self.versions_dir) else []
+            retained = set(on_disk[-max(1, keep):]) | {current}
+            for version in on_disk:
+                if version not in retained:
+                    # Open/mapped files stay valid for processes still serving the old version
+                    shutil.rmtree(self.version_dir(version), ignore_errors=True)
+                    removed.append(version)
+            for name in os.listdir(self.versions_dir) if os.path.isdir(self.versions_dir) else []:
+                path = os.path.join(self.versions_dir, name)
+                if name.startswith(".building-") and time.time() - os.path.getmtime(path) > STALE_BUILD_SECONDS:
+                    shutil.rmtree(path, ignore_errors=True)
+            data["versions"] = [v for v in data.get("versions", []) if v.get("version") not in removed]
+            self._write(data)
+        if removed:
+            logger.info("Removed old index versions: %s", removed)
+        return removed
+
+    def mtime(self) -> float:
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return 0.0
+
+
+def has_index(index_dir: str) -> bool:
+    return IndexManifest(index_dir).current()[0] is not None
+
+
+def _throttle_build():
+    """Make the calling (build) process yield CPU to serving: INDEX_BUILD_NICE and INDEX_BUILD_THREADS.
+
+    Called before torch/faiss are imported, so their OpenMP pools start at the capped size.
+    """
+    try:
+        os.nice(int(os.getenv("INDEX_BUILD_NICE", "10")))
+    except (AttributeError, OSError):
+        # No os.nice on Windows; an unprivileged process may not lower its niceness
+        pass
+    threads = int(os.getenv("INDEX_BUILD_THREADS") or max(1, (os.cpu_count() or 2) // 2))
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "EMBEDDING_THREADS"):
+        os.environ[var] = str(threads)
+    import faiss
+
+    faiss.omp_set_num_threads(threads)
+    return threads
+
+
+def build_snapshot(data_folder: str, index_dir: str, version: str, model_name: str,
+                   encoder_loader: Optional[Callable] = None) -> Dict:
+    """Chunk, embed and save a complete snapshot into versions/<version>; runs in a separate process."""
+    threads = _throttle_build()
+    from .logging_setup import configure_logging
+    from . import vector_store as vector_store_module
+    from .citation_index import CitationIndex
+    from .document_processor import DocumentProcessor
+    from .dedup import dedupe_chunks, signatures
+
+    configure_logging()
+    if encoder_loader is not None:
+        # Lets the parent's encoder choice (e.g. the offline benchmarks' hashing encoder) carry over
+        vector_store_module.load_encoder = encoder_loader
+    manifest = IndexManifest(index_dir)
+    building = manifest.building_dir(version)
+    start = time.perf_counter()
+    processor = DocumentProcessor()
+    documents = [(name, text, processor.chunk_text(text)) for name, text in processor.load_documents(data_folder)]
+    chunks = [chunk for _, _, doc_chunks in documents for chunk in doc_chunks]
+    if not chunks:
+        raise RuntimeError("No documents found in data folder")
+    if os.getenv("DEDUP_ENABLED", "1") == "1":
+        # Overlapping windows and statutes repeated across PDFs: keep one copy of each (near-)duplicate
+        chunks, sigs, dedup_stats = dedupe_chunks(chunks)
+    else:
+        sigs, dedup_stats = signatures(chunks), None
+    store = vector_store_module.VectorStore(model_name, index_dir=building)
+    store.add_documents(chunks, signatures=sigs)
+    store.save()
+    chunk_ids = {}
+    for i, chunk in enumerate(store.documents):
+        chunk_ids.setdefault(chunk, i)
+    citations = CitationIndex.build(documents, chunk_ids, processor.chunk_size, processor.chunk_overlap)
+    citations.save(building)
+    os.replace(building, manifest.version_dir(version))
+    return {
+        "factory": store.factory,
+        "ntotal": len(store.documents),
+        "model_name": model_name,
+        "dedup": dedup_stats,
+        "citations": len(citations),
+        "build_s": round(time.perf_counter() - start, 1),
+        "threads": threads,
+    }
+
+
+def build_in_subprocess(data_folder: str, index_dir: str, model_name: str,
+                        encoder_loader: Optional[Callable] = None) -> Tuple[str, Dict]:
+    """Build a new snapshot in a freshly spawned process so serving threads keep the GIL and caches.
+
+    Returns (version, build info); the snapshot is complete on disk but not yet published.
+    """
+    version = IndexManifest.new_version()
+    os.makedirs(IndexManifest(index_dir).versions_dir, exist_ok=True)
+    # spawn, not fork: the parent holds Mongo clients, torch/OpenMP pools and serving threads
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        info = pool.submit(build_snapshot, data_folder, index_dir, version, model_name, encoder_loader).result()
+    logger.info("Built index version %s: %s", version, info)
+    return version, info
@@ -1,30 +1,109 @@
 import json
+import logging
+import re
 from datetime import datetime
+from typing import Dict, List
 from pymongo import MongoClient
 from dotenv import load_dotenv
 import os
 
+from .metrics import time_stage
+
 load_dotenv()
+logger = logging.getLogger(__name__)
 
-class LegalEvaluationManager:
-    def __init__(self, groq_client):
-        self.groq_client = groq_client
-        mongo_uri = os.getenv("MONGODB_URI") or os.getenv("MONGO_URI")
-        dbname = os.getenv("MONGO_DB_NAME") or "rag_service"
-        self.client = MongoClient(mongo_uri)
-        self.db = self.client[dbname]
-        self.coll = self.db.get_collection("evaluations")
+DIMENSIONS = ("factual_accuracy", "legal_reasoning", "citation_quality", "clarity", "completeness")
+# Status of a judge reply that fails EVALUATION_SCHEMA, inline and in batch runs
+INVALID_STATUS = "invalid"
 
-    def evaluate_conversation_turn(self, session_id: str, query: str, response: str, context: str = ""):
-        """Evaluate using query + retrieved context as reference (no gold answer needed)."""
-        
-        prompt = f"""You are an expert legal evaluation system. Assess the quality of this legal assistant's response using the query and retrieved legal context as reference.
+_SCORE = {"type": "number", "minimum": 1, "maximum": 5}
+# JSON Schema (draft-07 subset) of an evaluation; checked by validate_schema()
+EVALUATION_SCHEMA = {
+    "type": "object",
+    "required": list(DIMENSIONS) + ["summary"],
+    "properties": dict(
+        {dim: {"type": "object", "required": ["score"],
+               "properties": {"score": _SCORE, "reason": {"type": "string"}}} for dim in DIMENSIONS},
+        overall_score=_SCORE,
+        summary={"type": "string"},
+    ),
+}
+
+_TYPES = {"object": dict, "array": list, "string": str, "number": (int, float), "integer": int, "boolean": bool}
+
+
+class EvaluationParseError(ValueError):
+    """The judge's reply is not JSON or does not match EVALUATION_SCHEMA."""
+
+
+def validate_schema(value, schema: Dict, path: str = "$") -> List[str]:
+    """Errors of `value` against the JSON Schema keywords used here (type, required, properties, enum, minimum, maximum)."""
+    expected = schema.get("type")
+    if expected and (not isinstance(value, _TYPES[expected]) or (expected in ("number", "integer") and isinstance(value, bool))):
+        return [f"{path}: expected {expected}, got {type(value).__name__}"]
+    errors = []
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {value!r} not in {schema['enum']}")
+    if "minimum" in schema and value < schema["minimum"]:
+        errors.append(f"{path}: {value} < {schema['minimum']}")
+    if "maximum" in schema and value > schema["maximum"]:
+        errors.append(f"{path}: {value} > {schema['maximum']}")
+    if isinstance(value, dict):
+        errors.extend(f"{path}.{key}: required" for key in schema.get("required", ()) if key not in value)
+        for key, sub in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(validate_schema(value[key], sub, f"{path}.{key}"))
+    return errors
+
+
+def _coerce_score(value):
+    # Judges sometimes answer "4", "4/5" or "4.0 out of 5"
+    if isinstance(value, str):
+        match = re.match(r"\s*(\d+(?:\.\d+)?)", value)
+        return float(match.group(1)) if match else value
+    return value
+
+
+def parse_evaluation(content: str) -> Dict:
+    """Evaluation dict from the judge's reply, or EvaluationParseError.
+
+    Tolerates code fences and text around the JSON object and numeric strings as scores; a
+    missing overall_score is the mean of the dimension scores.
+    """
+    text = (content or "").strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        raise EvaluationParseError("no JSON object in response")
+    try:
+        data = json.loads(text[start:end + 1])
+    except ValueError as e:
+        raise EvaluationParseError(f"invalid JSON: {e}") from None
+    if isinstance(data, dict):
+        for dim in DIMENSIONS:
+            if isinstance(data.get(dim), dict) and "score" in data[dim]:
+                data[dim]["score"] = _coerce_score(data[dim]["score"])
+            elif isinstance(data.get(dim), (int, float, str)):
+                data[dim] = {"score": _coerce_score(data[dim])}
+        if "overall_score" in data:
+            data["overall_score"] = _coerce_score(data["overall_score"])
+    errors = validate_schema(data, EVALUATION_SCHEMA)
+    if errors:
+        raise EvaluationParseError("; ".join(errors[:5]))
+    if "overall_score" not in data:
+        data["overall_score"] = round(sum(data[dim]["score"] for dim in DIMENSIONS) / len(DIMENSIONS), 2)
+    return data
+
+
+def evaluation_messages(query: str, response: str, context: str = "", context_chars: int = None) -> List[Dict]:
+    """Chat messages asking the judge to score one turn; context is cut to EVAL_CONTEXT_CHARS."""
+    context_chars = context_chars or int(os.getenv("EVAL_CONTEXT_CHARS", "6000"))
+    prompt = f"""You are an expert legal evaluation system. Assess the quality of this legal assistant's response using the query and retrieved legal context as reference.
 
 **USER QUERY:**
 {query}
 
 **RETRIEVED LEGAL CONTEXT (Ground Truth):**
-{context[:2000] if context else "No context provided"}
+{context[:context_chars] if context else "No context provided"}
 
 **AI RESPONSE TO EVALUATE:**
 {response}
@@ -52,33 +131,53 @@ Respond in JSON:
   "summary": "Brief overall assessment"
 }}
 """
-        
+    return [
+        {"role": "system", "content": "You are a legal evaluation expert. Always respond in valid JSON."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+class LegalEvaluationManager:
+    def __init__(self, llm):
+        self.llm = llm
+        self.connect()
+
+    def connect(self):
+        mongo_uri = os.getenv("MONGODB_URI") or os.getenv("MONGO_URI")
+        dbname = os.getenv("MONGO_DB_NAME") or "rag_service"
+        self.client = MongoClient(mongo_uri)
+        self.db = self.client[dbname]
+        self.coll = self.db.get_collection("evaluations")
+
+    def evaluate_conversation_turn(self, session_id: str, query: str, response: str, context: str = ""):
+        """Evaluate using query + retrieved context as reference (no gold answer needed).
+
+        A reply that does not match EVALUATION_SCHEMA is stored with status "invalid" and evaluation
+        None. It is not retried: batch runs (src/evaluation_engine.py) evaluate turns from `messages`
+        and never read these inline records.
+        """
         try:
-            api_resp = self.groq_client.chat.completions.create(
-                model="llama-3.1-8b-instant",  # Use larger model for better judgment
-                messages=[
-                    {"role": "system", "content": "You are a legal evaluation expert. Always respond in valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=1000
-            )
-            
-            eval_json = {}
+            with time_stage("evaluation"):
+                content = self.llm.complete("evaluation", evaluation_messages(query, response, context))
+
+            status, error = "ok", None
             try:
-                eval_json = json.loads(api_resp.choices[0].message.content)
-            except Exception as e:
-                print(f"JSON parse error: {e}")
-                eval_json = {"raw": api_resp.choices[0].message.content, "error": "parse_failed"}
+                eval_json = parse_evaluation(content)
+            except EvaluationParseError as e:
+                logger.warning("Evaluation parse error: %s", e)
+                eval_json, status, error = None, INVALID_STATUS, str(e)
             doc = {
                 "session_id": session_id,
                 "query": query,
                 "response": response,
                 "evaluation": eval_json,
+                "status": status,
+                "error": error,
                 "timestamp": datetime.utcnow()
             }
-            result = self.coll.insert_one(doc)
-            
+            with time_stage("mongo_write", collection="evaluations"):
+                result = self.coll.insert_one(doc)
+
             # Convert ObjectId to string before returning
             doc['_id'] = str(result.inserted_id)
             # Remove MongoDB-specific fields that aren't JSON serializable
@@ -87,9 +186,11 @@ Respond in JSON:
                 "query": doc["query"],
                 "response": doc["response"],
                 "evaluation": doc["evaluation"],
+                "status": doc["status"],
+                "error": doc["error"],
                 "timestamp": doc["timestamp"].isoformat() if isinstance(doc["timestamp"], datetime) else str(doc["timestamp"])
             }
             return serializable_doc
         except Exception as e:
-            print(f"Evaluation error: {e}")
+            logger.error("Evaluation error: %s", e)
             return None
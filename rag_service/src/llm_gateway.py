@@ -0,0 +1,284 @@
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from .metrics import LLM_CALLS, LLM_CIRCUIT_OPEN, record_token_usage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "llama-3.1-8b-instant"
+
+# Per-purpose defaults; each key can be overridden with LLM_<PURPOSE>_<KEY> (e.g. LLM_REWRITE_TIMEOUT_S=3)
+PURPOSES: Dict[str, Dict] = {
+    "generation": {"temperature": 0.2, "max_tokens": 1000, "timeout_s": 30.0},
+    "rewrite": {"temperature": 0.1, "max_tokens": 60, "timeout_s": 5.0},
+    "turn_summary": {"temperature": 0.1, "max_tokens": 150, "timeout_s": 10.0},
+    "summary_compression": {"temperature": 0.1, "max_tokens": 500, "timeout_s": 15.0},
+    "evaluation": {"temperature": 0.1, "max_tokens": 1000, "timeout_s": 30.0},
+    "stream": {"temperature": None, "max_tokens": None, "timeout_s": 60.0},
+}
+
+# Absolute time.monotonic() by which the current request must be done; see deadline()
+_DEADLINE: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("llm_deadline", default=None)
+
+
+class LLMError(Exception):
+    """Raised by the gateway itself, as opposed to errors from the provider."""
+
+
+class LLMUnavailable(LLMError):
+    """The circuit breaker is open, or no concurrency slot freed up in time."""
+
+
+class LLMDeadlineExceeded(LLMError):
+    """The request's deadline passed before the call could be made."""
+
+
+def status_code(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds to wait for a rate-limit error (0.0 if it names none); None for other errors."""
+    if status_code(error) != 429 and type(error).__name__ != "RateLimitError":
+        return None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def is_transient(error: Exception) -> bool:
+    """Timeouts, dropped connections, rate limits and 5xx: worth another attempt."""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in ("APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError",
+                                "TimeoutException", "ConnectError", "ReadTimeout", "RemoteProtocolError"):
+        return True
+    code = status_code(error)
+    return code is not None and (code == 429 or code >= 500)
+
+
+def backoff(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """Exponential backoff with jitter: attempt 1 waits 0.5-1 x base, each further one twice as long."""
+    return min(cap, base * 2 ** (attempt - 1)) * (0.5 + random.random() / 2)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Every gateway call inside the block (same thread or copied context) finishes within `seconds`.
+
+    Nested blocks can only shorten the deadline.
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+    at = time.monotonic() + seconds
+    current = _DEADLINE.get()
+    token = _DEADLINE.set(at if current is None else min(current, at))
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one."""
+    at = _DEADLINE.get()
+    return None if at is None else at - time.monotonic()
+
+
+class CircuitBreaker:
+    """Fails fast after `failures` consecutive transient errors, for `reset_s` seconds.
+
+    Then one trial call is let through (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failures: int = 5, reset_s: float = 30.0):
+        self.failures = failures
+        self.reset_s = reset_s
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half_open" if time.monotonic() - self._opened_at >= self.reset_s else "open"
+
+    def allow(self) -> bool:
+        if self.failures <= 0:
+            return True
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_s or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def record(self, success: bool):
+        with self._lock:
+            self._trial = False
+            if success:
+                self._consecutive, self._opened_at = 0, None
+            else:
+                self._consecutive += 1
+                if self._opened_at is not None or self._consecutive >= self.failures:
+                    self._opened_at = time.monotonic()
+            LLM_CIRCUIT_OPEN.set(0 if self._opened_at is None else 1)
+
+
+def create_client(api_key: Optional[str] = None, backend: Optional[str] = None):
+    """A chat-completions client for LLM_BACKEND: "groq" (pooled HTTP connections, no SDK retries) or "fake"."""
+    backend = backend or os.getenv("LLM_BACKEND", "groq")
+    if backend == "fake":
+        from .fake_llm import FakeLLMClient
+
+        return FakeLLMClient()
+    if backend != "groq":
+        raise ValueError(f"Unknown LLM_BACKEND {backend!r} (groq | fake)")
+    import httpx
+    from groq import Groq
+
+    # One keep-alive pool for every purpose; the gateway sets timeouts per call and does the retrying
+    limits = httpx.Limits(max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "32")),
+                          max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "16")),
+                          keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_S", "30")))
+    http_client = httpx.Client(limits=limits, timeout=httpx.Timeout(60.0, connect=5.0))
+    return Groq(api_key=api_key or os.getenv("GROQ_API_KEY"), max_retries=0, http_client=http_client)
+
+
+class LLMGateway:
+    """The one way the service calls the LLM: per-purpose model and parameters, timeouts bounded by the
+    request deadline, jittered retries of transient errors, a circuit breaker and a concurrency limit.
+
+    complete() returns the reply text and stream() yields its deltas. Errors that are not retried (or
+    survive the retries) are re-raised as the provider raised them, so callers keep their fallbacks.
+    """
+
+    def __init__(self, api_key: Optional[str] = None, client=None, backend: Optional[str] = None):
+        self.api_key = api_key
+        self.backend = backend or os.getenv("LLM_BACKEND", "groq")
+        self._own_client = client is None
+        self.client = client if client is not None else create_client(api_key, self.backend)
+        self.default_model = os.getenv("LLM_MODEL", DEFAULT_MODEL)
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "2"))
+        self.retry_base_s = float(os.getenv("LLM_RETRY_BASE_S", "0.5"))
+        self.max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self.breaker = CircuitBreaker(int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+                                      float(os.getenv("LLM_BREAKER_RESET_S", "30")))
+
+    def after_fork(self):
+        """A forked worker must not share the parent's pooled sockets."""
+        if self._own_client and self.backend == "groq":
+            self.client = create_client(self.api_key, self.backend)
+
+    def config(self, purpose: str, **overrides) -> Dict:
+        """Model and parameters for `purpose`: defaults, then LLM_<PURPOSE>_* env, then `overrides`."""
+        config = dict(PURPOSES.get(purpose, PURPOSES["generation"]), model=self.default_model)
+        prefix = f"LLM_{purpose.upper()}_"
+        for key, default in list(config.items()):
+            value = os.getenv(prefix + key.upper())
+            if value is not None:
+                config[key] = value if key == "model" else (int(value) if key == "max_tokens" else float(value))
+        config.update((k, v) for k, v in overrides.items() if v is not None)
+        return config
+
+    def complete(self, purpose: str, messages: List[Dict], retries: Optional[int] = None, **overrides) -> str:
+        """Reply text for `messages`; overrides (model, temperature, max_tokens, timeout_s) win over the config."""
+        config = self.config(purpose, **overrides)
+        resp = self._call(purpose, messages, config, self.max_retries if retries is None else retries, stream=False)
+        record_token_usage(purpose, resp)
+        return resp.choices[0].message.content
+
+    def stream(self, purpose: str, messages: List[Dict], **overrides) -> Iterator[str]:
+        """Reply deltas. Only opening the stream is retried; it holds its concurrency slot until it ends."""
+        config = self.config(purpose, **overrides)
+        with deadline(config["timeout_s"]):
+            resp = self._call(purpose, messages, config, self.max_retries, stream=True)
+        try:
+            for chunk in resp:
+                content = chunk.choices[0].delta.content
+                if content:
+                    yield content
+        finally:
+            self._slots.release()
+
+    def _call(self, purpose: str, messages: List[Dict], config: Dict, retries: int, stream: bool):
+        params = {"model": config["model"], "messages": messages}
+        for key in ("temperature", "max_tokens"):
+            if config.get(key) is not None:
+                params[key] = config[key]
+        if stream:
+            params["stream"] = True
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = self._timeout(purpose, config["timeout_s"])
+            if not self._slots.acquire(timeout=timeout):
+                LLM_CALLS.inc(purpose=purpose, outcome="saturated")
+                raise LLMUnavailable(f"No LLM slot free within {timeout:.1f}s ({self.max_concurrency} in flight)")
+            try:
+                # Time spent waiting for the slot counts against the deadline. Checked before the
+                # breaker: a half-open trial it hands out must be followed by a call and record()
+                timeout = self._timeout(purpose, config["timeout_s"])
+            except LLMDeadlineExceeded:
+                self._slots.release()
+                raise
+            if not self.breaker.allow():
+                self._slots.release()
+                LLM_CALLS.inc(purpose=purpose, outcome="circuit_open")
+                raise LLMUnavailable(f"LLM circuit open; {purpose} call not attempted")
+            # A stream keeps its slot until stream() has read it to the end
+            keep_slot = False
+            try:
+                resp = self.client.chat.completions.create(timeout=timeout, **params)
+            except Exception as e:
+                transient = is_transient(e)
+                # Rate limits say nothing about the provider's health
+                self.breaker.record(success=not transient or retry_after(e) is not None)
+                wait = self._retry_wait(e, attempt) if transient and attempt <= retries else None
+                left = remaining()
+                if wait is None or (left is not None and wait >= left):
+                    LLM_CALLS.inc(purpose=purpose, outcome="timeout" if _is_timeout(e) else "error")
+                    raise
+                LLM_CALLS.inc(purpose=purpose, outcome="retry")
+                logger.info("LLM %s attempt %d failed (%s: %s); retrying in %.2fs", purpose, attempt,
+                            type(e).__name__, e, wait)
+            else:
+                self.breaker.record(success=True)
+                LLM_CALLS.inc(purpose=purpose, outcome="ok")
+                keep_slot = stream
+                return resp
+            finally:
+                if not keep_slot:
+                    self._slots.release()
+            time.sleep(wait)
+
+    def _timeout(self, purpose: str, timeout_s: float) -> float:
+        left = remaining()
+        if left is None:
+            return timeout_s
+        if left <= 0:
+            LLM_CALLS.inc(purpose=purpose, outcome="deadline")
+            raise LLMDeadlineExceeded(f"Request deadline passed before the {purpose} call")
+        return min(timeout_s, left)
+
+    def _retry_wait(self, error: Exception, attempt: int) -> float:
+        after = retry_after(error)
+        return after if after else backoff(attempt, self.retry_base_s)
+
+
+def _is_timeout(error: Exception) -> bool:
+    return isinstance(error, TimeoutError) or "Timeout" in type(error).__name__
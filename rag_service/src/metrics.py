@@ -0,0 +1,241 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .tracing import span, current_span
+
+# Latency buckets (seconds) sized for the pipeline: sub-ms BM25/FAISS lookups up to multi-second LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(labelnames, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{_escape(extra[1])}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, k), v) for k, v in items]
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {",".join(k): v for k, v in self._values.items()}
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    samples = Counter.samples
+    snapshot = Counter.snapshot
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            items = [(k, dict(v, counts=list(v["counts"]))) for k, v in self._values.items()]
+        out = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                out.append((f"{self.name}_bucket", _format_labels(self.labelnames, key, ("le", _format_value(bound))), cumulative))
+            out.append((f"{self.name}_bucket", _format_labels(self.labelnames, key, ("le", "+Inf")), state["count"]))
+            out.append((f"{self.name}_sum", _format_labels(self.labelnames, key), state["sum"]))
+            out.append((f"{self.name}_count", _format_labels(self.labelnames, key), state["count"]))
+        return out
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Sum/count per label set, enough for benchmarks to diff mean stage latency."""
+        with self._lock:
+            return {",".join(k): {"sum": v["sum"], "count": v["count"]} for k, v in self._values.items()}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def reset(self):
+        for metric in self._metrics.values():
+            metric.reset()
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_LATENCY = REGISTRY.histogram(
+    "rag_stage_latency_seconds",
+    "Latency of RAG pipeline stages (language_detect, translate_query, route, rewrite, citation, embed, faiss, bm25, fusion, rerank, "
+    "packing, llm, translate_answer, translate_stream_tail, mongo_write, summarization, evaluation)",
+    ["stage"],
+)
+STAGE_ERRORS = REGISTRY.counter("rag_stage_errors_total", "Exceptions raised inside a pipeline stage", ["stage"])
+CACHE_EVENTS = REGISTRY.counter("rag_cache_events_total", "Cache lookups by cache name and result (hit/miss)", ["cache", "result"])
+LLM_TOKENS = REGISTRY.counter("rag_llm_tokens_total", "LLM token usage reported by the provider", ["purpose", "kind"])
+LLM_CALLS = REGISTRY.counter("rag_llm_calls_total", "LLM gateway attempts by purpose and outcome (ok, retry, error, timeout, "
+                             "deadline, saturated, circuit_open)", ["purpose", "outcome"])
+LLM_CIRCUIT_OPEN = REGISTRY.gauge("rag_llm_circuit_open", "1 while the LLM circuit breaker is failing calls fast")
+HTTP_REQUESTS = REGISTRY.counter("rag_http_requests_total", "HTTP requests served", ["path", "method", "status"])
+HTTP_LATENCY = REGISTRY.histogram("rag_http_request_latency_seconds", "End-to-end HTTP request latency", ["path", "method"])
+STARTUP_SECONDS = REGISTRY.gauge("rag_startup_stage_seconds", "Duration of each background startup stage", ["stage"])
+SERVICE_READY = REGISTRY.gauge("rag_ready", "1 once the pipeline is initialized and the embedding model is loaded")
+SEARCH_QUEUE_SECONDS = REGISTRY.histogram("rag_search_queue_seconds", "Time a retrieval waited for a search executor slot")
+RERANK_OUTCOMES = REGISTRY.counter("rag_rerank_total", "Reranking outcomes (reranked, budget_exceeded, error, unavailable)", ["outcome"])
+ROUTE_DECISIONS = REGISTRY.counter("rag_route_total", "Chat queries by route (greeting, citation, follow_up, open)", ["route"])
+ADMISSION = REGISTRY.counter("rag_admission_total", "Admission decisions by lane (stream, chat, batch) and outcome (admitted, "
+                             "queue_full, queue_timeout, rate_limited_user, rate_limited_session)", ["lane", "outcome"])
+ADMISSION_IN_FLIGHT = REGISTRY.gauge("rag_admission_in_flight", "Admitted requests holding a slot, by lane", ["lane"])
+ADMISSION_QUEUED = REGISTRY.gauge("rag_admission_queued", "Requests waiting for a slot, by lane", ["lane"])
+ADMISSION_WAIT = REGISTRY.histogram("rag_admission_wait_seconds", "Time an admitted request waited in its lane's queue", ["lane"])
+
+
+@contextmanager
+def time_stage(stage: str, **attrs):
+    """Time a pipeline stage into rag_stage_latency_seconds and the active trace (if any).
+
+    Yields the trace span so callers can attach attributes; exceptions are counted and re-raised.
+    """
+    start = time.perf_counter()
+    with span(stage, **attrs) as s:
+        try:
+            yield s
+        except BaseException:
+            STAGE_ERRORS.inc(stage=stage)
+            raise
+        finally:
+            STAGE_LATENCY.observe(time.perf_counter() - start, stage=stage)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_EVENTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def record_token_usage(purpose: str, response) -> None:
+    """Record prompt/completion tokens from an OpenAI-compatible completion response, if reported.
+
+    Call inside the stage's `time_stage` block so the counts are also attached to its span.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    s = current_span()
+    for kind in ("prompt_tokens", "completion_tokens"):
+        value = getattr(usage, kind, None)
+        if value:
+            LLM_TOKENS.inc(float(value), purpose=purpose, kind=kind.replace("_tokens", ""))
+            s.set(**{kind: value})
@@ -0,0 +1,86 @@
+import re
+import unicodedata
+from typing import List, NamedTuple, Tuple
+
+from .citation_index import citation_only, parse_citations
+
+
+class Route:
+    """Where a query goes, cheapest first."""
+
+    GREETING = "greeting"    # chit-chat: answered without retrieval
+    CITATION = "citation"    # nothing but cited provisions: served from the citation index
+    FOLLOW_UP = "follow_up"  # leans on the conversation: rewritten by the LLM, then retrieved
+    OPEN = "open"            # a self-contained question: full RAG, no rewrite
+
+
+ROUTES = (Route.GREETING, Route.CITATION, Route.FOLLOW_UP, Route.OPEN)
+
+# The whole query is a greeting, thanks or goodbye ("hi", "Good morning!", "thanks a lot")
+_GREETING = re.compile(
+    r"(?:hi+|hey+|hello+|hiya|yo|namaste|howdy|greetings|thanks?|thank\s+you|thanks\s+a\s+lot|thank\s+you\s+so\s+much"
+    r"|thx|ty|bye|goodbye|see\s+you|ok(?:ay)?|cool|great|good\s+(?:morning|afternoon|evening|night|day))"
+    r"(?:\s+(?:there|all|again|lexchat|bot))?[\s!.,?:)]*",
+    re.IGNORECASE,
+)
+# Legal vocabulary on word boundaries, so "act" no longer matches "contact" or "fact"
+_LEGAL = re.compile(
+    r"\b(?:articles?|sections?|acts?|laws?|rights?|ipc|crpc|judge?ments?|courts?|statutes?|contracts?|evidence"
+    r"|penalty|penalties|fines?|offen[cs]es?|crimes?|liable|liability|divorce|marriage|custody|writs?|injunctions?"
+    r"|constitution(?:al)?|bail|arrest|punish(?:ment|ed)?)\b",
+    re.IGNORECASE,
+)
+# Words that only make sense against an earlier turn: pronouns, "more", "elaborate", and openers
+# like "what about ...". A bare "explain" is not one of them: "Explain the basic structure doctrine"
+# stands on its own.
+_REFERENCE = re.compile(
+    r"\b(?:it|its|this|that|these|those|them|they|their|he|she|his|her|above|aforesaid|same|former|latter"
+    r"|more|elaborate|examples?)\b",
+    re.IGNORECASE,
+)
+_CONTINUATION = re.compile(r"^\s*(?:and|also|but|so|or|what\s+about|how\s+about|why|then)\b", re.IGNORECASE)
+# Longer queries restate their subject; only shorter ones are rewritten
+FOLLOW_UP_MAX_WORDS = 15
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case, width and spacing folded, closing punctuation dropped: "What is  Article 21?" -> "what is article 21"."""
+    q = _SPACES.sub(" ", unicodedata.normalize("NFKC", query or "").casefold()).strip()
+    return q.rstrip("?!.。। ")
+
+
+class RouteDecision(NamedTuple):
+    route: str
+    # (act, number) pairs cited in the query, for the citation route
+    citations: List[Tuple[str, str]]
+
+
+class QueryRouter:
+    """Classifies a query with a few compiled regexes, in microseconds and without a model."""
+
+    def classify(self, query: str, has_history: bool = False) -> RouteDecision:
+        q = (query or "").strip()
+        if not q:
+            return RouteDecision(Route.OPEN, [])
+        if _GREETING.fullmatch(q):
+            return RouteDecision(Route.GREETING, [])
+        citations = parse_citations(q)
+        follow_up = has_history and self.is_follow_up(q)
+        # "Explain it under Article 21" needs the earlier turn for "it"; "What about Section 420?" does not
+        if citations and citation_only(q) and not (follow_up and _REFERENCE.search(q)):
+            return RouteDecision(Route.CITATION, citations)
+        if follow_up:
+            return RouteDecision(Route.FOLLOW_UP, citations)
+        return RouteDecision(Route.OPEN, citations)
+
+    def is_greeting(self, query: str) -> bool:
+        return bool(query) and _GREETING.fullmatch(query.strip()) is not None
+
+    def is_informational(self, query: str) -> bool:
+        """A question, a long query, or one that uses legal vocabulary."""
+        q = (query or "").strip()
+        return bool(q) and ("?" in q or len(q) > 40 or _LEGAL.search(q) is not None)
+
+    def is_follow_up(self, query: str) -> bool:
+        return len(query.split()) <= FOLLOW_UP_MAX_WORDS and (_REFERENCE.search(query) or _CONTINUATION.search(query)) is not None
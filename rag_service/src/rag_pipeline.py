@@ -1,22 +1,49 @@
 import os
-from typing import List, Optional, Dict
-from groq import Groq
+import logging
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional, Dict, Tuple
 from .document_processor import DocumentProcessor
 from .vector_store import VectorStore
 from .conversation_manager import ConversationManager
 from .legal_evaluator import LegalEvaluationManager
 from .hybrid_retriever import HybridRetriever
+from .index_snapshots import IndexManifest, RetrievalSnapshot, build_in_subprocess
+from .search_executor import SearchExecutor
+from .reranker import reranker_from_env
+from .dedup import diversify, trim_overlaps
+from .citation_index import CitationIndex
+from .chunk_refs import ChunkSelection, chunk_key, chunk_refs
+from .query_router import QueryRouter, Route, RouteDecision, normalize_query
+from .single_flight import SingleFlight
+from .llm_gateway import LLMGateway, deadline
+from .translation_service import LANGUAGES, TranslationService
+from . import vector_store as vector_store_module
+from .metrics import ROUTE_DECISIONS, STAGE_LATENCY, record_cache, time_stage
+from .retrieval_config import load_retrieval_config
+from .tracing import start_trace, exporter_enabled
+from .trace_store import TRACES_COLLECTION, TraceStore
 import re
 
+logger = logging.getLogger(__name__)
+
 class RAGPipeline:
     def __init__(self, groq_api_key: str, index_dir: Optional[str] = None, mongo_uri: Optional[str] = None, db_name: Optional[str] = None):
-        self.groq_client = Groq(api_key=groq_api_key)
+        # Every LLM call (generation, rewrite, summaries, evaluation, streaming) goes through the gateway
+        self.llm = LLMGateway(groq_api_key)
+        # Budget for all LLM calls of one chat request (CHAT_DEADLINE_S=0 for none)
+        self.chat_deadline_s = float(os.getenv("CHAT_DEADLINE_S", "60"))
         self.document_processor = DocumentProcessor()
-        self.vector_store = VectorStore(index_dir=index_dir)
+        self.index_dir = index_dir or os.path.join(os.path.dirname(__file__), "..", "vector_store")
+        self.manifest = IndexManifest(self.index_dir)
+        # Live (version, vector store, hybrid retriever); replaced as a whole by _activate()
+        self._retrieval = RetrievalSnapshot(None, VectorStore(index_dir=self.index_dir))
+        self._rebuild_lock = threading.Lock()
+        self.keep_index_versions = int(os.getenv("INDEX_KEEP_VERSIONS", "2"))
         self.conversation_manager = ConversationManager(mongo_uri=mongo_uri, db_name=db_name)
         # evaluator optional
         try:
-            self.evaluator = LegalEvaluationManager(self.groq_client)
+            self.evaluator = LegalEvaluationManager(self.llm)
         except Exception:
             self.evaluator = None
         self.is_initialized = False
@@ -25,52 +52,306 @@ class RAGPipeline:
         self.reserved_response_tokens = int(os.getenv("RESERVED_RESPONSE_TOKENS", "1000"))
         # safe minimum k
         self.min_k = 1
-        self.hybrid_retriever = None  # Initialize after documents loaded
+        # Tuned retrieval knobs (alpha, rrf_k, candidate depth, nprobe, k); see benchmarks/sweep.py
+        self.retrieval_config = load_retrieval_config()
+        # Bounded pool (with per-thread torch/FAISS budgets) that every retrieval runs on
+        self.search_executor = SearchExecutor()
+        # Optional cross-encoder pass over the fused candidates (RERANK_ENABLED=1)
+        self.reranker = reranker_from_env()
+        # MMR step dropping near-duplicate chunks, and overlap trimming, before packing (DIVERSITY_ENABLED=0 turns both off)
+        self.diversity_enabled = os.getenv("DIVERSITY_ENABLED", "1") == "1"
+        self.diversity_lambda = float(os.getenv("DIVERSITY_LAMBDA", "0.7"))
+        self.diversity_max_similarity = float(os.getenv("DIVERSITY_MAX_SIMILARITY", "0.5"))
+        # Cited provisions ("Article 21", "Section 302 IPC") are looked up exactly before searching
+        # (CITATION_LOOKUP=0 turns it off); a query about nothing else skips the search (CITATION_SKIP_SEARCH)
+        self.citation_lookup = os.getenv("CITATION_LOOKUP", "1") == "1"
+        self.citation_skip_search = os.getenv("CITATION_SKIP_SEARCH", "1") == "1"
+        # Sends each chat query down the cheapest adequate path (greeting, citation, follow_up, open)
+        self.router = QueryRouter()
+        # Concurrent identical history-free chats share one retrieval + generation (SINGLE_FLIGHT=0 turns it off)
+        self.single_flight = SingleFlight() if os.getenv("SINGLE_FLIGHT", "1") == "1" else None
+        # Hindi <-> English models load on first use, or at startup with TRANSLATION_PRELOAD=1
+        self.translator = TranslationService()
+        self.translation_preload = os.getenv("TRANSLATION_PRELOAD", "0") == "1"
+        # Full traces (contexts, answer, spans) of a TRACE_SAMPLE_RATE sample of turns, compressed
+        self.trace_store = TraceStore.from_env(lambda: self.conversation_manager.db.get_collection(TRACES_COLLECTION))
+
+    @property
+    def retrieval(self) -> RetrievalSnapshot:
+        """Read once per request and use its members together."""
+        return self._retrieval
+
+    @property
+    def vector_store(self) -> VectorStore:
+        return self._retrieval.vector_store
+
+    @property
+    def hybrid_retriever(self) -> Optional[HybridRetriever]:
+        return self._retrieval.hybrid_retriever
+
+    @property
+    def index_version(self) -> Optional[str]:
+        return self._retrieval.version
 
     def initialize(self, data_folder: str, force_rebuild: bool = False):
-        vector_dir = self.vector_store.index_dir
-        loaded = False
-        if not force_rebuild:
-            loaded = self.vector_store.load()
-        if loaded:
-            print("Loaded existing vector store.")
+        """Load the live index snapshot, building one first if none exists (or if `force_rebuild`)."""
+        version, _ = self.manifest.current()
+        if force_rebuild or version is None:
+            version = self.rebuild_index(data_folder)
         else:
-            chunks = self.document_processor.process_documents(data_folder)
-            if not chunks:
-                raise RuntimeError("No documents found in data folder")
-            print(f"Processing {len(chunks)} chunks")
-            self.vector_store.add_documents(chunks)
-            self.vector_store.save()
-            print("Vector store built and saved.")
-        
-        # Initialize hybrid retriever after vector store is ready
-        if self.vector_store.documents:
+            self._activate(version)
+            logger.info("Loaded existing vector store (version %s).", version)
+        self.is_initialized = True
+
+    def rebuild_index(self, data_folder: str) -> str:
+        """Build a new snapshot in a separate process, then swap it in; requests keep using the old one meanwhile."""
+        if not self._rebuild_lock.acquire(blocking=False):
+            raise RuntimeError("An index rebuild is already running")
+        try:
+            version, info = build_in_subprocess(
+                data_folder, self.index_dir, self.vector_store.model_name,
+                # the encoder loader in effect here (real or a benchmark stand-in) is reused by the builder
+                encoder_loader=vector_store_module.load_encoder,
+            )
+            self._activate(version)
+            self.manifest.publish(version, info)
+            self.manifest.gc(self.keep_index_versions)
+            return version
+        finally:
+            self._rebuild_lock.release()
+
+    def refresh_index(self) -> bool:
+        """Switch to the manifest's current version if another process published a newer one."""
+        version, _ = self.manifest.current()
+        if version is None or version == self.index_version or not self._rebuild_lock.acquire(blocking=False):
+            return False
+        try:
+            self._activate(version)
+            return True
+        finally:
+            self._rebuild_lock.release()
+
+    def _activate(self, version: str):
+        """Load `version` fully off to the side, then make it live with a single reference swap."""
+        store = VectorStore(self.vector_store.model_name, index_dir=self.manifest.version_dir(version))
+        if not store.load():
+            raise RuntimeError(f"Index version {version} could not be loaded")
+        hybrid = None
+        if store.documents:
             try:
-                self.hybrid_retriever = HybridRetriever(self.vector_store, self.vector_store.documents)
-                print("Hybrid retriever initialized.")
+                hybrid = HybridRetriever(store, store.documents)
+                logger.info("Hybrid retriever initialized.")
             except Exception as e:
-                print(f"Hybrid retriever failed: {e}, falling back to vector-only")
-                self.hybrid_retriever = None
-        
-        self.is_initialized = True
+                logger.warning("Hybrid retriever failed: %s, falling back to vector-only", e)
+        citations = CitationIndex.load(self.manifest.version_dir(version))
+        if citations is None:
+            logger.info("Index version %s has no citation index; rebuild the index to enable citation lookup", version)
+        self._retrieval = RetrievalSnapshot(version, store, hybrid, citations)
+        logger.info("Index version %s is live (%d chunks)", version, len(store.documents))
+
+    def after_fork(self):
+        """Reopen connections in a forked worker; the read-only index, chunks and model stay shared."""
+        # Pool threads do not survive fork(); a worker gets its own
+        self.search_executor = SearchExecutor()
+        self.llm.after_fork()
+        self.conversation_manager.connect()
+        if self.evaluator is not None:
+            self.evaluator.connect()
+
+    def warmup(self):
+        """Load the embedding model and run one encode so the first request does not pay for it."""
+        self.vector_store.model.encode(["warmup"], convert_to_numpy=True, show_progress_bar=False)
+        if self.reranker is not None:
+            self.reranker.warmup()
+        if self.translation_preload:
+            self.preload_translation(warm=True)
+
+    def preload_translation(self, warm: bool = False):
+        """Load (and with warm=True, exercise) the translation models; failures leave them lazy."""
+        try:
+            if warm:
+                self.translator.warmup()
+            else:
+                self.translator.preload()
+        except Exception as e:
+            logger.warning("Translation models not preloaded, loading on first use: %s", e)
+
+    def localize_query(self, query: str, language: Optional[str] = None) -> Tuple[str, Dict]:
+        """(English query, language info) for `query`; `language` is the answer language the client asked for.
+
+        Retrieval, prompts and the stored conversation are English; the info dict carries the query
+        and answer languages and the milliseconds added by detection and translation (stage_ms).
+        """
+        start = time.perf_counter()
+        with time_stage("language_detect"):
+            source = self.translator.detect_language(query)
+        info = {
+            "query_language": source,
+            "answer_language": language if language in LANGUAGES else source,
+            "stage_ms": {"language_detect": round((time.perf_counter() - start) * 1000, 2)},
+        }
+        if source == "en":
+            return query, info
+        start = time.perf_counter()
+        try:
+            with time_stage("translate_query", source=source):
+                english = self.translator.translate(query, "en", source_lang=source)
+            info["english_query"] = english
+        except Exception as e:
+            logger.warning("Query translation failed, retrieving with the original text: %s", e)
+            english = query
+            info["error"] = f"translate_query: {e}"
+        info["stage_ms"]["translate_query"] = round((time.perf_counter() - start) * 1000, 2)
+        return english, info
+
+    def localize_answer(self, text: str, info: Dict) -> str:
+        """`text` (English) in the answer language of `info`; the English text if translation fails."""
+        target = info["answer_language"]
+        if target == "en" or not text:
+            return text
+        start = time.perf_counter()
+        try:
+            with time_stage("translate_answer", target=target):
+                return self.translator.translate(text, target, source_lang="en")
+        except Exception as e:
+            logger.warning("Answer translation failed, returning English: %s", e)
+            info["error"] = f"translate_answer: {e}"
+            return text
+        finally:
+            info["stage_ms"]["translate_answer"] = round((time.perf_counter() - start) * 1000, 2)
+
+    def localize_stream(self, deltas: Iterable[str], info: Dict) -> Iterator[str]:
+        """Streamed English text in the answer language of `info`, translated in sentence batches as it arrives.
+
+        Only the wait after the last delta adds latency; it is recorded as the translate_stream_tail stage.
+        """
+        target = info["answer_language"]
+        if target == "en":
+            yield from deltas
+            return
+        stream_ended = [None]
+
+        def watched():
+            yield from deltas
+            stream_ended[0] = time.perf_counter()
+
+        for segment in self.translator.translate_stream(watched(), "en", target):
+            yield segment
+        if stream_ended[0] is not None:
+            STAGE_LATENCY.observe(time.perf_counter() - stream_ended[0], stage="translate_stream_tail")
 
     def retrieve_context(self, query: str, k: int = 3) -> str:
+        return "\n\n".join(self.retrieve_chunks(query, k))
+
+    def retrieve_chunks(self, query: str, k: int = 3) -> List[str]:
+        """The chunks that go into the prompt for `query`, best first."""
+        return self.select_chunks(query, k).chunks
+
+    def select_chunks(self, query: str, k: int = 3, decision: Optional[RouteDecision] = None) -> ChunkSelection:
+        """retrieve_chunks, with the id, content key and score of each chunk in the index version searched.
+
+        `decision` is the router's for this exact query; its citations are looked up instead of parsing again.
+        """
         if not self.is_initialized:
-            return ""
-        
-        # Use hybrid search if available, else fallback to vector-only
-        if self.hybrid_retriever:
-            print(f"DEBUG: Using HYBRID retrieval for query: {query[:50]}...")  # ← Add this
-            results = self.hybrid_retriever.search(query, k, alpha=0.9)  # ← Try 90% vector, 10% BM25 first
+            return ChunkSelection([], [], [], [], None)
+
+        snapshot = self.retrieval
+        results, reranked, floors = self._retrieve(query, k, snapshot=snapshot, decision=decision)
+        if reranked:
+            # Already cut to the chunks the cross-encoder scored at least RERANK_MIN_SCORE
+            selected = results
         else:
-            print(f"DEBUG: Using VECTOR-ONLY retrieval for query: {query[:50]}...")  # ← Add this
-            results = self.vector_store.search(query, k)
-        
-        context_parts = [doc for doc, score in results if score > 0.2]
-        # fallback take top-k even if low score
-        if not context_parts and results:
-            context_parts = [doc for doc, score in results[:k]]
-        return "\n\n".join(context_parts)
+            # Fused scores are normalized per mode, and each fused chunk has its own floor (by the lists
+            # that found it); without BM25 they are cosine similarities
+            cfg = self.retrieval_config
+            threshold = cfg["fusion_threshold"] if snapshot.hybrid_retriever else cfg["vector_min_score"]
+            selected = [(doc, score) for doc, score in results if score >= floors.get(doc, threshold)]
+            # Fewer than k when the rest look irrelevant, but never fewer than min_chunks
+            if len(selected) < cfg["min_chunks"]:
+                selected = results[:cfg["min_chunks"]]
+        context_parts = [doc for doc, score in selected]
+        ids = [snapshot.vector_store.chunk_id(doc) for doc in context_parts]
+        keys = [chunk_key(doc) for doc in context_parts]
+        if self.diversity_enabled:
+            # Adjacent windows of the same text both selected: send their shared words once
+            context_parts = trim_overlaps(context_parts, self.document_processor.chunk_overlap)
+        return ChunkSelection(context_parts, ids, keys, [score for doc, score in selected], snapshot.version)
+
+    def search(self, query: str, k: int = 3, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+               rerank: bool = True) -> List[Tuple[str, float]]:
+        """Scored chunks from the live snapshot, computed on the search executor.
+
+        nprobe/ef_search override the tuned values for this call only; rerank=False skips the reranker.
+        """
+        return self._retrieve(query, k, nprobe, ef_search, rerank)[0]
+
+    def _retrieve(self, query: str, k: int, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                  rerank: bool = True, snapshot: Optional[RetrievalSnapshot] = None,
+                  decision: Optional[RouteDecision] = None) -> Tuple[List[Tuple[str, float]], bool, Dict[str, float]]:
+        """Scored chunks, whether the reranker cut them, and the score each fused chunk needs to be prompted."""
+        # One read of the snapshot so a concurrent index swap cannot mix versions within a query
+        snapshot = snapshot or self.retrieval
+        cfg = self.retrieval_config
+        reranker = self.reranker if rerank else None
+        return self.search_executor.run(self._search, snapshot, reranker, query, k,
+                                        nprobe or cfg["nprobe"], ef_search or cfg["ef_search"], decision)
+
+    def _search(self, snapshot: RetrievalSnapshot, reranker, query: str, k: int, nprobe: Optional[int],
+                ef_search: Optional[int], decision: Optional[RouteDecision] = None) -> Tuple[List[Tuple[str, float]], bool, Dict[str, float]]:
+        # Without a routing decision (search(), evaluation) the query is classified here
+        decision = decision or self.router.classify(query)
+        exact = self._cited_chunks(snapshot, decision.citations)
+        if exact and self.citation_skip_search and decision.route == Route.CITATION:
+            # "What is Article 21?": the provision's own chunks, no embedding or BM25
+            documents = snapshot.vector_store.documents
+            return [(documents[i], 1.0) for i in exact[:k]], False, {}
+        # The reranker sees a longer fused list than the k chunks that end up in the prompt. The
+        # per-retriever candidate depth stays k * multiplier, so its first k are the unreranked result.
+        depth = max(k, reranker.top_n) if reranker is not None else k
+        if self.diversity_enabled:
+            # Spare candidates to fill the places of dropped duplicates
+            depth = max(depth, 2 * k)
+        if snapshot.hybrid_retriever:
+            logger.debug("Using HYBRID retrieval for query: %s", query[:50])
+            cfg = self.retrieval_config
+            results, floors = snapshot.hybrid_retriever.search_with_floors(
+                query, depth,
+                alpha=cfg["alpha"],
+                rrf_k=cfg["rrf_k"],
+                candidate_multiplier=cfg["candidate_multiplier"],
+                nprobe=nprobe,
+                ef_search=ef_search,
+                depth=k * cfg["candidate_multiplier"],
+                pinned=exact,
+                fusion=cfg["fusion"],
+                threshold=cfg["fusion_threshold"],
+            )
+            floors = {doc: floor for (doc, _), floor in zip(results, floors)}
+        else:
+            logger.debug("Using VECTOR-ONLY retrieval for query: %s", query[:50])
+            results = snapshot.vector_store.search(query, depth, nprobe=nprobe, ef_search=ef_search)
+            floors = {}
+            if exact:
+                documents = snapshot.vector_store.documents
+                cited = {documents[i] for i in exact}
+                results = [(documents[i], 1.0) for i in exact] + [r for r in results if r[0] not in cited]
+        reranked = False
+        if reranker is not None:
+            results, reranked = reranker.rerank(query, results, depth)
+        if self.diversity_enabled:
+            with time_stage("diversity", candidates=len(results)):
+                results = diversify(results, k, snapshot.vector_store.signature,
+                                    self.diversity_lambda, self.diversity_max_similarity)
+        return results[:k], reranked, floors
+
+    def _cited_chunks(self, snapshot: RetrievalSnapshot, citations: List[Tuple[str, str]]) -> List[int]:
+        """Ids of the chunks holding the cited provisions, from the snapshot's citation index."""
+        if not self.citation_lookup or snapshot.citations is None:
+            return []
+        with time_stage("citation") as span:
+            exact = snapshot.citations.lookup(citations) if citations else []
+            span.set(citations=len(citations), hits=len(exact))
+        return exact
 
     def _estimate_tokens(self, text: str) -> int:
         """Same heuristic as ConversationManager (1 token ≈ 4 chars)."""
@@ -79,40 +360,19 @@ class RAGPipeline:
         return max(1, len(text) // 4)
 
     def is_greeting(self, query: str) -> bool:
-        if not query:
-            return False
-        q = query.strip().lower()
-        
-        # Very short single-word greetings
-        if len(q.split()) == 1 and q in ['hi', 'hey', 'hello', 'yo', 'thanks', 'thx', 'bye']:
-            return True
-        
-        # Short polite phrases (2 words max)
-        if len(q.split()) <= 2:
-            greeting_patterns = ['good morning', 'good night', 'good evening', 'thank you', 'thanks a lot']
-            if q in greeting_patterns:
-                return True
-        
-        return False
+        return self.router.is_greeting(query)
 
     def is_informational(self, query: str) -> bool:
         """Heuristic: treat as informational if it's a question, long, or contains legal keywords."""
-        if not query:
-            return False
-        q = query.strip().lower()
-        if "?" in q:
-            return True
-        if len(q) > 40:
-            return True
-        legal_keywords = [
-            "article", "section", "act", "law", "rights", "ipc", "judgment", "judgement",
-            "court", "statute", "contract", "evidence", "penalty", "fine", "offence", "crime",
-            "liable", "liability", "divorce", "marriage", "custody", "writ", "injunction"
-        ]
-        for kw in legal_keywords:
-            if kw in q:
-                return True
-        return False
+        return self.router.is_informational(query)
+
+    def route_query(self, query: str, has_history: bool = False) -> RouteDecision:
+        """Classify `query` for _chat and count the decision in rag_route_total."""
+        with time_stage("route") as span:
+            decision = self.router.classify(query, has_history)
+            span.set(route=decision.route)
+        ROUTE_DECISIONS.inc(route=decision.route)
+        return decision
 
     def generate_response(self, query: str, context: str, conversation_context: str = "") -> str:
         system_prompt = """You are a helpful legal assistant specializing in human rights law.
@@ -120,27 +380,21 @@ Use the provided context to answer questions accurately and cite relevant inform
 If the context doesn't contain relevant information, say so clearly."""
         user_prompt = f"Conversation:\n{conversation_context}\n\nContext:\n{context}\n\nQuestion: {query}"
         try:
-            resp = self.groq_client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[
+            with time_stage("llm"):
+                return self.llm.complete("generation", [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.2,
-                max_tokens=1000
-            )
-            return resp.choices[0].message.content
+                ])
         except Exception as e:
-            print(f"LLM error: {e}")
+            logger.error("LLM error: %s", e)
             return f"Error generating response: {e}"
 
     def rewrite_query_with_context(self, query: str, conversation_context: str) -> str:
         """Rewrite ambiguous follow-up queries using conversation context."""
-        if not conversation_context or len(query.split()) > 15:
+        if not conversation_context:
             return query
 
-        follow_up_keywords = ["that", "this", "those", "it", "them", "examples", "more", "explain", "elaborate", "tell me"]
-        if not any(kw in query.lower() for kw in follow_up_keywords):
+        if not self.router.is_follow_up(query):
             return query
 
         rewrite_prompt = f"""Previous conversation:
@@ -152,27 +406,138 @@ Rewrite the user's question to be self-contained by incorporating relevant conte
 Rewritten question:"""
 
         try:
-            resp = self.groq_client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": rewrite_prompt}],
-                temperature=0.1,
-                max_tokens=60
-            )
-            rewritten = resp.choices[0].message.content.strip()
-            print(f"DEBUG: Query rewritten from '{query}' to '{rewritten}'")
+            with time_stage("rewrite"):
+                rewritten = self.llm.complete("rewrite", [{"role": "user", "content": rewrite_prompt}]).strip()
+            logger.debug("Query rewritten from %r to %r", query, rewritten)
             return rewritten
         except Exception:
             return query
 
-    def chat(self, session_id: str, query: str, include_history: bool = True, evaluate: bool = False) -> Dict:
-        """Chat with turn-by-turn summarization and query rewriting for follow-ups."""
-        # If the query is non-informational (greeting/chit-chat), skip retrieval entirely.
-        if self.is_greeting(query) and not self.is_informational(query):
-            print(f"DEBUG: Skipping retrieval for greeting: '{query[:120]}' (session {session_id})")
+    def chat(self, session_id: str, query: str, include_history: bool = True, evaluate: bool = False, trace: bool = False,
+             language: Optional[str] = None) -> Dict:
+        """Chat entry point; when `trace` is set the per-stage span timings are added to `debug`.
+
+        `language` ("en"/"hi") is the language to answer in; by default, the language of the query.
+        A trace is also recorded (but not returned) when TRACE_EXPORT_PATH is configured.
+        """
+        sampled = self.trace_store.sample()
+        if not (trace or sampled or exporter_enabled()):
+            with deadline(self.chat_deadline_s):
+                return self._chat(session_id, query, include_history, evaluate, language)
+        # Filled by _chat with the full texts of the turn, which message debug only references
+        turn: Dict = {}
+        with start_trace("chat", session_id=session_id, include_history=include_history, evaluate=evaluate,
+                         language=language) as tr, deadline(self.chat_deadline_s):
+            out = self._chat(session_id, query, include_history, evaluate, language, capture=turn)
+        if trace and isinstance(out.get("debug"), dict):
+            # Copy so the trace and previews are only returned to the caller, never persisted with the message
+            out["debug"] = dict(out["debug"], trace=tr.compact(), stage_ms=tr.stage_totals(), trace_id=tr.trace_id,
+                                conversation_context_preview=turn.get("conversation_context", "")[:1000],
+                                retrieved_context_preview=turn.get("retrieved_context", "")[:2000])
+        if sampled and turn.get("message_id") is not None:
+            message_id = turn.pop("message_id")
+            self.trace_store.save(session_id, message_id, dict(
+                turn, debug=out.get("debug"), trace_id=tr.trace_id, spans=tr.compact(), stage_ms=tr.stage_totals()))
+        return out
+
+    def _answer(self, session_id: str, query: str, k: int, conversation_context: str, include_history: bool,
+                decision: Optional[RouteDecision] = None) -> Dict:
+        """Pack retrieved context (and the conversation) into the token budget and generate the answer.
+
+        Without history the result depends only on the query, k and the index, so it can be shared.
+        """
+        available_context_tokens = max(256, self.model_max_tokens - self.reserved_response_tokens)
+        query_tokens = self._estimate_tokens(query)
+
+        retrieved_context = ""
+        with time_stage("packing") as packing_span:
+            while True:
+                selection = self.select_chunks(query, k, decision)
+                retrieved_context = "\n\n".join(selection.chunks)
+                tokens_total = (
+                    self._estimate_tokens(conversation_context)
+                    + self._estimate_tokens(retrieved_context)
+                    + query_tokens
+                )
+
+                if tokens_total <= available_context_tokens:
+                    break
+
+                if include_history:
+                    try:
+                        self.conversation_manager.ensure_summary_limit(session_id, self.llm, max_summary_tokens=500)
+                        conversation_context = self.conversation_manager.get_conversation_context(session_id, llm=None)
+                        tokens_total = (
+                            self._estimate_tokens(conversation_context)
+                            + self._estimate_tokens(retrieved_context)
+                            + query_tokens
+                        )
+                        if tokens_total <= available_context_tokens:
+                            break
+                    except Exception:
+                        pass
+
+                if k > self.min_k:
+                    k = max(self.min_k, k - 1)
+                    continue
+
+                allowed_tokens_for_retrieved = max(0, available_context_tokens - self._estimate_tokens(conversation_context) - query_tokens)
+                if allowed_tokens_for_retrieved <= 0:
+                    conv_chars_keep = max(0, (available_context_tokens // 2) * 4)
+                    conversation_context = (conversation_context[-conv_chars_keep:]) if conv_chars_keep > 0 else ""
+                    allowed_tokens_for_retrieved = max(0, available_context_tokens - self._estimate_tokens(conversation_context) - query_tokens)
+
+                char_limit = allowed_tokens_for_retrieved * 4
+                if char_limit < len(retrieved_context):
+                    retrieved_context = retrieved_context[:char_limit]
+                break
+            packing_span.set(used_k=k, retrieved_chars=len(retrieved_context))
+
+        logger.info(
+            "Context packed",
+            extra={
+                "session_id": session_id,
+                "conversation_chars": len(conversation_context),
+                "retrieved_chars": len(retrieved_context),
+                "used_k": k,
+            },
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Conversation context preview: %s", conversation_context[:1000])
+            logger.debug("Retrieved context preview: %s", retrieved_context[:1000])
+
+        response_text = self.generate_response(query, retrieved_context, conversation_context)
+
+        return {
+            "conversation_context": conversation_context,
+            "retrieved_context": retrieved_context,
+            "selection": selection,
+            "used_k": k,
+            "response_text": response_text,
+        }
+
+    def _chat(self, session_id: str, query: str, include_history: bool = True, evaluate: bool = False,
+              language: Optional[str] = None, capture: Optional[Dict] = None) -> Dict:
+        """Chat with turn-by-turn summarization and query rewriting for follow-ups.
+
+        `capture`, if given, receives the turn's query, contexts, answer and assistant message id.
+        """
+        # Everything below runs in English; only the returned response is translated back
+        query, language_info = self.localize_query(query, language)
+
+        conversation_context = self.conversation_manager.get_conversation_context(
+            session_id,
+            llm=self.llm if include_history else None
+        ) if include_history else ""
+        # A follow-up needs earlier turns to lean on, not just a request that allows them
+        decision = self.route_query(query, has_history=bool(conversation_context))
+
+        # Greetings and chit-chat skip retrieval entirely.
+        if decision.route == Route.GREETING:
+            logger.debug("Skipping retrieval for greeting: %r (session %s)", query[:120], session_id)
             response_text = self.generate_response(query, context="", conversation_context="")
+            response = self.localize_answer(response_text, language_info)
             debug = {
-                "conversation_context_preview": "",
-                "retrieved_context_preview": "",
                 "tokens_estimate": {
                     "conversation": 0,
                     "retrieved": 0,
@@ -180,123 +545,66 @@ Rewritten question:"""
                     "total_context_allowed": self.model_max_tokens - self.reserved_response_tokens
                 },
                 "used_k": 0,
-                "note": "retrieval_skipped_greeting"
+                "note": "retrieval_skipped_greeting",
+                "route": decision.route,
+                "language": language_info
             }
 
+            message_id = None
             try:
-                self.conversation_manager.messages.insert_one({
-                    "session_id": session_id,
-                    "sender": "user",
-                    "text": query,
-                    "created_at": __import__("datetime").datetime.utcnow(),
-                    "debug": {"note": "greeting_user_input"}
-                })
-                self.conversation_manager.messages.insert_one({
-                    "session_id": session_id,
-                    "sender": "assistant",
-                    "text": response_text,
-                    "created_at": __import__("datetime").datetime.utcnow(),
-                    "debug": debug
-                })
+                self.conversation_manager.add_message(session_id, "user", query)
+                message_id = self.conversation_manager.add_message(session_id, "assistant", response_text, debug=debug,
+                                                                   route=decision.route)
             except Exception:
                 pass
+            if capture is not None:
+                capture.update(query=query, response=response_text, message_id=message_id)
 
             evaluation = None
             if evaluate and self.evaluator:
                 try:
                     evaluation = self.evaluator.evaluate_conversation_turn(session_id, query, response_text, context="")
                 except Exception as e:
-                    print(f"Evaluation failed for greeting: {e}")
+                    logger.error("Evaluation failed for greeting: %s", e)
 
-            return {"response": response_text, "debug": debug, "evaluation": evaluation}
+            return {"response": response, "debug": debug, "evaluation": evaluation}
 
-        # Informational query - full RAG flow
-        desired_k = int(os.getenv("RETRIEVE_K", "5"))
+        # Informational query - RAG flow. Citation queries are served from the citation index in
+        # _search; only follow-ups pay for the LLM rewrite.
+        desired_k = int(os.getenv("RETRIEVE_K", self.retrieval_config["k"]))
         k = desired_k
 
-        conversation_context = self.conversation_manager.get_conversation_context(
-            session_id,
-            groq_client=self.groq_client if include_history else None
-        ) if include_history else ""
-
         original_query = query
-        if include_history and conversation_context:
+        if decision.route == Route.FOLLOW_UP and conversation_context:
             query = self.rewrite_query_with_context(query, conversation_context)
 
         available_context_tokens = max(256, self.model_max_tokens - self.reserved_response_tokens)
         query_tokens = self._estimate_tokens(query)
 
-        retrieved_context = ""
-        while True:
-            retrieved_context = self.retrieve_context(query, k)
-            tokens_total = (
-                self._estimate_tokens(conversation_context)
-                + self._estimate_tokens(retrieved_context)
-                + query_tokens
-            )
-
-            if tokens_total <= available_context_tokens:
-                break
-
-            if include_history and self.groq_client:
-                try:
-                    self.conversation_manager.ensure_summary_limit(session_id, self.groq_client, max_summary_tokens=500)
-                    conversation_context = self.conversation_manager.get_conversation_context(session_id, groq_client=None)
-                    tokens_total = (
-                        self._estimate_tokens(conversation_context)
-                        + self._estimate_tokens(retrieved_context)
-                        + query_tokens
-                    )
-                    if tokens_total <= available_context_tokens:
-                        break
-                except Exception:
-                    pass
-
-            if k > self.min_k:
-                k = max(self.min_k, k - 1)
-                continue
-
-            allowed_tokens_for_retrieved = max(0, available_context_tokens - self._estimate_tokens(conversation_context) - query_tokens)
-            if allowed_tokens_for_retrieved <= 0:
-                conv_chars_keep = max(0, (available_context_tokens // 2) * 4)
-                conversation_context = (conversation_context[-conv_chars_keep:]) if conv_chars_keep > 0 else ""
-                allowed_tokens_for_retrieved = max(0, available_context_tokens - self._estimate_tokens(conversation_context) - query_tokens)
-
-            char_limit = allowed_tokens_for_retrieved * 4
-            if char_limit < len(retrieved_context):
-                retrieved_context = retrieved_context[:char_limit]
-            break
-
-        try:
-            print("\n" + "="*80)
-            print(f"DEBUG: SESSION_ID: {session_id}")
-            print("="*80)
-            print(f"DEBUG: Conversation context length: {len(conversation_context)} chars")
-            if conversation_context:
-                print("DEBUG: Conversation context preview:")
-                print(conversation_context[:1000])
-            print("-"*80)
-            print(f"DEBUG: Retrieved context length: {len(retrieved_context)} chars (using k={k})")
-            if retrieved_context:
-                print("DEBUG: Retrieved context preview:")
-                print(retrieved_context[:1000])
-            print("="*80 + "\n")
-        except Exception as e:
-            print(f"DEBUG: Failed to print debug context: {e}")
-
-        response_text = self.generate_response(query, retrieved_context, conversation_context)
-
-        try:
-            print("\n" + "="*80)
-            print(f"DEBUG: GENERATED RESPONSE (session {session_id}) - preview:")
-            print(response_text[:2000])
-            print("="*80 + "\n")
-        except Exception:
-            pass
-
+        # A rewritten query is classified again in _search; it may cite what the conversation did
+        routed = decision if query == original_query else None
+        coalesced = False
+        if include_history or self.single_flight is None:
+            answer = self._answer(session_id, query, k, conversation_context, include_history, routed)
+        else:
+            # Identical history-free queries in flight share one retrieval and generation;
+            # each request still persists and evaluates its own turn below
+            key = (normalize_query(query), self.index_version, k)
+            answer, coalesced = self.single_flight.do(key, self._answer, session_id, query, k, "", False, routed)
+            record_cache("chat_single_flight", coalesced)
+        conversation_context = answer["conversation_context"]
+        retrieved_context = answer["retrieved_context"]
+        selection = answer["selection"]
+        k = answer["used_k"]
+        response_text = answer["response_text"]
+
+        logger.debug("Generated response (session %s): %s", session_id, response_text[:2000])
+        response = self.localize_answer(response_text, language_info)
+
+        # The chunks are referenced, not copied: their text is in the index (see src/chunk_refs.py)
         debug = {
-            "conversation_context_preview": conversation_context[:1000],
-            "retrieved_context_preview": retrieved_context[:2000],
+            "retrieved_chunks": chunk_refs(selection),
+            "context_chars": {"conversation": len(conversation_context), "retrieved": len(retrieved_context)},
             "tokens_estimate": {
                 "conversation": self._estimate_tokens(conversation_context),
                 "retrieved": self._estimate_tokens(retrieved_context),
@@ -306,30 +614,27 @@ Rewritten question:"""
             "used_k": k,
             "query_rewritten": query != original_query,
             "original_query": original_query if original_query != query else None,
-            "rewritten_query": query if original_query != query else None
+            "rewritten_query": query if original_query != query else None,
+            "route": decision.route,
+            "coalesced": coalesced,
+            "language": language_info
         }
 
+        # Debug goes to message_debug, keyed by the assistant message; the user message carries none
         if include_history:
-            self.conversation_manager.add_exchange(
+            message_id = self.conversation_manager.add_exchange(
                 session_id, query, response_text,
                 debug={"assistant": debug},
-                groq_client=self.groq_client
+                llm=self.llm,
+                fields={"route": decision.route}
             )
         else:
-            self.conversation_manager.messages.insert_one({
-                "session_id": session_id,
-                "sender": "user",
-                "text": query,
-                "created_at": __import__("datetime").datetime.utcnow(),
-                "debug": {"retrieved_context_preview": retrieved_context[:500]}
-            })
-            self.conversation_manager.messages.insert_one({
-                "session_id": session_id,
-                "sender": "assistant",
-                "text": response_text,
-                "created_at": __import__("datetime").datetime.utcnow(),
-                "debug": debug
-            })
+            self.conversation_manager.add_message(session_id, "user", query)
+            message_id = self.conversation_manager.add_message(session_id, "assistant", response_text, debug=debug,
+                                                               route=decision.route)
+        if capture is not None:
+            capture.update(query=query, original_query=original_query, conversation_context=conversation_context,
+                           retrieved_context=retrieved_context, response=response_text, message_id=message_id)
 
         evaluation = None
         if evaluate and self.evaluator:
@@ -343,11 +648,11 @@ Rewritten question:"""
                 if evaluation and not isinstance(evaluation, dict):
                     evaluation = None
             except Exception as e:
-                print(f"Evaluation failed: {e}")
+                logger.error("Evaluation failed: %s", e)
                 evaluation = None
 
         return {
-            "response": response_text,
+            "response": response,
             "debug": debug,
             "evaluation": evaluation
         }
@@ -0,0 +1,142 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from .metrics import RERANK_OUTCOMES, record_cache, time_stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+def load_cross_encoder(model_name: str, max_length: int = 256):
+    """CrossEncoder scoring (query, chunk) pairs as probabilities in [0, 1]."""
+    import torch
+    from sentence_transformers import CrossEncoder
+
+    try:
+        return CrossEncoder(model_name, device="cpu", max_length=max_length, activation_fn=torch.nn.Sigmoid())
+    except TypeError:  # sentence-transformers < 4 (sigmoid is already the default for one label)
+        return CrossEncoder(model_name, device="cpu", max_length=max_length)
+
+
+class Reranker:
+    """Rescore the top fused candidates with a local cross-encoder, within a latency budget.
+
+    Pairs are scored in batches of RERANK_BATCH_SIZE and cached per (query, chunk). Before each
+    batch the expected cost (running per-pair average) is checked against RERANK_BUDGET_MS; if it
+    would overrun, the fused order is returned unchanged. Reranked results keep only chunks scoring
+    at least RERANK_MIN_SCORE (always at least one), so fewer, better chunks reach the prompt.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, top_n: Optional[int] = None, budget_ms: Optional[float] = None,
+                 batch_size: Optional[int] = None, min_score: Optional[float] = None, cache_size: Optional[int] = None):
+        self.model_name = model_name or os.getenv("RERANK_MODEL", DEFAULT_RERANK_MODEL)
+        self.top_n = top_n or int(os.getenv("RERANK_TOP_N", "20"))
+        self.budget_ms = budget_ms if budget_ms is not None else float(os.getenv("RERANK_BUDGET_MS", "200"))
+        self.batch_size = batch_size or int(os.getenv("RERANK_BATCH_SIZE", "8"))
+        self.min_score = min_score if min_score is not None else float(os.getenv("RERANK_MIN_SCORE", "0.1"))
+        self.max_length = int(os.getenv("RERANK_MAX_LENGTH", "256"))
+        self.cache_size = cache_size if cache_size is not None else int(os.getenv("RERANK_CACHE_SIZE", "4096"))
+        self._model = None
+        self._load_failed = False
+        self._load_lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, int], float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Seconds per scored pair (moving average), so the budget can stop before a batch overruns it
+        self._pair_cost: Optional[float] = None
+
+    @property
+    def model(self):
+        return self._model if self._model is not None else self.load()
+
+    def load(self):
+        """Load the cross-encoder once; None (and the fused order from then on) if it cannot be loaded."""
+        if self._model is None and not self._load_failed:
+            with self._load_lock:
+                if self._model is None and not self._load_failed:
+                    start = time.perf_counter()
+                    try:
+                        self._model = load_cross_encoder(self.model_name, self.max_length)
+                        logger.info("Loaded reranker %s in %.1fs", self.model_name, time.perf_counter() - start)
+                    except Exception as e:
+                        # Retrieval keeps working on the fused order
+                        logger.warning("Reranker %s unavailable, serving fused order: %s", self.model_name, e)
+                        self._load_failed = True
+        return self._model
+
+    def warmup(self):
+        """Load the model and time one batch, which seeds the per-pair cost estimate."""
+        model = self.model
+        if model is not None:
+            start = time.perf_counter()
+            pairs = [("warmup query", "warmup passage " * 40)] * self.batch_size
+            model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            self._pair_cost = (time.perf_counter() - start) / len(pairs)
+
+    def _cache_get(self, key) -> Optional[float]:
+        with self._cache_lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _cache_put(self, key, score: float):
+        with self._cache_lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rerank(self, query: str, candidates: List[Tuple[str, float]], k: int) -> Tuple[List[Tuple[str, float]], bool]:
+        """Return (results, reranked); on budget overrun, errors or a missing model, (candidates[:k], False)."""
+        if not candidates or self.model is None:
+            if candidates:
+                RERANK_OUTCOMES.inc(outcome="unavailable")
+            return candidates[:k], False
+        candidates = candidates[:self.top_n]
+        deadline = time.perf_counter() + self.budget_ms / 1000.0
+        normalized = " ".join(query.lower().split())
+        keys = [(normalized, hash(doc)) for doc, _ in candidates]
+        with time_stage("rerank", candidates=len(candidates)) as stage:
+            scores = [self._cache_get(key) for key in keys]
+            pending = [i for i, score in enumerate(scores) if score is None]
+            for i in range(len(candidates)):
+                record_cache("rerank", scores[i] is not None)
+            for start in range(0, len(pending), self.batch_size):
+                batch = pending[start:start + self.batch_size]
+                now = time.perf_counter()
+                if self._pair_cost is not None and now + self._pair_cost * len(batch) > deadline:
+                    # Pairs scored so far stay cached, so a repeated query gets further next time
+                    stage.set(outcome="budget_exceeded", scored=start)
+                    RERANK_OUTCOMES.inc(outcome="budget_exceeded")
+                    return candidates[:k], False
+                try:
+                    batch_scores = self._model.predict([(query, candidates[i][0]) for i in batch],
+                                                       batch_size=len(batch), show_progress_bar=False)
+                except Exception as e:
+                    logger.warning("Reranking failed, serving fused order: %s", e)
+                    RERANK_OUTCOMES.inc(outcome="error")
+                    return candidates[:k], False
+                cost = (time.perf_counter() - now) / len(batch)
+                self._pair_cost = cost if self._pair_cost is None else 0.8 * self._pair_cost + 0.2 * cost
+                for i, score in zip(batch, batch_scores):
+                    scores[i] = float(score)
+                    self._cache_put(keys[i], scores[i])
+            # Stable sort: ties keep the fused order
+            order = sorted(range(len(candidates)), key=lambda i: -scores[i])[:k]
+            results = [(candidates[i][0], scores[i]) for i in order]
+            kept = [r for r in results if r[1] >= self.min_score] or results[:1]
+            stage.set(outcome="reranked", scored=len(pending), kept=len(kept))
+        RERANK_OUTCOMES.inc(outcome="reranked")
+        return kept, True
+
+
+def reranker_from_env() -> Optional[Reranker]:
+    """A Reranker when RERANK_ENABLED=1, else None (retrieval returns the fused order)."""
+    if os.getenv("RERANK_ENABLED", "0") != "1":
+        return None
+    return Reranker()
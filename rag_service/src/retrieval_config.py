@@ -0,0 +1,66 @@
+import json
+import logging
+import os
+from typing import Dict, Optional
+
+from .fusion import FUSION_MODES, FUSION_THRESHOLDS
+
+logger = logging.getLogger(__name__)
+
+# Values used before any tuning; a sweep (benchmarks/sweep.py) writes a file overriding them
+DEFAULT_RETRIEVAL_CONFIG = {
+    "k": 5,                      # chunks packed into the prompt (RETRIEVE_K env still wins)
+    "alpha": 0.9,                # weight of the vector ranking in fusion (BM25 weight is 1.0)
+    "rrf_k": 60,                 # Reciprocal Rank Fusion constant
+    "candidate_multiplier": 3,   # each retriever contributes k * multiplier candidates
+    "nprobe": None,              # IVF lists probed per query; None = value persisted with the index
+    "ef_search": None,           # HNSW efSearch; None = value persisted with the index
+    "fusion": "rrf",             # rrf | minmax | zscore | dynamic (src/fusion.py); RETRIEVAL_FUSION env wins
+    "fusion_threshold": None,    # lowest fused score prompted; None = FUSION_THRESHOLDS of the mode
+    "vector_min_score": 0.2,     # lowest similarity prompted when there is no BM25 index
+    "min_chunks": 1,             # chunks kept even when none reaches the threshold
+}
+
+# Keys whose None default stands for a float rather than an int
+FLOAT_KEYS = ("fusion_threshold",)
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "retrieval_config.json")
+
+
+def load_retrieval_config(path: Optional[str] = None) -> Dict:
+    """Merge a recommended config file (RETRIEVAL_CONFIG env or rag_service/retrieval_config.json) over the defaults."""
+    config = dict(DEFAULT_RETRIEVAL_CONFIG)
+    path = path or os.getenv("RETRIEVAL_CONFIG") or DEFAULT_CONFIG_PATH
+    if not os.path.exists(path):
+        return resolve_fusion(config)
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        logger.warning("Ignoring unreadable retrieval config %s: %s", path, e)
+        return resolve_fusion(config)
+    params = data.get("params", data)
+    for key, default in DEFAULT_RETRIEVAL_CONFIG.items():
+        if key in params:
+            try:
+                value = params[key]
+                cast = float if key in FLOAT_KEYS else (int if default is None else type(default))
+                config[key] = None if value is None else cast(value)
+            except (TypeError, ValueError):
+                logger.warning("Ignoring invalid %s=%r in %s", key, params[key], path)
+    logger.info("Loaded retrieval config from %s: %s", path, config)
+    return resolve_fusion(config)
+
+
+def resolve_fusion(config: Dict) -> Dict:
+    """Apply RETRIEVAL_FUSION and fill in the threshold of the fusion mode; unknown modes fall back to rrf."""
+    mode = os.getenv("RETRIEVAL_FUSION") or config["fusion"]
+    if mode not in FUSION_MODES:
+        logger.warning("Unknown fusion mode %r (expected one of %s); using %s",
+                       mode, ", ".join(FUSION_MODES), DEFAULT_RETRIEVAL_CONFIG["fusion"])
+        mode = DEFAULT_RETRIEVAL_CONFIG["fusion"]
+    if mode != config["fusion"] or config["fusion_threshold"] is None:
+        # A threshold in the file was calibrated for the file's mode
+        config["fusion_threshold"] = FUSION_THRESHOLDS[mode]
+    config["fusion"] = mode
+    return config
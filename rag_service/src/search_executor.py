@@ -0,0 +1,85 @@
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, TypeVar
+
+from .metrics import SEARCH_QUEUE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # not Linux
+        return os.cpu_count() or 1
+
+
+def thread_budget(workers: Optional[int] = None, embedding_threads: Optional[int] = None,
+                  faiss_threads: Optional[int] = None) -> Dict[str, int]:
+    """Concurrent searches and the torch/FAISS threads each may use, sized so workers x threads ~ CPUs.
+
+    SEARCH_CONCURRENCY (default min(4, CPUs); 0 runs searches inline on the request thread),
+    EMBEDDING_THREADS (default CPUs / SEARCH_CONCURRENCY) and FAISS_THREADS (default 1: a
+    single-query search gains little from OpenMP and N of them would spawn N full thread teams).
+    """
+    cpus = available_cpus()
+    if workers is None:
+        workers = int(os.getenv("SEARCH_CONCURRENCY", str(min(4, cpus))))
+    if embedding_threads is None:
+        embedding_threads = int(os.getenv("EMBEDDING_THREADS", "0")) or max(1, cpus // max(1, workers))
+    if faiss_threads is None:
+        faiss_threads = int(os.getenv("FAISS_THREADS", "1"))
+    return {"workers": max(0, workers), "embedding_threads": max(1, embedding_threads), "faiss_threads": max(1, faiss_threads)}
+
+
+class SearchExecutor:
+    """Runs retrievals (query embedding, FAISS, BM25) on a fixed pool with pinned thread budgets.
+
+    FastAPI's threadpool admits ~40 concurrent requests; without a bound each would start its own
+    OpenMP/torch thread team and oversubscribe the CPU. Excess requests queue here instead
+    (rag_search_queue_seconds). Context variables (the active trace) are carried into the worker.
+    """
+
+    def __init__(self, workers: Optional[int] = None, embedding_threads: Optional[int] = None,
+                 faiss_threads: Optional[int] = None):
+        self.budget = thread_budget(workers, embedding_threads, faiss_threads)
+        self._pool = None
+        if self.budget["workers"]:
+            self._pool = ThreadPoolExecutor(max_workers=self.budget["workers"], thread_name_prefix="search")
+        # OpenMP thread counts are per calling thread, so each worker pins its own once the library is loaded
+        self._pinned = threading.local()
+        logger.info("Search executor: %s", self.budget)
+
+    def _pin_thread(self):
+        local = self._pinned
+        if not getattr(local, "faiss", False) and "faiss" in sys.modules:
+            sys.modules["faiss"].omp_set_num_threads(self.budget["faiss_threads"])
+            local.faiss = True
+        # torch is imported lazily with the embedding model
+        if not getattr(local, "torch", False) and "torch" in sys.modules:
+            sys.modules["torch"].set_num_threads(self.budget["embedding_threads"])
+            local.torch = True
+
+    def run(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Call `fn` on a search worker and wait for its result (inline when the executor is disabled)."""
+        if self._pool is None:
+            return fn(*args, **kwargs)
+        submitted = time.perf_counter()
+
+        def task():
+            SEARCH_QUEUE_SECONDS.observe(time.perf_counter() - submitted)
+            self._pin_thread()
+            return fn(*args, **kwargs)
+
+        return self._pool.submit(contextvars.copy_context().run, task).result()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
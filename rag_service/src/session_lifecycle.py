@@ -0,0 +1,242 @@
+"""Chat data lifecycle: TTL indexes on the hot collections, archival of idle sessions and bulk deletes.
+
+Retention is set in days by SESSION_RETENTION_DAYS (TTL on the hot collections) and
+SESSION_ARCHIVE_AFTER_DAYS (idle time before archive_sessions.py moves a session into
+session_archive, whose own TTL is SESSION_ARCHIVE_RETENTION_DAYS); 0 keeps data forever.
+
+Every hot document expires on its own last_active_at: when it was written, or when restore()
+brought its session back. Time spent in the archive does not count towards SESSION_RETENTION_DAYS,
+so a restored session has its full retention again; while archived, it only lives
+SESSION_ARCHIVE_RETENTION_DAYS past archival.
+"""
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import bson
+
+logger = logging.getLogger(__name__)
+
+DAY_S = 86400
+# Hot collection -> field its TTL index counts from
+TTL_FIELDS = {
+    "sessions": "last_active_at",
+    "messages": "last_active_at",
+    "message_debug": "last_active_at",
+    "conversation_summaries": "last_active_at",
+}
+# Fields the TTL indexes counted from before restore() could refresh them
+LEGACY_TTL_FIELDS = {
+    "messages": "created_at",
+    "message_debug": "created_at",
+    "conversation_summaries": "updated_at",
+}
+ARCHIVE_FORMAT = "bson+zlib"
+
+
+def env_days(name: str, default: str = "0") -> float:
+    return float(os.getenv(name, default))
+
+
+def ensure_ttl_index(collection, field: str, seconds: float):
+    """A TTL index on `field` expiring documents `seconds` after it; 0 drops it.
+
+    A changed retention is applied to the existing index in place (collMod) rather than by rebuilding it.
+    """
+    name = f"{field}_ttl"
+    if not seconds:
+        try:
+            collection.drop_index(name)
+        except Exception:
+            pass
+        return
+    try:
+        collection.create_index(field, expireAfterSeconds=int(seconds), name=name)
+    except Exception as e:
+        # IndexOptionsConflict / IndexKeySpecsConflict: same index, other expireAfterSeconds
+        if getattr(e, "code", None) not in (85, 86):
+            raise
+        collection.database.command("collMod", collection.name, index={"name": name, "expireAfterSeconds": int(seconds)})
+
+
+def move_ttl_index(collection, field: str, legacy_field: str, seconds: float):
+    """ensure_ttl_index on `field`, replacing a TTL index on `legacy_field`.
+
+    Documents written before `field` existed get it from `legacy_field`, so they keep expiring.
+    """
+    try:
+        collection.drop_index(f"{legacy_field}_ttl")
+    except Exception:
+        pass
+    if seconds:
+        collection.update_many({field: {"$exists": False}}, [{"$set": {field: f"${legacy_field}"}}])
+    ensure_ttl_index(collection, field, seconds)
+
+
+def delete_sessions(collections: Iterable, session_ids: List[str], chunk: int = 500) -> Dict[str, int]:
+    """Delete every document of `session_ids` from `collections`: one delete_many per collection per chunk."""
+    deleted: Dict[str, int] = {}
+    for start in range(0, len(session_ids), chunk):
+        ids = session_ids[start:start + chunk]
+        for coll in collections:
+            n = coll.delete_many({"session_id": {"$in": ids}}).deleted_count
+            deleted[coll.name] = deleted.get(coll.name, 0) + n
+    return deleted
+
+
+class SessionArchiver:
+    """Moves sessions idle for `archive_after_days` out of the hot collections into session_archive.
+
+    Each session becomes one document: its session, messages, debug and summary documents as BSON,
+    zlib-compressed, plus the counts and time range needed to list it without decompressing. The
+    archive is written before the hot documents are deleted, and only the documents it holds are
+    deleted, so an interrupted run only leaves work for the next one and a session that wakes up
+    in between loses nothing. restore() puts a session back when it is used again.
+    """
+
+    def __init__(self, db, archive_after_days: Optional[float] = None, archive_retention_days: Optional[float] = None):
+        self.archive_after_days = archive_after_days if archive_after_days is not None else env_days("SESSION_ARCHIVE_AFTER_DAYS")
+        self.hot = {name: db.get_collection(name) for name in TTL_FIELDS}
+        self.archive = db.get_collection("session_archive")
+        try:
+            self.archive.create_index("session_id", unique=True)
+            retention = archive_retention_days if archive_retention_days is not None else env_days("SESSION_ARCHIVE_RETENTION_DAYS")
+            ensure_ttl_index(self.archive, "archived_at", retention * DAY_S)
+        except Exception:
+            logger.warning("Could not create session_archive indexes", exc_info=True)
+
+    def cutoff(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        if not self.archive_after_days:
+            return None
+        return (now or datetime.utcnow()) - timedelta(days=self.archive_after_days)
+
+    def cold_sessions(self, cutoff: datetime, limit: Optional[int] = None) -> Iterator[str]:
+        """Sessions last active before `cutoff`; those without last_active_at go by created_at."""
+        flt = {"$or": [{"last_active_at": {"$lt": cutoff}},
+                       {"last_active_at": {"$exists": False}, "created_at": {"$lt": cutoff}}]}
+        cursor = self.hot["sessions"].find(flt, {"session_id": 1})
+        if limit:
+            cursor = cursor.limit(limit)
+        for doc in cursor:
+            yield doc["session_id"]
+
+    def _payload(self, session_id: str, cutoff: datetime) -> Optional[Dict]:
+        """The session's hot documents, or None if it has a message since `cutoff`."""
+        messages = list(self.hot["messages"].find({"session_id": session_id}).sort("created_at", 1))
+        # last_active_at is only bumped every few minutes, and legacy sessions have none
+        if messages and messages[-1]["created_at"] >= cutoff:
+            self.hot["sessions"].update_one({"session_id": session_id},
+                                            {"$set": {"last_active_at": messages[-1]["created_at"]}})
+            return None
+        return {
+            "session": self.hot["sessions"].find_one({"session_id": session_id}),
+            "messages": messages,
+            "debug": list(self.hot["message_debug"].find({"session_id": session_id})),
+            "summary": self.hot["conversation_summaries"].find_one({"session_id": session_id}),
+        }
+
+    def _archive_doc(self, session_id: str, payload: Dict, now: datetime) -> Dict:
+        messages = payload["messages"]
+        raw = bson.encode(payload)
+        data = zlib.compress(raw, 6)
+        return {
+            "session_id": session_id,
+            "archived_at": now,
+            "first_at": messages[0]["created_at"] if messages else None,
+            "last_at": messages[-1]["created_at"] if messages else None,
+            "message_count": len(messages),
+            "raw_bytes": len(raw),
+            "stored_bytes": len(data),
+            "format": ARCHIVE_FORMAT,
+            "data": data,
+        }
+
+    def _delete_archived(self, session_id: str, payload: Dict, now: datetime) -> bool:
+        """Delete the hot documents `payload` holds; False if the session woke up meanwhile.
+
+        Messages and debug go by _id, so anything written after the snapshot stays. The session
+        document goes only if its last_active_at is still the archived one (a new user message bumps
+        it); otherwise the archive is restored at once, next to the new messages.
+        """
+        for name, docs in (("messages", payload["messages"]), ("message_debug", payload["debug"])):
+            if docs:
+                self.hot[name].delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+        session = payload["session"]
+        if session is not None:
+            flt = {"_id": session["_id"]}
+            if "last_active_at" in session:
+                flt["last_active_at"] = session["last_active_at"]
+            else:
+                flt["last_active_at"] = {"$exists": False}
+            if not self.hot["sessions"].delete_one(flt).deleted_count:
+                self.restore(session_id, now)
+                return False
+        summary = payload["summary"]
+        if summary is not None:
+            self.hot["conversation_summaries"].delete_one({"_id": summary["_id"], "updated_at": summary.get("updated_at")})
+        return True
+
+    def run(self, limit: Optional[int] = None, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Archive up to `limit` cold sessions, one at a time; returns counts and byte totals."""
+        now = now or datetime.utcnow()
+        counts = {"archived": 0, "still_active": 0, "messages": 0, "raw_bytes": 0, "stored_bytes": 0}
+        cutoff = self.cutoff(now)
+        if cutoff is None:
+            return counts
+        for session_id in self.cold_sessions(cutoff, limit):
+            payload = self._payload(session_id, cutoff)
+            if payload is None:
+                counts["still_active"] += 1
+                continue
+            doc = self._archive_doc(session_id, payload, now)
+            self.archive.update_one({"session_id": session_id}, {"$set": doc}, upsert=True)
+            if not self._delete_archived(session_id, payload, now):
+                counts["still_active"] += 1
+                continue
+            counts["archived"] += 1
+            counts["messages"] += doc["message_count"]
+            counts["raw_bytes"] += doc["raw_bytes"]
+            counts["stored_bytes"] += doc["stored_bytes"]
+        logger.info("Archived %d sessions (%d messages, %d -> %d bytes); %d were active again",
+                    counts["archived"], counts["messages"], counts["raw_bytes"], counts["stored_bytes"],
+                    counts["still_active"])
+        return counts
+
+    def load(self, session_id: str) -> Optional[Dict]:
+        """The archived session's documents ({session, messages, debug, summary}), or None."""
+        doc = self.archive.find_one({"session_id": session_id})
+        if doc is None:
+            return None
+        if doc.get("format") != ARCHIVE_FORMAT:
+            raise ValueError(f"Unknown archive format {doc.get('format')!r} for session {session_id}")
+        return bson.decode(zlib.decompress(doc["data"]))
+
+    def restore(self, session_id: str, now: Optional[datetime] = None) -> bool:
+        """Move an archived session back into the hot collections; False if it is not archived."""
+        payload = self.load(session_id)
+        if payload is None:
+            return False
+        now = now or datetime.utcnow()
+        session = dict(payload.get("session") or {"session_id": session_id, "created_at": now})
+        session.pop("_id", None)
+        session["last_active_at"] = now
+        self.hot["sessions"].update_one({"session_id": session_id}, {"$set": session}, upsert=True)
+        for name, docs in (("messages", payload["messages"]), ("message_debug", payload["debug"])):
+            # Retention restarts now; the original created_at would have the TTL monitor delete them at once
+            docs = [dict(d, last_active_at=now) for d in docs]
+            if docs:
+                try:
+                    self.hot[name].insert_many(docs, ordered=False)
+                except Exception as e:
+                    # Documents left behind by an interrupted archive run are already there
+                    if type(e).__name__ != "BulkWriteError":
+                        raise
+        if payload.get("summary"):
+            summary = dict({k: v for k, v in payload["summary"].items() if k != "_id"}, last_active_at=now)
+            # A summary written since the archive (the session woke up mid-run) is newer; keep it
+            self.hot["conversation_summaries"].update_one({"session_id": session_id}, {"$setOnInsert": summary}, upsert=True)
+        self.archive.delete_one({"session_id": session_id})
+        logger.info("Restored archived session %s (%d messages)", session_id, len(payload["messages"]))
+        return True
@@ -0,0 +1,61 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from .metrics import STARTUP_SECONDS, SERVICE_READY
+
+logger = logging.getLogger(__name__)
+
+# Set when this module is first imported, i.e. early in `main` before any heavy import
+PROCESS_START = time.time()
+
+
+class StartupState:
+    """Phase and per-stage timings of the background startup, reported by /health.
+
+    Phases: starting -> loading -> ready | failed. Liveness only needs the process to answer;
+    readiness needs the pipeline initialized and the embedding model loaded.
+    """
+
+    def __init__(self):
+        self.phase = "starting"
+        self.error: Optional[str] = None
+        self.stages: Dict[str, float] = {}
+        self.ready_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] = round(elapsed, 3)
+            STARTUP_SECONDS.set(elapsed, stage=name)
+            logger.info("Startup stage %s took %.2fs", name, elapsed)
+
+    def set_phase(self, phase: str, error: Optional[str] = None):
+        with self._lock:
+            self.phase = phase
+            self.error = error
+            if phase == "ready":
+                self.ready_at = time.time()
+        SERVICE_READY.set(1.0 if phase == "ready" else 0.0)
+
+    @property
+    def ready(self) -> bool:
+        return self.phase == "ready"
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            out = {"phase": self.phase, "stages": dict(self.stages),
+                   "uptime_s": round(time.time() - PROCESS_START, 3)}
+            if self.ready_at is not None:
+                out["time_to_ready_s"] = round(self.ready_at - PROCESS_START, 3)
+            if self.error:
+                out["error"] = self.error
+        return out
@@ -0,0 +1,132 @@
+import logging
+import os
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Expanded at index and query time, so "IPC" in a query matches "Indian Penal Code" in the text
+LEGAL_ABBREVIATIONS: Dict[str, Tuple[str, ...]] = {
+    "ipc": ("indian", "penal", "code"),
+    "crpc": ("code", "criminal", "procedure"),
+    "cpc": ("code", "civil", "procedure"),
+    "coi": ("constitution", "india"),
+    "udhr": ("universal", "declaration", "human", "rights"),
+    "fir": ("first", "information", "report"),
+    "pil": ("public", "interest", "litigation"),
+    "art": ("article",),
+    "arts": ("articles",),
+    "sec": ("section",),
+    "secs": ("sections",),
+}
+
+ENGLISH_STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has have
+having he her here hers herself him himself his how i if in into is it its itself just me more most
+my myself of off on once only other our ours ourselves out over own same she should so some such
+than that the their theirs them themselves then there these they this those through to too under
+until up very was we were what when where which while who whom why will with would you your yours
+yourself yourselves
+""".split())
+# "no", "not" and "nor" are kept: "No person shall ..." and "shall not" carry the meaning of a provision
+
+HINDI_STOPWORDS = frozenset("""
+का के की को में से पर है हैं था थे थी और या एक यह वह ये वे इस उस इन उन भी तो ही जो कि
+लिए तक साथ द्वारा किया किए कर करने करता करती होता होती हो गया गई रहा रही क्या कौन कैसे
+""".split())
+
+_DEVANAGARI_DIGIT = re.compile("[०-९]")
+# Word characters: Latin letters and digits, and the Devanagari block without the danda (।, ॥)
+_TOKEN = re.compile(r"[0-9a-zÀ-ɏऀ-ॣ०-ॿ]+")
+_DOTTED = re.compile(r"(?<![a-z.])((?:cr\.)?[a-z]\.[a-z]\.(?:[a-z]\.)*)")
+_UNDER_SECTION = re.compile(r"(?<![a-z])u\s?/\s?s\b\.?")
+
+
+def light_stem(token: str) -> str:
+    """Plural and -ing/-ed stripping for Latin tokens ("offences" -> "offence", "punished" -> "punish")."""
+    if len(token) <= 4 or not (token.isascii() and token.isalpha()):
+        return token
+    if token.endswith("ies"):
+        return token[:-3] + "y"
+    if token.endswith(("sses", "xes", "zes", "ches", "shes")):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    for suffix in ("ing", "ed"):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 4:
+            return token[:-len(suffix)]
+    return token
+
+
+class Analyzer:
+    """Turns text into BM25 terms; HybridRetriever runs the same instance over chunks and queries."""
+
+    name = "base"
+
+    def analyze(self, text: str) -> List[str]:
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        return self.name
+
+
+class WhitespaceAnalyzer(Analyzer):
+    """The original tokenizer: lowercase, split on whitespace, drop one-character tokens."""
+
+    name = "whitespace"
+
+    def analyze(self, text: str) -> List[str]:
+        return [t for t in (text or "").lower().split() if len(t) > 1]
+
+
+class LegalAnalyzer(Analyzer):
+    """Unicode normalization, punctuation stripping, legal abbreviation expansion, stopwords, optional stemming.
+
+    NFKC plus casefold, so ligatures and full-width forms collapse; Devanagari digits become ASCII
+    and chandrabindu becomes anusvara. "liberty." and "liberty" are one term, numbers such as "21"
+    and "21a" are kept whole, and dotted forms ("I.P.C.", "Cr.P.C.", "u/s") are joined before
+    abbreviations expand.
+    """
+
+    name = "legal"
+
+    def __init__(self, stopwords: bool = True, stemming: bool = False, abbreviations: bool = True):
+        self.stopwords = (ENGLISH_STOPWORDS | HINDI_STOPWORDS) if stopwords else frozenset()
+        self.stemming = stemming
+        self.abbreviations = LEGAL_ABBREVIATIONS if abbreviations else {}
+
+    def describe(self) -> str:
+        options = [o for o, on in (("stopwords", self.stopwords), ("abbreviations", self.abbreviations),
+                                   ("stemming", self.stemming)) if on]
+        return f"{self.name}({','.join(options)})"
+
+    def analyze(self, text: str) -> List[str]:
+        text = unicodedata.normalize("NFKC", text or "").casefold()
+        if not text.isascii():
+            text = _DEVANAGARI_DIGIT.sub(lambda m: str(ord(m.group()) - ord("०")), text).replace("ँ", "ं")
+        if self.abbreviations:
+            text = _UNDER_SECTION.sub(" section ", text)
+            text = _DOTTED.sub(lambda m: m.group(1).replace(".", "") + " ", text)
+        words = _TOKEN.findall(text)
+        if self.abbreviations and not self.abbreviations.keys().isdisjoint(words):
+            words = [term for word in words for term in self.abbreviations.get(word, (word,))]
+        stopwords = self.stopwords
+        terms = [w for w in words if w not in stopwords and (len(w) > 1 or w.isdigit())]
+        return [light_stem(t) for t in terms] if self.stemming else terms
+
+
+ANALYZERS = {"whitespace": WhitespaceAnalyzer, "legal": LegalAnalyzer}
+
+
+def analyzer_from_env(name: Optional[str] = None) -> Analyzer:
+    """BM25_ANALYZER (legal | whitespace), with ANALYZER_STOPWORDS / ANALYZER_STEMMING for the legal one."""
+    name = name or os.getenv("BM25_ANALYZER", "legal")
+    if name not in ANALYZERS:
+        logger.warning("Unknown BM25_ANALYZER %r, using legal", name)
+        name = "legal"
+    if name == "legal":
+        return LegalAnalyzer(stopwords=os.getenv("ANALYZER_STOPWORDS", "1") == "1",
+                             stemming=os.getenv("ANALYZER_STEMMING", "0") == "1")
+    return ANALYZERS[name]()
@@ -0,0 +1,96 @@
+"""Sampled full chat traces, compressed, in their own collection (`chat_traces`).
+
+Message debug only references the retrieved chunks (src/chunk_refs.py). For a sample of turns
+(TRACE_SAMPLE_RATE, 0-1) the whole turn is kept here instead: query, rewritten query, the
+conversation and retrieved context exactly as prompted, the answer, debug and span timings.
+Each trace is one JSON document compressed with zstd (`zstandard`), or zlib where it is not
+installed, keyed by the assistant message id. TRACE_RETENTION_DAYS sets a TTL (0 = keep).
+"""
+import json
+import logging
+import os
+import random
+import zlib
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from .session_lifecycle import DAY_S, ensure_ttl_index
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+TRACES_COLLECTION = "chat_traces"
+
+
+def _codecs(level: int) -> Dict[str, tuple]:
+    codecs = {"zlib": (lambda raw: zlib.compress(raw, 6), zlib.decompress)}
+    if zstandard is not None:
+        # One (de)compressor per call: they are not safe to share between request threads
+        codecs["zstd"] = (lambda raw: zstandard.ZstdCompressor(level=level).compress(raw),
+                          lambda data: zstandard.ZstdDecompressor().decompress(data))
+    return codecs
+
+
+class TraceStore:
+    def __init__(self, collection: Callable, sample_rate: float = 0.0, retention_days: float = 0.0,
+                 codec: str = "zstd", level: int = 6):
+        # A factory, so pre-forked workers use their own client (ConversationManager.connect)
+        self._collection = collection
+        self.sample_rate = sample_rate
+        self.retention_days = retention_days
+        self.codecs = _codecs(level)
+        if codec not in self.codecs:
+            logger.warning("Trace codec %r unavailable (pip install zstandard); using zlib", codec)
+            codec = "zlib"
+        self.codec = codec
+        self._indexed = False
+
+    @classmethod
+    def from_env(cls, collection: Callable) -> "TraceStore":
+        return cls(
+            collection,
+            sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "0")),
+            retention_days=float(os.getenv("TRACE_RETENTION_DAYS", "30")),
+            codec=os.getenv("TRACE_CODEC", "zstd"),
+            level=int(os.getenv("TRACE_ZSTD_LEVEL", "6")),
+        )
+
+    def sample(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _traces(self):
+        coll = self._collection()
+        if not self._indexed:
+            coll.create_index("session_id")
+            ensure_ttl_index(coll, "created_at", self.retention_days * DAY_S)
+            self._indexed = True
+        return coll
+
+    def encode(self, trace: Dict) -> Dict:
+        """The stored document for `trace` (without _id and session_id)."""
+        raw = json.dumps(trace, default=str, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        data = self.codecs[self.codec][0](raw)
+        return {"codec": self.codec, "raw_bytes": len(raw), "stored_bytes": len(data), "data": data}
+
+    def save(self, session_id: str, message_id, trace: Dict, created_at: Optional[datetime] = None):
+        """Store `trace` for the turn answered by `message_id`; errors are logged, never raised."""
+        try:
+            doc = {"_id": message_id, "session_id": session_id, "created_at": created_at or datetime.utcnow(),
+                   "trace_id": trace.get("trace_id")}
+            doc.update(self.encode(trace))
+            self._traces().insert_one(doc)
+        except Exception:
+            logger.warning("Could not store the trace of message %s", message_id, exc_info=True)
+
+    def load(self, message_id) -> Optional[Dict]:
+        doc = self._traces().find_one({"_id": message_id})
+        if doc is None:
+            return None
+        codec = self.codecs.get(doc.get("codec"))
+        if codec is None:
+            raise ValueError(f"Trace of message {message_id} uses codec {doc.get('codec')!r}, which is not available")
+        return json.loads(codec[1](doc["data"]))
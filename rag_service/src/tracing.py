@@ -0,0 +1,191 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start_ns", "end_ns", "attrs", "error")
+
+    def __init__(self, name: str, parent_id: Optional[int], span_id: int, attrs: Optional[Dict] = None):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns: Optional[int] = None
+        self.attrs = dict(attrs) if attrs else {}
+        self.error: Optional[str] = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.perf_counter_ns()
+        return (end - self.start_ns) / 1e6
+
+
+class _NoopSpan:
+    """Returned when no trace is active so call sites never need to branch."""
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    def __init__(self, name: str, attrs: Optional[Dict] = None):
+        self.trace_id = uuid.uuid4().hex
+        self.wall_start = time.time()
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.spans: List[Span] = []
+        self.root = self.new_span(name, None, attrs)
+
+    def new_span(self, name: str, parent_id: Optional[int], attrs: Optional[Dict] = None) -> Span:
+        with self._lock:
+            self._next_id += 1
+            s = Span(name, parent_id, self._next_id, attrs)
+            self.spans.append(s)
+        return s
+
+    def compact(self) -> List[Dict]:
+        """Span list with millisecond offsets relative to the root, suitable for the `debug` payload."""
+        origin = self.root.start_ns
+        out = []
+        for s in self.spans:
+            item = {
+                "name": s.name,
+                "id": s.span_id,
+                "parent": s.parent_id,
+                "start_ms": round((s.start_ns - origin) / 1e6, 3),
+                "dur_ms": round(s.duration_ms, 3),
+            }
+            if s.attrs:
+                item["attrs"] = s.attrs
+            if s.error:
+                item["error"] = s.error
+            out.append(item)
+        return out
+
+    def stage_totals(self) -> Dict[str, float]:
+        """Total milliseconds per span name (a stage can run several times, e.g. retrieval inside packing)."""
+        totals: Dict[str, float] = {}
+        for s in self.spans[1:]:
+            totals[s.name] = round(totals.get(s.name, 0.0) + s.duration_ms, 3)
+        return totals
+
+    def to_record(self) -> Dict:
+        """Absolute timestamps (epoch microseconds) so exported traces can be turned into flame graphs."""
+        origin_ns = self.root.start_ns
+        base_us = self.wall_start * 1e6
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "ts": self.wall_start,
+            "duration_ms": round(self.root.duration_ms, 3),
+            "spans": [
+                {
+                    "name": s.name,
+                    "id": s.span_id,
+                    "parent": s.parent_id,
+                    "start_us": int(base_us + (s.start_ns - origin_ns) / 1e3),
+                    "dur_us": int(s.duration_ms * 1e3),
+                    "attrs": s.attrs,
+                    "error": s.error,
+                }
+                for s in self.spans
+            ],
+        }
+
+
+class JsonlTraceExporter:
+    """Append one JSON line per finished trace; thread-safe within a process."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+
+    def export(self, trace: Trace):
+        line = json.dumps(trace.to_record(), default=str, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("rag_current_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("rag_current_span", default=None)
+_exporter: Optional[JsonlTraceExporter] = None
+if os.getenv("TRACE_EXPORT_PATH"):
+    _exporter = JsonlTraceExporter(os.getenv("TRACE_EXPORT_PATH"))
+
+
+def set_exporter(exporter: Optional[JsonlTraceExporter]):
+    global _exporter
+    _exporter = exporter
+
+
+def exporter_enabled() -> bool:
+    return _exporter is not None
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+
+@contextmanager
+def start_trace(name: str, **attrs):
+    """Start a new trace and make its root span current for this context (thread/task)."""
+    trace = Trace(name, attrs)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(trace.root)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.root.error = type(e).__name__
+        raise
+    finally:
+        trace.root.end_ns = time.perf_counter_ns()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        if _exporter is not None:
+            try:
+                _exporter.export(trace)
+            except Exception as e:
+                logger.warning("Trace export failed: %s", e)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Record a child span of the current span; a no-op when no trace is active."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield NOOP_SPAN
+        return
+    parent = _current_span.get()
+    s = trace.new_span(name, parent.span_id if parent else None, attrs)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = type(e).__name__
+        raise
+    finally:
+        s.end_ns = time.perf_counter_ns()
+        _current_span.reset(token)
@@ -1,66 +1,300 @@
-from transformers import MarianMTModel, MarianTokenizer
-from typing import Optional
-import langdetect
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .metrics import record_cache, time_stage
+
+logger = logging.getLogger(__name__)
+
+# (source, target) -> MarianMT checkpoint
+MODELS = {
+    ("en", "hi"): "Helsinki-NLP/opus-mt-en-hi",
+    ("hi", "en"): "Helsinki-NLP/opus-mt-hi-en",
+}
+LANGUAGES = ("en", "hi")
+
+# Sentence ends (Latin punctuation or the Devanagari danda) followed by whitespace, or line breaks
+_BOUNDARY = re.compile(r"(?<=[.!?।॥])\s+|\s*\n+\s*")
+# A period after these does not end a sentence ("Art. 21", "Sec. 302", "No. 5", a "3." list marker)
+_ABBREVIATIONS = re.compile(r"(?:\b(?:art|arts|sec|secs|s|no|nos|cl|ch|vs|v|dr|mr|mrs|ms|st|ltd|co|i\.e|e\.g|viz|etc)|\b[A-Z]|^\s*\d{1,2})\.$", re.IGNORECASE)
+
+
+def _langdetect():
+    """langdetect, imported on first use rather than with this module (main imports LANGUAGES)."""
+    import langdetect
+
+    # langdetect is randomized; a fixed seed gives the same answer for the same text in every worker
+    langdetect.DetectorFactory.seed = 0
+    return langdetect
+
+
+def load_marian(model_name: str, int8: bool = False):
+    """(tokenizer, model) for a MarianMT checkpoint; transformers is imported here, not at module import."""
+    import torch
+    from transformers import MarianMTModel, MarianTokenizer
+
+    tokenizer = MarianTokenizer.from_pretrained(model_name)
+    model = MarianMTModel.from_pretrained(model_name).eval()
+    if int8:
+        # Same dynamic quantization as the torch-int8 embedding backend
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return tokenizer, model
+
+
+def split_sentences(text: str) -> List[Tuple[str, str]]:
+    """(sentence, following whitespace) pairs; joining them gives back `text`."""
+    parts, last = [], 0
+    for match in _BOUNDARY.finditer(text):
+        sentence = text[last:match.start()]
+        if parts and _ABBREVIATIONS.search(parts[-1][0]) and "\n" not in parts[-1][1]:
+            prev, sep = parts.pop()
+            sentence = prev + sep + sentence
+        parts.append((sentence, match.group(0)))
+        last = match.end()
+    tail = text[last:]
+    if parts and _ABBREVIATIONS.search(parts[-1][0]) and "\n" not in parts[-1][1]:
+        prev, sep = parts.pop()
+        tail = prev + sep + tail
+    parts.append((tail, ""))
+    return [(s, sep) for s, sep in parts if s or sep]
+
 
 class TranslationService:
-    def __init__(self):
-        # Initialize models lazily when needed
-        self._en_hi_model = None
-        self._hi_en_model = None
-        self._en_hi_tokenizer = None
-        self._hi_en_tokenizer = None
-
-    def _load_en_hi(self):
-        if self._en_hi_model is None:
-            model_name = "Helsinki-NLP/opus-mt-en-hi"
-            self._en_hi_model = MarianMTModel.from_pretrained(model_name)
-            self._en_hi_tokenizer = MarianTokenizer.from_pretrained(model_name)
-
-    def _load_hi_en(self):
-        if self._hi_en_model is None:
-            model_name = "Helsinki-NLP/opus-mt-hi-en"
-            self._hi_en_model = MarianMTModel.from_pretrained(model_name)
-            self._hi_en_tokenizer = MarianTokenizer.from_pretrained(model_name)
+    """Hindi <-> English MarianMT translation.
+
+    Text is split into sentences (long ones further into pieces under TRANSLATION_MAX_TOKENS, so
+    nothing is truncated), unique uncached sentences are translated in length-sorted batches and
+    every sentence translation is kept in an LRU cache. Models load lazily, or up front via
+    preload() (TRANSLATION_PRELOAD=1 at startup). Generation runs at most TRANSLATION_CONCURRENCY
+    at a time with TRANSLATION_THREADS torch threads; TRANSLATION_INT8=1 quantizes the models.
+    """
+
+    def __init__(self, cache_size: Optional[int] = None, batch_size: Optional[int] = None,
+                 max_tokens: Optional[int] = None, int8: Optional[bool] = None, threads: Optional[int] = None):
+        self.cache_size = cache_size if cache_size is not None else int(os.getenv("TRANSLATION_CACHE_SIZE", "4096"))
+        self.batch_size = batch_size or int(os.getenv("TRANSLATION_BATCH_SIZE", "16"))
+        self.max_tokens = max_tokens or int(os.getenv("TRANSLATION_MAX_TOKENS", "400"))
+        self.int8 = int8 if int8 is not None else os.getenv("TRANSLATION_INT8", "0") == "1"
+        self.threads = threads if threads is not None else int(os.getenv("TRANSLATION_THREADS", "0"))
+        self.num_beams = int(os.getenv("TRANSLATION_NUM_BEAMS", "0")) or None
+        self._models: Dict[Tuple[str, str], Tuple[object, object]] = {}
+        self._load_lock = threading.Lock()
+        self.concurrency = int(os.getenv("TRANSLATION_CONCURRENCY", "1"))
+        self._generate_slots = threading.BoundedSemaphore(self.concurrency)
+        self._stream_pool: Optional[ThreadPoolExecutor] = None
+        self._pinned = threading.local()
+        self._cache: "OrderedDict[Tuple[str, str, str], str]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._detected: "OrderedDict[str, str]" = OrderedDict()
+
+    def _load(self, source: str, target: str):
+        key = (source, target)
+        if key not in self._models:
+            with self._load_lock:
+                if key not in self._models:
+                    start = time.perf_counter()
+                    self._models[key] = load_marian(MODELS[key], self.int8)
+                    logger.info("Loaded %s (int8=%s) in %.1fs", MODELS[key], self.int8, time.perf_counter() - start)
+        return self._models[key]
+
+    def preload(self, directions: Optional[List[Tuple[str, str]]] = None):
+        """Load the translation models now instead of on the first request that needs them."""
+        for source, target in directions or list(MODELS):
+            self._load(source, target)
+
+    def warmup(self):
+        """Load the models and run one short generation per direction."""
+        self.preload()
+        for source, target in MODELS:
+            self._generate(source, target, ["Warmup." if source == "en" else "नमस्ते।"])
 
     def detect_language(self, text: str) -> str:
-        """Detect language of text. Returns 'en' for English, 'hi' for Hindi."""
+        """Detect language of text. Returns 'en' for English, 'hi' for Hindi.
+
+        Mostly-Devanagari text is Hindi and Latin-only text English without running langdetect;
+        mixed text goes to langdetect, with results cached per text.
+        """
+        letters = [c for c in text if c.isalpha()]
+        if not letters:
+            return 'en'
+        devanagari = sum(1 for c in letters if '\u0900' <= c <= '\u097f')
+        if devanagari * 2 >= len(letters):
+            return 'hi'
+        if devanagari == 0 and all(c < '\u0250' for c in letters):
+            return 'en'
+        with self._cache_lock:
+            if text in self._detected:
+                self._detected.move_to_end(text)
+                return self._detected[text]
         try:
-            detected = langdetect.detect(text)
-            return 'hi' if detected == 'hi' else 'en'
-        except:
-            return 'en'  # Default to English on error
+            detected = 'hi' if _langdetect().detect(text) == 'hi' else 'en'
+        except Exception:
+            detected = 'en'  # Default to English on error
+        with self._cache_lock:
+            self._detected[text] = detected
+            while len(self._detected) > 1024:
+                self._detected.popitem(last=False)
+        return detected
 
     def translate_to_english(self, text: str) -> str:
         """Translate Hindi text to English."""
         if not text or self.detect_language(text) == 'en':
             return text
-        
-        self._load_hi_en()
-        inputs = self._hi_en_tokenizer(text, return_tensors="pt", padding=True, truncation=True)
-        translated = self._hi_en_model.generate(**inputs)
-        return self._hi_en_tokenizer.decode(translated[0], skip_special_tokens=True)
+        return self.translate_batch([text], "hi", "en")[0]
 
     def translate_to_hindi(self, text: str) -> str:
         """Translate English text to Hindi."""
         if not text or self.detect_language(text) == 'hi':
             return text
-            
-        self._load_en_hi()
-        inputs = self._en_hi_tokenizer(text, return_tensors="pt", padding=True, truncation=True)
-        translated = self._en_hi_model.generate(**inputs)
-        return self._en_hi_tokenizer.decode(translated[0], skip_special_tokens=True)
-
-    def translate(self, text: str, target_lang: str, force: bool = False) -> str:
-        """Translate text to target language if needed."""
+        return self.translate_batch([text], "en", "hi")[0]
+
+    def translate(self, text: str, target_lang: str, force: bool = False, source_lang: Optional[str] = None) -> str:
+        """Translate text to target language if needed (the language is detected once, unless given)."""
         if not text:
             return text
-            
-        current_lang = self.detect_language(text)
+
+        current_lang = source_lang or self.detect_language(text)
         if current_lang == target_lang and not force:
             return text
-            
-        if target_lang == 'hi':
-            return self.translate_to_hindi(text)
-        elif target_lang == 'en':
-            return self.translate_to_english(text)
-        return text  # Default case
\ No newline at end of file
+        source = "en" if target_lang == "hi" else "hi"
+        if (source, target_lang) not in MODELS:
+            return text  # Default case
+        return self.translate_batch([text], source, target_lang)[0]
+
+    def translate_batch(self, texts: List[str], source: str, target: str) -> List[str]:
+        """Translate several texts from `source` to `target` in shared batches, whitespace layout preserved."""
+        layouts = [split_sentences(t) if t else [] for t in texts]
+        pending = OrderedDict()
+        resolved: Dict[str, str] = {}
+        for layout in layouts:
+            for sentence, _ in layout:
+                if not sentence.strip() or sentence in resolved or sentence in pending:
+                    continue
+                cached = self._cache_get((source, target, sentence))
+                record_cache("translation", cached is not None)
+                if cached is None:
+                    pending[sentence] = None
+                else:
+                    resolved[sentence] = cached
+        if pending:
+            with time_stage("translation", direction=f"{source}-{target}", sentences=len(pending)):
+                translated = self._translate_sentences(list(pending), source, target)
+            for sentence, out in zip(pending, translated):
+                resolved[sentence] = out
+                self._cache_put((source, target, sentence), out)
+        return ["".join((resolved.get(s, s) if s.strip() else s) + sep for s, sep in layout) for layout in layouts]
+
+    def translate_stream(self, deltas: Iterable[str], source: str, target: str) -> Iterator[str]:
+        """Translate text as it streams in, yielding translated segments in order.
+
+        Complete sentences are translated on a background thread while more text arrives; whatever
+        completes while a batch is in flight goes out as the next batch. If a batch fails, its
+        source text is passed through.
+        """
+        if self._stream_pool is None:
+            with self._load_lock:
+                if self._stream_pool is None:
+                    self._stream_pool = ThreadPoolExecutor(max_workers=self.concurrency,
+                                                           thread_name_prefix="translate")
+        in_flight = deque()
+
+        def drain(block: bool) -> Iterator[str]:
+            while in_flight and (block or in_flight[0][1].done()):
+                text, future = in_flight.popleft()
+                try:
+                    yield future.result()[0]
+                except Exception as e:
+                    logger.warning("Streaming translation failed, passing text through: %s", e)
+                    yield text
+
+        buffer, ready = "", ""
+        for delta in deltas:
+            buffer += delta
+            parts = split_sentences(buffer)
+            if len(parts) > 1:
+                # The last sentence may still be growing (or be "Art." waiting for its number)
+                ready += "".join(sentence + sep for sentence, sep in parts[:-1])
+                buffer = "".join(parts[-1])
+            yield from drain(False)
+            if ready and not in_flight:
+                in_flight.append((ready, self._stream_pool.submit(
+                    contextvars.copy_context().run, self.translate_batch, [ready], source, target)))
+                ready = ""
+        ready += buffer
+        if ready:
+            in_flight.append((ready, self._stream_pool.submit(
+                contextvars.copy_context().run, self.translate_batch, [ready], source, target)))
+        yield from drain(True)
+
+    def _translate_sentences(self, sentences: List[str], source: str, target: str) -> List[str]:
+        tokenizer, _ = self._load(source, target)
+        # A sentence longer than the model's input window is translated in pieces and re-joined
+        pieces, owners = [], []
+        for i, sentence in enumerate(sentences):
+            for piece in self._fit(tokenizer, sentence):
+                pieces.append(piece)
+                owners.append(i)
+        outputs = [""] * len(pieces)
+        # Similar lengths per batch keep padding (and wasted decoder steps) low
+        order = sorted(range(len(pieces)), key=lambda i: len(pieces[i]))
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, out in zip(batch, self._generate(source, target, [pieces[i] for i in batch])):
+                outputs[i] = out
+        joined = [[] for _ in sentences]
+        for owner, out in zip(owners, outputs):
+            joined[owner].append(out)
+        return [" ".join(parts) for parts in joined]
+
+    def _fit(self, tokenizer, sentence: str) -> List[str]:
+        n_tokens = len(tokenizer.tokenize(sentence))
+        if n_tokens <= self.max_tokens:
+            return [sentence]
+        words = sentence.split()
+        if len(words) <= 1:
+            return [sentence]
+        # Split proportionally at word boundaries, then re-check each half
+        step = max(1, len(words) * self.max_tokens // n_tokens)
+        out = []
+        for i in range(0, len(words), step):
+            out.extend(self._fit(tokenizer, " ".join(words[i:i + step])))
+        return out
+
+    def _generate(self, source: str, target: str, batch: List[str]) -> List[str]:
+        import torch
+
+        tokenizer, model = self._load(source, target)
+        with self._generate_slots:
+            if self.threads and not getattr(self._pinned, "done", False):
+                torch.set_num_threads(self.threads)
+                self._pinned.done = True
+            inputs = tokenizer(batch, return_tensors="pt", padding=True)
+            longest = int(inputs["input_ids"].shape[1])
+            kwargs = {"max_new_tokens": min(512, 2 * longest + 16)}
+            if self.num_beams:
+                kwargs["num_beams"] = self.num_beams
+            with torch.inference_mode():
+                generated = model.generate(**inputs, **kwargs)
+        return tokenizer.batch_decode(generated, skip_special_tokens=True)
+
+    def _cache_get(self, key) -> Optional[str]:
+        with self._cache_lock:
+            out = self._cache.get(key)
+            if out is not None:
+                self._cache.move_to_end(key)
+            return out
+
+    def _cache_put(self, key, value: str):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
@@ -1,23 +1,72 @@
 import os
+import json
+import time
 import pickle
-from typing import List, Tuple
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
 import numpy as np
 
-from sentence_transformers import SentenceTransformer
 import faiss
 
+from .embeddings import load_encoder
+from . import dedup
+from .metrics import time_stage
+from .faiss_index import resolve_factory, build_index, default_search_params, apply_search_params, read_index, index_kind, search_parameters
+
+logger = logging.getLogger(__name__)
+
+# One encoder per model name per process, shared by every index snapshot's VectorStore
+_ENCODERS: Dict[str, object] = {}
+_ENCODER_LOCK = threading.Lock()
+
 class VectorStore:
     def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", index_dir: str = None):
-        self.model = SentenceTransformer(model_name)
-        self.dim = self.model.get_sentence_embedding_dimension()
+        self.model_name = model_name
+        # Loaded on first use (or by RAGPipeline.warmup) so constructing the store stays cheap
+        self._model = None
         self.index = None
         self.documents: List[str] = []
         self.index_dir = index_dir or os.path.join(os.path.dirname(__file__), "..", "vector_store")
         os.makedirs(self.index_dir, exist_ok=True)
         self.index_path = os.path.join(self.index_dir, "faiss.index")
         self.pickle_path = os.path.join(self.index_dir, "docs.pkl")
+        self.meta_path = os.path.join(self.index_dir, "index_meta.json")
+        self.signatures_path = os.path.join(self.index_dir, "signatures.npy")
+        # MinHash signature per document (row-aligned), for near-duplicate checks at query time
+        self.signatures: Optional[np.ndarray] = None
+        self._doc_index: Dict[str, int] = {}
+        # Factory string and search-time parameters (nprobe/efSearch), persisted in index_meta.json
+        self.factory = None
+        self.search_params: Dict[str, int] = {}
+        self.index_kind = None
+        # Map the index file read-only instead of copying it onto the heap (FAISS_MMAP=1)
+        self.mmap = os.getenv("FAISS_MMAP", "0") == "1"
+
+    @property
+    def model(self):
+        return self._model if self._model is not None else self.load_model()
+
+    def load_model(self):
+        with _ENCODER_LOCK:
+            if self.model_name not in _ENCODERS:
+                start = time.perf_counter()
+                _ENCODERS[self.model_name] = load_encoder(self.model_name)
+                logger.info("Loaded embedding model %s in %.1fs", self.model_name, time.perf_counter() - start)
+            self._model = _ENCODERS[self.model_name]
+        return self._model
+
+    @property
+    def model_loaded(self) -> bool:
+        return self._model is not None or self.model_name in _ENCODERS
+
+    @property
+    def dim(self) -> int:
+        if self.index is not None:
+            return int(self.index.d)
+        return self.model.get_sentence_embedding_dimension()
 
-    def add_documents(self, docs: List[str]):
+    def add_documents(self, docs: List[str], signatures: Optional[np.ndarray] = None):
         if not docs:
             return
         # Use batch processing for better performance
@@ -27,69 +76,118 @@ class VectorStore:
             batch = docs[i:i + batch_size]
             batch_embeddings = self.model.encode(batch, convert_to_numpy=True, show_progress_bar=False, batch_size=batch_size)
             embeddings.append(batch_embeddings)
-        embeddings = np.vstack(embeddings)
-        
-        if self.index is None:
-            # Prefer IVF for larger datasets, but gracefully fall back to IndexFlatIP if Faiss build fails
-            use_ivf = os.getenv("FAISS_USE_IVF", "1") != "0"
-            if use_ivf:
-                try:
-                    nlist = max(4, min(len(docs) // 10, 100))  # number of clusters
-                    quantizer = faiss.IndexFlatIP(self.dim)
-                    self.index = faiss.IndexIVFFlat(quantizer, self.dim, nlist, faiss.METRIC_INNER_PRODUCT)
-                    # training can fail on small datasets or unsupported builds; handle that
-                    self.index.train(embeddings)
-                except Exception as e:
-                    print(f"IVF index creation failed, falling back to IndexFlatIP: {e}")
-                    self.index = faiss.IndexFlatIP(self.dim)
-            else:
-                self.index = faiss.IndexFlatIP(self.dim)
-        
+        embeddings = np.vstack(embeddings).astype(np.float32)
+        # Normalize before training so IVF/PQ centroids live on the same sphere as the searched vectors
         faiss.normalize_L2(embeddings)
-        self.index.add(embeddings)
+
+        if self.index is None:
+            self.factory = resolve_factory(len(embeddings))
+            try:
+                start = time.perf_counter()
+                self.index = build_index(embeddings, self.factory)
+                logger.info("Built %s index over %d vectors in %.1fs", self.factory, len(embeddings), time.perf_counter() - start)
+            except Exception as e:
+                # training can fail on small datasets or unsupported builds; fall back to exact search
+                logger.warning("%s index creation failed, falling back to IndexFlatIP: %s", self.factory, e)
+                self.factory = "Flat"
+                self.index = build_index(embeddings, self.factory)
+            self.index_kind = index_kind(self.index)
+            self.search_params = default_search_params(self.index)
+            for key, env in (("nprobe", "FAISS_NPROBE"), ("efSearch", "FAISS_EF_SEARCH")):
+                if key in self.search_params and os.getenv(env):
+                    self.search_params[key] = int(os.getenv(env))
+            apply_search_params(self.index, self.search_params)
+        else:
+            self.index.add(embeddings)
         self.documents.extend(docs)
+        if signatures is None:
+            signatures = dedup.signatures(docs)
+        self.signatures = signatures if self.signatures is None else np.vstack([self.signatures, signatures])
+        self._doc_index = {doc: i for i, doc in enumerate(self.documents)}
 
     def save(self):
         if self.index is not None:
             faiss.write_index(self.index, self.index_path)
         with open(self.pickle_path, "wb") as f:
             pickle.dump(self.documents, f)
+        if self.signatures is not None:
+            np.save(self.signatures_path, self.signatures)
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "factory": self.factory,
+                "model_name": self.model_name,
+                "embedding_backend": getattr(self._model, "embedding_backend", None),
+                "dim": self.dim,
+                "ntotal": int(self.index.ntotal) if self.index is not None else 0,
+                "search_params": self.search_params,
+            }, f, indent=2)
 
     def load(self) -> bool:
         try:
             if os.path.exists(self.index_path) and os.path.exists(self.pickle_path):
                 try:
-                    self.index = faiss.read_index(self.index_path)
+                    self.index = read_index(self.index_path, mmap=self.mmap)
                 except Exception as e:
-                    print(f"Failed to read faiss index file, will recreate: {e}")
+                    logger.warning("Failed to read faiss index file, will recreate: %s", e)
                     self.index = None
+                if self.index is not None:
+                    self.index_kind = index_kind(self.index)
+                    self.search_params = default_search_params(self.index)
+                    if os.path.exists(self.meta_path):
+                        with open(self.meta_path, encoding="utf-8") as f:
+                            meta = json.load(f)
+                        self.factory = meta.get("factory")
+                        self.search_params.update(meta.get("search_params") or {})
+                    apply_search_params(self.index, self.search_params)
                 with open(self.pickle_path, "rb") as f:
                     self.documents = pickle.load(f)
+                self._doc_index = {doc: i for i, doc in enumerate(self.documents)}
+                if os.path.exists(self.signatures_path):
+                    self.signatures = np.load(self.signatures_path, mmap_mode="r" if self.mmap else None)
+                else:
+                    # Index built before signatures were stored
+                    start = time.perf_counter()
+                    self.signatures = dedup.signatures(self.documents)
+                    logger.info("Computed %d chunk signatures in %.1fs", len(self.documents), time.perf_counter() - start)
                 return True
         except Exception as e:
-            print(f"Failed to load vector store: {e}")
+            logger.error("Failed to load vector store: %s", e)
         return False
 
-    def search(self, query: str, k: int = 3) -> List[Tuple[str, float]]:
+    def chunk_id(self, doc: str) -> Optional[int]:
+        """Position of `doc` in `documents` (the id debug data and traces refer to chunks by)."""
+        return self._doc_index.get(doc)
+
+    def signature(self, doc: str) -> np.ndarray:
+        idx = self._doc_index.get(doc)
+        if idx is None or self.signatures is None:
+            return dedup.minhash(doc)
+        return self.signatures[idx]
+
+    def search(self, query: str, k: int = 3, nprobe: int = None, ef_search: int = None) -> List[Tuple[str, float]]:
         if self.index is None or len(self.documents) == 0:
             return []
-        q_emb = self.model.encode([query], convert_to_numpy=True, show_progress_bar=False)
-        faiss.normalize_L2(q_emb)
+        with time_stage("embed", chars=len(query)):
+            q_emb = self.model.encode([query], convert_to_numpy=True, show_progress_bar=False)
+            faiss.normalize_L2(q_emb)
+        params = self.search_params
+        if nprobe or ef_search:
+            # Per-call override of the persisted recall/speed trade-off
+            params = dict(params)
+            if nprobe:
+                params["nprobe"] = nprobe
+            if ef_search:
+                params["efSearch"] = ef_search
         try:
-            if isinstance(self.index, faiss.IndexIVFFlat):
-                # For IVF index, increase nprobe for better recall/speed trade-off
-                try:
-                    self.index.nprobe = min(16, self.index.nlist)
-                except Exception:
-                    # older faiss builds may not expose nlist
-                    pass
-            D, I = self.index.search(q_emb, k)
+            # Passed with the call rather than set on the index, which every request thread shares
+            with time_stage("faiss", k=k):
+                D, I = self.index.search(q_emb, k, params=search_parameters(self.index, params, self.index_kind))
         except Exception as e:
             # If Faiss search fails unexpectedly, return empty and log — avoid crashing the service
-            print(f"Faiss search failed: {e}")
+            logger.error("Faiss search failed: %s", e)
             return []
         results = []
         for score, idx in zip(D[0], I[0]):
-            if idx < len(self.documents):
+            if 0 <= idx < len(self.documents):
                 results.append((self.documents[idx], float(score)))
         return results
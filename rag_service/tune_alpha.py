@@ -1,22 +1,16 @@
-import json
-from src.rag_pipeline import RAGPipeline
-import os
+"""Alpha-only sweep (kept for the old entry point); see benchmarks/sweep.py for the full grid.
 
-groq_key = os.getenv("GROQ_API_KEY")
-rag = RAGPipeline(groq_key)
-rag.initialize("./data")
+Usage: python tune_alpha.py [--real-embedder] [--index-dir ../vector_store]
+"""
+import sys
 
-alphas = [0.3, 0.5, 0.7, 0.9]
-results = {}
+from benchmarks.sweep import main
 
-for alpha in alphas:
-    # Modify hybrid_retriever alpha
-    rag.hybrid_retriever.search = lambda q, k: rag.hybrid_retriever.search(q, k, alpha=alpha)
-    
-    # Run benchmark (simplified)
-    # ... run same benchmark loop ...
-    
-    results[alpha] = accuracy
-
-print(results)
-# Expected: alpha=0.5-0.7 performs best
+if __name__ == "__main__":
+    sys.exit(main([
+        "--alpha", "0.3,0.5,0.7,0.9",
+        "--k", "3",
+        "--rrf-k", "60",
+        "--candidate-multiplier", "3",
+        "--objective", "hit@3",
+    ] + sys.argv[1:]))